@@ -1,18 +1,28 @@
-from flask_bcrypt import Bcrypt
-from flask_jwt_extended import create_access_token
+from flask import request, jsonify
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from bson import ObjectId
+from functools import wraps
 import re
 
-bcrypt = Bcrypt()
+_bcrypt = None
+
+def _get_bcrypt():
+    # The bcrypt extension is only needed to log in or register, so keep it off the start-up path
+    global _bcrypt
+    if _bcrypt is None:
+        from flask_bcrypt import Bcrypt
+        _bcrypt = Bcrypt()
+    return _bcrypt
 
 def initialize_auth(app):
-    bcrypt.init_app(app)
+    _get_bcrypt().init_app(app)
 
 def hash_password(password):
-    return bcrypt.generate_password_hash(password).decode('utf-8')
+    return _get_bcrypt().generate_password_hash(password).decode('utf-8')
 
 def verify_password(plain_password, hashed_password):
     try:
-        return bcrypt.check_password_hash(hashed_password, plain_password)
+        return _get_bcrypt().check_password_hash(hashed_password, plain_password)
     except Exception as e:
         print(f"Password verification error: {e}")
         return False
@@ -28,4 +38,20 @@ def validate_email(email):
 
 def validate_password(password):
     # At least 6 characters
-    return len(password) >= 6 if password else False
\ No newline at end of file
+    return len(password) >= 6 if password else False
+
+def admin_required(fn):
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        try:
+            user = request.current_app.db.users.find_one({"_id": ObjectId(get_jwt_identity())}, {"role": 1})
+        except Exception:
+            user = None
+        if not user or user.get('role') != 'admin':
+            return jsonify({
+                "message": "Admin access required",
+                "error": "forbidden"
+            }), 403
+        return fn(*args, **kwargs)
+    return wrapper
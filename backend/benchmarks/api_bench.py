@@ -0,0 +1,441 @@
+"""Load-test every API route in-process and report latency, throughput and RSS as JSON.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.api_bench --docs 10000 --output bench.json
+    python -m benchmarks.api_bench --backend mongo --mongo-uri mongodb://localhost:27017 --docs 100000
+    python -m benchmarks.api_bench --docs 10000 --compare bench.json
+    python -m benchmarks.api_bench compare old.json new.json
+    python -m benchmarks.api_bench --audit-queries --strict-queries --query-baseline bench.json
+
+The app is booted with create_app() and driven through Flask test clients, one
+per worker thread, so no server or network is involved. With --audit-queries
+every query shape the routes send is explained (see utils/query_audit.py) and
+the report gains a "queryAudit" section; --strict-queries exits non-zero when
+a route has a scan or unindexed sort that the --query-baseline report does not.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+BENCH_DB_NAME = 'thrive_bench'
+BENCH_EMAIL = 'bench.user@thrive.test'
+BENCH_PASSWORD = 'bench-password'
+
+
+# ---------------------------------------------------------------------------
+# Setup
+# ---------------------------------------------------------------------------
+
+def boot_app(backend, mongo_uri=None, audit_queries=False):
+    os.environ['DB_BACKEND'] = backend
+    os.environ['MONGO_DB_NAME'] = BENCH_DB_NAME
+    # One bench user drives every request; limits would only measure the 429 path
+    os.environ['RATE_LIMIT_ENABLED'] = 'false'
+    os.environ['LOAD_SHED_MAX_IN_FLIGHT'] = '0'
+    if mongo_uri:
+        os.environ['MONGO_URI'] = mongo_uri
+    if audit_queries:
+        os.environ['QUERY_AUDIT_MODE'] = 'full'
+
+    from app import create_app
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = create_app()
+        app.startup.wait(60)
+    for name in ('users', 'leads', 'projects', 'budgets', 'payments', 'customer_ledger'):
+        app.db[name].delete_many({})
+    return app
+
+
+def seed(app, total_docs, users, seed_value, batch_size=5000):
+    """Spread `total_docs` across the four data collections and `users` owners."""
+    from auth import hash_password
+    from utils.seed_data import generate_dataset
+
+    password_hash = hash_password(BENCH_PASSWORD)
+    bench_user = app.db.users.insert_one({
+        "fullName": "Bench User",
+        "email": BENCH_EMAIL,
+        "password": password_hash,
+        "role": "admin",
+        "createdAt": datetime.utcnow(),
+        "updatedAt": datetime.utcnow(),
+        "isActive": True
+    }).inserted_id
+
+    per_collection = max(total_docs // 4, 1)
+    generate_dataset(
+        app.db, users=max(users - 1, 0), leads=per_collection, projects=per_collection,
+        budgets=per_collection, payments=per_collection, seed=seed_value, batch_size=batch_size,
+        owners=[str(bench_user)], password_hash=password_hash, fx=app.fx
+    )
+    return str(bench_user)
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+class Scenario:
+    def __init__(self, name, method, path, body=None, auth=True, expect=(200, 201)):
+        self.name = name
+        self.method = method
+        self.path = path          # str or callable(i) -> str
+        self.body = body          # None, dict or callable(i) -> dict
+        self.auth = auth
+        self.expect = expect
+
+    def request_args(self, i):
+        path = self.path(i) if callable(self.path) else self.path
+        body = self.body(i) if callable(self.body) else self.body
+        return path, body
+
+
+def build_scenarios(app, user_id, requests_per_route):
+    """One scenario per route; write routes get their own pre-created targets."""
+    db = app.db
+    now = datetime.utcnow()
+    n = requests_per_route
+
+    def make(collection, doc, count):
+        docs = [dict(doc, createdBy=user_id, createdAt=now, updatedAt=now) for _ in range(count)]
+        return [str(_id) for _id in db[collection].insert_many(docs).inserted_ids]
+
+    lead_ids = make('leads', {"name": "Target", "email": "t@example.com", "mobile": "1", "status": "New"}, n)
+    lead_deletes = make('leads', {"name": "Doomed", "email": "d@example.com", "mobile": "1", "status": "New"}, n)
+    project_ids = make('projects', {"projectName": "Target", "deadline": "2025-01-01", "status": "Active"}, n)
+    project_deletes = make('projects', {"projectName": "Doomed", "deadline": "2025-01-01", "status": "Active"}, n)
+    budget_ids = make('budgets', {"budgetName": "Target", "projectId": "bench_project", "totalBudget": 1.0}, n)
+    budget_deletes = make('budgets', {"budgetName": "Doomed", "projectId": "bench_project", "totalBudget": 1.0}, n)
+    payment_ids = make('payments', {"customer": "Target", "amount": 1.0, "date": "2024-10-10"}, n)
+    payment_deletes = make('payments', {"customer": "Doomed", "amount": 1.0, "date": "2024-10-10"}, n)
+
+    return [
+        Scenario('health', 'GET', '/api/health', auth=False),
+        Scenario('auth.login', 'POST', '/api/auth/login', auth=False,
+                 body={"identifier": BENCH_EMAIL, "password": BENCH_PASSWORD}),
+        Scenario('auth.profile', 'GET', '/api/auth/profile'),
+        Scenario('dashboard.get', 'GET', '/api/dashboard/'),
+
+        Scenario('leads.list', 'GET', '/api/leads/'),
+        Scenario('leads.by_score', 'GET', '/api/leads/?sort=score'),
+        Scenario('leads.create', 'POST', '/api/leads/',
+                 body=lambda i: {"name": f"Bench {i}", "email": f"bench{i}@example.com", "mobile": f"+91 9{i:09d}"}),
+        Scenario('leads.update', 'PUT', lambda i: f"/api/leads/{lead_ids[i]}",
+                 body=lambda i: {"notes": f"bench update {i}", "status": "Contacted"}),
+        Scenario('leads.delete', 'DELETE', lambda i: f"/api/leads/{lead_deletes[i]}"),
+
+        Scenario('projects.list', 'GET', '/api/projects/'),
+        Scenario('projects.get', 'GET', lambda i: f"/api/projects/{project_ids[i]}"),
+        Scenario('projects.create', 'POST', '/api/projects/',
+                 body=lambda i: {"projectName": f"Bench {i}", "deadline": "2025-01-01"}),
+        Scenario('projects.update', 'PUT', lambda i: f"/api/projects/{project_ids[i]}",
+                 body=lambda i: {"details": f"bench update {i}"}),
+        Scenario('projects.delete', 'DELETE', lambda i: f"/api/projects/{project_deletes[i]}"),
+
+        Scenario('budget.list', 'GET', '/api/budget/'),
+        Scenario('budget.by_project', 'GET', '/api/budget/bench_project/project'),
+        Scenario('budget.totals', 'GET', '/api/budget/totals'),
+        Scenario('budget.create', 'POST', '/api/budget/',
+                 body=lambda i: {"budgetName": f"Bench {i}", "projectId": "bench_new", "projectName": "Bench",
+                                 "totalBudget": 1000 + i}),
+        Scenario('budget.update', 'PUT', lambda i: f"/api/budget/{budget_ids[i]}",
+                 body=lambda i: {"designCost": i + 1}),
+        Scenario('budget.delete', 'DELETE', lambda i: f"/api/budget/{budget_deletes[i]}"),
+
+        Scenario('payments.list', 'GET', '/api/payments/'),
+        Scenario('payments.totals', 'GET', '/api/payments/totals'),
+        Scenario('payments.create', 'POST', '/api/payments/',
+                 body=lambda i: {"customer": f"Bench {i}", "amount": 100 + i, "date": "2024-10-10"}),
+        Scenario('payments.update', 'PUT', lambda i: f"/api/payments/{payment_ids[i]}",
+                 body=lambda i: {"amount": 200 + i}),
+        Scenario('payments.delete', 'DELETE', lambda i: f"/api/payments/{payment_deletes[i]}"),
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_kb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+def run_scenario(app, scenario, token, requests_per_route, concurrency):
+    headers = {"Authorization": f"Bearer {token}"} if scenario.auth else {}
+    latencies = [None] * requests_per_route
+    errors = []
+    # Requests that raised instead of answering: "Type: message" for each distinct failure
+    exceptions = []
+    counter = iter(range(requests_per_route))
+    counter_lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            try:
+                path, body = scenario.request_args(i)
+                response = client.open(path, method=scenario.method, json=body, headers=headers)
+            except Exception as e:
+                exceptions.append(f"{type(e).__name__}: {e}")
+                continue
+            latencies[i] = (time.perf_counter() - started) * 1000.0
+            if response.status_code not in scenario.expect:
+                errors.append(response.status_code)
+
+    rss_before = peak_rss_kb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        workers = [pool.submit(worker) for _ in range(concurrency)]
+    elapsed = time.perf_counter() - started
+    for future in workers:
+        # A worker that died leaves its remaining slots empty; surface its exception, not a TypeError below
+        future.result()
+
+    # Only answered requests have a latency
+    ordered = sorted(latency for latency in latencies if latency is not None)
+    return {
+        "method": scenario.method,
+        "requests": requests_per_route,
+        "concurrency": concurrency,
+        "errors": len(errors) + requests_per_route - len(ordered),
+        "error_statuses": sorted(set(errors)),
+        "exceptions": sorted(set(exceptions)),
+        "throughput_rps": round(requests_per_route / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered), 3),
+            "p50": round(percentile(ordered, 50), 3),
+            "p95": round(percentile(ordered, 95), 3),
+            "p99": round(percentile(ordered, 99), 3),
+            "max": round(ordered[-1], 3)
+        } if ordered else None,
+        "peak_rss_kb": peak_rss_kb(),
+        "rss_growth_kb": peak_rss_kb() - rss_before
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    app = boot_app(args.backend, args.mongo_uri, args.audit_queries)
+
+    seed_started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        user_id = seed(app, args.docs, args.users, args.seed)
+    seed_seconds = time.perf_counter() - seed_started
+
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        token = create_access_token(identity=user_id)
+
+    scenarios = build_scenarios(app, user_id, args.requests)
+    if args.routes:
+        wanted = set(args.routes.split(','))
+        scenarios = [s for s in scenarios if s.name in wanted or s.name.split('.')[0] in wanted]
+
+    results = {}
+    for scenario in scenarios:
+        sink = io.StringIO() if args.quiet else sys.stdout
+        with contextlib.redirect_stdout(sink):
+            results[scenario.name] = run_scenario(app, scenario, token, args.requests, args.concurrency)
+        result = results[scenario.name]
+        if result['latency_ms'] is None:
+            print(f"{scenario.name:<22} every request raised: {'; '.join(result['exceptions'])}", file=sys.stderr)
+            continue
+        print(f"{scenario.name:<22} p50={result['latency_ms']['p50']:>9.3f}ms "
+              f"p99={result['latency_ms']['p99']:>9.3f}ms "
+              f"{result['throughput_rps']:>9.1f} rps", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "docs": args.docs,
+            "users": args.users,
+            "seed": args.seed,
+            "seed_seconds": round(seed_seconds, 3),
+            "requests_per_route": args.requests,
+            "concurrency": args.concurrency
+        },
+        "routes": results
+    }
+    if args.audit_queries:
+        app.query_auditor.drain()
+        report['queryAudit'] = json.loads(json.dumps(app.query_auditor.report(), default=str))
+    return report
+
+
+# ---------------------------------------------------------------------------
+# Comparison
+# ---------------------------------------------------------------------------
+
+def compare(baseline, current, threshold):
+    """Return (rows, regressions) comparing p95 latency and throughput per route."""
+    rows = []
+    regressions = []
+    for name, now in current['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            rows.append({"route": name, "status": "new"})
+            continue
+        if now['latency_ms'] is None or before['latency_ms'] is None:
+            # No request of the route answered in one of the runs
+            row = {"route": name, "status": "failed" if now['latency_ms'] is None else "ok"}
+            rows.append(row)
+            if row['status'] == 'failed':
+                regressions.append(row)
+            continue
+        p95_before, p95_now = before['latency_ms']['p95'], now['latency_ms']['p95']
+        rps_before, rps_now = before['throughput_rps'], now['throughput_rps']
+        p95_change = (p95_now - p95_before) / p95_before if p95_before else 0.0
+        rps_change = (rps_now - rps_before) / rps_before if rps_before else 0.0
+        regressed = p95_change > threshold or rps_change < -threshold
+        row = {
+            "route": name,
+            "p95_ms": [p95_before, p95_now],
+            "p95_change": round(p95_change, 4),
+            "throughput_rps": [rps_before, rps_now],
+            "throughput_change": round(rps_change, 4),
+            "status": "regressed" if regressed else "ok"
+        }
+        rows.append(row)
+        if regressed:
+            regressions.append(row)
+    return rows, regressions
+
+
+def print_comparison(rows, out=sys.stderr):
+    for row in rows:
+        if row['status'] == 'new':
+            print(f"{row['route']:<22} (new route)", file=out)
+            continue
+        if 'p95_change' not in row:
+            print(f"{row['route']:<22} ({'failed' if row['status'] == 'failed' else 'failed in the baseline'})",
+                  file=out)
+            continue
+        flag = '  <-- REGRESSION' if row['status'] == 'regressed' else ''
+        print(f"{row['route']:<22} p95 {row['p95_change']:+8.1%}  throughput {row['throughput_change']:+8.1%}{flag}",
+              file=out)
+
+
+def print_findings(findings, out=sys.stderr):
+    for finding in findings:
+        print(f"{finding['route']:<32} {finding['collection']:<16} {finding['issue']:<16} "
+              f"{json.dumps(finding['shape'])}", file=out)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    if argv and argv[0] == 'compare':
+        parser = argparse.ArgumentParser(prog='api_bench compare')
+        parser.add_argument('baseline')
+        parser.add_argument('current')
+        parser.add_argument('--threshold', type=float, default=0.2)
+        args = parser.parse_args(argv[1:])
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        rows, regressions = compare(baseline, current, args.threshold)
+        print_comparison(rows)
+        print(json.dumps({"comparison": rows}, indent=2))
+        return 1 if regressions else 0
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['memory', 'mongo'], default='memory')
+    parser.add_argument('--mongo-uri', default=None)
+    parser.add_argument('--docs', type=int, default=10000, help='documents seeded across all collections')
+    parser.add_argument('--users', type=int, default=20, help='owners the seeded documents are spread over')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--routes', default=None, help='comma-separated route names or blueprint prefixes')
+    parser.add_argument('--output', default=None, help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', default=None, help='baseline JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative change counted as a regression')
+    parser.add_argument('--verbose', dest='quiet', action='store_false', help="keep the routes' console output")
+    parser.add_argument('--audit-queries', action='store_true', help='explain every query shape the routes send')
+    parser.add_argument('--strict-queries', action='store_true',
+                        help='fail on query findings that are not in --query-baseline')
+    parser.add_argument('--query-baseline', default=None,
+                        help='earlier report (with a queryAudit section) whose findings are accepted')
+    args = parser.parse_args(argv)
+    if args.strict_queries:
+        args.audit_queries = True
+
+    report = run(args)
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(baseline, report, args.threshold)
+        print_comparison(rows)
+        report['comparison'] = {"baseline": args.compare, "threshold": args.threshold, "routes": rows}
+        exit_code = 1 if regressions else 0
+
+    if args.audit_queries:
+        from utils.query_audit import new_findings
+        baseline = None
+        if args.query_baseline:
+            with open(args.query_baseline) as f:
+                baseline = json.load(f)
+            baseline = baseline.get('queryAudit', baseline)
+        findings = new_findings(report['queryAudit'], baseline)
+        report['queryAudit']['newFindings'] = findings
+        if findings:
+            print(f"{len(findings)} query finding(s) not in the baseline:", file=sys.stderr)
+            print_findings(findings)
+            if args.strict_queries:
+                exit_code = 1
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(payload)
+    else:
+        print(payload)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
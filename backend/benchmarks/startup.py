@@ -0,0 +1,125 @@
+"""Measure cold-start latency: fresh interpreter to first served request and to readiness.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.startup --runs 10
+    python -m benchmarks.startup --backend mongo --mongo-uri mongodb://localhost:27017 --runs 5
+    python -m benchmarks.startup --runs 10 --max-first-request-ms 1500 --output startup.json
+
+Every run boots the app in a new Python process, so module imports are paid
+again exactly as they are when an autoscaler starts a worker. Each run
+reports the time to import ``app``, to return from create_app(), to answer
+``/api/health/live`` and to pass ``/api/health/ready``.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.api_bench import BACKEND_DIR, percentile, git_revision
+
+# Runs inside the child process; reports milliseconds since the interpreter started
+CHILD = r"""
+import contextlib, io, json, sys, time
+started = float(sys.argv[1])
+def since():
+    return round((time.time() - started) * 1000.0, 3)
+timings = {"interpreter_ms": since()}
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as app_module
+    timings["import_ms"] = since()
+    app = app_module.create_app()
+    timings["create_app_ms"] = since()
+    client = app.test_client()
+    live = client.get('/api/health/live')
+    timings["first_request_ms"] = since()
+    deadline = time.monotonic() + float(sys.argv[2])
+    ready = client.get('/api/health/ready')
+    while ready.status_code != 200 and time.monotonic() < deadline:
+        time.sleep(0.01)
+        ready = client.get('/api/health/ready')
+    timings["ready_ms"] = since() if ready.status_code == 200 else None
+timings["live_status"] = live.status_code
+timings["ready_status"] = ready.status_code
+print(json.dumps(timings))
+"""
+
+PHASES = ('interpreter_ms', 'import_ms', 'create_app_ms', 'first_request_ms', 'ready_ms')
+
+
+def boot_once(env, ready_timeout):
+    started = time.time()
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD, repr(started), str(ready_timeout)],
+        cwd=BACKEND_DIR, env=env, stderr=subprocess.DEVNULL
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def summarize(values):
+    ordered = sorted(v for v in values if v is not None)
+    if not ordered:
+        return None
+    return {
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": round(percentile(ordered, 50), 3),
+        "p95": round(percentile(ordered, 95), 3),
+        "max": round(ordered[-1], 3)
+    }
+
+
+def run(args):
+    env = dict(os.environ, DB_BACKEND=args.backend, MONGO_DB_NAME='thrive_bench')
+    if args.mongo_uri:
+        env['MONGO_URI'] = args.mongo_uri
+
+    runs = [boot_once(env, args.ready_timeout) for _ in range(args.runs)]
+    return {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "runs": args.runs
+        },
+        "phases": {phase: summarize([run[phase] for run in runs]) for phase in PHASES},
+        "not_ready": sum(1 for run in runs if run['ready_ms'] is None),
+        "runs": runs
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['memory', 'mongo'], default='memory')
+    parser.add_argument('--mongo-uri', default=None)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--ready-timeout', type=float, default=30, help='seconds to wait for readiness per run')
+    parser.add_argument('--max-first-request-ms', type=float, default=None,
+                        help='exit non-zero when the p95 time to the first served request exceeds this')
+    parser.add_argument('--output', default=None, help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    first_request = report['phases']['first_request_ms']
+    exit_code = 0
+    if args.max_first_request_ms is not None and first_request['p95'] > args.max_first_request_ms:
+        print(f"first request p95 {first_request['p95']:.1f}ms exceeds {args.max_first_request_ms:.1f}ms",
+              file=sys.stderr)
+        exit_code = 1
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(payload)
+    else:
+        print(payload)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,6 +2,11 @@ from datetime import datetime
 from bson import ObjectId
 import json
 
+from utils.validation import Field, Schema
+from utils.dedupe import blocking_keys
+from utils.scoring import score_lead
+from utils.ledger import customer_key
+
 class JSONEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, ObjectId):
@@ -10,75 +15,131 @@ class JSONEncoder(json.JSONEncoder):
             return o.isoformat()
         return json.JSONEncoder.default(self, o)
 
+# Request schemas. Compiled once at import time; create handlers validate the
+# full schema, update handlers validate with partial=True so only updatable
+# fields reach $set.
+AMOUNT_ERRORS = dict(
+    invalid_message="{field} must be a valid number", invalid_error="invalid_amount_format",
+    range_message="{field} must be a positive number", range_error="invalid_amount"
+)
+
+user_validator = Schema('user', {
+    "fullName": Field('string', required=True, strip=True),
+    "email": Field('string', required=True, strip=True),
+    "password": Field('string', required=True),
+})
+
+lead_validator = Schema('lead', {
+    "name": Field('string', required=True, strip=True, updatable=False),
+    "email": Field('string', required=True, strip=True, updatable=False),
+    "mobile": Field('string', required=True, strip=True, updatable=False),
+    "address": Field('string', updatable=False),
+    "company": Field('string', updatable=False),
+    "designation": Field('string', updatable=False),
+    "source": Field('string'),
+    "notes": Field('string'),
+    "status": Field('string', default='New'),
+    "nextFollowUp": Field('date'),
+    "assignedTo": Field('string', default='Not Assigned'),
+    "fileName": Field('string', updatable=False),
+})
+
+project_validator = Schema('project', {
+    "projectName": Field('string', required=True, strip=True),
+    "details": Field('string'),
+    "deadline": Field('date', required=True),
+    "priority": Field('string', default='Medium'),
+    "projectFile": Field('string'),
+    "status": Field('string', default='Active'),
+})
+
+budget_validator = Schema('budget', {
+    "budgetName": Field('string', required=True, strip=True),
+    "projectId": Field('string', required=True),
+    "projectName": Field('string', required=True),
+    "totalBudget": Field('number', required=True, minimum=0, **AMOUNT_ERRORS),
+    "developmentCost": Field('number', default=0.0, minimum=0, **AMOUNT_ERRORS),
+    "designCost": Field('number', default=0.0, minimum=0, **AMOUNT_ERRORS),
+    "testingCost": Field('number', default=0.0, minimum=0, **AMOUNT_ERRORS),
+    "deploymentCost": Field('number', default=0.0, minimum=0, **AMOUNT_ERRORS),
+    "maintenanceCost": Field('number', default=0.0, minimum=0, **AMOUNT_ERRORS),
+    "thirdPartyCost": Field('number', default=0.0, minimum=0, **AMOUNT_ERRORS),
+    "currency": Field('string', default='INR', strip=True),
+    "notes": Field('string', default=''),
+}, report_all_missing=True)
+
+payment_validator = Schema('payment', {
+    "customer": Field('string', required=True, strip=True),
+    "date": Field('date', required=True),
+    "amount": Field(
+        'number', required=True, exclusive_minimum=0,
+        invalid_message="Amount must be a valid positive number", invalid_error="invalid_amount",
+        range_message="Amount must be a valid positive number", range_error="invalid_amount"
+    ),
+    "status": Field('string', default='Completed'),
+    "currency": Field('string', default='INR', strip=True),
+})
+
+# Collections that get a matching $jsonSchema validator when MONGO_SCHEMA_VALIDATION is on
+COLLECTION_VALIDATORS = {
+    "leads": lead_validator,
+    "projects": project_validator,
+    "budgets": budget_validator,
+    "payments": payment_validator,
+}
+
 # User Schema
 def user_schema(user_data):
-    return {
-        "fullName": user_data.get('fullName'),
-        "email": user_data.get('email'),
-        "password": user_data.get('password'),  # Will be hashed
-        "role": user_data.get('role', 'user'),
+    user = user_validator.validate(user_data)  # password will be hashed
+    user.update({
+        # Never taken from the request: admins are granted with python -m utils.admins
+        "role": 'user',
         "createdAt": datetime.utcnow(),
         "updatedAt": datetime.utcnow(),
         "isActive": True
-    }
+    })
+    return user
 
 # Lead Schema
 def lead_schema(lead_data, user_id):
-    return {
-        "name": lead_data.get('name'),
-        "email": lead_data.get('email'),
-        "mobile": lead_data.get('mobile'),
-        "address": lead_data.get('address'),
-        "company": lead_data.get('company'),
-        "designation": lead_data.get('designation'),
-        "source": lead_data.get('source'),
-        "notes": lead_data.get('notes'),
-        "status": lead_data.get('status', 'New'),
-        "nextFollowUp": lead_data.get('nextFollowUp'),
-        "assignedTo": lead_data.get('assignedTo', 'Not Assigned'),
+    lead = lead_validator.validate(lead_data)
+    lead.update({
+        "dedupeKeys": blocking_keys(lead),
         "createdBy": user_id,
-        "fileName": lead_data.get('fileName'),
         "createdAt": datetime.utcnow(),
         "updatedAt": datetime.utcnow()
-    }
+    })
+    lead["score"] = score_lead(lead, lead["createdAt"])
+    lead["scoredAt"] = lead["createdAt"]
+    return lead
 
 # Project Schema
 def project_schema(project_data, user_id):
-    return {
-        "projectName": project_data.get('projectName'),
-        "details": project_data.get('details'),
-        "deadline": project_data.get('deadline'),
-        "priority": project_data.get('priority', 'Medium'),
-        "projectFile": project_data.get('projectFile'),
-        "status": project_data.get('status', 'Active'),
+    project = project_validator.validate(project_data)
+    project.update({
         "createdBy": user_id,
         "createdAt": datetime.utcnow(),
         "updatedAt": datetime.utcnow()
-    }
+    })
+    return project
 
 # Budget Schema
 def budget_schema(budget_data, user_id):
-    return {
-        "budgetName": budget_data.get('budgetName'),
-        "estimatedAmount": float(budget_data.get('estimatedAmount', 0)),
-        "actualAmount": float(budget_data.get('actualAmount', 0)),
-        "startDate": budget_data.get('startDate'),
-        "endDate": budget_data.get('endDate'),
-        "notes": budget_data.get('notes'),
-        "projectId": budget_data.get('projectId'),
+    budget = budget_validator.validate(budget_data)
+    budget.update({
         "createdBy": user_id,
         "createdAt": datetime.utcnow(),
         "updatedAt": datetime.utcnow()
-    }
+    })
+    return budget
 
 # Payment Schema
 def payment_schema(payment_data, user_id):
-    return {
-        "customer": payment_data.get('customer'),
-        "date": payment_data.get('date'),
-        "amount": float(payment_data.get('amount', 0)),
-        "status": payment_data.get('status', 'Completed'),
+    payment = payment_validator.validate(payment_data)
+    payment.update({
+        "customerKey": customer_key(payment.get("customer")),
         "createdBy": user_id,
         "createdAt": datetime.utcnow(),
         "updatedAt": datetime.utcnow()
-    }
\ No newline at end of file
+    })
+    return payment
@@ -0,0 +1,581 @@
+from flask import Blueprint, Response, request, jsonify
+from flask_jwt_extended import get_jwt_identity
+from pymongo.errors import BulkWriteError
+from datetime import datetime
+import time
+
+from auth import admin_required
+from utils.seed_data import generate_dataset
+from utils.fx import BASE_BUILDERS, backfill_base_amounts
+from utils.jobs import job_handler, job_accepted_response, JobFailed, QUEUED, RUNNING
+from utils.tenancy import each_partition, frozen_tenants
+from utils.migrations import MIGRATIONS, APPLIED, apply_migration, migration_status
+from utils.archive import POLICIES, archive_all, tier_sizes
+from models import JSONEncoder
+import json
+
+admin_bp = Blueprint('admin', __name__)
+
+SEED_COUNT_FIELDS = ['users', 'leads', 'projects', 'budgets', 'payments']
+
+@job_handler('seed', concurrency=1, max_attempts=1, tenant=True)
+def run_seed_job(ctx):
+    counts = ctx.params['counts']
+    total = sum(counts.values())
+    written = {}
+    
+    def progress(collection, done, collection_total):
+        written[collection] = done
+        ctx.progress(sum(written.values()), total, f"{collection}: {done}/{collection_total}")
+    
+    started = time.perf_counter()
+    try:
+        inserted = generate_dataset(
+            ctx.db, seed=ctx.params['seed'], owners=ctx.params['owners'], progress=progress, fx=ctx.app.fx, **counts
+        )
+    except BulkWriteError:
+        raise JobFailed("Generated users already exist for this seed; use a different seed")
+    elapsed = time.perf_counter() - started
+    print(f"✅ Seeded {sum(inserted.values())} documents in {elapsed:.2f}s: {inserted}")
+    
+    return {"inserted": inserted, "seconds": round(elapsed, 3)}
+
+@job_handler('fx_backfill', concurrency=1, max_attempts=3)
+def run_fx_backfill_job(ctx):
+    fx = ctx.app.fx
+    fx.refresh()
+    results = []
+    for db in each_partition(ctx.db):
+        for name in ctx.params['collections']:
+            def progress(done, total, name=name):
+                ctx.progress(done, total, f"{name}: {done}/{total}")
+            results.append(backfill_base_amounts(
+                db, fx, name,
+                batch_size=ctx.params['batchSize'],
+                recompute=ctx.params['recompute'],
+                progress=progress
+            ))
+    return {"results": results}
+
+@job_handler('schema_migration', concurrency=1, max_attempts=3)
+def run_schema_migration_job(ctx):
+    router = getattr(ctx.app, 'tenant_router', None)
+    partitions = list(router.partitions.items()) if router else [('default', ctx.db)]
+    return apply_migration(
+        ctx.db, partitions, MIGRATIONS[ctx.params['version']],
+        batch_size=ctx.params['batchSize'],
+        max_per_second=ctx.params['maxPerSecond'],
+        dry_run=ctx.params['dryRun'],
+        progress=ctx.progress
+    )
+
+@job_handler('archive', concurrency=1, max_attempts=2)
+def run_archive_job(ctx):
+    router = getattr(ctx.app, 'tenant_router', None)
+    partitions = list(router.partitions.items()) if router else [('default', ctx.db)]
+    return archive_all(
+        partitions, ctx.params['olderThanDays'], ctx.params['collections'],
+        batch_size=ctx.params['batchSize'],
+        max_per_second=ctx.params['maxPerSecond'],
+        dry_run=ctx.params['dryRun'],
+        progress=lambda done, key: ctx.progress(done, None, f"{key}: {done}"),
+        # A tenant being migrated keeps its documents where the migration can see them
+        skip_owners=lambda: frozen_tenants(ctx.db)
+    )
+
+@admin_bp.route('/seed', methods=['POST'])
+@admin_required
+def seed_dataset():
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json(silent=True) or {}
+
+        counts = {}
+        for field in SEED_COUNT_FIELDS:
+            try:
+                counts[field] = int(data.get(field, 0))
+                if counts[field] < 0:
+                    raise ValueError(f"{field} must not be negative")
+            except (ValueError, TypeError):
+                return jsonify({
+                    "message": f"{field} must be a non-negative integer",
+                    "error": "invalid_count"
+                }), 400
+
+        limit = request.current_app.config['SEED_MAX_DOCUMENTS']
+        if sum(counts.values()) > limit:
+            return jsonify({
+                "message": f"At most {limit} documents can be seeded per request; use the seed_data CLI for more",
+                "error": "seed_too_large"
+            }), 400
+
+        # By default the generated data belongs to the caller; `spread` hands
+        # it out to the generated users as well
+        owners = [user_id] if not data.get('spread') or not counts['users'] else []
+        
+        job = request.current_app.jobs.submit('seed', {
+            "counts": counts,
+            "seed": int(data.get('seed', 42)),
+            "owners": owners
+        }, user_id)
+        
+        return job_accepted_response(job, "Dataset seeding started")
+        
+    except Exception as e:
+        print(f"❌ Error seeding dataset: {str(e)}")
+        return jsonify({
+            "message": "Failed to seed dataset",
+            "error": str(e)
+        }), 500
+
+@admin_bp.route('/fx-rates', methods=['GET'])
+@admin_required
+def get_fx_rates():
+    try:
+        query = {}
+        if request.args.get('currency'):
+            query['currency'] = request.args['currency'].strip().upper()
+        
+        rates = []
+        for rate in request.current_app.db.fx_rates.find(query).sort([("currency", 1), ("effectiveDate", -1)]):
+            rates.append({
+                "id": str(rate['_id']),
+                "currency": rate['currency'],
+                "rate": rate['rate'],
+                "effectiveDate": rate['effectiveDate'].isoformat()
+            })
+        
+        return jsonify({
+            "message": "FX rates fetched successfully",
+            "baseCurrency": request.current_app.fx.base_currency,
+            "rates": rates,
+            "count": len(rates)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch FX rates",
+            "error": str(e)
+        }), 500
+
+@admin_bp.route('/fx-rates', methods=['POST'])
+@admin_required
+def set_fx_rate():
+    try:
+        data = request.get_json(silent=True) or {}
+        fx = request.current_app.fx
+        
+        currency = str(data.get('currency') or '').strip().upper()
+        if not currency or currency == fx.base_currency:
+            return jsonify({
+                "message": f"currency is required and must differ from the base currency {fx.base_currency}",
+                "error": "invalid_currency"
+            }), 400
+        
+        try:
+            rate = float(data.get('rate'))
+            if not rate > 0 or rate == float('inf'):
+                raise ValueError("rate must be positive")
+        except (ValueError, TypeError):
+            return jsonify({
+                "message": "rate must be a positive number",
+                "error": "invalid_rate"
+            }), 400
+        
+        try:
+            effective = data.get('effectiveDate')
+            effective_date = datetime.fromisoformat(effective) if effective else datetime.utcnow()
+        except (ValueError, TypeError):
+            return jsonify({
+                "message": "effectiveDate must be an ISO date",
+                "error": "invalid_date"
+            }), 400
+        
+        # One rate per currency and effective date; posting again corrects it
+        request.current_app.db.fx_rates.update_one(
+            {"currency": currency, "effectiveDate": effective_date},
+            {"$set": {"rate": rate, "updatedAt": datetime.utcnow()}},
+            upsert=True
+        )
+        fx.invalidate()
+        
+        return jsonify({
+            "message": "FX rate saved successfully",
+            "rate": {
+                "currency": currency,
+                "rate": rate,
+                "effectiveDate": effective_date.isoformat()
+            }
+        }), 201
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to save FX rate",
+            "error": str(e)
+        }), 500
+
+@admin_bp.route('/fx-rates/backfill', methods=['POST'])
+@admin_required
+def backfill_fx():
+    try:
+        data = request.get_json(silent=True) or {}
+        collections = data.get('collections') or list(BASE_BUILDERS)
+        unknown = [name for name in collections if name not in BASE_BUILDERS]
+        if unknown:
+            return jsonify({
+                "message": f"Unknown collections: {', '.join(map(str, unknown))}",
+                "error": "invalid_collection"
+            }), 400
+        
+        try:
+            batch_size = int(data.get('batchSize', 1000))
+            if batch_size <= 0:
+                raise ValueError("batchSize must be positive")
+        except (ValueError, TypeError):
+            return jsonify({
+                "message": "batchSize must be a positive integer",
+                "error": "invalid_batch_size"
+            }), 400
+        
+        job = request.current_app.jobs.submit('fx_backfill', {
+            "collections": collections,
+            "batchSize": batch_size,
+            "recompute": bool(data.get('recompute'))
+        }, get_jwt_identity())
+        
+        return job_accepted_response(job, "Base currency backfill started")
+        
+    except Exception as e:
+        print(f"❌ Error backfilling FX amounts: {str(e)}")
+        return jsonify({
+            "message": "Failed to backfill base currency amounts",
+            "error": str(e)
+        }), 500
+
+@admin_bp.route('/tenants/<user_id>', methods=['GET'])
+@admin_required
+def get_tenant(user_id):
+    try:
+        router = getattr(request.current_app, 'tenant_router', None)
+        if router is None:
+            return jsonify({
+                "message": "Tenant partitioning is not enabled",
+                "error": "partitioning_disabled"
+            }), 404
+        
+        router.invalidate(user_id)
+        entry = router.entry(user_id) or {}
+        partition = router.partition_for(user_id)
+        counts = {
+            name: router.partitions[partition][name].count_documents({"createdBy": user_id})
+            for name in ('leads', 'projects', 'budgets', 'payments')
+        }
+        
+        return jsonify({
+            "tenant": {
+                "userId": user_id,
+                "partition": partition,
+                "assignedBy": "directory" if entry else "hash",
+                "state": entry.get('state', 'active'),
+                "target": entry.get('target'),
+                "counts": counts
+            },
+            "partitions": list(router.partitions)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch tenant",
+            "error": str(e)
+        }), 500
+
+@admin_bp.route('/tenants/<user_id>/migrate', methods=['POST'])
+@admin_required
+def migrate_tenant(user_id):
+    try:
+        router = getattr(request.current_app, 'tenant_router', None)
+        if router is None:
+            return jsonify({
+                "message": "Tenant partitioning is not enabled",
+                "error": "partitioning_disabled"
+            }), 404
+        
+        data = request.get_json(silent=True) or {}
+        target = data.get('target')
+        if target not in router.partitions:
+            return jsonify({
+                "message": f"target must be one of: {', '.join(router.partitions)}",
+                "error": "invalid_partition"
+            }), 400
+        
+        entry = router.entry(user_id)
+        if entry and entry.get('state', 'active') != 'active':
+            return jsonify({
+                "message": "A migration is already running for this tenant",
+                "error": "migration_in_progress"
+            }), 409
+        
+        job = request.current_app.jobs.submit('tenant_migration', {
+            "userId": user_id,
+            "target": target
+        }, get_jwt_identity())
+        
+        return job_accepted_response(job, "Tenant migration started")
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to start tenant migration",
+            "error": str(e)
+        }), 500
+
+@admin_bp.route('/stats', methods=['GET'])
+@admin_required
+def get_stats():
+    try:
+        app = request.current_app
+        singleflight = getattr(app, 'singleflight', None)
+        
+        return jsonify({
+            "singleflight": singleflight.stats() if singleflight else None,
+            "audit": app.audit.stats(),
+            "revocations": app.revocations.stats()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch stats",
+            "error": str(e)
+        }), 500
+
+def _profiler_disabled():
+    return jsonify({
+        "message": "The profiler is not enabled (PROFILER_ENABLED)",
+        "error": "profiler_disabled"
+    }), 404
+
+@admin_bp.route('/profiles', methods=['GET'])
+@admin_required
+def get_profiles():
+    try:
+        profiler = request.current_app.profiler
+        if profiler is None:
+            return _profiler_disabled()
+        
+        return jsonify({
+            "profiles": json.loads(JSONEncoder().encode(profiler.recent()))
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch profiles",
+            "error": str(e)
+        }), 500
+
+@admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def get_profile(profile_id):
+    try:
+        profiler = request.current_app.profiler
+        if profiler is None:
+            return _profiler_disabled()
+        profile = profiler.get(profile_id)
+        if profile is None:
+            return jsonify({
+                "message": "Profile not found",
+                "error": "not_found"
+            }), 404
+        
+        output = request.args.get('format', 'speedscope')
+        if output == 'speedscope':
+            response = jsonify(profile.speedscope())
+            response.headers['Content-Disposition'] = f'attachment; filename="profile-{profile.id}.speedscope.json"'
+            return response
+        if output == 'collapsed':
+            return Response(profile.collapsed(), mimetype='text/plain')
+        if output == 'json':
+            return jsonify({"profile": json.loads(JSONEncoder().encode(profile.detail()))}), 200
+        return jsonify({
+            "message": "format must be one of: speedscope, collapsed, json",
+            "error": "invalid_format"
+        }), 400
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch profile",
+            "error": str(e)
+        }), 500
+
+@admin_bp.route('/query-audit', methods=['GET'])
+@admin_required
+def get_query_audit():
+    try:
+        auditor = request.current_app.query_auditor
+        if auditor is None:
+            return jsonify({
+                "message": "The query auditor is not enabled (QUERY_AUDIT_MODE)",
+                "error": "query_audit_disabled"
+            }), 404
+        
+        report = auditor.report()
+        if request.args.get('issues', '').lower() in ('1', 'true'):
+            # Only the routes with a flagged shape, and only those shapes
+            for route in list(report['routes']):
+                shapes = [shape for shape in report['routes'][route]['shapes'] if shape.get('issues')]
+                if shapes:
+                    report['routes'][route]['shapes'] = shapes
+                else:
+                    del report['routes'][route]
+        return jsonify(json.loads(JSONEncoder().encode(report))), 200
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch the query audit",
+            "error": str(e)
+        }), 500
+
+@admin_bp.route('/migrations', methods=['GET'])
+@admin_required
+def get_migrations():
+    try:
+        return jsonify({
+            "migrations": json.loads(JSONEncoder().encode(migration_status(request.current_app.db)))
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch migrations",
+            "error": str(e)
+        }), 500
+
+@admin_bp.route('/migrations/<int:version>/run', methods=['POST'])
+@admin_required
+def run_migration(version):
+    try:
+        if version not in MIGRATIONS:
+            return jsonify({
+                "message": f"Unknown migration version {version}",
+                "error": "not_found"
+            }), 404
+        
+        data = request.get_json(silent=True) or {}
+        dry_run = bool(data.get('dryRun'))
+        try:
+            batch_size = int(data.get('batchSize', 1000))
+            max_per_second = float(data.get('maxPerSecond', 0))
+            if batch_size <= 0 or max_per_second < 0:
+                raise ValueError("batchSize must be positive and maxPerSecond not negative")
+        except (ValueError, TypeError):
+            return jsonify({
+                "message": "batchSize must be a positive integer and maxPerSecond a non-negative number",
+                "error": "invalid_throttle"
+            }), 400
+        
+        db = request.current_app.db
+        record = db.schema_migrations.find_one({"_id": version}, {"state": 1}) or {}
+        if record.get('state') == APPLIED and not dry_run:
+            return jsonify({
+                "message": f"Migration {version} has already been applied",
+                "error": "already_applied"
+            }), 409
+        active = db.jobs.find_one({
+            "type": "schema_migration", "params.version": version, "status": {"$in": [QUEUED, RUNNING]}
+        }, {"_id": 1})
+        if active:
+            return jsonify({
+                "message": f"Migration {version} is already running",
+                "error": "migration_in_progress",
+                "jobId": str(active['_id'])
+            }), 409
+        
+        job = request.current_app.jobs.submit('schema_migration', {
+            "version": version,
+            "dryRun": dry_run,
+            "batchSize": batch_size,
+            "maxPerSecond": max_per_second
+        }, get_jwt_identity())
+        
+        return job_accepted_response(job, f"Migration {version} {'dry run ' if dry_run else ''}started")
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to start migration",
+            "error": str(e)
+        }), 500
+
+@admin_bp.route('/archive', methods=['GET'])
+@admin_required
+def get_archive():
+    try:
+        app = request.current_app
+        router = getattr(app, 'tenant_router', None)
+        partitions = router.partitions.items() if router else [('default', app.db)]
+        
+        return jsonify({
+            "policies": {
+                name: {
+                    "statuses": list(policy.statuses),
+                    "ageField": policy.age_field,
+                    "olderThanDays": app.config['ARCHIVE_AFTER_DAYS'][name]
+                }
+                for name, policy in POLICIES.items()
+            },
+            "tiers": {partition: tier_sizes(db) for partition, db in partitions}
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch archive tiers",
+            "error": str(e)
+        }), 500
+
+@admin_bp.route('/archive/run', methods=['POST'])
+@admin_required
+def run_archive():
+    try:
+        app = request.current_app
+        data = request.get_json(silent=True) or {}
+        collections = data.get('collections') or list(POLICIES)
+        unknown = [name for name in collections if name not in POLICIES]
+        if unknown:
+            return jsonify({
+                "message": f"collections must be among: {', '.join(POLICIES)}",
+                "error": "invalid_collection"
+            }), 400
+        try:
+            batch_size = int(data.get('batchSize', app.config['ARCHIVE_BATCH_SIZE']))
+            max_per_second = float(data.get('maxPerSecond', app.config['ARCHIVE_MAX_PER_SECOND']))
+            older_than_days = dict(app.config['ARCHIVE_AFTER_DAYS'])
+            older_than_days.update({name: int(days) for name, days in (data.get('olderThanDays') or {}).items()})
+            if batch_size <= 0 or max_per_second < 0 or any(days < 0 for days in older_than_days.values()):
+                raise ValueError("out of range")
+        except (ValueError, TypeError, AttributeError):
+            return jsonify({
+                "message": "batchSize must be a positive integer, maxPerSecond a non-negative number "
+                           "and olderThanDays a map of collection to non-negative days",
+                "error": "invalid_throttle"
+            }), 400
+        
+        active = app.db.jobs.find_one({"type": "archive", "status": {"$in": [QUEUED, RUNNING]}}, {"_id": 1})
+        if active:
+            return jsonify({
+                "message": "An archive run is already in progress",
+                "error": "archive_in_progress",
+                "jobId": str(active['_id'])
+            }), 409
+        
+        dry_run = bool(data.get('dryRun'))
+        job = app.jobs.submit('archive', {
+            "collections": collections,
+            "olderThanDays": older_than_days,
+            "dryRun": dry_run,
+            "batchSize": batch_size,
+            "maxPerSecond": max_per_second
+        }, get_jwt_identity())
+        
+        return job_accepted_response(job, f"Archive {'dry run ' if dry_run else ''}started")
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to start archive run",
+            "error": str(e)
+        }), 500
@@ -1,9 +1,12 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from bson import ObjectId
 from datetime import datetime
 import traceback
 
+from utils.projection import parse_fields, full_projection, invalid_fields_response, InvalidFieldsError
+from utils.validation import ValidationError
+
 # Import models and auth functions
 try:
     from models import user_schema
@@ -15,7 +18,7 @@ except ImportError:
             "fullName": user_data.get('fullName'),
             "email": user_data.get('email'),
             "password": user_data.get('password'),
-            "role": user_data.get('role', 'user'),
+            "role": 'user',
             "createdAt": datetime.utcnow(),
             "updatedAt": datetime.utcnow(),
             "isActive": True
@@ -49,23 +52,20 @@ def register():
         print("📨 Received registration data:", data)
         
         # Validation
-        required_fields = ['fullName', 'email', 'password']
-        for field in required_fields:
-            if not data.get(field):
-                print(f"❌ Missing field: {field}")
-                return jsonify({
-                    "message": f"{field} is required",
-                    "error": "missing_fields"
-                }), 400
-        
-        if not validate_email(data['email']):
-            print(f"❌ Invalid email: {data['email']}")
+        try:
+            user_data = user_schema(data)
+        except ValidationError as e:
+            print(f"❌ Invalid registration: {e.message}")
+            return e.response()
+        
+        if not validate_email(user_data['email']):
+            print(f"❌ Invalid email: {user_data['email']}")
             return jsonify({
                 "message": "Invalid email format",
                 "error": "invalid_email"
             }), 400
         
-        if not validate_password(data['password']):
+        if not validate_password(user_data['password']):
             print("❌ Weak password")
             return jsonify({
                 "message": "Password must be at least 6 characters long",
@@ -73,17 +73,16 @@ def register():
             }), 400
         
         # Check if user already exists
-        existing_user = request.current_app.db.users.find_one({"email": data['email']})
+        existing_user = request.current_app.db.users.find_one({"email": user_data['email']})
         if existing_user:
-            print(f"❌ User already exists: {data['email']}")
+            print(f"❌ User already exists: {user_data['email']}")
             return jsonify({
                 "message": "User with this email already exists",
                 "error": "user_exists"
             }), 409
         
         # Create user
-        user_data = user_schema(data)
-        user_data['password'] = hash_password(data['password'])
+        user_data['password'] = hash_password(user_data['password'])
         
         print("📝 Creating user with data:", {k: v for k, v in user_data.items() if k != 'password'})
         
@@ -94,8 +93,8 @@ def register():
             "message": "User registered successfully",
             "user": {
                 "id": str(result.inserted_id),
-                "fullName": data['fullName'],
-                "email": data['email']
+                "fullName": user_data['fullName'],
+                "email": user_data['email']
             }
         }), 201
         
@@ -169,7 +168,13 @@ def login():
 def get_profile():
     try:
         user_id = get_jwt_identity()
-        user = request.current_app.db.users.find_one({"_id": ObjectId(user_id)})
+        
+        try:
+            projection = parse_fields('users', request.args.get('fields'), default=full_projection('users'))
+        except InvalidFieldsError as e:
+            return invalid_fields_response(e)
+        
+        user = request.current_app.db.users.find_one({"_id": ObjectId(user_id)}, projection)
         
         if not user:
             return jsonify({
@@ -177,14 +182,14 @@ def get_profile():
                 "error": "user_not_found"
             }), 404
         
+        profile = {"id": str(user['_id'])}
+        for field in projection:
+            if field == '_id':
+                continue
+            profile[field] = user.get(field, 'user' if field == 'role' else None)
+        
         return jsonify({
-            "user": {
-                "id": str(user['_id']),
-                "fullName": user['fullName'],
-                "email": user['email'],
-                "role": user.get('role', 'user'),
-                "createdAt": user.get('createdAt')
-            }
+            "user": profile
         }), 200
         
     except Exception as e:
@@ -196,7 +201,19 @@ def get_profile():
 @auth_bp.route('/logout', methods=['POST'])
 @jwt_required()
 def logout():
-    # With JWT, logout is handled on the client side by removing the token
-    return jsonify({
-        "message": "Logout successful"
-    }), 200
\ No newline at end of file
+    try:
+        # The token stays revoked until it would have expired anyway
+        token = get_jwt()
+        request.current_app.revocations.revoke(
+            token['jti'], get_jwt_identity(), datetime.utcfromtimestamp(token['exp'])
+        )
+        
+        return jsonify({
+            "message": "Logout successful"
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to log out",
+            "error": str(e)
+        }), 500
\ No newline at end of file
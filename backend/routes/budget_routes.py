@@ -3,11 +3,49 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 from datetime import datetime
 
-from models import budget_schema, JSONEncoder
+from models import budget_schema, budget_validator, JSONEncoder
+from utils.projection import parse_fields, full_projection, invalid_fields_response, InvalidFieldsError
+from utils.validation import ValidationError
+from utils.fx import (
+    BUDGET_AMOUNT_FIELDS, UnknownCurrencyError, unsupported_currency_response, currency_totals
+)
+from utils.audit import history_response
+from utils.singleflight import coalesced
 import json
 
 budget_bp = Blueprint('budget', __name__)
 
+# Values returned for projected fields that are missing on older documents
+BUDGET_DEFAULTS = {
+    'budgetName': '',
+    'projectId': '',
+    'projectName': '',
+    'totalBudget': 0,
+    'developmentCost': 0,
+    'designCost': 0,
+    'testingCost': 0,
+    'deploymentCost': 0,
+    'maintenanceCost': 0,
+    'thirdPartyCost': 0,
+    'currency': 'INR',
+    'notes': '',
+    'createdBy': '',
+}
+
+def serialize_budget(budget, projection):
+    budget_dict = {'id': str(budget['_id'])}
+    for field in projection:
+        if field == '_id':
+            continue
+        value = budget.get(field, BUDGET_DEFAULTS.get(field))
+        # Convert datetime to ISO format for JSON serialization
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif value is None and field in ('createdAt', 'updatedAt'):
+            continue
+        budget_dict[field] = value
+    return budget_dict
+
 @budget_bp.route('/', methods=['POST'])
 @jwt_required()
 def create_budget():
@@ -17,60 +55,17 @@ def create_budget():
         
         print("📥 Received budget data:", data)
         
-        # Enhanced Validation for software project budget
-        required_fields = ['budgetName', 'projectId', 'projectName', 'totalBudget']
-        missing_fields = []
-        
-        for field in required_fields:
-            if field not in data or data.get(field) is None or data.get(field) == '':
-                missing_fields.append(field)
-        
-        if missing_fields:
-            return jsonify({
-                "message": f"The following fields are required: {', '.join(missing_fields)}",
-                "error": "missing_fields",
-                "missing_fields": missing_fields
-            }), 400
+        # Validate and build the software project budget in one pass
+        try:
+            budget_data = budget_schema(data, user_id)
+        except ValidationError as e:
+            return e.response()
         
-        # Validate numeric fields
-        numeric_fields = [
-            'totalBudget', 'developmentCost', 'designCost', 
-            'testingCost', 'deploymentCost', 'maintenanceCost', 'thirdPartyCost'
-        ]
-        
-        for field in numeric_fields:
-            if field in data and data[field] is not None:
-                try:
-                    value = float(data[field])
-                    if value < 0:
-                        return jsonify({
-                            "message": f"{field} must be a positive number",
-                            "error": "invalid_amount"
-                        }), 400
-                except (ValueError, TypeError):
-                    return jsonify({
-                        "message": f"{field} must be a valid number",
-                        "error": "invalid_amount_format"
-                    }), 400
-        
-        # Create budget data for software project
-        budget_data = {
-            'budgetName': data['budgetName'].strip(),
-            'projectId': data['projectId'],
-            'projectName': data['projectName'],
-            'totalBudget': float(data['totalBudget']),
-            'developmentCost': float(data.get('developmentCost', 0)),
-            'designCost': float(data.get('designCost', 0)),
-            'testingCost': float(data.get('testingCost', 0)),
-            'deploymentCost': float(data.get('deploymentCost', 0)),
-            'maintenanceCost': float(data.get('maintenanceCost', 0)),
-            'thirdPartyCost': float(data.get('thirdPartyCost', 0)),
-            'currency': data.get('currency', 'INR'),
-            'notes': data.get('notes', ''),
-            'createdBy': user_id,
-            'createdAt': datetime.utcnow(),
-            'updatedAt': datetime.utcnow()
-        }
+        # Store the amounts converted to the base currency alongside the originals
+        try:
+            budget_data['base'] = request.current_app.fx.budget_base(budget_data)
+        except UnknownCurrencyError as e:
+            return unsupported_currency_response(e)
         
         print("💾 Saving budget data:", budget_data)
         
@@ -100,44 +95,22 @@ def get_budgets_by_project(project_id):
     try:
         user_id = get_jwt_identity()
         
+        try:
+            projection = parse_fields('budgets', request.args.get('fields'), default=full_projection('budgets'))
+        except InvalidFieldsError as e:
+            return invalid_fields_response(e)
+        
         print(f"📋 Fetching budgets for project: {project_id}, user: {user_id}")
         
         # Find all budgets for this project and user
-        budgets = list(request.current_app.db.budgets.find({
+        budgets = request.current_app.db.budgets.find({
             "projectId": project_id,
             "createdBy": user_id
-        }).sort("createdAt", -1))  # Sort by newest first
-        
-        print(f"✅ Found {len(budgets)} budgets")
-        print("📊 Budgets data:", budgets)
-        
-        # Convert budgets for JSON serialization
-        serialized_budgets = []
-        for budget in budgets:
-            budget_dict = {
-                'id': str(budget['_id']),
-                'budgetName': budget.get('budgetName', ''),
-                'projectId': budget.get('projectId', ''),
-                'projectName': budget.get('projectName', ''),
-                'totalBudget': budget.get('totalBudget', 0),
-                'developmentCost': budget.get('developmentCost', 0),
-                'designCost': budget.get('designCost', 0),
-                'testingCost': budget.get('testingCost', 0),
-                'deploymentCost': budget.get('deploymentCost', 0),
-                'maintenanceCost': budget.get('maintenanceCost', 0),
-                'thirdPartyCost': budget.get('thirdPartyCost', 0),
-                'currency': budget.get('currency', 'INR'),
-                'notes': budget.get('notes', ''),
-                'createdBy': budget.get('createdBy', ''),
-            }
-            
-            # Convert datetime to ISO format for JSON serialization
-            if 'createdAt' in budget and isinstance(budget['createdAt'], datetime):
-                budget_dict['createdAt'] = budget['createdAt'].isoformat()
-            if 'updatedAt' in budget and isinstance(budget['updatedAt'], datetime):
-                budget_dict['updatedAt'] = budget['updatedAt'].isoformat()
-            
-            serialized_budgets.append(budget_dict)
+        }, projection).sort("createdAt", -1)  # Sort by newest first
+        
+        serialized_budgets = [serialize_budget(budget, projection) for budget in budgets]
+        
+        print(f"✅ Found {len(serialized_budgets)} budgets")
         
         return jsonify({
             "message": "Budgets fetched successfully",
@@ -154,39 +127,21 @@ def get_budgets_by_project(project_id):
 
 @budget_bp.route('/', methods=['GET'])
 @jwt_required()
+@coalesced
 def get_all_budgets():
     try:
         user_id = get_jwt_identity()
         
-        budgets = list(request.current_app.db.budgets.find({
+        try:
+            projection = parse_fields('budgets', request.args.get('fields'), default=full_projection('budgets'))
+        except InvalidFieldsError as e:
+            return invalid_fields_response(e)
+        
+        budgets = request.current_app.db.budgets.find({
             "createdBy": user_id
-        }).sort("createdAt", -1))
-        
-        serialized_budgets = []
-        for budget in budgets:
-            budget_dict = {
-                'id': str(budget['_id']),
-                'budgetName': budget.get('budgetName', ''),
-                'projectId': budget.get('projectId', ''),
-                'projectName': budget.get('projectName', ''),
-                'totalBudget': budget.get('totalBudget', 0),
-                'developmentCost': budget.get('developmentCost', 0),
-                'designCost': budget.get('designCost', 0),
-                'testingCost': budget.get('testingCost', 0),
-                'deploymentCost': budget.get('deploymentCost', 0),
-                'maintenanceCost': budget.get('maintenanceCost', 0),
-                'thirdPartyCost': budget.get('thirdPartyCost', 0),
-                'currency': budget.get('currency', 'INR'),
-                'notes': budget.get('notes', ''),
-                'createdBy': budget.get('createdBy', ''),
-            }
-            
-            if 'createdAt' in budget and isinstance(budget['createdAt'], datetime):
-                budget_dict['createdAt'] = budget['createdAt'].isoformat()
-            if 'updatedAt' in budget and isinstance(budget['updatedAt'], datetime):
-                budget_dict['updatedAt'] = budget['updatedAt'].isoformat()
-            
-            serialized_budgets.append(budget_dict)
+        }, projection).sort("createdAt", -1)
+        
+        serialized_budgets = [serialize_budget(budget, projection) for budget in budgets]
         
         return jsonify({
             "message": "All budgets fetched successfully",
@@ -201,6 +156,30 @@ def get_all_budgets():
             "error": str(e)
         }), 500
 
+@budget_bp.route('/totals', methods=['GET'])
+@jwt_required()
+def get_budget_totals():
+    try:
+        user_id = get_jwt_identity()
+        
+        totals = currency_totals(
+            request.current_app.db.budgets, user_id, BUDGET_AMOUNT_FIELDS, request.current_app.fx.base_currency
+        )
+        totals['allocated'] = round(sum(totals[field] for field in BUDGET_AMOUNT_FIELDS if field != 'totalBudget'), 2)
+        totals['currency'] = request.current_app.fx.base_currency
+        
+        return jsonify({
+            "message": "Budget totals fetched successfully",
+            "totals": totals
+        }), 200
+        
+    except Exception as e:
+        print(f"❌ Error fetching budget totals: {str(e)}")
+        return jsonify({
+            "message": "Failed to fetch budget totals",
+            "error": str(e)
+        }), 500
+
 @budget_bp.route('/<budget_id>', methods=['PUT'])
 @jwt_required()
 def update_budget(budget_id):
@@ -220,30 +199,21 @@ def update_budget(budget_id):
                 "error": "not_found"
             }), 404
         
-        # Validate numeric fields if provided
-        numeric_fields = [
-            'totalBudget', 'developmentCost', 'designCost', 
-            'testingCost', 'deploymentCost', 'maintenanceCost', 'thirdPartyCost'
-        ]
-        
-        for field in numeric_fields:
-            if field in data and data[field] is not None:
-                try:
-                    value = float(data[field])
-                    if value < 0:
-                        return jsonify({
-                            "message": f"{field} must be a positive number",
-                            "error": "invalid_amount"
-                        }), 400
-                    data[field] = value
-                except (ValueError, TypeError):
-                    return jsonify({
-                        "message": f"{field} must be a valid number",
-                        "error": "invalid_amount_format"
-                    }), 400
+        # Validate provided fields, coercing numeric ones
+        try:
+            update_data = budget_validator.validate(data, partial=True)
+        except ValidationError as e:
+            return e.response()
+        
+        # Re-normalize when an amount or the currency changes
+        if any(field in update_data for field in BUDGET_AMOUNT_FIELDS + ['currency']):
+            try:
+                update_data["base"] = request.current_app.fx.budget_base({**existing_budget, **update_data})
+            except UnknownCurrencyError as e:
+                return unsupported_currency_response(e)
         
         # Update budget
-        update_data = {**data, "updatedAt": datetime.utcnow()}
+        update_data["updatedAt"] = datetime.utcnow()
         result = request.current_app.db.budgets.update_one(
             {"_id": ObjectId(budget_id)},
             {"$set": update_data}
@@ -255,6 +225,8 @@ def update_budget(budget_id):
                 "error": "no_changes"
             }), 400
         
+        request.current_app.audit.record_update('budgets', existing_budget, update_data, user_id)
+        
         # Return updated budget
         updated_budget = request.current_app.db.budgets.find_one({"_id": ObjectId(budget_id)})
         updated_budget['id'] = str(updated_budget['_id'])
@@ -281,17 +253,19 @@ def delete_budget(budget_id):
     try:
         user_id = get_jwt_identity()
         
-        result = request.current_app.db.budgets.delete_one({
+        deleted = request.current_app.db.budgets.find_one_and_delete({
             "_id": ObjectId(budget_id),
             "createdBy": user_id
         })
         
-        if result.deleted_count == 0:
+        if deleted is None:
             return jsonify({
                 "message": "Budget not found",
                 "error": "not_found"
             }), 404
         
+        request.current_app.audit.record_delete('budgets', deleted, user_id)
+        
         return jsonify({
             "message": "Budget deleted successfully"
         }), 200
@@ -300,4 +274,18 @@ def delete_budget(budget_id):
         return jsonify({
             "message": "Failed to delete budget",
             "error": str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+@budget_bp.route('/<budget_id>/history', methods=['GET'])
+@jwt_required()
+def get_budget_history(budget_id):
+    try:
+        user_id = get_jwt_identity()
+        
+        return history_response('budgets', budget_id, user_id)
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch budget history",
+            "error": str(e)
+        }), 500
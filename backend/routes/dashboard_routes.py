@@ -0,0 +1,136 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from utils.fx import BUDGET_AMOUNT_FIELDS, base_amount
+from utils.singleflight import coalesced
+from utils.archive import archive_name
+
+dashboard_bp = Blueprint('dashboard', __name__)
+
+# Shared pool for the per-collection aggregations. MongoClient is thread-safe,
+# so every query runs on its own pooled connection and the endpoint only waits
+# for the slowest one.
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='dashboard')
+
+# Follow-ups and deadlines this many days ahead count as due soon
+DUE_SOON_DAYS = 7
+
+def _lead_status_counts(leads, user_id):
+    # Archived (closed) leads still count towards the pipeline's outcome
+    pipeline = [
+        {"$match": {"createdBy": user_id}},
+        {"$unionWith": {"coll": archive_name('leads'), "pipeline": [{"$match": {"createdBy": user_id}}]}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]
+    by_status = {row['_id'] or 'Unknown': row['count'] for row in leads.aggregate(pipeline)}
+    return {"total": sum(by_status.values()), "byStatus": by_status}
+
+def _active_projects_by_priority(projects, user_id):
+    pipeline = [
+        {"$match": {"createdBy": user_id, "status": "Active"}},
+        {"$group": {"_id": "$priority", "count": {"$sum": 1}}}
+    ]
+    by_priority = {row['_id'] or 'Unknown': row['count'] for row in projects.aggregate(pipeline)}
+    return {"active": sum(by_priority.values()), "byPriority": by_priority}
+
+def _budget_totals(budgets, user_id):
+    group = {"_id": None, "count": {"$sum": 1}}
+    for field in BUDGET_AMOUNT_FIELDS:
+        group[field] = {"$sum": base_amount(field)}
+    pipeline = [
+        {"$match": {"createdBy": user_id}},
+        {"$group": group}
+    ]
+    rows = list(budgets.aggregate(pipeline))
+    totals = rows[0] if rows else {"count": 0}
+    totals.pop('_id', None)
+    for field in BUDGET_AMOUNT_FIELDS:
+        totals.setdefault(field, 0)
+    totals['allocated'] = sum(totals[field] for field in BUDGET_AMOUNT_FIELDS if field != 'totalBudget')
+    return totals
+
+def _recent_payment_totals(payments, user_id, since):
+    pipeline = [
+        {"$match": {"createdBy": user_id, "createdAt": {"$gte": since}}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}, "amount": {"$sum": base_amount('amount')}}}
+    ]
+    by_status = {
+        row['_id'] or 'Unknown': {"count": row['count'], "amount": row['amount']}
+        for row in payments.aggregate(pipeline)
+    }
+    return {
+        "since": since.isoformat(),
+        "count": sum(row['count'] for row in by_status.values()),
+        "amount": sum(row['amount'] for row in by_status.values()),
+        "byStatus": by_status
+    }
+
+def _due_dates(collection, user_id, field, today, extra=None):
+    # Range counts on a typed date field, served by the (createdBy, field) index
+    query = dict(extra or {}, createdBy=user_id)
+    soon = today + timedelta(days=DUE_SOON_DAYS)
+    return {
+        "overdue": collection.count_documents(dict(query, **{field: {"$lt": today}})),
+        "dueSoon": collection.count_documents(dict(query, **{field: {"$gte": today, "$lt": soon}})),
+        "days": DUE_SOON_DAYS
+    }
+
+@dashboard_bp.route('/', methods=['GET'])
+@jwt_required()
+@coalesced
+def get_dashboard():
+    try:
+        user_id = get_jwt_identity()
+        app = request.current_app
+
+        try:
+            days = int(request.args.get('days', 30))
+            if days <= 0:
+                raise ValueError("days must be positive")
+        except (ValueError, TypeError):
+            return jsonify({
+                "message": "days must be a positive integer",
+                "error": "invalid_days"
+            }), 400
+
+        now = datetime.utcnow()
+        since = now - timedelta(days=days)
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        db = app.db
+
+        # Resolve collections on the request thread, then fan the queries out
+        futures = {
+            "leads": _executor.submit(_lead_status_counts, db.leads, user_id),
+            "projects": _executor.submit(_active_projects_by_priority, db.projects, user_id),
+            "budgets": _executor.submit(_budget_totals, db.budgets, user_id),
+            "payments": _executor.submit(_recent_payment_totals, db.payments, user_id, since),
+            "followUps": _executor.submit(_due_dates, db.leads, user_id, 'nextFollowUp', today),
+            "deadlines": _executor.submit(
+                _due_dates, db.projects, user_id, 'deadline', today, {"status": "Active"}
+            )
+        }
+
+        # One deadline for the whole fan-out, not one per query
+        _, not_done = wait(futures.values(), timeout=app.config.get('DASHBOARD_QUERY_TIMEOUT', 10))
+        if not_done:
+            for future in not_done:
+                future.cancel()
+            late = [name for name, future in futures.items() if future in not_done]
+            raise TimeoutError(f"Dashboard queries timed out: {', '.join(late)}")
+        dashboard = {name: future.result() for name, future in futures.items()}
+        # Amounts are summed from the stored base-currency values
+        dashboard['currency'] = app.fx.base_currency
+
+        return jsonify({
+            "message": "Dashboard fetched successfully",
+            "dashboard": dashboard
+        }), 200
+
+    except Exception as e:
+        print(f"❌ Error fetching dashboard: {str(e)}")
+        return jsonify({
+            "message": "Failed to fetch dashboard",
+            "error": str(e)
+        }), 500
@@ -0,0 +1,98 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from bson.errors import InvalidId
+
+from utils.jobs import serialize_job, FINISHED_STATUSES, CANCELLED
+
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.route('/', methods=['GET'])
+@jwt_required()
+def get_jobs():
+    try:
+        user_id = get_jwt_identity()
+
+        query = {"createdBy": user_id}
+        if request.args.get('status'):
+            query['status'] = request.args['status']
+        if request.args.get('type'):
+            query['type'] = request.args['type']
+
+        jobs = request.current_app.db.jobs.find(query).sort("createdAt", -1).limit(50)
+        serialized_jobs = [serialize_job(job) for job in jobs]
+
+        return jsonify({
+            "message": "Jobs fetched successfully",
+            "jobs": serialized_jobs,
+            "count": len(serialized_jobs)
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch jobs",
+            "error": str(e)
+        }), 500
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    try:
+        user_id = get_jwt_identity()
+
+        try:
+            job = request.current_app.jobs.get(job_id, user_id)
+        except InvalidId:
+            job = None
+
+        if not job:
+            return jsonify({
+                "message": "Job not found",
+                "error": "not_found"
+            }), 404
+
+        response = jsonify({"job": serialize_job(job)})
+        if job['status'] not in FINISHED_STATUSES:
+            # Hint for pollers
+            response.headers['Retry-After'] = '1'
+        return response, 200
+
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch job",
+            "error": str(e)
+        }), 500
+
+@jobs_bp.route('/<job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_job(job_id):
+    try:
+        user_id = get_jwt_identity()
+
+        try:
+            job = request.current_app.jobs.cancel(job_id, user_id)
+        except InvalidId:
+            job = None
+
+        if not job:
+            return jsonify({
+                "message": "Job not found",
+                "error": "not_found"
+            }), 404
+
+        if job['status'] in FINISHED_STATUSES and job['status'] != CANCELLED:
+            return jsonify({
+                "message": f"Job already {job['status']}",
+                "error": "job_finished",
+                "job": serialize_job(job)
+            }), 409
+
+        return jsonify({
+            "message": "Job cancelled" if job['status'] == CANCELLED else "Cancellation requested",
+            "job": serialize_job(job)
+        }), 202
+
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to cancel job",
+            "error": str(e)
+        }), 500
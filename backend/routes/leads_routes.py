@@ -4,37 +4,61 @@ from bson import ObjectId
 from datetime import datetime
 import json
 
+from models import lead_schema, lead_validator, JSONEncoder
+from utils.projection import parse_fields, invalid_fields_response, InvalidFieldsError
+from utils.validation import ValidationError
+from utils.idempotency import idempotent
+from utils.attachments import upload_response, download_response, delete_response
+from utils.dedupe import find_duplicates, backfill_keys, find_clusters, merge_cluster, blocking_keys, KEY_FIELDS
+from utils.jobs import job_handler, job_accepted_response
+from utils.tenancy import owner_database
+from utils.scoring import score_lead, rescore_leads
+from utils.audit import history_response
+from utils.singleflight import coalesced
+from utils.archive import include_archived, tiered_pipeline, is_archived, archived_response, restore_document
+
 leads_bp = Blueprint('leads', __name__)
 
-class JSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, ObjectId):
-            return str(o)
-        if isinstance(o, datetime):
-            return o.isoformat()
-        return json.JSONEncoder.default(self, o)
+# Internal blocking keys are not part of the API representation of a lead
+HIDDEN_FIELDS = {"dedupeKeys": 0}
+
+# ?sort= values for the lead list; the _id tie-break runs the same way as the
+# leading key so one index walk provides the whole order
+SORT_ORDERS = {
+    'score': [("score", -1), ("_id", -1)],
+    'createdAt': [("createdAt", -1), ("_id", -1)],
+}
+
+@job_handler('lead_rescore', concurrency=1, max_attempts=2, tenant=True)
+def run_lead_rescore_job(ctx):
+    leads = owner_database(ctx.db, ctx.user_id).leads
+    scored, changed = rescore_leads(leads, ctx.user_id, progress=lambda done, total: ctx.progress(done, total, "leads"))
+    return {"scored": scored, "changed": changed}
+
+@job_handler('lead_dedupe', concurrency=1, max_attempts=2, tenant=True)
+def run_lead_dedupe_job(ctx):
+    leads = owner_database(ctx.db, ctx.user_id).leads
+    backfilled = backfill_keys(leads, ctx.user_id, progress=lambda done: ctx.progress(done, message="keys"))
+    clusters, stats = find_clusters(
+        leads, ctx.user_id, match_names=ctx.params.get('matchNames', False),
+        progress=lambda done: ctx.progress(done, message="blocks")
+    )
+    result = dict(stats, keysBackfilled=backfilled, clusters=len(clusters), merged=0,
+                  dryRun=ctx.params.get('dryRun', False))
+    if result['dryRun']:
+        result['sample'] = [[str(_id) for _id in cluster] for cluster in clusters[:20]]
+        return result
 
-def lead_schema(lead_data, user_id):
-    return {
-        "name": lead_data.get('name'),
-        "email": lead_data.get('email'),
-        "mobile": lead_data.get('mobile'),
-        "address": lead_data.get('address'),
-        "company": lead_data.get('company'),
-        "designation": lead_data.get('designation'),
-        "source": lead_data.get('source'),
-        "notes": lead_data.get('notes'),
-        "status": lead_data.get('status', 'New'),
-        "nextFollowUp": lead_data.get('nextFollowUp'),
-        "assignedTo": lead_data.get('assignedTo', 'Not Assigned'),
-        "createdBy": user_id,
-        "fileName": lead_data.get('fileName'),
-        "createdAt": datetime.utcnow(),
-        "updatedAt": datetime.utcnow()
-    }
+    for done, cluster in enumerate(clusters, 1):
+        for survivor, removed in merge_cluster(leads, ctx.user_id, cluster, ctx.params.get('matchNames', False)):
+            ctx.app.attachments.reparent(ctx.user_id, 'leads', [str(_id) for _id in removed], str(survivor))
+            result['merged'] += len(removed)
+        ctx.progress(done, len(clusters), "clusters")
+    return result
 
 @leads_bp.route('/', methods=['POST'])
 @jwt_required(optional=True)
+@idempotent
 def create_lead():
     try:
         user_id = get_jwt_identity()
@@ -44,30 +68,32 @@ def create_lead():
         data = request.get_json()
         print("📨 Received lead creation data:", data)
         
-        # Validation
-        required_fields = ['name', 'mobile', 'email']
-        for field in required_fields:
-            if not data.get(field):
-                print(f"❌ Missing field: {field}")
-                return jsonify({
-                    "message": f"{field} is required",
-                    "error": "missing_fields"
-                }), 400
-        
-        # Create lead
-        lead_data = lead_schema(data, user_id)
+        # Validate and create lead
+        try:
+            lead_data = lead_schema(data, user_id)
+        except ValidationError as e:
+            print(f"❌ Invalid lead: {e.message}")
+            return e.response()
+        
         print("📝 Creating lead with data:", {k: v for k, v in lead_data.items() if k != 'password'})
         
-        result = request.current_app.db.leads.insert_one(lead_data)
+        # Warn about, but still accept, leads that look like existing ones
+        duplicates = find_duplicates(request.current_app.db.leads, user_id, lead_data)
+        
+        result = request.current_app.writes.insert_one(request.current_app.db.leads, lead_data)
         print(f"✅ Lead created with ID: {result.inserted_id}")
         
         lead_data['_id'] = result.inserted_id
         lead_data['id'] = str(result.inserted_id)
+        lead_data.pop('dedupeKeys', None)
         
-        return jsonify({
+        response = {
             "message": "Lead created successfully",
             "lead": json.loads(JSONEncoder().encode(lead_data))
-        }), 201
+        }
+        if duplicates:
+            response['possibleDuplicates'] = duplicates
+        return jsonify(response), 201
         
     except Exception as e:
         print("❌ Lead creation error:", str(e))
@@ -80,13 +106,37 @@ def create_lead():
 
 @leads_bp.route('/', methods=['GET'])
 @jwt_required(optional=True)
+@coalesced
 def get_leads():
     try:
         user_id = get_jwt_identity()
         if not user_id:
             user_id = "dev_user_001"
+        
+        try:
+            projection = parse_fields('leads', request.args.get('fields'), default=HIDDEN_FIELDS)
+        except InvalidFieldsError as e:
+            return invalid_fields_response(e)
+        
+        sort = request.args.get('sort')
+        if sort and sort not in SORT_ORDERS:
+            return jsonify({
+                "message": f"sort must be one of: {', '.join(SORT_ORDERS)}",
+                "error": "invalid_sort"
+            }), 400
             
-        leads = list(request.current_app.db.leads.find({"createdBy": user_id}))
+        db = request.current_app.db
+        if include_archived(request.args):
+            pipeline = tiered_pipeline(
+                'leads', {"createdBy": user_id}, projection, archived=True,
+                sort=dict(SORT_ORDERS[sort]) if sort else None
+            )
+            leads = list(db.leads.aggregate(pipeline, allowDiskUse=True))
+        else:
+            cursor = db.leads.find({"createdBy": user_id}, projection)
+            if sort:
+                cursor = cursor.sort(SORT_ORDERS[sort])
+            leads = list(cursor)
         
         for lead in leads:
             lead['id'] = str(lead['_id'])
@@ -122,20 +172,26 @@ def update_lead(lead_id):
         })
         
         if not existing_lead:
+            if is_archived(request.current_app.db, 'leads', lead_id, user_id):
+                return archived_response("Lead")
             print(f"❌ Lead {lead_id} not found for user {user_id}")
             return jsonify({
                 "message": "Lead not found",
                 "error": "not_found"
             }), 404
         
-        # Prepare update data - only update provided fields
-        update_data = {"updatedAt": datetime.utcnow()}
-        
-        # Only update fields that are provided in the request
-        updatable_fields = ['status', 'nextFollowUp', 'assignedTo', 'notes', 'source']
-        for field in updatable_fields:
-            if field in data:
-                update_data[field] = data[field]
+        # Prepare update data - only updatable fields that are provided
+        try:
+            update_data = lead_validator.validate(data, partial=True)
+        except ValidationError as e:
+            return e.response()
+        update_data["updatedAt"] = datetime.utcnow()
+        # Rescore just this lead from its stored fields plus the changes
+        update_data["score"] = score_lead({**existing_lead, **update_data}, update_data["updatedAt"])
+        update_data["scoredAt"] = update_data["updatedAt"]
+        # Stale keys would let the dedupe job merge this lead into one it no longer matches
+        if any(field in update_data for field in KEY_FIELDS):
+            update_data["dedupeKeys"] = blocking_keys({**existing_lead, **update_data})
         
         print(f"📝 Final update data for lead {lead_id}:", update_data)
         
@@ -154,8 +210,10 @@ def update_lead(lead_id):
                 "error": "no_changes"
             }), 400
         
+        request.current_app.audit.record_update('leads', existing_lead, update_data, user_id)
+        
         # Return updated lead
-        updated_lead = request.current_app.db.leads.find_one({"_id": ObjectId(lead_id)})
+        updated_lead = request.current_app.db.leads.find_one({"_id": ObjectId(lead_id)}, HIDDEN_FIELDS)
         updated_lead['id'] = str(updated_lead['_id'])
         
         print(f"✅ Lead {lead_id} updated successfully")
@@ -182,17 +240,22 @@ def delete_lead(lead_id):
         if not user_id:
             user_id = "dev_user_001"
             
-        result = request.current_app.db.leads.delete_one({
+        deleted = request.current_app.db.leads.find_one_and_delete({
             "_id": ObjectId(lead_id),
             "createdBy": user_id
         })
         
-        if result.deleted_count == 0:
+        if deleted is None:
+            if is_archived(request.current_app.db, 'leads', lead_id, user_id):
+                return archived_response("Lead")
             return jsonify({
                 "message": "Lead not found",
                 "error": "not_found"
             }), 404
         
+        request.current_app.audit.record_delete('leads', deleted, user_id)
+        request.current_app.attachments.delete_for(user_id, 'leads', lead_id)
+        
         return jsonify({
             "message": "Lead deleted successfully"
         }), 200
@@ -203,6 +266,138 @@ def delete_lead(lead_id):
             "error": str(e)
         }), 500
 
+@leads_bp.route('/<lead_id>/file', methods=['PUT'])
+@jwt_required(optional=True)
+def upload_lead_file(lead_id):
+    try:
+        user_id = get_jwt_identity()
+        if not user_id:
+            user_id = "dev_user_001"
+        
+        return upload_response('leads', lead_id, user_id, 'fileName')
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to upload file",
+            "error": str(e)
+        }), 500
+
+@leads_bp.route('/<lead_id>/file', methods=['GET'])
+@jwt_required(optional=True)
+def download_lead_file(lead_id):
+    try:
+        user_id = get_jwt_identity()
+        if not user_id:
+            user_id = "dev_user_001"
+        
+        return download_response('leads', lead_id, user_id)
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to download file",
+            "error": str(e)
+        }), 500
+
+@leads_bp.route('/<lead_id>/file', methods=['DELETE'])
+@jwt_required(optional=True)
+def delete_lead_file(lead_id):
+    try:
+        user_id = get_jwt_identity()
+        if not user_id:
+            user_id = "dev_user_001"
+        
+        return delete_response('leads', lead_id, user_id, 'fileName')
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to delete file",
+            "error": str(e)
+        }), 500
+
+@leads_bp.route('/dedupe', methods=['POST'])
+@jwt_required(optional=True)
+def dedupe_leads():
+    try:
+        user_id = get_jwt_identity()
+        if not user_id:
+            user_id = "dev_user_001"
+        
+        data = request.get_json(silent=True) or {}
+        job = request.current_app.jobs.submit('lead_dedupe', {
+            "dryRun": bool(data.get('dryRun', False)),
+            "matchNames": bool(data.get('matchNames', False))
+        }, user_id)
+        
+        return job_accepted_response(job, "Lead de-duplication started")
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to start lead de-duplication",
+            "error": str(e)
+        }), 500
+
+@leads_bp.route('/rescore', methods=['POST'])
+@jwt_required(optional=True)
+def rescore_all_leads():
+    try:
+        user_id = get_jwt_identity()
+        if not user_id:
+            user_id = "dev_user_001"
+        
+        job = request.current_app.jobs.submit('lead_rescore', {}, user_id)
+        
+        return job_accepted_response(job, "Lead rescoring started")
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to start lead rescoring",
+            "error": str(e)
+        }), 500
+
+@leads_bp.route('/<lead_id>/restore', methods=['POST'])
+@jwt_required(optional=True)
+def restore_lead(lead_id):
+    try:
+        user_id = get_jwt_identity()
+        if not user_id:
+            user_id = "dev_user_001"
+        
+        lead = restore_document(request.current_app.db, 'leads', lead_id, user_id)
+        if lead is None:
+            return jsonify({
+                "message": "Archived lead not found",
+                "error": "not_found"
+            }), 404
+        lead['id'] = str(lead['_id'])
+        lead.pop('dedupeKeys', None)
+        
+        return jsonify({
+            "message": "Lead restored successfully",
+            "lead": json.loads(JSONEncoder().encode(lead))
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to restore lead",
+            "error": str(e)
+        }), 500
+
+@leads_bp.route('/<lead_id>/history', methods=['GET'])
+@jwt_required(optional=True)
+def get_lead_history(lead_id):
+    try:
+        user_id = get_jwt_identity()
+        if not user_id:
+            user_id = "dev_user_001"
+        
+        return history_response('leads', lead_id, user_id)
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch lead history",
+            "error": str(e)
+        }), 500
+
 # Route to initialize sample data
 @leads_bp.route('/initialize-sample', methods=['POST'])
 @jwt_required(optional=True)
@@ -241,13 +436,12 @@ def initialize_sample_data():
             }
         ]
         
-        created_leads = []
-        for sample_lead in sample_leads:
-            lead_data = lead_schema(sample_lead, user_id)
-            result = request.current_app.db.leads.insert_one(lead_data)
-            lead_data['_id'] = result.inserted_id
-            lead_data['id'] = str(result.inserted_id)
-            created_leads.append(lead_data)
+        created_leads = [lead_schema(sample_lead, user_id) for sample_lead in sample_leads]
+        result = request.current_app.db.leads.insert_many(created_leads)
+        for lead_data, inserted_id in zip(created_leads, result.inserted_ids):
+            lead_data['_id'] = inserted_id
+            lead_data['id'] = str(inserted_id)
+            lead_data.pop('dedupeKeys', None)
         
         return jsonify({
             "message": "Sample data initialized successfully",
@@ -1,46 +1,68 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
+from pymongo import ReturnDocument
 from datetime import datetime
 
-from models import payment_schema, JSONEncoder
+from models import payment_schema, payment_validator, JSONEncoder
+from utils.validation import ValidationError
+from utils.idempotency import idempotent
+from utils.projection import parse_fields, invalid_fields_response, InvalidFieldsError
+from utils.fx import UnknownCurrencyError, unsupported_currency_response, currency_totals
+from utils.ledger import (
+    CUSTOMER_SORTS, customer_key, ledger_guard, record_payment, remove_payment, move_payment, serialize_ledger,
+    rebuild_ledger
+)
+from utils.jobs import job_handler, job_accepted_response
+from utils.tenancy import owner_database
+from utils.audit import history_response
+from utils.singleflight import coalesced
+from utils.archive import (
+    archive_name, include_archived, tiered_pipeline, is_archived, archived_response, restore_document
+)
 import json
 
 payment_bp = Blueprint('payments', __name__)
 
+# Most recent payments listed on a customer statement
+STATEMENT_PAYMENTS = 50
+
+# Reads of a payment before an update gives up on concurrent writers
+UPDATE_ATTEMPTS = 3
+
+@job_handler('ledger_rebuild', concurrency=1, max_attempts=2, tenant=True)
+def run_ledger_rebuild_job(ctx):
+    customers = rebuild_ledger(
+        owner_database(ctx.db, ctx.user_id), ctx.user_id,
+        progress=lambda done, total: ctx.progress(done, total, "customers")
+    )
+    return {"customers": customers}
+
 @payment_bp.route('/', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_payment():
     try:
         user_id = get_jwt_identity()
         data = request.get_json()
         
-        # Validation
-        required_fields = ['customer', 'amount', 'date']
-        for field in required_fields:
-            if not data.get(field):
-                return jsonify({
-                    "message": f"{field} is required",
-                    "error": "missing_fields"
-                }), 400
+        # Validate and create payment
+        try:
+            payment_data = payment_schema(data, user_id)
+        except ValidationError as e:
+            return e.response()
         
-        # Validate amount
+        # Store the amount converted to the base currency at the payment date's rate
         try:
-            amount = float(data['amount'])
-            if amount <= 0:
-                raise ValueError("Amount must be positive")
-        except (ValueError, TypeError):
-            return jsonify({
-                "message": "Amount must be a valid positive number",
-                "error": "invalid_amount"
-            }), 400
+            payment_data['base'] = request.current_app.fx.payment_base(payment_data)
+        except UnknownCurrencyError as e:
+            return unsupported_currency_response(e)
         
-        # Create payment
-        payment_data = payment_schema(data, user_id)
-        result = request.current_app.db.payments.insert_one(payment_data)
+        result = request.current_app.writes.insert_one(request.current_app.db.payments, payment_data)
         
         payment_data['_id'] = result.inserted_id
         payment_data['id'] = str(result.inserted_id)
+        record_payment(request.current_app.db, user_id, payment_data)
         
         return jsonify({
             "message": "Payment recorded successfully",
@@ -55,10 +77,23 @@ def create_payment():
 
 @payment_bp.route('/', methods=['GET'])
 @jwt_required()
+@coalesced
 def get_payments():
     try:
         user_id = get_jwt_identity()
-        payments = list(request.current_app.db.payments.find({"createdBy": user_id}))
+        
+        try:
+            projection = parse_fields('payments', request.args.get('fields'))
+        except InvalidFieldsError as e:
+            return invalid_fields_response(e)
+        
+        db = request.current_app.db
+        if include_archived(request.args):
+            payments = list(db.payments.aggregate(
+                tiered_pipeline('payments', {"createdBy": user_id}, projection, archived=True)
+            ))
+        else:
+            payments = list(db.payments.find({"createdBy": user_id}, projection))
         
         for payment in payments:
             payment['id'] = str(payment['_id'])
@@ -73,53 +108,87 @@ def get_payments():
             "error": str(e)
         }), 500
 
-@payment_bp.route('/<payment_id>', methods=['PUT'])
+@payment_bp.route('/totals', methods=['GET'])
 @jwt_required()
-def update_payment(payment_id):
+def get_payment_totals():
     try:
         user_id = get_jwt_identity()
-        data = request.get_json()
         
-        # Check if payment exists and belongs to user
-        existing_payment = request.current_app.db.payments.find_one({
-            "_id": ObjectId(payment_id),
-            "createdBy": user_id
-        })
+        # Lifetime totals, so archived payments count too
+        totals = currency_totals(
+            request.current_app.db.payments, user_id, ['amount'], request.current_app.fx.base_currency,
+            union=archive_name('payments')
+        )
+        totals['currency'] = request.current_app.fx.base_currency
         
-        if not existing_payment:
-            return jsonify({
-                "message": "Payment not found",
-                "error": "not_found"
-            }), 404
+        return jsonify({
+            "message": "Payment totals fetched successfully",
+            "totals": totals
+        }), 200
         
-        # Validate amount if provided
-        if 'amount' in data:
-            try:
-                amount = float(data['amount'])
-                if amount <= 0:
-                    raise ValueError("Amount must be positive")
-            except (ValueError, TypeError):
-                return jsonify({
-                    "message": "Amount must be a valid positive number",
-                    "error": "invalid_amount"
-                }), 400
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch payment totals",
+            "error": str(e)
+        }), 500
+
+@payment_bp.route('/<payment_id>', methods=['PUT'])
+@jwt_required()
+def update_payment(payment_id):
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json()
         
         # Update payment
-        update_data = {**data, "updatedAt": datetime.utcnow()}
-        result = request.current_app.db.payments.update_one(
-            {"_id": ObjectId(payment_id)},
-            {"$set": update_data}
-        )
+        try:
+            update_data = payment_validator.validate(data, partial=True)
+        except ValidationError as e:
+            return e.response()
         
-        if result.modified_count == 0:
+        payments = request.current_app.db.payments
+        query = {"_id": ObjectId(payment_id), "createdBy": user_id}
+        for _ in range(UPDATE_ATTEMPTS):
+            # Check if payment exists and belongs to user
+            existing_payment = payments.find_one(query)
+            
+            if not existing_payment:
+                if is_archived(request.current_app.db, 'payments', payment_id, user_id):
+                    return archived_response("Payment")
+                return jsonify({
+                    "message": "Payment not found",
+                    "error": "not_found"
+                }), 404
+            
+            changes = dict(update_data)
+            # Re-normalize when the amount, currency or date (and so the rate) changes
+            if any(field in changes for field in ('amount', 'currency', 'date')):
+                try:
+                    changes["base"] = request.current_app.fx.payment_base({**existing_payment, **changes})
+                except UnknownCurrencyError as e:
+                    return unsupported_currency_response(e)
+            if 'customer' in changes or not existing_payment.get('customerKey'):
+                changes["customerKey"] = customer_key(changes.get('customer', existing_payment.get('customer')))
+            changes["updatedAt"] = datetime.utcnow()
+            
+            # Only while the fields the ledger change is computed from are as read
+            previous = payments.find_one_and_update(
+                dict(query, **ledger_guard(existing_payment)),
+                {"$set": changes},
+                return_document=ReturnDocument.BEFORE
+            )
+            if previous is not None:
+                break
+        else:
             return jsonify({
-                "message": "No changes made to payment",
-                "error": "no_changes"
-            }), 400
+                "message": "Payment is being changed by another request, please retry",
+                "error": "conflict"
+            }), 409
         
-        # Return updated payment
-        updated_payment = request.current_app.db.payments.find_one({"_id": ObjectId(payment_id)})
+        # The ledger moves by what this write changed, taken from the pre-image it replaced
+        updated_payment = {**previous, **changes}
+        move_payment(request.current_app.db, user_id, previous, updated_payment)
         updated_payment['id'] = str(updated_payment['_id'])
+        request.current_app.audit.record_update('payments', previous, changes, user_id)
         
         return jsonify({
             "message": "Payment updated successfully",
@@ -138,17 +207,22 @@ def delete_payment(payment_id):
     try:
         user_id = get_jwt_identity()
         
-        result = request.current_app.db.payments.delete_one({
+        deleted = request.current_app.db.payments.find_one_and_delete({
             "_id": ObjectId(payment_id),
             "createdBy": user_id
         })
         
-        if result.deleted_count == 0:
+        if deleted is None:
+            if is_archived(request.current_app.db, 'payments', payment_id, user_id):
+                return archived_response("Payment")
             return jsonify({
                 "message": "Payment not found",
                 "error": "not_found"
             }), 404
         
+        remove_payment(request.current_app.db, user_id, deleted)
+        request.current_app.audit.record_delete('payments', deleted, user_id)
+        
         return jsonify({
             "message": "Payment deleted successfully"
         }), 200
@@ -157,4 +231,128 @@ def delete_payment(payment_id):
         return jsonify({
             "message": "Failed to delete payment",
             "error": str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+@payment_bp.route('/<payment_id>/restore', methods=['POST'])
+@jwt_required()
+def restore_payment(payment_id):
+    try:
+        user_id = get_jwt_identity()
+        
+        payment = restore_document(request.current_app.db, 'payments', payment_id, user_id)
+        if payment is None:
+            return jsonify({
+                "message": "Archived payment not found",
+                "error": "not_found"
+            }), 404
+        payment['id'] = str(payment['_id'])
+        
+        return jsonify({
+            "message": "Payment restored successfully",
+            "payment": json.loads(JSONEncoder().encode(payment))
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to restore payment",
+            "error": str(e)
+        }), 500
+
+@payment_bp.route('/<payment_id>/history', methods=['GET'])
+@jwt_required()
+def get_payment_history(payment_id):
+    try:
+        user_id = get_jwt_identity()
+        
+        return history_response('payments', payment_id, user_id)
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch payment history",
+            "error": str(e)
+        }), 500
+
+@payment_bp.route('/customers', methods=['GET'])
+@jwt_required()
+def get_customers():
+    try:
+        user_id = get_jwt_identity()
+        
+        sort = request.args.get('sort', 'total')
+        if sort not in CUSTOMER_SORTS:
+            return jsonify({
+                "message": f"sort must be one of: {', '.join(CUSTOMER_SORTS)}",
+                "error": "invalid_sort"
+            }), 400
+        try:
+            limit = min(max(int(request.args.get('limit', 20)), 1), 200)
+        except ValueError:
+            return jsonify({
+                "message": "limit must be an integer",
+                "error": "invalid_limit"
+            }), 400
+        
+        entries = request.current_app.db.customer_ledger.find({"createdBy": user_id}).sort(
+            [(CUSTOMER_SORTS[sort], -1), ("customerKey", 1)]
+        ).limit(limit)
+        
+        return jsonify({
+            "customers": json.loads(JSONEncoder().encode([serialize_ledger(entry) for entry in entries])),
+            "currency": request.current_app.fx.base_currency
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch customers",
+            "error": str(e)
+        }), 500
+
+@payment_bp.route('/customers/<customer>/statement', methods=['GET'])
+@jwt_required()
+def get_customer_statement(customer):
+    try:
+        user_id = get_jwt_identity()
+        key = customer_key(customer)
+        
+        entry = request.current_app.db.customer_ledger.find_one({"createdBy": user_id, "customerKey": key})
+        if not entry:
+            return jsonify({
+                "message": "Customer not found",
+                "error": "not_found"
+            }), 404
+        
+        payments = list(request.current_app.db.payments.aggregate(tiered_pipeline(
+            'payments', {"createdBy": user_id, "customerKey": key},
+            {"customer": 1, "date": 1, "amount": 1, "currency": 1, "base": 1, "status": 1},
+            archived=include_archived(request.args), sort={"date": -1, "_id": -1}, limit=STATEMENT_PAYMENTS
+        )))
+        for payment in payments:
+            payment['id'] = str(payment['_id'])
+        
+        return jsonify({
+            "customer": json.loads(JSONEncoder().encode(serialize_ledger(entry))),
+            "payments": json.loads(JSONEncoder().encode(payments)),
+            "currency": request.current_app.fx.base_currency
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch customer statement",
+            "error": str(e)
+        }), 500
+
+@payment_bp.route('/customers/rebuild', methods=['POST'])
+@jwt_required()
+def rebuild_customer_ledger():
+    try:
+        user_id = get_jwt_identity()
+        
+        job = request.current_app.jobs.submit('ledger_rebuild', {}, user_id)
+        
+        return job_accepted_response(job, "Customer ledger rebuild started")
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to start customer ledger rebuild",
+            "error": str(e)
+        }), 500
@@ -3,29 +3,49 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 from datetime import datetime
 
-from models import project_schema, JSONEncoder
+from models import project_schema, project_validator, JSONEncoder
+from utils.validation import ValidationError
+from utils.idempotency import idempotent
+from utils.projection import parse_fields, invalid_fields_response, InvalidFieldsError
+from utils.jobs import job_handler, serialize_job
+from utils.attachments import upload_response, download_response, delete_response
+from utils.audit import history_response
+from utils.singleflight import coalesced
 import json
 
 projects_bp = Blueprint('projects', __name__)
 
+# Documents removed per batch when cleaning up after a deleted project
+CLEANUP_BATCH_SIZE = 500
+
+@job_handler('project_cleanup', concurrency=2, max_attempts=3, tenant=True)
+def run_project_cleanup_job(ctx):
+    query = {"projectId": ctx.params['projectId'], "createdBy": ctx.user_id}
+    total = ctx.db.budgets.count_documents(query)
+    deleted = 0
+    while True:
+        ids = [doc['_id'] for doc in ctx.db.budgets.find(query, {"_id": 1}).limit(CLEANUP_BATCH_SIZE)]
+        if not ids:
+            break
+        deleted += ctx.db.budgets.delete_many(dict(query, _id={"$in": ids})).deleted_count
+        ctx.progress(deleted, max(total, deleted), "budgets")
+    files = ctx.app.attachments.delete_for(ctx.user_id, 'projects', ctx.params['projectId'])
+    return {"budgets": deleted, "attachments": files}
+
 @projects_bp.route('/', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_project():
     try:
         user_id = get_jwt_identity()
         data = request.get_json()
         
-        # Validation
-        required_fields = ['projectName', 'deadline']
-        for field in required_fields:
-            if not data.get(field):
-                return jsonify({
-                    "message": f"{field} is required",
-                    "error": "missing_fields"
-                }), 400
-        
-        # Create project
-        project_data = project_schema(data, user_id)
+        # Validate and create project
+        try:
+            project_data = project_schema(data, user_id)
+        except ValidationError as e:
+            return e.response()
+        
         result = request.current_app.db.projects.insert_one(project_data)
         
         project_data['_id'] = result.inserted_id
@@ -44,10 +64,17 @@ def create_project():
 
 @projects_bp.route('/', methods=['GET'])
 @jwt_required()
+@coalesced
 def get_projects():
     try:
         user_id = get_jwt_identity()
-        projects = list(request.current_app.db.projects.find({"createdBy": user_id}))
+        
+        try:
+            projection = parse_fields('projects', request.args.get('fields'))
+        except InvalidFieldsError as e:
+            return invalid_fields_response(e)
+        
+        projects = list(request.current_app.db.projects.find({"createdBy": user_id}, projection))
         
         for project in projects:
             project['id'] = str(project['_id'])
@@ -67,10 +94,16 @@ def get_projects():
 def get_project(project_id):
     try:
         user_id = get_jwt_identity()
+        
+        try:
+            projection = parse_fields('projects', request.args.get('fields'))
+        except InvalidFieldsError as e:
+            return invalid_fields_response(e)
+        
         project = request.current_app.db.projects.find_one({
             "_id": ObjectId(project_id),
             "createdBy": user_id
-        })
+        }, projection)
         
         if not project:
             return jsonify({
@@ -110,7 +143,11 @@ def update_project(project_id):
             }), 404
         
         # Update project
-        update_data = {**data, "updatedAt": datetime.utcnow()}
+        try:
+            update_data = project_validator.validate(data, partial=True)
+        except ValidationError as e:
+            return e.response()
+        update_data["updatedAt"] = datetime.utcnow()
         result = request.current_app.db.projects.update_one(
             {"_id": ObjectId(project_id)},
             {"$set": update_data}
@@ -122,6 +159,8 @@ def update_project(project_id):
                 "error": "no_changes"
             }), 400
         
+        request.current_app.audit.record_update('projects', existing_project, update_data, user_id)
+        
         # Return updated project
         updated_project = request.current_app.db.projects.find_one({"_id": ObjectId(project_id)})
         updated_project['id'] = str(updated_project['_id'])
@@ -143,23 +182,79 @@ def delete_project(project_id):
     try:
         user_id = get_jwt_identity()
         
-        result = request.current_app.db.projects.delete_one({
+        deleted = request.current_app.db.projects.find_one_and_delete({
             "_id": ObjectId(project_id),
             "createdBy": user_id
         })
         
-        if result.deleted_count == 0:
+        if deleted is None:
             return jsonify({
                 "message": "Project not found",
                 "error": "not_found"
             }), 404
         
+        request.current_app.audit.record_delete('projects', deleted, user_id)
+        
+        # Dependent budgets are removed in the background
+        job = request.current_app.jobs.submit('project_cleanup', {"projectId": project_id}, user_id)
+        
         return jsonify({
-            "message": "Project deleted successfully"
+            "message": "Project deleted successfully",
+            "cleanupJob": serialize_job(job)
         }), 200
         
     except Exception as e:
         return jsonify({
             "message": "Failed to delete project",
             "error": str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+@projects_bp.route('/<project_id>/file', methods=['PUT'])
+@jwt_required()
+def upload_project_file(project_id):
+    try:
+        return upload_response('projects', project_id, get_jwt_identity(), 'projectFile')
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to upload file",
+            "error": str(e)
+        }), 500
+
+@projects_bp.route('/<project_id>/file', methods=['GET'])
+@jwt_required()
+def download_project_file(project_id):
+    try:
+        return download_response('projects', project_id, get_jwt_identity())
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to download file",
+            "error": str(e)
+        }), 500
+
+@projects_bp.route('/<project_id>/file', methods=['DELETE'])
+@jwt_required()
+def delete_project_file(project_id):
+    try:
+        return delete_response('projects', project_id, get_jwt_identity(), 'projectFile')
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to delete file",
+            "error": str(e)
+        }), 500
+
+@projects_bp.route('/<project_id>/history', methods=['GET'])
+@jwt_required()
+def get_project_history(project_id):
+    try:
+        user_id = get_jwt_identity()
+        
+        return history_response('projects', project_id, user_id)
+        
+    except Exception as e:
+        return jsonify({
+            "message": "Failed to fetch project history",
+            "error": str(e)
+        }), 500
@@ -0,0 +1,71 @@
+"""Shared fixtures: the app on the in-memory engine, so no MongoDB server is needed."""
+
+import os
+import sys
+import time
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from utils.memory_db import MemoryClient  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    return MemoryClient()['thrive_test']
+
+
+def create_test_app(monkeypatch, **env):
+    """create_app() on the in-memory engine; `env` overrides its environment settings."""
+    settings = {
+        'DB_BACKEND': 'memory',
+        'MONGO_DB_NAME': 'thrive_test',
+        'RATE_LIMIT_ENABLED': 'false',
+        'LOAD_SHED_MAX_IN_FLIGHT': '0',
+        'TENANT_PARTITIONS': '',
+        'QUERY_AUDIT_MODE': 'off',
+        'PROFILER_ENABLED': 'false',
+    }
+    settings.update(env)
+    for name, value in settings.items():
+        monkeypatch.setenv(name, value)
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    assert app.startup.wait(30)
+    return app
+
+
+@pytest.fixture
+def app(monkeypatch):
+    return create_test_app(monkeypatch)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def auth_headers(app, user_id='user-1'):
+    with app.app_context():
+        token = create_access_token(identity=user_id)
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def headers(app):
+    return auth_headers(app)
+
+
+def wait_for_job(client, headers, job, timeout=10):
+    """Poll a job accepted with 202 until it finishes; returns the final job."""
+    deadline = time.monotonic() + timeout
+    while True:
+        current = client.get(f"/api/jobs/{job['id']}", headers=headers).get_json()['job']
+        if current['status'] in ('succeeded', 'failed', 'cancelled') or time.monotonic() >= deadline:
+            return current
+        time.sleep(0.02)
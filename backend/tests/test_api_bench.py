@@ -0,0 +1,30 @@
+from benchmarks.api_bench import Scenario, compare, run_scenario
+
+
+def _report(route):
+    return {"routes": {"health": route}}
+
+
+def test_requests_that_raise_count_as_errors(app):
+    def path(i):
+        if i % 2:
+            raise RuntimeError("no target for this slot")
+        return '/api/health'
+
+    result = run_scenario(app, Scenario('health', 'GET', path, auth=False), 'token', 10, 3)
+
+    assert result['errors'] == 5
+    assert result['exceptions'] == ["RuntimeError: no target for this slot"]
+    assert result['latency_ms']['max'] > 0
+
+
+def test_a_route_where_every_request_raised_is_a_regression(app):
+    def path(i):
+        raise KeyError('customerKey')
+
+    result = run_scenario(app, Scenario('health', 'GET', path, auth=False), 'token', 4, 2)
+    assert (result['errors'], result['latency_ms']) == (4, None)
+
+    baseline = run_scenario(app, Scenario('health', 'GET', '/api/health', auth=False), 'token', 4, 2)
+    rows, regressions = compare(_report(baseline), _report(result), 0.2)
+    assert [row['status'] for row in regressions] == ['failed']
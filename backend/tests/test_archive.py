@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+from utils.archive import POLICIES, archive_collection, restore_document
+
+
+def _payment(db, days_old, status="Completed"):
+    date = datetime.utcnow() - timedelta(days=days_old)
+    return db.payments.insert_one({
+        "customer": "Acme", "customerKey": "acme", "amount": 10.0, "status": status, "date": date,
+        "createdBy": "user-1", "createdAt": date, "updatedAt": date
+    }).inserted_id
+
+
+def test_old_settled_payments_move_to_the_archive(db):
+    old, recent, pending = _payment(db, 400), _payment(db, 10), _payment(db, 400, status="Pending")
+
+    counts = archive_collection(db, POLICIES['payments'])
+
+    assert counts == {"archived": 1, "conflicts": 0}
+    assert [doc['_id'] for doc in db.payments.find()] == [recent, pending]
+    assert db.payments_archive.find_one({"_id": old})['archivedAt'] is not None
+
+
+def test_a_payment_edited_during_the_run_stays_hot(db, monkeypatch):
+    edited, untouched = _payment(db, 400), _payment(db, 400)
+    archive = db.payments_archive
+    copy = archive.bulk_write
+
+    def copy_then_edit(requests, **kwargs):
+        result = copy(requests, **kwargs)
+        # The edit keeps the status and date the policy matches on
+        db.payments.update_one({"_id": edited}, {"$set": {"amount": 99.0, "updatedAt": datetime.utcnow()}})
+        monkeypatch.setattr(archive, 'bulk_write', copy)
+        return result
+
+    monkeypatch.setattr(archive, 'bulk_write', copy_then_edit)
+    counts = archive_collection(db, POLICIES['payments'])
+
+    # The stale copy is dropped, and the next batch archives the edited version
+    assert counts == {"archived": 2, "conflicts": 1}
+    assert db.payments.count_documents({}) == 0
+    assert archive.find_one({"_id": edited})['amount'] == 99.0
+    assert archive.find_one({"_id": untouched}) is not None
+
+
+def test_restored_payments_are_not_archived_again_straight_away(db):
+    payment_id = _payment(db, 400)
+    archive_collection(db, POLICIES['payments'])
+
+    assert restore_document(db, 'payments', payment_id, "user-1")['_id'] == payment_id
+    assert archive_collection(db, POLICIES['payments'])['archived'] == 0
+    assert db.payments.find_one({"_id": payment_id}) is not None
+
+
+def test_archived_payments_answer_409_until_restored(app, client, headers):
+    payment_id = _payment(app.db, 400)
+    archive_collection(app.db, POLICIES['payments'])
+
+    assert client.put(f'/api/payments/{payment_id}', json={"amount": 5}, headers=headers).status_code == 409
+    listed = client.get('/api/payments/?include_archived=true', headers=headers).get_json()
+    assert listed['payments'][0]['archived'] is True
+    assert client.post(f'/api/payments/{payment_id}/restore', headers=headers).status_code == 200
+    assert client.put(f'/api/payments/{payment_id}', json={"amount": 5}, headers=headers).status_code == 200
+
+
+def test_skipped_owners_keep_their_documents_hot(db):
+    mine = _payment(db, 400)
+    theirs = db.payments.insert_one(dict(db.payments.find_one({"_id": mine}, {"_id": 0}), createdBy="user-2")).inserted_id
+
+    counts = archive_collection(db, POLICIES['payments'], skip_owners=lambda: ["user-1"])
+
+    assert counts == {"archived": 1, "conflicts": 0}
+    assert [doc['_id'] for doc in db.payments.find()] == [mine]
+    assert [doc['_id'] for doc in db.payments_archive.find()] == [theirs]
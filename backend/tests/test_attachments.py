@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+from bson import ObjectId
+
+from tests.conftest import auth_headers, create_test_app
+
+
+@pytest.fixture
+def app(monkeypatch):
+    return create_test_app(monkeypatch, ATTACHMENT_MAX_BYTES='4096', ATTACHMENT_QUOTA_BYTES='6000')
+
+
+def _create_lead(client, headers, mobile='9876500001'):
+    lead = {"name": "Lead", "email": f"{mobile}@x.com", "mobile": mobile}
+    response = client.post('/api/leads/', json=lead, headers=headers)
+    assert response.status_code == 201
+    return response.get_json()['lead']['id']
+
+
+def _upload(client, headers, lead_id, data, filename='notes.txt'):
+    return client.put(
+        f'/api/leads/{lead_id}/file?filename={filename}', data=data,
+        headers=dict(headers, **{'Content-Type': 'text/plain'})
+    )
+
+
+def test_download_serves_a_byte_range(client, headers):
+    lead_id = _create_lead(client, headers)
+    data = bytes(range(256)) * 10
+    assert _upload(client, headers, lead_id, data).status_code == 201
+
+    response = client.get(f'/api/leads/{lead_id}/file', headers=dict(headers, Range='bytes=100-299'))
+
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-299/{len(data)}'
+    assert response.data == data[100:300]
+
+
+def test_unsatisfiable_range_is_416(client, headers):
+    lead_id = _create_lead(client, headers)
+    assert _upload(client, headers, lead_id, b'x' * 100).status_code == 201
+
+    response = client.get(f'/api/leads/{lead_id}/file', headers=dict(headers, Range='bytes=500-600'))
+
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */100'
+    assert response.get_json()['error'] == 'invalid_range'
+
+
+def test_upload_over_the_quota_is_refused(app, client, headers):
+    first, second = _create_lead(client, headers, '9876500001'), _create_lead(client, headers, '9876500002')
+    assert _upload(client, headers, first, b'a' * 4000).status_code == 201
+
+    response = _upload(client, headers, second, b'b' * 3000)
+
+    assert response.status_code == 413
+    assert response.get_json()['error'] == 'attachment_quota_exceeded'
+    assert app.attachments.usage('user-1') == 4000
+
+
+def test_body_over_max_content_length_is_refused_as_too_large(app, client, headers):
+    assert app.config['MAX_CONTENT_LENGTH'] > app.config['ATTACHMENT_MAX_BYTES']
+    lead_id = _create_lead(client, headers)
+
+    response = _upload(client, headers, lead_id, b'x' * (app.config['MAX_CONTENT_LENGTH'] + 1))
+
+    assert response.status_code == 413
+    assert response.get_json()['error'] == 'attachment_too_large'
+
+
+def test_racing_uploads_leave_exactly_one_file(app, headers):
+    lead_id = _create_lead(app.test_client(), headers)
+    store = app.attachments
+    upload = store.upload
+    both_stored = threading.Barrier(2)
+
+    def upload_then_wait(*args, **kwargs):
+        file_doc = upload(*args, **kwargs)
+        both_stored.wait(timeout=5)
+        return file_doc
+
+    store.upload = upload_then_wait
+    statuses = []
+
+    def put(data):
+        statuses.append(_upload(app.test_client(), auth_headers(app), lead_id, data).status_code)
+
+    threads = [threading.Thread(target=put, args=(data,)) for data in (b'a' * 1000, b'b' * 2000)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert 201 in statuses and set(statuses) <= {201, 409}
+    files = list(store.files.find({"metadata.parentId": lead_id}))
+    assert len(files) == 1
+    lead = app.db.leads.find_one({"_id": ObjectId(lead_id)})
+    assert lead['attachment']['id'] == str(files[0]['_id'])
+    assert store.usage('user-1') == files[0]['length']
@@ -0,0 +1,69 @@
+import time
+
+from tests.conftest import auth_headers
+from utils.audit import AuditTrail, diff_fields
+
+
+def test_diff_keeps_only_changed_fields_that_matter():
+    before = {"_id": 1, "notes": "old", "status": "New", "score": 10}
+    changes = {"notes": "new", "status": "New", "score": 55, "updatedAt": "now"}
+
+    assert diff_fields(before, changes) == {"notes": {"from": "old", "to": "new"}}
+
+
+def test_entries_are_written_in_batches_and_dropped_when_the_queue_is_full(db):
+    audit = AuditTrail(db, max_queue=3, batch_size=2, enqueue_timeout=0)
+    for n in range(4):
+        audit.record('leads', n, 'update', 'user-1', {"notes": {"from": None, "to": n}})
+
+    assert audit.stats() == {"queued": 3, "written": 0, "dropped": 1, "failed": 0, "pending": 3}
+    assert audit.flush() == 3
+    assert db.audit_log.count_documents({}) == 3
+    assert audit.stats()['written'] == 3
+
+
+def _drain(audit, timeout=5):
+    """Flush the queue and wait for a batch the background writer may be holding."""
+    audit.flush()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = audit.stats()
+        if stats['written'] + stats['failed'] == stats['queued']:
+            return
+        time.sleep(0.01)
+
+
+def _create_lead(client, headers):
+    lead = {"name": "Ann", "email": "ann@x.com", "mobile": "9876500001"}
+    return client.post('/api/leads/', json=lead, headers=headers).get_json()['lead']['id']
+
+
+def test_history_pages_newest_first_with_a_cursor(app, client, headers):
+    lead_id = _create_lead(client, headers)
+    for n in range(5):
+        assert client.put(f'/api/leads/{lead_id}', json={"notes": f"note {n}"}, headers=headers).status_code == 200
+    _drain(app.audit)
+
+    notes, cursor = [], ''
+    while True:
+        page = client.get(f'/api/leads/{lead_id}/history?limit=2&before={cursor}', headers=headers).get_json()
+        assert len(page['history']) <= 2
+        notes += [entry['changes']['notes']['to'] for entry in page['history']]
+        cursor = page['nextCursor']
+        if cursor is None:
+            break
+
+    assert notes == [f"note {n}" for n in reversed(range(5))]
+
+
+def test_history_is_private_and_validates_the_cursor(app, client, headers):
+    lead_id = _create_lead(client, headers)
+    client.put(f'/api/leads/{lead_id}', json={"notes": "changed"}, headers=headers)
+    _drain(app.audit)
+
+    other = client.get(f'/api/leads/{lead_id}/history', headers=auth_headers(app, 'user-2'))
+    assert other.get_json()['history'] == []
+
+    response = client.get(f'/api/leads/{lead_id}/history?before=nope', headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'invalid_cursor'
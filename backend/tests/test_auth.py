@@ -0,0 +1,40 @@
+from tests.conftest import auth_headers
+from utils.admins import set_role
+
+
+def _register(client, **fields):
+    user = dict({"fullName": "Eve", "email": "eve@example.com", "password": "secret123"}, **fields)
+    return client.post('/api/auth/register', json=user)
+
+
+def test_register_ignores_a_requested_role(app, client):
+    response = _register(client, role="admin")
+    assert response.status_code == 201
+    user_id = response.get_json()['user']['id']
+
+    assert app.db.users.find_one({"email": "eve@example.com"})['role'] == 'user'
+    assert client.get('/api/admin/stats', headers=auth_headers(app, user_id)).status_code == 403
+
+
+def test_granted_admins_reach_admin_routes(app, client):
+    user_id = _register(client).get_json()['user']['id']
+    assert set_role(app.db, "eve@example.com", 'admin')
+    assert client.get('/api/admin/stats', headers=auth_headers(app, user_id)).status_code == 200
+    assert not set_role(app.db, "nobody@example.com", 'admin')
+
+
+def test_register_checks_the_validated_email(app, client):
+    assert _register(client).status_code == 201
+
+    response = _register(client, email="  eve@example.com ")
+
+    assert response.status_code == 409
+    assert response.get_json()['error'] == 'user_exists'
+    assert app.db.users.count_documents({}) == 1
+
+
+def test_register_reports_missing_fields(client):
+    response = _register(client, email="")
+
+    assert response.status_code == 400
+    assert response.get_json() == {"message": "email is required", "error": "missing_fields"}
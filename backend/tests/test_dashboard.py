@@ -0,0 +1,34 @@
+import threading
+import time
+
+from routes import dashboard_routes
+
+
+def test_dashboard_sums_every_section(client, headers):
+    client.post('/api/payments/', json={"customer": "Acme", "amount": 100, "date": "2030-01-01"}, headers=headers)
+    response = client.get('/api/dashboard/', headers=headers)
+    assert response.status_code == 200
+    dashboard = response.get_json()['dashboard']
+    assert {"leads", "projects", "budgets", "payments", "followUps", "deadlines", "currency"} <= set(dashboard)
+
+
+def test_dashboard_waits_one_timeout_for_all_queries(app, client, headers, monkeypatch):
+    release = threading.Event()
+
+    def slow(*args):
+        release.wait(5)
+        return {}
+
+    for name in ('_lead_status_counts', '_budget_totals', '_recent_payment_totals', '_due_dates'):
+        monkeypatch.setattr(dashboard_routes, name, slow)
+    app.config['DASHBOARD_QUERY_TIMEOUT'] = 0.2
+
+    started = time.monotonic()
+    response = client.get('/api/dashboard/', headers=headers)
+    elapsed = time.monotonic() - started
+    release.set()
+
+    assert response.status_code == 500
+    assert 'timed out' in response.get_json()['error']
+    # Five slow queries, one deadline
+    assert elapsed < 0.6
@@ -0,0 +1,69 @@
+import itertools
+
+from bson import ObjectId
+
+from tests.conftest import wait_for_job
+from utils.dedupe import blocking_keys, merge_cluster
+
+
+_phones = itertools.count(9876500100)
+
+
+def _create(client, headers, **fields):
+    lead = dict({"name": "Lead", "mobile": str(next(_phones))}, **fields)
+    response = client.post('/api/leads/', json=lead, headers=headers)
+    assert response.status_code == 201
+    return ObjectId(response.get_json()['lead']['id'])
+
+
+def test_dedupe_merges_leads_sharing_an_email(app, client, headers):
+    first = _create(client, headers, name="Ann", email="shared@x.com", notes="first")
+    second = _create(client, headers, name="Ann B", email="Shared@X.com", notes="second")
+
+    job = client.post('/api/leads/dedupe', json={}, headers=headers).get_json()['job']
+    assert wait_for_job(client, headers, job)['result']['merged'] == 1
+
+    survivor = app.db.leads.find_one({"_id": first})
+    assert survivor['notes'] == "first\nsecond"
+    assert survivor['mergedFrom'] == [str(second)]
+    assert app.db.leads.find_one({"_id": second}) is None
+
+
+def test_dedupe_keeps_a_lead_edited_away_from_its_match(app, client, headers):
+    first = _create(client, headers, name="Ann", email="shared@x.com")
+    second = _create(client, headers, name="Bob", email="shared@x.com")
+    # An edit that leaves the stored keys behind still carries e:shared@x.com
+    app.db.leads.update_one({"_id": second}, {"$set": {"email": "bob@y.com"}})
+
+    job = client.post('/api/leads/dedupe', json={}, headers=headers).get_json()['job']
+    assert wait_for_job(client, headers, job)['result']['merged'] == 0
+
+    assert app.db.leads.count_documents({"_id": {"$in": [first, second]}}) == 2
+    assert 'e:shared@x.com' not in app.db.leads.find_one({"_id": second})['dedupeKeys']
+
+
+def test_merge_splits_a_cluster_into_groups_that_still_match(db):
+    leads = [
+        {"name": "A", "email": "a@x.com", "mobile": "9876500001", "createdBy": "u1"},
+        {"name": "B", "email": "a@x.com", "mobile": "9876500002", "createdBy": "u1"},
+        {"name": "C", "email": "c@x.com", "mobile": "9876500003", "createdBy": "u1"},
+        {"name": "D", "email": "d@x.com", "mobile": "9876500003", "createdBy": "u1"},
+    ]
+    for lead in leads:
+        lead['dedupeKeys'] = blocking_keys(lead)
+    ids = db.leads.insert_many(leads).inserted_ids
+
+    merged = merge_cluster(db.leads, "u1", ids)
+
+    assert merged == [(ids[0], [ids[1]]), (ids[2], [ids[3]])]
+    assert [lead['name'] for lead in db.leads.find()] == ['A', 'C']
+
+
+def test_updated_lead_is_returned_without_its_blocking_keys(client, headers):
+    lead_id = _create(client, headers, email="ann@x.com")
+
+    response = client.put(f'/api/leads/{lead_id}', json={"notes": "call back"}, headers=headers)
+
+    assert response.status_code == 200
+    assert response.get_json()['lead']['notes'] == 'call back'
+    assert 'dedupeKeys' not in response.get_json()['lead']
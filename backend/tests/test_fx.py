@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pytest
+
+from utils.fx import FxRateTable, UnknownCurrencyError
+
+
+@pytest.fixture
+def fx(db):
+    db.fx_rates.insert_many([
+        {"currency": "USD", "rate": 80.0, "effectiveDate": datetime(2024, 1, 1)},
+        {"currency": "USD", "rate": 83.0, "effectiveDate": datetime(2024, 6, 1)},
+        {"currency": "EUR", "rate": 90.0, "effectiveDate": datetime(2024, 1, 1)},
+    ])
+    return FxRateTable(db, 'INR', ttl=300)
+
+
+def test_rate_is_the_one_effective_on_the_date(fx):
+    assert fx.rate('INR') == 1.0
+    assert fx.rate('usd', datetime(2024, 3, 15)) == 80.0
+    assert fx.rate('USD', datetime(2024, 6, 1)) == 83.0
+    # Before the first effective date the earliest rate applies
+    assert fx.rate('USD', datetime(2023, 1, 1)) == 80.0
+    with pytest.raises(UnknownCurrencyError):
+        fx.rate('GBP')
+
+
+def test_payments_convert_at_their_own_date(fx):
+    early = fx.payment_base({"amount": 10, "currency": "USD", "date": datetime(2024, 2, 1)})
+    late = fx.payment_base({"amount": 10, "currency": "USD", "date": "2024-07-01T00:00:00Z"})
+
+    assert early == {"currency": "INR", "rate": 80.0, "amount": 800.0}
+    assert late['amount'] == 830.0
+
+
+def test_cached_rates_reload_only_when_invalidated(db, fx):
+    assert fx.rate('EUR') == 90.0
+    db.fx_rates.insert_one({"currency": "EUR", "rate": 95.0, "effectiveDate": datetime(2024, 2, 1)})
+    assert fx.rate('EUR') == 90.0
+
+    fx.invalidate()
+    assert fx.rate('EUR') == 95.0
+
+
+def test_payment_totals_are_summed_in_the_base_currency(app, client, headers):
+    app.db.fx_rates.insert_many([
+        {"currency": "USD", "rate": 80.0, "effectiveDate": datetime(2024, 1, 1)},
+        {"currency": "USD", "rate": 83.0, "effectiveDate": datetime(2024, 6, 1)},
+    ])
+    app.fx.invalidate()
+    for payment in [
+        {"customer": "Acme", "date": "2024-02-01", "amount": 10, "currency": "USD"},
+        {"customer": "Acme", "date": "2024-07-01", "amount": 10, "currency": "USD"},
+        {"customer": "Acme", "date": "2024-07-01", "amount": 500, "currency": "INR"},
+    ]:
+        assert client.post('/api/payments/', json=payment, headers=headers).status_code == 201
+
+    totals = client.get('/api/payments/totals', headers=headers).get_json()['totals']
+
+    assert totals['amount'] == 800.0 + 830.0 + 500.0
+    assert totals['currency'] == 'INR'
+    assert totals['byCurrency']['USD'] == {"count": 2, "amount": 20}
+
+
+def test_payment_in_an_unknown_currency_is_rejected(client, headers):
+    payment = {"customer": "Acme", "date": "2024-02-01", "amount": 10, "currency": "XYZ"}
+
+    response = client.post('/api/payments/', json=payment, headers=headers)
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'unsupported_currency'
@@ -0,0 +1,20 @@
+def _lead(name):
+    return {"name": name, "email": f"{name.lower()}@x.com", "mobile": "9876543210"}
+
+
+def test_a_retried_create_replays_the_first_response(app, client, headers):
+    retry = dict(headers, **{"Idempotency-Key": "create-ann"})
+    first = client.post('/api/leads/', json=_lead("Ann"), headers=retry)
+    second = client.post('/api/leads/', json=_lead("Ann"), headers=retry)
+
+    assert first.status_code == second.status_code == 201
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.get_json()['lead']['id'] == first.get_json()['lead']['id']
+    assert app.db.leads.count_documents({}) == 1
+
+
+def test_an_idempotency_key_cannot_be_reused_for_another_body(client, headers):
+    retry = dict(headers, **{"Idempotency-Key": "create-ann"})
+    client.post('/api/leads/', json=_lead("Ann"), headers=retry)
+    response = client.post('/api/leads/', json=_lead("Bob"), headers=retry)
+    assert (response.status_code, response.get_json()['error']) == (422, 'idempotency_key_reused')
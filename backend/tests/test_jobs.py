@@ -0,0 +1,119 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import utils.jobs
+from utils.jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobRunner, job_handler
+
+started = threading.Event()
+release = threading.Event()
+
+
+@job_handler('test_echo', max_attempts=2)
+def run_echo_job(ctx):
+    return {"echo": ctx.params.get('value')}
+
+
+@job_handler('test_blocking', max_attempts=2)
+def run_blocking_job(ctx):
+    started.set()
+    release.wait(5)
+    ctx.progress(1, 1, force=True)
+    return {"finished": True}
+
+
+@job_handler('test_tenant_echo', tenant=True)
+def run_tenant_echo_job(ctx):
+    return {"user": ctx.user_id}
+
+
+@pytest.fixture
+def runner(db):
+    started.clear()
+    release.clear()
+    return JobRunner(SimpleNamespace(db=db), max_workers=2, lease_seconds=30)
+
+
+def _wait(db, job_id, statuses, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = db.jobs.find_one({"_id": job_id})
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.01)
+    return job
+
+
+def _running_job(db, job_type, locked_until, attempts=1, max_attempts=2):
+    now = datetime.utcnow()
+    return db.jobs.insert_one({
+        "type": job_type, "status": RUNNING, "params": {}, "attempts": attempts, "maxAttempts": max_attempts,
+        "cancelRequested": False, "ownerId": "other-host:1:x", "lockedUntil": locked_until,
+        "createdBy": "user-1", "createdAt": now, "updatedAt": now, "startedAt": now, "finishedAt": None
+    }).inserted_id
+
+
+def test_claimed_jobs_carry_the_runners_lease(db, runner):
+    job = runner.submit('test_blocking', user_id='user-1')
+    assert started.wait(5)
+    claimed = db.jobs.find_one({"_id": job['_id']})
+    assert claimed['ownerId'] == runner.owner_id
+    assert claimed['lockedUntil'] > datetime.utcnow() + timedelta(seconds=20)
+    release.set()
+    finished = _wait(db, job['_id'], (SUCCEEDED,))
+    assert finished['result'] == {"finished": True}
+    assert finished['lockedUntil'] is None
+
+
+def test_recover_leaves_jobs_with_a_live_lease_alone(db, runner):
+    live = _running_job(db, 'test_echo', datetime.utcnow() + timedelta(seconds=30))
+    exhausted = _running_job(db, 'test_echo', datetime.utcnow() + timedelta(seconds=30), attempts=2)
+
+    assert runner.recover() == 0
+    assert db.jobs.find_one({"_id": live})['status'] == RUNNING
+    assert db.jobs.find_one({"_id": exhausted})['status'] == RUNNING
+
+
+def test_recover_takes_over_jobs_with_an_expired_lease(db, runner):
+    expired = _running_job(db, 'test_echo', datetime.utcnow() - timedelta(seconds=1))
+    legacy = _running_job(db, 'test_echo', None)
+    exhausted = _running_job(db, 'test_echo', datetime.utcnow() - timedelta(seconds=1), attempts=2)
+
+    assert runner.recover() == 2
+    for job_id in (expired, legacy):
+        job = _wait(db, job_id, (SUCCEEDED,))
+        assert (job['status'], job['ownerId'], job['attempts']) == (SUCCEEDED, runner.owner_id, 2)
+    assert db.jobs.find_one({"_id": exhausted})['status'] == FAILED
+
+
+def test_an_owner_that_lost_its_lease_stops_without_a_result(db, runner):
+    job = runner.submit('test_blocking', user_id='user-1')
+    assert started.wait(5)
+    # Another runner took the job over after the lease expired
+    db.jobs.update_one({"_id": job['_id']}, {"$set": {"status": QUEUED, "ownerId": None, "lockedUntil": None}})
+    release.set()
+    deadline = time.monotonic() + 5
+    while runner._active and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stopped = db.jobs.find_one({"_id": job['_id']})
+    assert (stopped['status'], stopped['result']) == (QUEUED, None)
+
+
+def test_tenant_jobs_wait_while_their_tenant_is_frozen(db, runner, monkeypatch):
+    monkeypatch.setattr(utils.jobs, 'HOLD_SECONDS', 0.05)
+    frozen = {'user-1'}
+    runner.tenant_held = lambda user_id: user_id in frozen
+
+    held = runner.submit('test_tenant_echo', user_id='user-1')
+    other = runner.submit('test_tenant_echo', user_id='user-2')
+    untyped = runner.submit('test_echo', {"value": 1}, user_id='user-1')
+    assert _wait(db, other['_id'], (SUCCEEDED,))['status'] == SUCCEEDED
+    assert _wait(db, untyped['_id'], (SUCCEEDED,))['status'] == SUCCEEDED
+    time.sleep(0.2)
+    assert db.jobs.find_one({"_id": held['_id']})['status'] == QUEUED
+
+    frozen.clear()
+    assert _wait(db, held['_id'], (SUCCEEDED,))['result'] == {"user": 'user-1'}
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from utils.ledger import rebuild_ledger, record_payment
+
+
+def _ledger(app, key):
+    return app.db.customer_ledger.find_one({"createdBy": "user-1", "customerKey": key})
+
+
+def test_create_update_and_delete_keep_the_ledger_in_step(app, client, headers):
+    response = client.post('/api/payments/', json={"customer": "ABC Corp.", "amount": 100, "date": "2024-10-10"},
+                           headers=headers)
+    assert response.status_code == 201
+    payment_id = response.get_json()['payment']['id']
+    assert _ledger(app, 'abc')['totalAmount'] == 100
+
+    assert client.put(f'/api/payments/{payment_id}', json={"amount": 250}, headers=headers).status_code == 200
+    assert _ledger(app, 'abc')['totalAmount'] == 250
+
+    assert client.put(f'/api/payments/{payment_id}', json={"customer": "XYZ Ltd"}, headers=headers).status_code == 200
+    assert _ledger(app, 'abc') is None
+    assert _ledger(app, 'xyz')['paymentCount'] == 1
+
+    assert client.delete(f'/api/payments/{payment_id}', headers=headers).status_code == 200
+    assert _ledger(app, 'xyz') is None
+
+
+def test_updating_a_payment_without_a_customer_key(app, client, headers):
+    now = datetime.utcnow()
+    # Written before payments stored customer keys
+    payment_id = app.db.payments.insert_one({
+        "customer": "Legacy Traders Pvt Ltd", "amount": 40.0, "date": datetime(2024, 1, 5), "status": "Completed",
+        "createdBy": "user-1", "createdAt": now, "updatedAt": now
+    }).inserted_id
+
+    response = client.put(f'/api/payments/{payment_id}', json={"amount": 60}, headers=headers)
+
+    assert response.status_code == 200
+    assert app.db.payments.find_one({"_id": payment_id})['customerKey'] == 'legacy traders'
+    # The ledger never counted it, so it gains the difference until a rebuild recounts it
+    assert _ledger(app, 'legacy traders')['totals']['Completed']['amount'] == 20
+
+
+def test_concurrent_updates_move_the_ledger_once_each(app, client, headers, monkeypatch):
+    payment_id = client.post('/api/payments/', json={"customer": "Acme", "amount": 100, "date": "2024-10-10"},
+                             headers=headers).get_json()['payment']['id']
+    payments = app.db.payments
+    read = payments.find_one
+    raced = []
+
+    def read_then_race(*args, **kwargs):
+        payment = read(*args, **kwargs)
+        if not raced:
+            raced.append(True)
+            # Another request updates the payment between this one's read and its write
+            assert client.put(f'/api/payments/{payment_id}', json={"amount": 300}, headers=headers).status_code == 200
+        return payment
+
+    monkeypatch.setattr(payments, 'find_one', read_then_race)
+    assert client.put(f'/api/payments/{payment_id}', json={"amount": 250}, headers=headers).status_code == 200
+    monkeypatch.undo()
+
+    assert payments.find_one({"_id": ObjectId(payment_id)})['amount'] == 250
+    assert (_ledger(app, 'acme')['paymentCount'], _ledger(app, 'acme')['totalAmount']) == (1, 250)
+
+
+def test_rebuild_keeps_payments_recorded_while_it_runs(db, monkeypatch):
+    db.customer_ledger.create_index([("createdBy", 1), ("customerKey", 1)], unique=True)
+    first = {"customer": "Acme", "customerKey": "acme", "amount": 10.0, "status": "Completed", "createdBy": "user-1"}
+    db.payments.insert_one(dict(first))
+    aggregate = db.payments.aggregate
+    late = dict(first, amount=5.0)
+
+    def recount_then_record(*args, **kwargs):
+        rows = list(aggregate(*args, **kwargs))
+        if '_id' not in late:
+            # Recorded after the recount read the payments, before the rebuild writes the entry
+            db.payments.insert_one(late)
+            record_payment(db, "user-1", late)
+        return iter(rows)
+
+    monkeypatch.setattr(db.payments, 'aggregate', recount_then_record)
+    assert rebuild_ledger(db, "user-1") == 1
+
+    entry = db.customer_ledger.find_one({"createdBy": "user-1", "customerKey": "acme"})
+    assert (entry['paymentCount'], entry['totalAmount']) == (2, 15.0)
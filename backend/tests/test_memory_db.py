@@ -0,0 +1,225 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.operations import DeleteOne, InsertOne, ReplaceOne, UpdateOne
+
+
+def _plan(db, collection, **find):
+    explain = db.command({"explain": dict({"find": collection}, **find), "verbosity": "executionStats"})
+    stages = []
+    stage = explain['queryPlanner']['winningPlan']
+    while stage:
+        stages.append(stage['stage'])
+        stage = stage.get('inputStage')
+    return stages, explain['executionStats']
+
+
+@pytest.fixture
+def people(db):
+    db.people.insert_many([
+        {"name": "ann", "age": 31, "tags": ["a", "b"], "address": {"city": "Pune"}},
+        {"name": "bob", "age": 25, "tags": ["b"], "address": {"city": "Goa"}},
+        {"name": "cid", "age": 40, "tags": [], "address": {"city": "Pune"}},
+        {"name": "dee", "tags": ["c"]},
+    ])
+    return db.people
+
+
+def test_insert_assigns_ids_on_the_callers_documents(db):
+    document = {"name": "ann"}
+    result = db.people.insert_one(document)
+    assert isinstance(result.inserted_id, ObjectId)
+    assert document['_id'] == result.inserted_id
+    assert db.people.find_one({"_id": result.inserted_id})['name'] == 'ann'
+
+
+def test_returned_documents_are_copies(people):
+    found = people.find_one({"name": "ann"})
+    found['tags'].append('z')
+    assert people.find_one({"name": "ann"})['tags'] == ['a', 'b']
+
+
+@pytest.mark.parametrize('query, names', [
+    ({"age": {"$gte": 31}}, ['ann', 'cid']),
+    ({"age": {"$exists": False}}, ['dee']),
+    ({"tags": "b"}, ['ann', 'bob']),
+    ({"tags": {"$in": ["c", "a"]}}, ['ann', 'dee']),
+    ({"tags": {"$size": 0}}, ['cid']),
+    ({"address.city": "Pune"}, ['ann', 'cid']),
+    ({"name": {"$regex": "^[ab]"}}, ['ann', 'bob']),
+    ({"$or": [{"age": {"$lt": 30}}, {"name": "dee"}]}, ['bob', 'dee']),
+    ({"age": {"$ne": 31}}, ['bob', 'cid', 'dee']),
+    ({"name": {"$nin": ["ann", "bob"]}, "age": {"$gt": 0}}, ['cid']),
+])
+def test_find_filters(people, query, names):
+    assert sorted(doc['name'] for doc in people.find(query)) == names
+
+
+def test_sort_skip_limit_and_projection(people):
+    docs = list(people.find({}, {"name": 1, "_id": 0}).sort("age", -1).skip(1).limit(2))
+    # Missing values sort before numbers, so descending puts them last
+    assert docs == [{"name": "ann"}, {"name": "bob"}]
+
+
+def test_update_operators(people):
+    people.update_one({"name": "ann"}, {
+        "$set": {"address.city": "Delhi"}, "$inc": {"age": 1}, "$push": {"tags": "c"}, "$unset": {"name": ""}
+    })
+    doc = people.find_one({"age": 32})
+    assert doc['address'] == {"city": "Delhi"}
+    assert doc['tags'] == ['a', 'b', 'c']
+    assert 'name' not in doc
+
+
+def test_update_many_and_counts(people):
+    result = people.update_many({"address.city": "Pune"}, {"$set": {"flag": True}})
+    assert (result.matched_count, result.modified_count) == (2, 2)
+    assert people.count_documents({"flag": True}) == 2
+    assert people.update_many({"flag": True}, {"$set": {"flag": True}}).modified_count == 0
+
+
+def test_upsert_seeds_from_equality_filter(db):
+    result = db.counters.update_one({"key": "a"}, {"$inc": {"n": 2}}, upsert=True)
+    assert result.upserted_id is not None
+    assert db.counters.find_one({"key": "a"}, {"_id": 0}) == {"key": "a", "n": 2}
+
+
+def test_find_one_and_update_returns_before_or_after(people):
+    before = people.find_one_and_update({"name": "bob"}, {"$inc": {"age": 1}})
+    after = people.find_one_and_update({"name": "bob"}, {"$inc": {"age": 1}}, return_document=ReturnDocument.AFTER)
+    assert (before['age'], after['age']) == (25, 27)
+
+
+def test_unique_index_rejects_duplicates(db):
+    db.users.create_index("email", unique=True)
+    db.users.insert_one({"email": "a@x.com"})
+    with pytest.raises(DuplicateKeyError):
+        db.users.insert_one({"email": "a@x.com"})
+    second = db.users.insert_one({"email": "b@x.com"}).inserted_id
+    with pytest.raises(DuplicateKeyError):
+        db.users.update_one({"_id": second}, {"$set": {"email": "a@x.com"}})
+    assert db.users.find_one({"_id": second})['email'] == 'b@x.com'
+
+
+def test_insert_many_unordered_keeps_going_past_duplicates(db):
+    db.users.create_index("email", unique=True)
+    with pytest.raises(BulkWriteError) as error:
+        db.users.insert_many([{"email": "a"}, {"email": "a"}, {"email": "b"}], ordered=False)
+    assert error.value.details['nInserted'] == 2
+    assert db.users.count_documents({}) == 2
+
+
+def test_bulk_write(people):
+    result = people.bulk_write([
+        InsertOne({"name": "eve"}),
+        UpdateOne({"name": "ann"}, {"$set": {"age": 1}}),
+        ReplaceOne({"name": "zed"}, {"name": "zed", "age": 9}, upsert=True),
+        DeleteOne({"name": "bob"}),
+    ])
+    assert (result.inserted_count, result.modified_count, result.upserted_count, result.deleted_count) == (1, 1, 1, 1)
+    assert sorted(doc['name'] for doc in people.find()) == ['ann', 'cid', 'dee', 'eve', 'zed']
+
+
+def test_equality_uses_an_index(people):
+    assert _plan(people.database, 'people', filter={"name": "ann"})[0] == ['COLLSCAN']
+    people.create_index([("name", 1)])
+    stages, stats = _plan(people.database, 'people', filter={"name": "ann"})
+    assert stages == ['FETCH', 'IXSCAN']
+    assert stats['totalDocsExamined'] == 1
+
+
+def test_index_covers_sort_after_equality_prefix(db):
+    db.leads.create_index([("createdBy", 1), ("createdAt", -1), ("_id", -1)])
+    now = datetime.utcnow()
+    for i in range(5):
+        db.leads.insert_one({"createdBy": "u1" if i % 2 else "u2", "createdAt": now - timedelta(days=i)})
+    stages, _ = _plan(db, 'leads', filter={"createdBy": "u1"}, sort={"createdAt": -1, "_id": -1})
+    assert 'SORT' not in stages
+    # Mixed directions cannot walk the index in one direction
+    stages, _ = _plan(db, 'leads', filter={"createdBy": "u1"}, sort={"createdAt": -1, "_id": 1})
+    assert stages[0] == 'SORT'
+    days = [doc['createdAt'] for doc in db.leads.find({"createdBy": "u1"}).sort([("createdAt", -1), ("_id", -1)])]
+    assert days == sorted(days, reverse=True)
+
+
+def test_range_scan_returns_only_bounded_documents(db):
+    db.payments.create_index([("status", 1), ("date", 1)])
+    for day in range(10):
+        db.payments.insert_one({"status": "Completed", "date": datetime(2024, 1, day + 1)})
+    query = {"status": {"$in": ["Completed"]}, "date": {"$lt": datetime(2024, 1, 4)}}
+    stages, stats = _plan(db, 'payments', filter=query)
+    assert stages == ['FETCH', 'IXSCAN']
+    assert stats['totalDocsExamined'] == stats['nReturned'] == 3
+    assert db.payments.count_documents(query) == 3
+
+
+def test_index_stays_consistent_through_updates_and_deletes(db):
+    db.items.create_index([("status", 1)])
+    ids = [db.items.insert_one({"status": "a"}).inserted_id for _ in range(3)]
+    db.items.update_one({"_id": ids[0]}, {"$set": {"status": "b"}})
+    db.items.delete_one({"_id": ids[1]})
+    assert [doc['_id'] for doc in db.items.find({"status": "a"})] == [ids[2]]
+    assert [doc['_id'] for doc in db.items.find({"status": "b"})] == [ids[0]]
+
+
+def test_ttl_index_expires_documents(db):
+    db.sessions.create_index("at", expireAfterSeconds=60)
+    db.sessions.insert_many([
+        {"at": datetime.utcnow() - timedelta(minutes=5)},
+        {"at": datetime.utcnow()},
+    ])
+    assert db.sessions.count_documents({}) == 1
+
+
+def test_aggregate_group_sort_and_project(people):
+    rows = list(people.aggregate([
+        {"$match": {"age": {"$exists": True}}},
+        {"$group": {"_id": "$address.city", "count": {"$sum": 1}, "oldest": {"$max": "$age"}}},
+        {"$sort": {"count": -1}},
+        {"$project": {"_id": 0, "city": "$_id", "count": 1, "oldest": 1}},
+    ]))
+    assert rows == [{"city": "Pune", "count": 2, "oldest": 40}, {"city": "Goa", "count": 1, "oldest": 25}]
+
+
+def test_aggregate_unwind_and_count(people):
+    rows = list(people.aggregate([{"$unwind": "$tags"}, {"$match": {"tags": "b"}}, {"$count": "n"}]))
+    assert rows == [{"n": 2}]
+
+
+def test_aggregate_union_with(db):
+    db.leads.insert_one({"name": "hot"})
+    db.leads_archive.insert_one({"name": "cold"})
+    rows = list(db.leads.aggregate([
+        {"$match": {}},
+        {"$unionWith": {"coll": "leads_archive", "pipeline": [{"$addFields": {"archived": True}}]}},
+        {"$project": {"_id": 0}},
+    ]))
+    assert rows == [{"name": "hot"}, {"name": "cold", "archived": True}]
+
+
+def test_reads_are_published_to_command_listeners():
+    from pymongo import monitoring
+    from utils.memory_db import MemoryClient
+
+    class Listener(monitoring.CommandListener):
+        def __init__(self):
+            self.started_commands = []
+
+        def started(self, event):
+            self.started_commands.append((event.command_name, event.command))
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    listener = Listener()
+    db = MemoryClient(event_listeners=[listener])['thrive_test']
+    list(db.leads.find({"createdBy": "u1"}))
+    db.leads.count_documents({})
+    assert [name for name, _ in listener.started_commands] == ['find', 'count']
+    assert listener.started_commands[0][1]['filter'] == {"createdBy": "u1"}
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+import pymongo
+
+from utils.memory_db import MemoryClient
+from utils.migrations import MIGRATIONS, apply_migration, main
+
+
+def test_typed_dates_converts_archived_documents_too(db):
+    db.leads_archive.insert_one({"createdBy": "user-1", "nextFollowUp": "2024-03-01"})
+    db.payments_archive.insert_one({"createdBy": "user-1", "date": "2024-02-01"})
+
+    report = apply_migration(db, [('default', db)], MIGRATIONS[1])
+
+    assert db.leads_archive.find_one()['nextFollowUp'] == datetime(2024, 3, 1)
+    assert db.payments_archive.find_one()['date'] == datetime(2024, 2, 1)
+    assert report['counts']['default:leads_archive']['updated'] == 1
+    assert report['counts']['default:payments_archive']['updated'] == 1
+
+
+def test_command_line_migrates_every_tenant_partition(monkeypatch):
+    clients = {}
+    monkeypatch.setattr(pymongo, 'MongoClient', lambda uri, **kwargs: clients.setdefault(uri, MemoryClient()))
+    spec = 'p0=mongodb://db0:27017/thrive_p0;p1=mongodb://db1:27017/thrive_p1'
+    monkeypatch.setenv('TENANT_PARTITIONS', spec)
+    control = pymongo.MongoClient('mongodb://control:27017')['thrive_test']
+    p1 = pymongo.MongoClient('mongodb://db1:27017/thrive_p1')['thrive_p1']
+    p1.payments.insert_one({"createdBy": "user-1", "date": "2024-02-01"})
+
+    assert main(['--mongo-uri', 'mongodb://control:27017', '--db', 'thrive_test', '--version', '1']) == 0
+
+    assert p1.payments.find_one()['date'] == datetime(2024, 2, 1)
+    # Keyed like the schema_migration job, which names partitions after TENANT_PARTITIONS
+    record = control.schema_migrations.find_one({"_id": 1})
+    assert {key.split(':')[0] for key in record['counts']} == {'p0', 'p1'}
+    assert list(record['checkpoints']) == ['p1:payments']
@@ -0,0 +1,90 @@
+import time
+from types import SimpleNamespace
+
+from tests.conftest import auth_headers, create_test_app
+from utils.admins import set_role
+from utils.profiler import PROFILE_HEADER, PROFILE_ID_HEADER, Profile
+
+
+def _command(request_id, name='find', collection='leads', duration_micros=1500):
+    return SimpleNamespace(
+        request_id=request_id, command_name=name, command={name: collection},
+        database_name='thrive_test', duration_micros=duration_micros
+    )
+
+
+def _frame(name, line, back=None):
+    code = SimpleNamespace(co_name=name, co_filename=f'/srv/app/{name}.py')
+    return SimpleNamespace(f_code=code, f_lineno=line, f_back=back)
+
+
+def _profile():
+    profile = Profile(0, 'GET', '/api/leads/', 'leads.get_leads', 'header')
+    view = _frame('get_leads', 10)
+    query, render = _frame('_query', 20, view), _frame('_render', 30, view)
+    profile.add_sample(query, profile.start + 0.002)
+    profile.add_sample(query, profile.start + 0.004)
+    profile.add_sample(render, profile.start + 0.005)
+    profile.command_started(_command(1))
+    profile.command_finished(_command(1), True)
+    profile.finish(200)
+    return profile
+
+
+def test_repeated_stacks_are_merged_into_one_weighted_sample():
+    profile = _profile()
+
+    assert len(profile.samples) == 2
+    assert round(profile.samples[0][1], 6) == 0.004
+    assert profile.summary()['mongo'] == {"commands": 1, "durationMs": 1.5}
+
+
+def test_speedscope_output_references_its_frames():
+    document = _profile().speedscope()
+
+    assert document['$schema'] == 'https://www.speedscope.app/file-format-schema.json'
+    frames = document['shared']['frames']
+    sampled, evented = document['profiles']
+    assert sampled['type'] == 'sampled' and sampled['unit'] == 'milliseconds'
+    assert len(sampled['samples']) == len(sampled['weights']) == 2
+    assert all(0 <= index < len(frames) for stack in sampled['samples'] for index in stack)
+    assert [frames[index]['name'] for index in sampled['samples'][0]] == ['get_leads', '_query']
+    assert [event['type'] for event in evented['events']] == ['O', 'C']
+    assert frames[evented['events'][0]['frame']]['name'] == 'mongo find leads'
+
+
+def test_collapsed_stacks_carry_microsecond_weights():
+    lines = _profile().collapsed().splitlines()
+
+    assert len(lines) == 2
+    stack, weight = lines[0].rsplit(' ', 1)
+    assert stack == 'get_leads (get_leads.py:10);_query (_query.py:20)'
+    assert int(weight) == 4000
+
+
+def test_admins_can_profile_a_request_and_download_it(monkeypatch):
+    app = create_test_app(monkeypatch, PROFILER_ENABLED='true', PROFILER_INTERVAL_MS='0.5')
+    client = app.test_client()
+    registered = client.post('/api/auth/register', json={
+        "fullName": "Ada", "email": "ada@example.com", "password": "secret123"
+    }).get_json()['user']
+    assert set_role(app.db, "ada@example.com", 'admin')
+    headers = auth_headers(app, registered['id'])
+
+    find = app.db.leads.find
+    app.db.leads.find = lambda *args, **kwargs: time.sleep(0.02) or find(*args, **kwargs)
+    response = client.get('/api/leads/', headers=dict(headers, **{PROFILE_HEADER: 'true'}))
+    profile_id = response.headers[PROFILE_ID_HEADER]
+
+    listed = client.get('/api/admin/profiles', headers=headers).get_json()['profiles']
+    assert profile_id in [profile['id'] for profile in listed]
+    document = client.get(f'/api/admin/profiles/{profile_id}', headers=headers)
+    assert document.status_code == 200
+    assert document.get_json()['profiles'][0]['samples']
+    collapsed = client.get(f'/api/admin/profiles/{profile_id}?format=collapsed', headers=headers)
+    assert collapsed.mimetype == 'text/plain' and collapsed.data
+    assert client.get(f'/api/admin/profiles/{profile_id}?format=svg', headers=headers).status_code == 400
+
+    # Other users cannot switch profiling on
+    other = client.get('/api/leads/', headers=dict(auth_headers(app, 'user-2'), **{PROFILE_HEADER: 'true'}))
+    assert PROFILE_ID_HEADER not in other.headers
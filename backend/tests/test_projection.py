@@ -0,0 +1,48 @@
+import pytest
+
+from tests.conftest import auth_headers
+from utils.projection import InvalidFieldsError, parse_fields
+
+
+def test_requested_fields_become_a_projection():
+    assert parse_fields('leads', ' name, email,name,id ') == {"name": 1, "email": 1}
+    assert parse_fields('leads', 'id') == {"_id": 1}
+    assert parse_fields('leads', '', default={"dedupeKeys": 0}) == {"dedupeKeys": 0}
+
+
+def test_fields_outside_the_whitelist_are_rejected():
+    with pytest.raises(InvalidFieldsError) as raised:
+        parse_fields('users', 'email,password')
+    assert raised.value.unknown == ['password']
+
+
+def test_list_returns_only_the_requested_fields(client, headers):
+    lead = {"name": "Ann", "email": "ann@x.com", "mobile": "9876500001", "notes": "long notes"}
+    assert client.post('/api/leads/', json=lead, headers=headers).status_code == 201
+
+    response = client.get('/api/leads/?fields=name,email', headers=headers)
+
+    assert response.status_code == 200
+    [listed] = response.get_json()['leads']
+    assert set(listed) == {'_id', 'id', 'name', 'email'}
+
+
+def test_unknown_fields_get_a_400_listing_the_allowed_ones(client, headers):
+    response = client.get('/api/leads/?fields=name,dedupeKeys', headers=headers)
+
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['error'] == 'invalid_fields'
+    assert 'dedupeKeys' in body['message']
+    assert 'name' in body['allowed_fields']
+
+
+def test_profile_never_exposes_the_password(app, client):
+    registered = client.post('/api/auth/register', json={
+        "fullName": "Eve", "email": "eve@example.com", "password": "secret123"
+    }).get_json()['user']
+    headers = auth_headers(app, registered['id'])
+
+    assert client.get('/api/auth/profile?fields=password', headers=headers).status_code == 400
+    profile = client.get('/api/auth/profile?fields=email', headers=headers).get_json()['user']
+    assert profile == {"id": registered['id'], "email": "eve@example.com"}
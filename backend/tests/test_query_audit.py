@@ -0,0 +1,31 @@
+from utils.query_audit import COLLSCAN, IN_MEMORY_SORT, QueryAuditor, FULL, command_shape, filter_shape, new_findings
+from utils.memory_db import MemoryClient
+
+
+def test_filter_shape_drops_values_and_keeps_operators():
+    query = {"createdBy": "u1", "age": {"$gte": 3}, "$or": [{"name": "a"}, {"tags": {"$in": [1, 2]}}]}
+    assert filter_shape(query) == {
+        "createdBy": "?", "age": {"$gte": "?"}, "$or": [{"name": "?"}, {"tags": {"$in": "?"}}]
+    }
+
+
+def test_aggregate_shape_lists_stage_names():
+    shape = command_shape('aggregate', {"pipeline": [{"$match": {"a": 1}}, {"$sort": {"b": -1}}, {"$limit": 5}]})
+    assert shape == {"pipeline": [{"$match": {"a": "?"}}, {"$sort": {"b": -1}}, "$limit"]}
+
+
+def test_auditor_flags_scans_and_sorts_once_per_shape():
+    auditor = QueryAuditor(mode=FULL)
+    db = MemoryClient(event_listeners=[auditor.command_listener])['thrive_test']
+    auditor.add_database(db)
+    db.leads.create_index([("createdBy", 1), ("createdAt", -1)])
+    for user in ('u1', 'u2', 'u3'):
+        db.leads.insert_one({"createdBy": user, "createdAt": 1, "status": "New"})
+        list(db.leads.find({"createdBy": user}).sort("createdAt", -1))
+        list(db.leads.find({"status": "New"}).sort("name", 1))
+    assert auditor.drain(10)
+
+    report = auditor.report()
+    assert report['shapes'] == 2
+    assert sorted(finding['issue'] for finding in report['findings']) == [COLLSCAN, IN_MEMORY_SORT]
+    assert new_findings(report, report) == []
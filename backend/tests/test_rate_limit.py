@@ -0,0 +1,78 @@
+import threading
+import time
+
+from tests.conftest import auth_headers, create_test_app
+from utils.rate_limit import MemoryBucketStore, PoolMonitor, SqliteBucketStore
+
+
+def test_bucket_allows_the_burst_then_reports_the_wait():
+    store = MemoryBucketStore()
+    assert [store.take('k', rate=2, burst=3)[0] for _ in range(3)] == [True] * 3
+
+    allowed, _, wait = store.take('k', rate=2, burst=3)
+
+    assert not allowed
+    assert 0 < wait <= 0.5
+    assert store.take('other', rate=2, burst=3)[0]
+
+
+def test_sqlite_buckets_are_shared_between_stores(tmp_path):
+    path = str(tmp_path / 'buckets.db')
+    first, second = SqliteBucketStore(path), SqliteBucketStore(path)
+
+    assert first.take('k', rate=0.01, burst=1)[0]
+    assert not second.take('k', rate=0.01, burst=1)[0]
+
+
+def test_pool_monitor_tracks_checkout_waits():
+    monitor = PoolMonitor()
+    monitor.connection_check_out_started(None)
+    time.sleep(0.05)
+    monitor.connection_checked_out(None)
+
+    assert monitor.wait_ms() > 5
+    assert monitor.checked_out == 1
+
+
+def test_requests_over_the_limit_get_429_with_retry_after(monkeypatch):
+    app = create_test_app(monkeypatch, RATE_LIMIT_ENABLED='true', RATE_LIMIT_RATE='0.5', RATE_LIMIT_BURST='2')
+    client = app.test_client()
+    headers = auth_headers(app)
+
+    statuses = [client.get('/api/leads/', headers=headers).status_code for _ in range(3)]
+    limited = client.get('/api/leads/', headers=headers)
+
+    assert statuses == [200, 200, 429]
+    assert limited.status_code == 429
+    assert limited.get_json()['error'] == 'rate_limited'
+    assert limited.headers['Retry-After'] == '2'
+    # Other users and the health checks have buckets of their own
+    assert client.get('/api/leads/', headers=auth_headers(app, 'user-2')).status_code == 200
+    assert client.get('/api/health').status_code == 200
+
+
+def test_requests_over_the_in_flight_limit_get_503(monkeypatch):
+    app = create_test_app(monkeypatch, LOAD_SHED_MAX_IN_FLIGHT='1')
+    headers = auth_headers(app)
+    entered, release = threading.Event(), threading.Event()
+    find = app.db.leads.find
+
+    def slow_find(*args, **kwargs):
+        entered.set()
+        release.wait(5)
+        return find(*args, **kwargs)
+
+    app.db.leads.find = slow_find
+    first = threading.Thread(target=lambda: app.test_client().get('/api/leads/', headers=headers))
+    first.start()
+    try:
+        assert entered.wait(5)
+        shed = app.test_client().get('/api/projects/', headers=headers)
+    finally:
+        release.set()
+        first.join(5)
+
+    assert shed.status_code == 503
+    assert shed.get_json()['error'] == 'overloaded'
+    assert shed.headers['Retry-After'] == '1'
+    assert app.test_client().get('/api/projects/', headers=headers).status_code == 200
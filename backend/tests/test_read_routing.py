@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+from bson.timestamp import Timestamp
+
+from utils.read_routing import (
+    CAUSAL_TOKEN, SessionCollection, _RequestReads, decode_token, encode_token, parse_route_preferences
+)
+
+
+class _Session:
+    def __init__(self):
+        self.operation_time = None
+        self.ended = False
+
+    def advance_operation_time(self, operation_time):
+        if self.operation_time is None or operation_time > self.operation_time:
+            self.operation_time = operation_time
+
+    def end_session(self):
+        self.ended = True
+
+
+class _Client:
+    def __init__(self):
+        self.started = []
+
+    def start_session(self, causal_consistency=False):
+        assert causal_consistency
+        self.started.append(_Session())
+        return self.started[-1]
+
+
+class _Collection:
+    def __init__(self, client):
+        self.database = type('Database', (), {'client': client})()
+        self.sessions = []
+
+    def find_one(self, query, session=None):
+        self.sessions.append(session)
+        return None
+
+
+def test_token_round_trips():
+    times = {'default': Timestamp(1700000000, 3), 'p1': Timestamp(1700000001, 1)}
+    assert decode_token(encode_token(times)) == times
+    assert decode_token('not a token') == {}
+
+
+def test_route_preferences_can_be_overridden():
+    routes = parse_route_preferences('leads.get_leads=primary;reports.get=nearest')
+    assert routes['leads.get_leads'] == 'primary'
+    assert routes['reports.get'] == 'nearest'
+    with pytest.raises(ValueError):
+        parse_route_preferences('leads.get_leads=sometimes')
+
+
+def test_a_request_uses_one_session_per_client():
+    client = _Client()
+    reads = _RequestReads(None, {'default': Timestamp(100, 1)}, {id(client): 'default'})
+    leads, payments = SessionCollection(_Collection(client), reads), SessionCollection(_Collection(client), reads)
+
+    leads.find_one({})
+    payments.find_one({})
+    leads.find_one({})
+
+    assert len(client.started) == 1
+    session = client.started[0]
+    assert leads._collection.sessions == [session, session] and payments._collection.sessions == [session]
+    # Started from the caller's causal token
+    assert session.operation_time == Timestamp(100, 1)
+    assert reads.operation_times() == [('default', Timestamp(100, 1))]
+
+    reads.end()
+    assert session.ended
+
+
+def test_worker_threads_get_their_own_session_from_the_request_position():
+    client = _Client()
+    reads = _RequestReads(None, {}, {id(client): 'default'})
+    collection = SessionCollection(_Collection(client), reads)
+    collection.find_one({})
+    client.started[0].operation_time = Timestamp(200, 5)
+
+    worker = threading.Thread(target=collection.find_one, args=({},))
+    worker.start()
+    worker.join(5)
+
+    assert len(client.started) == 2
+    assert client.started[1].operation_time == Timestamp(200, 5)
+
+
+def test_singleflight_keys_on_the_causal_cookie(app, client, headers):
+    keys = []
+    do = app.singleflight.do
+    app.singleflight.do = lambda key, fn: keys.append(key) or do(key, fn)
+
+    client.set_cookie(CAUSAL_TOKEN, 'from-cookie')
+    assert client.get('/api/leads/', headers=headers).status_code == 200
+    assert client.get('/api/leads/', headers=dict(headers, **{CAUSAL_TOKEN: 'from-header'})).status_code == 200
+
+    assert 'from-cookie' in keys[0]
+    assert 'from-header' in keys[1]
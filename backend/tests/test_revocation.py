@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+from utils.revocation import BloomFilter, RevocationList
+from tests.conftest import auth_headers
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    keys = [f"jti-{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_revoked_tokens_are_seen_by_other_workers_after_a_refresh(db):
+    expires = datetime.utcnow() + timedelta(hours=1)
+    first, second = RevocationList(db), RevocationList(db)
+    first.load()
+    second.load()
+    first.revoke('jti-1', 'user-1', expires)
+    assert first.is_revoked('jti-1')
+    assert not second.is_revoked('jti-1')
+    second.refresh()
+    assert second.is_revoked('jti-1')
+    assert not second.is_revoked('jti-2')
+
+
+def test_load_skips_expired_revocations(db):
+    db.revoked_tokens.insert_one({
+        "_id": 'old', "userId": 'user-1', "revokedAt": datetime.utcnow() - timedelta(days=2),
+        "expiresAt": datetime.utcnow() - timedelta(days=1)
+    })
+    revocations = RevocationList(db)
+    revocations.load()
+    assert revocations.stats()['revoked'] == 0
+
+
+def test_logout_revokes_the_token(app, client):
+    headers = auth_headers(app)
+    assert client.get('/api/leads/', headers=headers).status_code == 200
+    assert client.post('/api/auth/logout', headers=headers).status_code == 200
+    response = client.get('/api/leads/', headers=headers)
+    assert response.status_code == 401
+    assert response.get_json()['error'] == 'token_revoked'
@@ -0,0 +1,87 @@
+import itertools
+import math
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from tests.conftest import wait_for_job
+from utils import scoring
+from utils.scoring import rescore_leads, score_lead, score_leads
+
+NOW = datetime(2024, 6, 15, 12)
+
+
+def _scalar_score(lead, now):
+    """One lead at a time, straight from the weights: the reference the batch version must match."""
+    z = scoring.BIAS
+    z += scoring.SOURCE_WEIGHTS.get(lead.get('source'), 0.0)
+    z += scoring.STATUS_WEIGHTS.get(lead.get('status'), 0.0)
+    designation = (lead.get('designation') or '').lower()
+    z += max((weight for keyword, weight in scoring.SENIORITY_WEIGHTS if keyword in designation), default=0.0)
+    created = lead.get('createdAt')
+    if isinstance(created, datetime):
+        z += scoring.AGE_WEIGHT * min(max(now.toordinal() - created.toordinal(), 0), scoring.AGE_CAP_DAYS)
+    follow_up = lead.get('nextFollowUp')
+    if isinstance(follow_up, str):
+        try:
+            follow_up = datetime.strptime(follow_up[:10], '%Y-%m-%d')
+        except ValueError:
+            follow_up = None
+    if not follow_up:
+        z += scoring.FOLLOW_UP_NONE_WEIGHT
+    else:
+        until = follow_up.toordinal() - now.toordinal()
+        if -1 <= until <= scoring.FOLLOW_UP_SOON_DAYS:
+            z += scoring.FOLLOW_UP_SOON_WEIGHT
+        elif until < -1:
+            z += scoring.OVERDUE_WEIGHT * min(-until, scoring.OVERDUE_CAP_DAYS) / scoring.OVERDUE_CAP_DAYS
+    return round(100.0 / (1.0 + math.exp(-z)), 2)
+
+
+def _leads(n, seed=7):
+    rng = random.Random(seed)
+    sources = list(scoring.SOURCE_WEIGHTS) + ['Other', None]
+    statuses = list(scoring.STATUS_WEIGHTS) + [None]
+    designations = ['Founder & CEO', 'Sales Manager', 'Team Lead', 'Engineer', '', None, 'VP Sales']
+    follow_ups = [None, '', 'not a date', NOW + timedelta(days=3), NOW - timedelta(days=1), NOW - timedelta(days=12),
+                  (NOW + timedelta(days=20)).strftime('%Y-%m-%d'), (NOW - timedelta(days=90)).isoformat()]
+    return [{
+        "source": rng.choice(sources),
+        "status": rng.choice(statuses),
+        "designation": rng.choice(designations),
+        "createdAt": rng.choice([None, NOW - timedelta(days=rng.randint(0, 400))]),
+        "nextFollowUp": rng.choice(follow_ups),
+    } for _ in range(n)]
+
+
+def test_batch_scores_match_the_scalar_formula():
+    leads = _leads(2000)
+    assert score_leads(leads, NOW).tolist() == pytest.approx([_scalar_score(lead, NOW) for lead in leads], abs=0.011)
+
+
+@pytest.mark.parametrize('status, follow_up', list(itertools.product(['Converted', 'Lost'], [None, NOW])))
+def test_single_lead_matches_its_batch_score(status, follow_up):
+    lead = {"status": status, "source": "Referral", "nextFollowUp": follow_up, "createdAt": NOW}
+    assert score_lead(lead, NOW) == score_leads([lead, *_leads(10)], NOW)[0]
+
+
+def test_empty_batch():
+    assert len(score_leads([], NOW)) == 0
+
+
+def test_rescore_only_writes_scores_that_moved(db):
+    db.leads.insert_many([dict(lead, createdBy='user-1') for lead in _leads(50)])
+
+    assert rescore_leads(db.leads, 'user-1', batch_size=20) == (50, 50)
+    assert rescore_leads(db.leads, 'user-1', batch_size=20) == (50, 0)
+
+
+def test_rescore_job_scores_every_lead(app, client, headers):
+    app.db.leads.insert_many([dict(lead, createdBy='user-1') for lead in _leads(30)])
+
+    job = client.post('/api/leads/rescore', json={}, headers=headers).get_json()['job']
+    job = wait_for_job(client, headers, job)
+
+    assert job['status'] == 'succeeded'
+    assert app.db.leads.count_documents({"createdBy": "user-1", "score": {"$exists": True}}) == 30
@@ -0,0 +1,41 @@
+from utils.ledger import rebuild_ledger, serialize_ledger
+from utils.seed_data import generate_dataset
+
+
+def _ledger(db, owner):
+    entries = db.customer_ledger.find({"createdBy": owner}, {"_id": 0})
+    return sorted((serialize_ledger(entry) for entry in entries), key=lambda entry: entry['customerKey'])
+
+
+def test_seeded_payments_have_ledgers_that_match_a_rebuild(db):
+    counts = generate_dataset(db, users=0, leads=0, projects=2, budgets=5, payments=50, owners=['u1', 'u2'],
+                              batch_size=20)
+
+    assert counts['payments'] == 50
+    assert counts['customer_ledger'] > 0
+    seeded = {owner: _ledger(db, owner) for owner in ('u1', 'u2')}
+    assert sum(entry['paymentCount'] for entries in seeded.values() for entry in entries) == 50
+    for owner, entries in seeded.items():
+        rebuild_ledger(db, owner)
+        rebuilt = _ledger(db, owner)
+        assert [dict(entry, updatedAt=None) for entry in entries] == [dict(entry, updatedAt=None) for entry in rebuilt]
+
+
+def test_seeded_budgets_and_payments_carry_base_amounts(db):
+    generate_dataset(db, users=0, leads=0, projects=1, budgets=3, payments=3, owners=['u1'])
+
+    for payment in db.payments.find():
+        assert payment['base'] == {"currency": 'INR', "rate": 1.0, "amount": payment['amount']}
+    for budget in db.budgets.find():
+        assert budget['base']['currency'] == 'INR'
+        assert budget['base']['totalBudget'] == budget['totalBudget']
+
+
+def test_the_same_seed_generates_the_same_data(db):
+    from utils.memory_db import MemoryClient
+    other = MemoryClient()['thrive_test']
+    for database in (db, other):
+        generate_dataset(database, users=0, leads=5, projects=2, budgets=2, payments=5, owners=['u1'], seed=7)
+    fields = {"_id": 0, "createdAt": 0, "updatedAt": 0, "date": 0, "nextFollowUp": 0, "scoredAt": 0, "projectId": 0}
+    for name in ('leads', 'payments', 'budgets'):
+        assert list(db[name].find({}, fields)) == list(other[name].find({}, fields))
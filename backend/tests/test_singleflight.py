@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from utils.singleflight import SingleFlight
+
+
+def _call_concurrently(flights, fn, callers=4):
+    """Run `callers` identical flights.do calls at once; fn must block until they have all joined."""
+    results, errors = [], []
+    started = threading.Barrier(callers)
+
+    def call():
+        started.wait(5)
+        try:
+            results.append(flights.do('key', fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def _slow(calls, result=None, error=None):
+    def fn():
+        calls.append(1)
+        # Long enough for every caller to arrive while this one is in flight
+        time.sleep(0.3)
+        if error is not None:
+            raise error
+        return result
+    return fn
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+
+    results, errors = _call_concurrently(flights, _slow(calls, result='rows'))
+
+    assert not errors
+    assert len(calls) == 1
+    assert [value for value, _ in results] == ['rows'] * 4
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert flights.stats() == {"executed": 1, "coalesced": 3, "timedOut": 0, "inFlight": 0}
+
+
+def test_every_caller_sees_the_leaders_error():
+    flights = SingleFlight()
+    calls = []
+
+    results, errors = _call_concurrently(flights, _slow(calls, error=RuntimeError('boom')))
+
+    assert not results
+    assert len(calls) == 1
+    assert [str(e) for e in errors] == ['boom'] * 4
+
+
+def test_nothing_is_cached_once_the_flight_lands():
+    flights = SingleFlight()
+    assert flights.do('key', lambda: 'first') == ('first', False)
+    assert flights.do('key', lambda: 'second') == ('second', False)
+
+
+@pytest.mark.parametrize('path', ['/api/leads/', '/api/payments/'])
+def test_identical_concurrent_requests_get_the_same_response(app, headers, path):
+    lock = threading.Lock()
+    do = app.singleflight.do
+    executions = []
+
+    def slow_do(key, fn):
+        def slow():
+            with lock:
+                executions.append(key)
+            time.sleep(0.3)
+            return fn()
+        return do(key, slow)
+
+    app.singleflight.do = slow_do
+    responses = []
+    started = threading.Barrier(3)
+
+    def get():
+        client = app.test_client()
+        started.wait(5)
+        responses.append(client.get(path, headers=headers))
+
+    threads = [threading.Thread(target=get) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(executions) == 1
+    assert [response.status_code for response in responses] == [200] * 3
+    assert len({response.data for response in responses}) == 1
+    assert sorted(response.headers.get('X-Coalesced', 'false') for response in responses) == ['false', 'true', 'true']
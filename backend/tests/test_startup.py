@@ -0,0 +1,97 @@
+import threading
+import time
+
+from utils.startup import StartupTasks
+
+
+class FlakyDatabase:
+    """Answers pings once `up` is set."""
+
+    def __init__(self, up=True):
+        self.up = up
+
+    def command(self, name):
+        if not self.up:
+            raise ConnectionError("no servers available")
+        return {"ok": 1}
+
+
+def _tasks(db, **kwargs):
+    return StartupTasks(db, retry_delay=0, max_retry_delay=0, **kwargs)
+
+
+def test_a_task_that_keeps_failing_does_not_block_the_ones_after_it():
+    ran = []
+
+    def build_unique_index():
+        raise RuntimeError("E11000 duplicate key")
+
+    startup = _tasks(FlakyDatabase(), max_attempts=3)
+    startup.add('indexes', build_unique_index)
+    startup.add('jobs', lambda: ran.append('jobs'))
+    startup.start(background=False)
+
+    assert startup.wait(0)
+    assert ran == ['jobs']
+    ready, details = startup.ready()
+    assert ready
+    assert details['status'] == 'degraded'
+    assert details['tasks'] == {"indexes": "failed", "jobs": "done"}
+    assert 'E11000' in details['errors']['indexes']
+
+
+def test_failures_while_the_database_is_down_do_not_use_up_attempts():
+    db = FlakyDatabase(up=False)
+    calls = []
+
+    def create_indexes():
+        calls.append(1)
+        if len(calls) == 5:
+            db.up = True
+        if not db.up:
+            raise ConnectionError("no servers available")
+
+    startup = _tasks(db, max_attempts=2)
+    startup.add('indexes', create_indexes)
+    startup.start(background=False)
+
+    assert len(calls) == 5
+    ready, details = startup.ready()
+    assert (ready, details['status'], details['tasks']) == (True, 'ready', {"indexes": "done"})
+    assert 'errors' not in details
+
+
+def test_not_ready_until_the_tasks_finish_and_the_database_answers():
+    startup = _tasks(FlakyDatabase(up=False))
+    ready, details = startup.ready()
+    assert (ready, details['status'], details['database']['ok']) == (False, 'starting', False)
+
+
+def test_readiness_endpoint_serves_the_cached_state(app, client):
+    response = client.get('/api/health/ready')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'ready'
+    assert set(response.get_json()['tasks']) >= {'indexes', 'jobs', 'fx_rates', 'revocations'}
+    assert client.get('/api/health/live').get_json()['status'] == 'alive'
+
+
+def test_not_ready_while_a_task_is_still_running(app, client):
+    release = threading.Event()
+    startup = _tasks(FlakyDatabase())
+    startup.add('indexes', lambda: release.wait(5))
+    startup.start()
+    app.startup = startup
+
+    starting = client.get('/api/health/ready')
+    release.set()
+    assert startup.wait(5)
+    # The first ping follows the tasks
+    deadline = time.monotonic() + 5
+    while not startup.ready()[0] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert starting.status_code == 503
+    assert starting.get_json()['status'] == 'starting'
+    assert starting.get_json()['tasks'] == {"indexes": "pending"}
+    assert client.get('/api/health/live').status_code == 200
+    assert client.get('/api/health/ready').status_code == 200
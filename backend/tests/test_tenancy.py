@@ -0,0 +1,86 @@
+import time
+from datetime import datetime
+
+import pytest
+
+import utils.tenancy
+from tests.conftest import auth_headers, create_test_app
+from utils.jobs import FINISHED_STATUSES
+from utils.tenancy import HashRing, parse_partitions
+
+
+@pytest.fixture
+def partitioned_app(monkeypatch):
+    return create_test_app(
+        monkeypatch, TENANT_PARTITIONS="p0=memory://thrive_p0;p1=memory://thrive_p1", TENANT_DIRECTORY_TTL='0'
+    )
+
+
+def test_parse_partitions():
+    assert parse_partitions("p0=memory://a; p1=mongodb://db1:27017/thrive_p1", 'thrive') == [
+        ('p0', 'memory://a', 'a'), ('p1', 'mongodb://db1:27017/thrive_p1', 'thrive_p1')
+    ]
+    with pytest.raises(ValueError):
+        parse_partitions("p0=memory://a;p0=memory://b", 'thrive')
+
+
+def test_hash_ring_is_stable_and_spreads_keys():
+    ring = HashRing(['p0', 'p1', 'p2'])
+    owners = [ring.lookup(f"user-{i}") for i in range(300)]
+    assert owners == [HashRing(['p0', 'p1', 'p2']).lookup(f"user-{i}") for i in range(300)]
+    assert all(owners.count(name) > 50 for name in ('p0', 'p1', 'p2'))
+
+
+def test_each_tenant_reads_and_writes_its_own_partition(partitioned_app):
+    app, client = partitioned_app, partitioned_app.test_client()
+    router = app.tenant_router
+    users = [f"user-{i}" for i in range(8)]
+    for user in users:
+        response = client.post('/api/leads/', json={"name": user, "email": f"{user}@x.com", "mobile": "9876543210"},
+                               headers=auth_headers(app, user))
+        assert response.status_code == 201
+
+    for user in users:
+        home = router.partition_for(user)
+        for name, database in router.partitions.items():
+            assert database.leads.count_documents({"createdBy": user}) == (1 if name == home else 0)
+        leads = client.get('/api/leads/', headers=auth_headers(app, user)).get_json()['leads']
+        assert [lead['name'] for lead in leads] == [user]
+
+
+def test_migration_carries_writes_that_keep_their_updated_at(partitioned_app, monkeypatch):
+    app, client = partitioned_app, partitioned_app.test_client()
+    for name in ("Ann", "Bob"):
+        client.post('/api/leads/', json={"name": name, "email": f"{name}@x.com", "mobile": "9876543210"},
+                    headers=auth_headers(app, 'user-1'))
+    router = app.tenant_router
+    source_name = router.partition_for('user-1')
+    target_name = next(name for name in router.partitions if name != source_name)
+    source = router.partitions[source_name]
+    # Leads last edited long ago, as archived ones are
+    source.leads.update_many({}, {"$set": {"updatedAt": datetime(2024, 1, 1)}})
+    ann, bob = source.leads.find_one({"name": "Ann"}), source.leads.find_one({"name": "Bob"})
+    copy = utils.tenancy._copy
+    written = []
+
+    def copy_then_write(source_collection, *args):
+        copy(source_collection, *args)
+        if source_collection.name == 'leads_archive' and not written:
+            written.append(True)
+            # Archiving and rescoring leave updatedAt alone, and both happen after their collection was copied
+            source.leads.delete_one({"_id": ann['_id']})
+            source.leads_archive.insert_one(ann)
+            source.leads.update_one({"_id": bob['_id']}, {"$set": {"score": 99}})
+
+    monkeypatch.setattr(utils.tenancy, '_copy', copy_then_write)
+    job = app.jobs.submit('tenant_migration', {"userId": 'user-1', "target": target_name}, 'admin')
+    deadline = time.monotonic() + 10
+    while app.jobs.get(job['_id'])['status'] not in FINISHED_STATUSES and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert app.jobs.get(job['_id'])['result']['moved']
+    target = router.partitions[target_name]
+    assert [lead['name'] for lead in target.leads.find()] == ["Bob"]
+    assert target.leads.find_one({"name": "Bob"})['score'] == 99
+    assert [lead['_id'] for lead in target.leads_archive.find()] == [ann['_id']]
+    assert source.leads.count_documents({}) == source.leads_archive.count_documents({}) == 0
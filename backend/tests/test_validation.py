@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import pytest
+
+from models import budget_validator, lead_validator, payment_validator
+from utils.validation import Field, Schema, ValidationError
+
+
+def test_create_coerces_types_applies_defaults_and_drops_unknown_fields():
+    lead = lead_validator.validate({
+        "name": " Ann ", "email": "ann@x.com", "mobile": 9876500001,
+        "nextFollowUp": "2024-03-01T10:00:00Z", "createdBy": "someone-else"
+    })
+
+    assert lead['name'] == 'Ann'
+    assert lead['mobile'] == '9876500001'
+    assert lead['nextFollowUp'] == datetime(2024, 3, 1, 10)
+    assert lead['status'] == 'New' and lead['assignedTo'] == 'Not Assigned'
+    assert 'createdBy' not in lead
+
+
+def test_partial_update_keeps_only_present_updatable_fields():
+    update = lead_validator.validate({"name": "Renamed", "notes": "call back", "status": ""}, partial=True)
+
+    assert update == {"notes": "call back", "status": None}
+
+
+def test_the_first_missing_field_is_reported():
+    with pytest.raises(ValidationError) as raised:
+        payment_validator.validate({"date": "2024-01-01"})
+
+    assert raised.value.error == 'missing_fields'
+    assert raised.value.message == 'customer is required'
+
+
+def test_report_all_missing_lists_every_field():
+    with pytest.raises(ValidationError) as raised:
+        budget_validator.validate({"budgetName": "Q1"})
+
+    assert raised.value.extra['missing_fields'] == ['projectId', 'projectName', 'totalBudget']
+
+
+@pytest.mark.parametrize('amount', ['abc', True, float('nan'), 0, -5])
+def test_invalid_amounts_are_rejected(amount):
+    with pytest.raises(ValidationError) as raised:
+        payment_validator.validate({"customer": "Acme", "date": "2024-01-01", "amount": amount})
+
+    assert raised.value.error == 'invalid_amount'
+
+
+def test_choices_are_enforced():
+    schema = Schema('thing', {"kind": Field('string', choices=('a', 'b'))})
+
+    assert schema.validate({"kind": "a"}) == {"kind": "a"}
+    with pytest.raises(ValidationError):
+        schema.validate({"kind": "c"})
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from utils.write_coalescer import WriteCoalescer
+
+
+def _insert_concurrently(coalescer, collection, documents):
+    """insert_one every document from its own thread; returns {email: result or exception}."""
+    results = {}
+    start = threading.Barrier(len(documents))
+
+    def insert(document):
+        start.wait()
+        try:
+            results[document['email']] = coalescer.insert_one(collection, document)
+        except Exception as e:
+            results[document['email']] = e
+
+    threads = [threading.Thread(target=insert, args=(document,)) for document in documents]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+@pytest.fixture
+def batches(db, monkeypatch):
+    """The document lists passed to leads.insert_many."""
+    calls = []
+    insert_many = db.leads.insert_many
+
+    def record(documents, **kwargs):
+        calls.append([document['email'] for document in documents])
+        return insert_many(documents, **kwargs)
+
+    monkeypatch.setattr(db.leads, 'insert_many', record)
+    return calls
+
+
+def test_concurrent_inserts_share_one_insert_many(db, batches):
+    coalescer = WriteCoalescer(['leads'], max_batch=100, max_delay=0.5)
+    documents = [{"email": f"{i}@x.com"} for i in range(5)]
+
+    results = _insert_concurrently(coalescer, db.leads, documents)
+
+    assert len(batches) == 1 and sorted(batches[0]) == sorted(results)
+    assert sorted(result.inserted_id for result in results.values()) == sorted(doc['_id'] for doc in db.leads.find())
+
+
+def test_a_duplicate_fails_only_its_own_insert(db, batches):
+    db.leads.create_index("email", unique=True)
+    db.leads.insert_one({"email": "taken@x.com"})
+    coalescer = WriteCoalescer(['leads'], max_batch=3, max_delay=0.5)
+
+    results = _insert_concurrently(coalescer, db.leads, [
+        {"email": "taken@x.com"}, {"email": "new-1@x.com"}, {"email": "new-2@x.com"}
+    ])
+
+    assert len(batches) == 1
+    assert isinstance(results.pop("taken@x.com"), DuplicateKeyError)
+    assert all(result.inserted_id for result in results.values())
+    assert db.leads.count_documents({}) == 3
+
+
+def test_a_full_batch_is_written_without_waiting_for_the_delay(db, batches):
+    coalescer = WriteCoalescer(['leads'], max_batch=3, max_delay=30)
+    started = time.monotonic()
+
+    _insert_concurrently(coalescer, db.leads, [{"email": f"{i}@x.com"} for i in range(3)])
+
+    assert time.monotonic() - started < 5
+    assert [len(batch) for batch in batches] == [3]
+
+
+def test_other_collections_insert_directly(db, batches):
+    coalescer = WriteCoalescer(['payments'], max_delay=30)
+    result = coalescer.insert_one(db.leads, {"email": "a@x.com"})
+    assert batches == []
+    assert db.leads.find_one({"_id": result.inserted_id})['email'] == "a@x.com"
@@ -0,0 +1,50 @@
+"""Grant or revoke the admin role; registration only ever creates plain users.
+
+Usage (from the backend directory):
+
+    python -m utils.admins grant someone@example.com
+    python -m utils.admins revoke someone@example.com
+    python -m utils.admins list
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+ADMIN = 'admin'
+USER = 'user'
+
+
+def set_role(db, email, role):
+    """Give the user with `email` `role`; returns whether such a user exists."""
+    result = db.users.update_one({"email": email}, {"$set": {"role": role, "updatedAt": datetime.utcnow()}})
+    return result.matched_count > 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage which users have admin access")
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/thrive_solutions'))
+    parser.add_argument('--db', default=os.getenv('MONGO_DB_NAME', 'thrive_solutions'))
+    parser.add_argument('action', choices=['grant', 'revoke', 'list'])
+    parser.add_argument('email', nargs='?')
+    args = parser.parse_args(argv)
+    if args.action != 'list' and not args.email:
+        parser.error(f"{args.action} needs the user's email")
+
+    from pymongo import MongoClient
+    db = MongoClient(args.mongo_uri)[args.db]
+    if args.action == 'list':
+        for user in db.users.find({"role": ADMIN}, {"email": 1, "fullName": 1}).sort("email", 1):
+            print(f"{user['email']} ({user.get('fullName')})")
+        return 0
+
+    if not set_role(db, args.email, ADMIN if args.action == 'grant' else USER):
+        print(f"❌ No user with email {args.email}")
+        return 1
+    print(f"✅ {args.email} is {'now' if args.action == 'grant' else 'no longer'} an admin")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
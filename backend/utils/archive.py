@@ -0,0 +1,233 @@
+"""Hot/cold tiering: closed leads and settled payments move to archive collections.
+
+An ``ArchivePolicy`` names the statuses after which a document no longer
+changes and the date field that says how long ago that was. A run moves every
+matching document older than the policy's age into ``<collection>_archive``
+(stamped with ``archivedAt``), in batches paced to ``max_per_second`` like
+the schema migrations. Each batch is copied first and each document is then
+deleted from the hot collection only while its ``updatedAt`` is still the
+one that was copied, so a document edited during the run stays hot (and its
+stale copy is dropped from the archive).
+
+Lists read the hot collection unless a request passes ``include_archived``,
+which unions the archive in the same aggregation (``$unionWith``) and marks
+those documents ``archived: true``. Updates and deletes of an archived
+document answer 409 until it is restored with ``POST .../<id>/restore``; a
+restored document is left alone by the policy for another full age period.
+Lifetime figures (payment totals, the ledger rebuild, lead status counts)
+read both tiers.
+
+Runs are started with ``POST /api/admin/archive/run`` (the ``archive`` job,
+once per tenant partition) or from the command line:
+
+    python -m utils.archive --dry-run
+    python -m utils.archive --collection payments --max-per-second 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask import jsonify
+from pymongo import DeleteOne, ReplaceOne
+
+from utils.migrations import Pacer
+
+ARCHIVE_SUFFIX = '_archive'
+
+
+class ArchivePolicy:
+    def __init__(self, collection, statuses, age_field, default_days):
+        self.collection = collection
+        self.archive = collection + ARCHIVE_SUFFIX
+        self.statuses = statuses
+        self.age_field = age_field
+        self.default_days = default_days
+
+    def query(self, cutoff):
+        """Documents this policy archives when `cutoff` is the newest age that qualifies."""
+        return {
+            "status": {"$in": list(self.statuses)},
+            self.age_field: {"$lt": cutoff},
+            # Restored documents get a full age period back in the hot tier
+            "$or": [{"restoredAt": {"$exists": False}}, {"restoredAt": {"$lt": cutoff}}]
+        }
+
+
+POLICIES = {
+    'leads': ArchivePolicy('leads', ('Converted', 'Lost'), 'updatedAt', 180),
+    'payments': ArchivePolicy('payments', ('Completed', 'Failed'), 'date', 365),
+}
+
+
+def archive_name(collection):
+    return collection + ARCHIVE_SUFFIX
+
+
+def include_archived(args):
+    return args.get('include_archived', '').lower() in ('1', 'true')
+
+
+def tiered_pipeline(collection, match, projection=None, archived=False, sort=None, limit=None):
+    """Pipeline reading `match` from `collection` and, with `archived`, from its archive too.
+
+    Each tier is sorted and limited on its own (so both can use their indexes)
+    before the union is; the projection comes last so the sort keys survive it.
+    """
+    def read(flag):
+        stages = [{"$match": match}]
+        if sort:
+            stages.append({"$sort": sort})
+        if limit:
+            stages.append({"$limit": limit})
+        if flag:
+            stages.append({"$addFields": {"archived": True}})
+        return stages
+
+    pipeline = read(False)
+    if archived:
+        pipeline.append({"$unionWith": {"coll": archive_name(collection), "pipeline": read(True)}})
+        if sort:
+            pipeline.append({"$sort": sort})
+        if limit:
+            pipeline.append({"$limit": limit})
+    if projection:
+        if archived and any(value for field, value in projection.items() if field != '_id'):
+            projection = dict(projection, archived=1)
+        pipeline.append({"$project": projection})
+    return pipeline
+
+
+def is_archived(db, collection, document_id, user_id):
+    try:
+        document_id = ObjectId(document_id)
+    except Exception:
+        return False
+    return db[archive_name(collection)].find_one({"_id": document_id, "createdBy": user_id}, {"_id": 1}) is not None
+
+
+def archived_response(label):
+    return jsonify({
+        "message": f"{label} is archived; restore it before changing it",
+        "error": "archived"
+    }), 409
+
+
+def restore_document(db, collection, document_id, user_id):
+    """Move one of `user_id`'s documents back to the hot tier; returns it, or None when it is not archived."""
+    archive = db[archive_name(collection)]
+    document = archive.find_one({"_id": ObjectId(document_id), "createdBy": user_id})
+    if document is None:
+        return None
+    document.pop('archivedAt', None)
+    document['restoredAt'] = datetime.utcnow()
+    db[collection].replace_one({"_id": document['_id']}, document, upsert=True)
+    archive.delete_one({"_id": document['_id']})
+    return document
+
+
+def archive_collection(db, policy, older_than_days=None, batch_size=1000, pace=None, dry_run=False, progress=None,
+                       skip_owners=None):
+    """Move `db`'s documents matching `policy` to its archive; returns the counts.
+
+    `skip_owners()`, asked before every batch, names users whose documents must not move right now.
+    """
+    days = policy.default_days if older_than_days is None else older_than_days
+    query = base_query = policy.query(datetime.utcnow() - timedelta(days=days))
+    hot, archive = db[policy.collection], db[policy.archive]
+    counts = {"archived": 0, "conflicts": 0}
+    if dry_run:
+        counts['archived'] = hot.count_documents(query)
+        return counts
+
+    pace = pace or Pacer(0)
+    while True:
+        skipped = skip_owners() if skip_owners else None
+        query = dict(base_query, createdBy={"$nin": skipped}) if skipped else base_query
+        # Moved documents leave the hot collection, so each batch starts from the top
+        batch = list(hot.find(query).limit(batch_size))
+        if not batch:
+            return counts
+        now = datetime.utcnow()
+        archive.bulk_write([
+            ReplaceOne({"_id": document['_id']}, dict(document, archivedAt=now), upsert=True) for document in batch
+        ], ordered=False)
+        # Only the version that was copied: an edit since then keeps the document hot
+        deleted = hot.bulk_write([
+            DeleteOne(dict(query, _id=document['_id'], updatedAt=document.get('updatedAt'))) for document in batch
+        ], ordered=False).deleted_count
+        if deleted < len(batch):
+            copied = {document['_id']: document.get('updatedAt') for document in batch}
+            kept = list(hot.find({"_id": {"$in": list(copied)}}, {"_id": 1}))
+            if kept:
+                archive.bulk_write([
+                    DeleteOne({"_id": document['_id'], "updatedAt": copied[document['_id']]}) for document in kept
+                ], ordered=False)
+            counts['conflicts'] += len(kept)
+        counts['archived'] += deleted
+        if progress:
+            progress(counts['archived'])
+        pace(len(batch))
+
+
+def archive_all(partitions, older_than_days=None, collections=None, batch_size=1000, max_per_second=0,
+                dry_run=False, progress=None, skip_owners=None):
+    """Run the policies (all, or those for `collections`) over every (name, database) in `partitions`."""
+    pace = Pacer(max_per_second)
+    report = {}
+    for partition, db in partitions:
+        for name, policy in POLICIES.items():
+            if collections and name not in collections:
+                continue
+            key = f"{partition}:{name}"
+            report[key] = archive_collection(
+                db, policy, (older_than_days or {}).get(name), batch_size, pace, dry_run,
+                progress=(lambda done, key=key: progress(done, key)) if progress else None,
+                skip_owners=skip_owners
+            )
+    return report
+
+
+def tier_sizes(db):
+    """Document counts of each archived collection's hot and cold tier."""
+    return {
+        name: {
+            "hot": db[name].estimated_document_count(),
+            "archived": db[policy.archive].estimated_document_count()
+        }
+        for name, policy in POLICIES.items()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move closed leads and settled payments to the archive tier")
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/thrive_solutions'))
+    parser.add_argument('--db', default=os.getenv('MONGO_DB_NAME', 'thrive_solutions'))
+    parser.add_argument('--collection', choices=list(POLICIES), action='append', help='default: every policy')
+    parser.add_argument('--older-than-days', type=int, default=None, help="default: each policy's own age")
+    parser.add_argument('--dry-run', action='store_true', help='count what would move')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--max-per-second', type=float, default=0, help='documents per second (0: unthrottled)')
+    args = parser.parse_args(argv)
+
+    from pymongo import MongoClient
+    db = MongoClient(args.mongo_uri)[args.db]
+    days = {name: args.older_than_days for name in POLICIES} if args.older_than_days is not None else None
+
+    def progress(done, key):
+        print(f"📝 {key}: {done}")
+
+    started = time.perf_counter()
+    report = archive_all(
+        [('default', db)], days, args.collection, args.batch_size, args.max_per_second, args.dry_run, progress
+    )
+    elapsed = time.perf_counter() - started
+    print(f"✅ Archive {'checked' if args.dry_run else 'run'} in {elapsed:.1f}s: {report}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""File attachments for leads and projects, stored in GridFS format.
+
+Files live in ``attachments.files`` and ``attachments.chunks`` using the
+standard GridFS layout, so ``gridfs.GridFSBucket(db, 'attachments')`` and the
+mongofiles tool can read them. They are written chunk by chunk here rather
+than through pymongo's GridFSBucket, which only accepts a real ``Database``,
+so the same code also runs on the in-memory engine.
+
+Uploads are read from the request stream one chunk at a time, and downloads
+are streamed the same way, so a worker never holds more than one chunk of a
+file. Downloads honour ``Range``, ``If-Range`` and ``If-None-Match`` (the ETag
+is the file's SHA-256). Each user's total stored bytes are tracked in
+``attachment_usage`` and reserved chunk by chunk with a conditional ``$inc``,
+so concurrent uploads cannot overshoot the quota.
+
+The record keeps a pointer to its current file in ``attachment``. A finished
+upload swaps that pointer only if it still points at an older file, and then
+deletes just the file it replaced, so two uploads racing for the same record
+never delete each other's file: the newer one wins and the older one removes
+itself.
+"""
+
+import hashlib
+import io
+import json
+import mimetypes
+from datetime import datetime
+
+from bson import ObjectId, Binary
+from flask import request, jsonify, send_file
+from pymongo import ReturnDocument
+from werkzeug.exceptions import RequestedRangeNotSatisfiable, RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+from models import JSONEncoder
+
+BUCKET = 'attachments'
+
+# GridFS default: just under 256KB so a chunk document stays below 16MB with room to spare
+CHUNK_SIZE = 255 * 1024
+
+
+class AttachmentError(Exception):
+    def __init__(self, message, error, status=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.error = error
+        self.status = status
+        self.extra = extra
+
+    def response(self):
+        return jsonify({"message": self.message, "error": self.error, **self.extra}), self.status
+
+
+def _read_exact(stream, size):
+    # Request streams may return short reads; GridFS needs full chunks except the last
+    parts = []
+    remaining = size
+    while remaining:
+        data = stream.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b''.join(parts)
+
+
+class GridReader(io.RawIOBase):
+    """A seekable, read-only view of a stored file that loads one chunk at a time."""
+
+    def __init__(self, chunks, file_doc):
+        self._chunks = chunks
+        self._file = file_doc
+        self._chunk_size = file_doc['chunkSize']
+        self._position = 0
+        self._cached = (None, b'')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._file['length']
+        self._position = max(0, offset)
+        return self._position
+
+    def _chunk(self, n):
+        if self._cached[0] != n:
+            chunk = self._chunks.find_one({"files_id": self._file['_id'], "n": n})
+            if chunk is None:
+                raise IOError(f"Attachment {self._file['_id']} is missing chunk {n}")
+            self._cached = (n, bytes(chunk['data']))
+        return self._cached[1]
+
+    def readinto(self, buffer):
+        if self._position >= self._file['length']:
+            return 0
+        n, offset = divmod(self._position, self._chunk_size)
+        data = self._chunk(n)[offset:offset + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class AttachmentStore:
+    def __init__(self, db, quota_bytes, max_file_bytes, chunk_size=CHUNK_SIZE):
+        self.db = db
+        self.quota_bytes = quota_bytes
+        self.max_file_bytes = max_file_bytes
+        self.chunk_size = chunk_size
+
+    @property
+    def files(self):
+        return self.db[f'{BUCKET}.files']
+
+    @property
+    def chunks(self):
+        return self.db[f'{BUCKET}.chunks']
+
+    def create_indexes(self):
+        # The two indexes the GridFS spec expects, plus lookups by owning record
+        self.chunks.create_index([("files_id", 1), ("n", 1)], unique=True)
+        self.files.create_index([("filename", 1), ("uploadDate", 1)])
+        self.files.create_index([("metadata.owner", 1), ("metadata.parentKind", 1), ("metadata.parentId", 1)])
+
+    def usage(self, owner):
+        doc = self.db.attachment_usage.find_one({"_id": owner})
+        return doc['bytes'] if doc else 0
+
+    def _reserve(self, owner, size):
+        result = self.db.attachment_usage.update_one(
+            {"_id": owner, "bytes": {"$lte": self.quota_bytes - size}},
+            {"$inc": {"bytes": size}}
+        )
+        return result.matched_count == 1
+
+    def _release(self, owner, size):
+        if size:
+            self.db.attachment_usage.update_one({"_id": owner}, {"$inc": {"bytes": -size}})
+
+    def _too_large(self):
+        return AttachmentError(
+            f"Attachments are limited to {self.max_file_bytes} bytes", "attachment_too_large", 413,
+            maxBytes=self.max_file_bytes
+        )
+
+    def _over_quota(self, owner):
+        return AttachmentError(
+            "Attachment storage quota exceeded", "attachment_quota_exceeded", 413,
+            quotaBytes=self.quota_bytes, usedBytes=self.usage(owner)
+        )
+
+    def upload(self, stream, owner, parent_kind, parent_id, filename, content_type, expected_length=None):
+        """Store `stream` chunk by chunk; returns the files document."""
+        if expected_length is not None and expected_length > self.max_file_bytes:
+            raise self._too_large()
+        if expected_length is not None and expected_length > self.quota_bytes - self.usage(owner):
+            raise self._over_quota(owner)
+        self.db.attachment_usage.update_one({"_id": owner}, {"$setOnInsert": {"bytes": 0}}, upsert=True)
+
+        file_id = ObjectId()
+        digest = hashlib.sha256()
+        length = reserved = n = 0
+        try:
+            while True:
+                data = _read_exact(stream, self.chunk_size)
+                if not data:
+                    break
+                length += len(data)
+                if length > self.max_file_bytes:
+                    raise self._too_large()
+                if not self._reserve(owner, len(data)):
+                    raise self._over_quota(owner)
+                reserved += len(data)
+                digest.update(data)
+                self.chunks.insert_one({"files_id": file_id, "n": n, "data": Binary(data)})
+                n += 1
+                if len(data) < self.chunk_size:
+                    break
+            # The files document goes in last, so readers never see a partial upload
+            file_doc = {
+                "_id": file_id,
+                "length": length,
+                "chunkSize": self.chunk_size,
+                "uploadDate": datetime.utcnow(),
+                "filename": filename,
+                "metadata": {
+                    "owner": owner,
+                    "parentKind": parent_kind,
+                    "parentId": parent_id,
+                    "contentType": content_type,
+                    "sha256": digest.hexdigest()
+                }
+            }
+            self.files.insert_one(file_doc)
+        except BaseException:
+            self.chunks.delete_many({"files_id": file_id})
+            self._release(owner, reserved)
+            raise
+        return file_doc
+
+    def find(self, owner, parent_kind, parent_id):
+        """The newest file attached to a record, or None."""
+        cursor = self.files.find({
+            "metadata.owner": owner,
+            "metadata.parentKind": parent_kind,
+            "metadata.parentId": parent_id
+        }).sort("uploadDate", -1).limit(1)
+        return next(iter(cursor), None)
+
+    def open(self, file_doc):
+        return GridReader(self.chunks, file_doc)
+
+    def delete(self, file_doc):
+        if self.files.delete_one({"_id": file_doc['_id']}).deleted_count:
+            self.chunks.delete_many({"files_id": file_doc['_id']})
+            self._release(file_doc['metadata']['owner'], file_doc['length'])
+
+    def discard(self, file_id):
+        file_doc = self.files.find_one({"_id": file_id}, {"length": 1, "metadata.owner": 1})
+        if file_doc:
+            self.delete(file_doc)
+
+    def reparent(self, owner, parent_kind, parent_ids, new_parent_id):
+        """Move the files of merged records onto the record they were merged into."""
+        self.files.update_many(
+            {"metadata.owner": owner, "metadata.parentKind": parent_kind, "metadata.parentId": {"$in": parent_ids}},
+            {"$set": {"metadata.parentId": new_parent_id}}
+        )
+
+    def delete_for(self, owner, parent_kind, parent_id, keep=None):
+        """Delete every file attached to a record except `keep`; returns how many were removed."""
+        query = {"metadata.owner": owner, "metadata.parentKind": parent_kind, "metadata.parentId": parent_id}
+        if keep is not None:
+            query['_id'] = {"$ne": keep}
+        removed = 0
+        for file_doc in self.files.find(query, {"length": 1, "metadata.owner": 1}):
+            self.delete(file_doc)
+            removed += 1
+        return removed
+
+
+def serialize_attachment(file_doc):
+    return {
+        "id": str(file_doc['_id']),
+        "fileName": file_doc['filename'],
+        "length": file_doc['length'],
+        "contentType": file_doc['metadata']['contentType'],
+        "sha256": file_doc['metadata']['sha256'],
+        "uploadedAt": file_doc['uploadDate']
+    }
+
+
+def _not_found(message):
+    return jsonify({"message": message, "error": "not_found"}), 404
+
+
+def upload_response(collection, parent_id, owner, name_field):
+    """Handle an upload for the record `parent_id` in `collection`, storing its name in `name_field`."""
+    label = collection[:-1].capitalize()
+    parent = request.current_app.db[collection].find_one(
+        {"_id": ObjectId(parent_id), "createdBy": owner}, {name_field: 1}
+    )
+    if not parent:
+        return _not_found(f"{label} not found")
+
+    # Either a multipart form with a `file` part (spooled to disk by Werkzeug)
+    # or the raw file as the request body
+    store = request.current_app.attachments
+    try:
+        upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+        if upload is not None:
+            stream, filename, content_type, expected = upload.stream, upload.filename, upload.mimetype, None
+        else:
+            stream = request.stream
+            filename = request.args.get('filename') or request.headers.get('X-File-Name')
+            content_type, expected = request.mimetype, request.content_length
+    except RequestEntityTooLarge:
+        # The body is over MAX_CONTENT_LENGTH, which is sized from ATTACHMENT_MAX_BYTES
+        return store._too_large().response()
+    filename = secure_filename(filename or parent.get(name_field) or '') or 'attachment'
+    if not content_type or content_type == 'application/x-www-form-urlencoded':
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    try:
+        file_doc = store.upload(stream, owner, collection, parent_id, filename, content_type, expected)
+    except AttachmentError as e:
+        return e.response()
+
+    # Point the record at the new file unless a newer upload got there first
+    attachment = serialize_attachment(file_doc)
+    previous = request.current_app.db[collection].find_one_and_update(
+        {
+            "_id": ObjectId(parent_id),
+            "createdBy": owner,
+            "$or": [
+                {"attachment.uploadedAt": {"$exists": False}},
+                {"attachment.uploadedAt": {"$lt": file_doc['uploadDate']}}
+            ]
+        },
+        {"$set": {name_field: filename, "attachment": attachment, "updatedAt": datetime.utcnow()}},
+        projection={"attachment.id": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if previous is None:
+        store.delete(file_doc)
+        if not request.current_app.db[collection].find_one({"_id": ObjectId(parent_id), "createdBy": owner}, {"_id": 1}):
+            return _not_found(f"{label} not found")
+        return jsonify({
+            "message": "A newer upload replaced this file",
+            "error": "attachment_superseded"
+        }), 409
+    if previous.get('attachment'):
+        store.discard(ObjectId(previous['attachment']['id']))
+    return jsonify({
+        "message": "File uploaded successfully",
+        "attachment": json.loads(JSONEncoder().encode(attachment)),
+        "usedBytes": store.usage(owner),
+        "quotaBytes": store.quota_bytes
+    }), 201
+
+
+def download_response(collection, parent_id, owner):
+    store = request.current_app.attachments
+    file_doc = store.find(owner, collection, parent_id)
+    if not file_doc:
+        return _not_found("File not found")
+
+    response = send_file(
+        store.open(file_doc),
+        mimetype=file_doc['metadata']['contentType'],
+        as_attachment=True,
+        download_name=file_doc['filename'],
+        etag=file_doc['metadata']['sha256'],
+        last_modified=file_doc['uploadDate'],
+        conditional=False
+    )
+    # send_file cannot size a custom file object; with the length known,
+    # make_conditional answers Range, If-Range and If-None-Match
+    response.content_length = file_doc['length']
+    response.headers['Accept-Ranges'] = 'bytes'
+    try:
+        return response.make_conditional(request, accept_ranges=True, complete_length=file_doc['length'])
+    except RequestedRangeNotSatisfiable:
+        response = jsonify({"message": "Requested range not satisfiable", "error": "invalid_range"})
+        response.status_code = 416
+        response.headers['Content-Range'] = f"bytes */{file_doc['length']}"
+        return response
+
+
+def delete_response(collection, parent_id, owner, name_field):
+    store = request.current_app.attachments
+    if not store.delete_for(owner, collection, parent_id):
+        return _not_found("File not found")
+    request.current_app.db[collection].update_one(
+        {"_id": ObjectId(parent_id), "createdBy": owner},
+        {"$unset": {"attachment": "", name_field: ""}, "$set": {"updatedAt": datetime.utcnow()}}
+    )
+    return jsonify({
+        "message": "File deleted successfully",
+        "usedBytes": store.usage(owner)
+    }), 200
@@ -0,0 +1,178 @@
+"""Write-behind change history for leads, projects, budgets and payments.
+
+Update and delete handlers already hold the document as it was, so they pass
+it here with the fields they wrote and a field-level diff is computed in the
+request. The entry is only put on a bounded in-memory queue; a background
+thread writes queued entries to ``audit_log`` with one unordered
+``insert_many`` per batch, so a request never waits on an audit write. When
+the queue is full a request waits at most ``enqueue_timeout`` for room before
+the entry is dropped (and counted in ``stats()``).
+
+``close()`` drains the queue and is registered with ``atexit``, so a graceful
+worker shutdown writes whatever is still queued. Entries expire through a
+TTL index on ``at`` after ``AUDIT_RETENTION_DAYS``. History reads are
+eventually consistent: an entry shows up once its batch has been flushed,
+normally within ``AUDIT_FLUSH_INTERVAL`` seconds.
+"""
+
+import atexit
+import json
+import queue
+import threading
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import request, jsonify
+
+from models import JSONEncoder
+
+# Bookkeeping and derived fields: they follow from the edited fields and would only add noise
+IGNORED_FIELDS = frozenset(['_id', 'id', 'updatedAt', 'score', 'scoredAt', 'dedupeKeys', 'customerKey', 'base'])
+
+# Largest page GET .../history returns
+MAX_HISTORY_PAGE = 100
+
+
+def diff_fields(before, changes):
+    """{field: {"from": old, "to": new}} for the fields in `changes` whose value differs from `before`."""
+    return {
+        field: {"from": before.get(field), "to": value}
+        for field, value in changes.items()
+        if field not in IGNORED_FIELDS and before.get(field) != value
+    }
+
+
+def _snapshot(document):
+    return {field: value for field, value in document.items() if field not in IGNORED_FIELDS}
+
+
+class AuditTrail:
+    def __init__(self, db, max_queue=10000, batch_size=500, flush_interval=1.0, enqueue_timeout=0.05):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._counts = {"queued": 0, "written": 0, "dropped": 0, "failed": 0}
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._counts[key] += n
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, pending=self._queue.qsize())
+
+    def record(self, entity, entity_id, action, user_id, changes=None, snapshot=None):
+        entry = {
+            "entity": entity,
+            "entityId": str(entity_id),
+            "action": action,
+            "changes": changes or {},
+            "createdBy": user_id,
+            "at": datetime.utcnow()
+        }
+        if snapshot is not None:
+            entry['snapshot'] = snapshot
+        try:
+            self._queue.put(entry, timeout=self.enqueue_timeout)
+            self._count('queued')
+        except queue.Full:
+            self._count('dropped')
+
+    def record_update(self, entity, before, update, user_id):
+        changes = diff_fields(before, update)
+        if changes:
+            self.record(entity, before['_id'], 'update', user_id, changes)
+
+    def record_delete(self, entity, before, user_id):
+        self.record(entity, before['_id'], 'delete', user_id, snapshot=_snapshot(before))
+
+    def _take(self, block):
+        """Up to `batch_size` queued entries; with `block`, wait up to flush_interval for the first."""
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval) if block else self._queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        try:
+            self.db.audit_log.insert_many(batch, ordered=False)
+            self._count('written', len(batch))
+        except Exception as e:
+            self._count('failed', len(batch))
+            print(f"❌ Failed to write {len(batch)} audit entries: {e}")
+
+    def flush(self):
+        """Write everything queued so far from the calling thread; returns how many were written."""
+        written = 0
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                return written
+            self._write(batch)
+            written += len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._take(block=True)
+            if batch:
+                self._write(batch)
+
+    def close(self, timeout=10):
+        """Stop the writer, waiting up to `timeout` for its batch, and flush what is left."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.flush()
+
+
+def serialize_entry(entry):
+    serialized = {
+        "id": str(entry['_id']),
+        "action": entry['action'],
+        "changes": entry.get('changes') or {},
+        "at": entry['at']
+    }
+    if 'snapshot' in entry:
+        serialized['snapshot'] = entry['snapshot']
+    return serialized
+
+
+def history_response(entity, entity_id, user_id):
+    """One page of an entity's history, newest first; pass ``nextCursor`` back as ?before= for the next."""
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), MAX_HISTORY_PAGE)
+    except ValueError:
+        return jsonify({"message": "limit must be an integer", "error": "invalid_limit"}), 400
+
+    query = {"createdBy": user_id, "entity": entity, "entityId": entity_id}
+    before = request.args.get('before')
+    if before:
+        try:
+            query['_id'] = {"$lt": ObjectId(before)}
+        except (InvalidId, TypeError):
+            return jsonify({"message": "before must be a history entry id", "error": "invalid_cursor"}), 400
+
+    entries = list(request.current_app.db.audit_log.find(query).sort("_id", -1).limit(limit + 1))
+    more = len(entries) > limit
+    entries = entries[:limit]
+    return jsonify({
+        "history": json.loads(JSONEncoder().encode([serialize_entry(entry) for entry in entries])),
+        "nextCursor": str(entries[-1]['_id']) if more else None
+    }), 200
@@ -0,0 +1,284 @@
+"""Lead de-duplication with blocking keys.
+
+Each lead stores ``dedupeKeys``: its canonical email (``e:``), canonical phone
+(``p:``) and one ``n:<company>|<name token>`` key per name token. A multikey
+index on ``(createdBy, dedupeKeys)`` makes both the on-write check and the
+batch job cheap: candidates are only ever leads that share a key.
+
+The merge job groups leads by key in one aggregation and only looks inside
+each block. Leads sharing an email or phone key are duplicates outright, so
+those blocks are unioned in linear time. Name blocks are compared pairwise
+(similar names at the same company), and only when asked to, and only up to
+``MAX_NAME_BLOCK`` leads. Clusters are collected with union-find, so the work
+grows with the size of the blocks, not with the square of the lead count.
+A cluster is only merged after its leads are compared again as stored, so
+keys an edit left stale never merge leads that no longer match.
+"""
+
+import re
+from datetime import datetime
+from difflib import SequenceMatcher
+
+from pymongo import UpdateOne
+
+# National significant number length; "+91 98765 43210" and "098765-43210" agree
+PHONE_DIGITS = 10
+
+COMPANY_STOPWORDS = frozenset([
+    'the', 'and', 'co', 'company', 'corp', 'corporation', 'inc', 'incorporated',
+    'llc', 'llp', 'ltd', 'limited', 'pvt', 'private', 'plc'
+])
+
+# Minimum similarity of two canonical names at the same company
+NAME_SIMILARITY = 0.85
+
+# Name blocks bigger than this are too unspecific to compare pairwise
+MAX_NAME_BLOCK = 200
+
+# Fields a merge copies onto the surviving lead when it has no value of its own
+MERGE_FIELDS = ('address', 'company', 'designation', 'source', 'nextFollowUp', 'assignedTo', 'fileName')
+
+# Fields the blocking keys are computed from; changing one means recomputing them
+KEY_FIELDS = ('name', 'email', 'mobile', 'company')
+
+EXACT_REASONS = ('email', 'phone')
+
+
+def _tokens(value):
+    return re.findall(r'[a-z0-9]+', str(value or '').lower())
+
+
+def canonical_phone(mobile):
+    digits = re.sub(r'\D', '', str(mobile or ''))
+    if len(digits) < 6:
+        return None
+    return digits[-PHONE_DIGITS:]
+
+
+def canonical_email(email):
+    email = str(email or '').strip().lower()
+    local, _, domain = email.rpartition('@')
+    if not local or not domain:
+        return None
+    local = local.split('+', 1)[0]
+    if domain in ('gmail.com', 'googlemail.com'):
+        local, domain = local.replace('.', ''), 'gmail.com'
+    return f"{local}@{domain}"
+
+
+def canonical_company(company):
+    return ' '.join(token for token in _tokens(company) if token not in COMPANY_STOPWORDS)
+
+
+def canonical_name(name):
+    return ' '.join(sorted(_tokens(name)))
+
+
+def blocking_keys(lead):
+    keys = set()
+    email = canonical_email(lead.get('email'))
+    if email:
+        keys.add(f"e:{email}")
+    phone = canonical_phone(lead.get('mobile'))
+    if phone:
+        keys.add(f"p:{phone}")
+    company = canonical_company(lead.get('company'))
+    if company:
+        keys.update(f"n:{company}|{token}" for token in _tokens(lead.get('name')) if len(token) > 1)
+    return sorted(keys)
+
+
+def names_match(a, b):
+    a, b = canonical_name(a), canonical_name(b)
+    return bool(a and b) and (a == b or SequenceMatcher(None, a, b).ratio() >= NAME_SIMILARITY)
+
+
+def match_reasons(lead, other):
+    reasons = []
+    email = canonical_email(lead.get('email'))
+    if email and email == canonical_email(other.get('email')):
+        reasons.append('email')
+    phone = canonical_phone(lead.get('mobile'))
+    if phone and phone == canonical_phone(other.get('mobile')):
+        reasons.append('phone')
+    company = canonical_company(lead.get('company'))
+    if company and company == canonical_company(other.get('company')) and names_match(lead.get('name'), other.get('name')):
+        reasons.append('name')
+    return reasons
+
+
+def find_duplicates(collection, user_id, lead, limit=5):
+    """Existing leads of `user_id` that look like `lead`, strongest matches first."""
+    keys = lead.get('dedupeKeys') or blocking_keys(lead)
+    if not keys:
+        return []
+    candidates = collection.find(
+        {"createdBy": user_id, "dedupeKeys": {"$in": keys}},
+        {"name": 1, "email": 1, "mobile": 1, "company": 1, "status": 1}
+    ).limit(50)
+    matches = []
+    for candidate in candidates:
+        reasons = match_reasons(lead, candidate)
+        if reasons:
+            matches.append({
+                "id": str(candidate['_id']),
+                "name": candidate.get('name'),
+                "email": candidate.get('email'),
+                "mobile": candidate.get('mobile'),
+                "company": candidate.get('company'),
+                "status": candidate.get('status'),
+                "reasons": reasons
+            })
+    matches.sort(key=lambda match: (not any(r in EXACT_REASONS for r in match['reasons']), -len(match['reasons'])))
+    return matches[:limit]
+
+
+def backfill_keys(collection, user_id, batch_size=1000, progress=None):
+    """Compute ``dedupeKeys`` for leads written before they existed."""
+    query = {"createdBy": user_id, "dedupeKeys": {"$exists": False}}
+    projection = {"name": 1, "email": 1, "mobile": 1, "company": 1}
+    updated = 0
+    while True:
+        batch = list(collection.find(query, projection).limit(batch_size))
+        if not batch:
+            return updated
+        collection.bulk_write(
+            [UpdateOne({"_id": lead['_id']}, {"$set": {"dedupeKeys": blocking_keys(lead)}}) for lead in batch],
+            ordered=False
+        )
+        updated += len(batch)
+        if progress:
+            progress(updated)
+
+
+class DisjointSet:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent.setdefault(item, item)
+        if parent != item:
+            parent = self.parent[item] = self.find(parent)
+        return parent
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+    def groups(self):
+        groups = {}
+        for item in list(self.parent):
+            groups.setdefault(self.find(item), []).append(item)
+        return [members for members in groups.values() if len(members) > 1]
+
+
+def find_clusters(collection, user_id, match_names=False, progress=None):
+    """Group `user_id`'s duplicate leads; returns (clusters of _ids, stats)."""
+    pipeline = [
+        {"$match": {"createdBy": user_id}},
+        {"$project": {"dedupeKeys": 1, "name": 1}},
+        {"$unwind": "$dedupeKeys"},
+    ]
+    if not match_names:
+        pipeline.append({"$match": {"dedupeKeys": {"$regex": "^[ep]:"}}})
+    pipeline += [
+        {"$group": {"_id": "$dedupeKeys", "members": {"$push": {"id": "$_id", "name": "$name"}}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+
+    sets = DisjointSet()
+    stats = {"blocks": 0, "skippedBlocks": 0, "comparisons": 0}
+    for block in collection.aggregate(pipeline, allowDiskUse=True):
+        stats['blocks'] += 1
+        members = block['members']
+        if not block['_id'].startswith('n:'):
+            for member in members[1:]:
+                sets.union(members[0]['id'], member['id'])
+        elif len(members) > MAX_NAME_BLOCK:
+            stats['skippedBlocks'] += 1
+        else:
+            for i, member in enumerate(members):
+                for other in members[i + 1:]:
+                    stats['comparisons'] += 1
+                    if names_match(member.get('name'), other.get('name')):
+                        sets.union(member['id'], other['id'])
+        if progress:
+            progress(stats['blocks'])
+    return sets.groups(), stats
+
+
+def _components(leads, reasons):
+    """Split `leads` into the groups that still match, by any of `reasons`, as stored right now.
+
+    Clusters come from the stored keys, which an edit may have left stale, so
+    nothing is merged on their word alone.
+    """
+    components = []
+    pending = list(leads)
+    while pending:
+        component = [pending.pop(0)]
+        grown = True
+        while grown:
+            grown = False
+            for lead in list(pending):
+                if any(set(match_reasons(lead, member)) & reasons for member in component):
+                    component.append(lead)
+                    pending.remove(lead)
+                    grown = True
+        components.append(component)
+    return components
+
+
+def merge_cluster(collection, user_id, ids, match_names=False):
+    """Fold each still-matching group of a cluster into its oldest lead.
+
+    Returns a (survivor _id, removed _ids) pair per group that was merged.
+    """
+    leads = sorted(
+        collection.find({"_id": {"$in": ids}, "createdBy": user_id}),
+        key=lambda lead: (lead.get('createdAt') or datetime.max, str(lead['_id']))
+    )
+    reasons = set(EXACT_REASONS) | ({'name'} if match_names else set())
+    merged = []
+    for component in _components(leads, reasons):
+        if len(component) > 1:
+            merged.append(_merge(collection, user_id, component))
+            continue
+        lead = component[0]
+        keys = blocking_keys(lead)
+        if not lead.get('mergedFrom') and lead.get('dedupeKeys') != keys:
+            # Left alone, the stale keys would put it in the same cluster on every run
+            collection.update_one({"_id": lead['_id'], "createdBy": user_id}, {"$set": {"dedupeKeys": keys}})
+    return merged
+
+
+def _merge(collection, user_id, leads):
+    survivor, others = leads[0], leads[1:]
+
+    update = {}
+    for field in MERGE_FIELDS:
+        if not survivor.get(field):
+            value = next((lead.get(field) for lead in others if lead.get(field)), None)
+            if value:
+                update[field] = value
+    notes = []
+    for lead in leads:
+        note = (lead.get('notes') or '').strip()
+        if note and note not in notes:
+            notes.append(note)
+    if len(notes) > 1:
+        update['notes'] = '\n'.join(notes)
+    keys = set(survivor.get('dedupeKeys') or blocking_keys(survivor))
+    for lead in others:
+        keys.update(blocking_keys(lead))
+    update['dedupeKeys'] = sorted(keys)
+    update['updatedAt'] = datetime.utcnow()
+
+    removed = [lead['_id'] for lead in others]
+    collection.update_one(
+        {"_id": survivor['_id'], "createdBy": user_id},
+        {"$set": update, "$addToSet": {"mergedFrom": {"$each": [str(_id) for _id in removed]}}}
+    )
+    collection.delete_many({"_id": {"$in": removed}, "createdBy": user_id})
+    return survivor['_id'], removed
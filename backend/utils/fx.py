@@ -0,0 +1,199 @@
+"""Locally managed FX rates and base-currency normalization for budgets and payments.
+
+Rates live in the ``fx_rates`` collection as ``{currency, rate, effectiveDate}``
+where ``rate`` is the number of base-currency units per unit of ``currency``.
+The table is loaded into memory and reloaded after ``ttl`` seconds (or when
+``invalidate`` is called after a local write), so normalizing an amount never
+costs a database round trip on the request path.
+
+Every budget and payment stores a ``base`` sub-document with its amounts
+converted at write time, which lets portfolio totals be a plain ``$sum``.
+"""
+
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime
+
+from flask import jsonify
+from pymongo import UpdateOne
+
+BUDGET_AMOUNT_FIELDS = [
+    'totalBudget', 'developmentCost', 'designCost',
+    'testingCost', 'deploymentCost', 'maintenanceCost', 'thirdPartyCost'
+]
+
+
+def base_amount(field):
+    """Aggregation expression for a base-currency amount; unconverted documents use the raw amount."""
+    return {"$ifNull": [f"$base.{field}", f"${field}"]}
+
+
+def currency_totals(collection, user_id, fields, base_currency, union=None):
+    """Sum `fields` in the base currency with one aggregation, broken down by original currency.
+
+    `union` names a collection (an archive tier) whose matching documents are summed as well.
+    """
+    group = {
+        # Documents without a currency are in the base currency
+        "_id": {"$ifNull": ["$currency", base_currency]},
+        "count": {"$sum": 1},
+        "unconverted": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$base", None]}, None]}, 1, 0]}}
+    }
+    for field in fields:
+        group[field] = {"$sum": base_amount(field)}
+        group[f"{field}Original"] = {"$sum": f"${field}"}
+    pipeline = [{"$match": {"createdBy": user_id}}]
+    if union:
+        pipeline.append({"$unionWith": {"coll": union, "pipeline": [{"$match": {"createdBy": user_id}}]}})
+    rows = list(collection.aggregate(pipeline + [{"$group": group}]))
+
+    totals = {"count": 0, "unconverted": 0}
+    totals.update({field: 0 for field in fields})
+    by_currency = {}
+    for row in rows:
+        for key in ["count", "unconverted"] + list(fields):
+            totals[key] += row[key]
+        by_currency[row['_id']] = {
+            "count": row['count'],
+            **{field: row[f"{field}Original"] for field in fields}
+        }
+    for field in fields:
+        totals[field] = round(totals[field], 2)
+    totals['byCurrency'] = by_currency
+    return totals
+
+
+class UnknownCurrencyError(ValueError):
+    def __init__(self, currency):
+        self.currency = currency
+        super().__init__(f"No exchange rate configured for currency {currency}")
+
+
+def unsupported_currency_response(error):
+    return jsonify({
+        "message": str(error),
+        "error": "unsupported_currency",
+        "currency": error.currency
+    }), 400
+
+
+def _as_datetime(value, fallback=None):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+        except ValueError:
+            pass
+    return fallback or datetime.utcnow()
+
+
+class FxRateTable:
+    def __init__(self, db, base_currency='INR', ttl=300):
+        self.db = db
+        self.base_currency = base_currency
+        self.ttl = ttl
+        self._rates = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        rates = {}
+        cursor = self.db.fx_rates.find(
+            {}, {"currency": 1, "rate": 1, "effectiveDate": 1}
+        ).sort([("currency", 1), ("effectiveDate", 1)])
+        for doc in cursor:
+            dates, values = rates.setdefault(doc['currency'], ([], []))
+            dates.append(doc['effectiveDate'])
+            values.append(float(doc['rate']))
+        with self._lock:
+            self._rates = rates
+            self._loaded_at = time.monotonic()
+        return rates
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _current(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            return self.refresh()
+        return self._rates
+
+    def currencies(self):
+        return sorted(set(self._current()) | {self.base_currency})
+
+    def rate(self, currency, on=None):
+        """Base-currency units per unit of `currency`, effective on `on` (default: now)."""
+        currency = (currency or self.base_currency).upper()
+        if currency == self.base_currency:
+            return 1.0
+        series = self._current().get(currency)
+        if not series:
+            raise UnknownCurrencyError(currency)
+        dates, values = series
+        index = bisect_right(dates, on or datetime.utcnow()) - 1
+        # Dates before the first effective rate use the earliest one we have
+        return values[max(index, 0)]
+
+    def budget_base(self, budget):
+        rate = self.rate(budget.get('currency'), _as_datetime(budget.get('createdAt')))
+        base = {"currency": self.base_currency, "rate": rate}
+        for field in BUDGET_AMOUNT_FIELDS:
+            base[field] = round(float(budget.get(field) or 0) * rate, 2)
+        return base
+
+    def payment_base(self, payment):
+        on = _as_datetime(payment.get('date'), payment.get('createdAt'))
+        rate = self.rate(payment.get('currency'), on)
+        return {
+            "currency": self.base_currency,
+            "rate": rate,
+            "amount": round(float(payment.get('amount') or 0) * rate, 2)
+        }
+
+
+BASE_BUILDERS = {
+    'budgets': FxRateTable.budget_base,
+    'payments': FxRateTable.payment_base,
+}
+
+
+def backfill_base_amounts(db, fx, collection, batch_size=1000, recompute=False, progress=None):
+    """Write `base` amounts for documents that lack them (or all, with `recompute`).
+
+    Walks the collection in `_id` order in batches and writes each batch with
+    one bulk_write. Documents in a currency without a rate are counted as
+    skipped and left untouched.
+    """
+    build = BASE_BUILDERS[collection]
+    query = {} if recompute else {"$or": [
+        {"base": {"$exists": False}},
+        {"base.currency": {"$ne": fx.base_currency}}
+    ]}
+    total = db[collection].count_documents(query)
+    updated = skipped = 0
+    last_id = None
+
+    while True:
+        page_query = dict(query, _id={"$gt": last_id}) if last_id is not None else query
+        batch = list(db[collection].find(page_query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]['_id']
+
+        operations = []
+        for doc in batch:
+            try:
+                operations.append(UpdateOne({"_id": doc['_id']}, {"$set": {"base": build(fx, doc)}}))
+            except UnknownCurrencyError:
+                skipped += 1
+        if operations:
+            db[collection].bulk_write(operations, ordered=False)
+            updated += len(operations)
+        if progress:
+            progress(updated + skipped, total)
+
+    return {"collection": collection, "updated": updated, "skipped": skipped}
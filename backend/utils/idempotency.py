@@ -0,0 +1,212 @@
+"""``Idempotency-Key`` support for create endpoints.
+
+The first request with a given key (per user and endpoint) claims it in the
+``idempotency_keys`` collection, runs the handler and stores the response.
+Retries with the same key replay that response without touching the main
+collections; retries that arrive while the first request is still running
+wait for it instead of inserting a duplicate. Completed responses are also
+kept in a small in-process LRU so most replays never reach MongoDB.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import request, jsonify, make_response
+from flask_jwt_extended import get_jwt_identity
+from pymongo.errors import DuplicateKeyError
+
+MAX_KEY_LENGTH = 255
+
+# Seconds between checks of the collection while another process owns a key
+POLL_INTERVAL = 0.05
+
+
+class LRUCache:
+    def __init__(self, maxsize=10000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class IdempotencyStore:
+    def __init__(self, db, ttl=86400, wait_timeout=10, lock_timeout=30, cache_size=10000):
+        self.db = db
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.lock_timeout = lock_timeout
+        self.cache = LRUCache(cache_size, ttl)
+        # key id -> Event set when the in-process owner finishes
+        self._owners = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key_id, fingerprint):
+        """Try to become the owner of `key_id`; returns None if claimed, else the existing record."""
+        now = datetime.utcnow()
+        try:
+            self.db.idempotency_keys.insert_one({
+                "_id": key_id,
+                "fingerprint": fingerprint,
+                "status": "processing",
+                "lockedAt": now,
+                "createdAt": now
+            })
+        except DuplicateKeyError:
+            existing = self.db.idempotency_keys.find_one({"_id": key_id})
+            if existing is None:
+                # Expired or released between the insert and the read
+                return self.claim(key_id, fingerprint)
+            if existing['status'] == 'processing' and existing['lockedAt'] < now - timedelta(seconds=self.lock_timeout):
+                # The owner died mid-request; take the key over
+                taken = self.db.idempotency_keys.update_one(
+                    {"_id": key_id, "status": "processing", "lockedAt": existing['lockedAt']},
+                    {"$set": {"lockedAt": now, "fingerprint": fingerprint}}
+                )
+                if taken.modified_count:
+                    existing = None
+            if existing is not None:
+                return existing
+        with self._lock:
+            self._owners[key_id] = threading.Event()
+        return None
+
+    def complete(self, key_id, stored):
+        self.db.idempotency_keys.update_one(
+            {"_id": key_id},
+            {"$set": {"status": "completed", "response": stored, "fingerprint": stored['fingerprint']}}
+        )
+        self.cache.put(key_id, stored)
+        self._release(key_id)
+
+    def abandon(self, key_id):
+        """Free the key after a server error so the client's retry runs again."""
+        self.db.idempotency_keys.delete_one({"_id": key_id, "status": "processing"})
+        self._release(key_id)
+
+    def _release(self, key_id):
+        with self._lock:
+            event = self._owners.pop(key_id, None)
+        if event is not None:
+            event.set()
+
+    def wait(self, key_id):
+        """Wait for the owner of `key_id` to finish; returns the completed record or None."""
+        deadline = time.monotonic() + self.wait_timeout
+        with self._lock:
+            event = self._owners.get(key_id)
+        if event is not None:
+            # Owned by this process: no need to poll the database
+            event.wait(self.wait_timeout)
+        while True:
+            record = self.db.idempotency_keys.find_one({"_id": key_id})
+            if record is None or record['status'] == 'completed':
+                return record
+            if time.monotonic() >= deadline:
+                return record
+            time.sleep(POLL_INTERVAL)
+
+
+def _fingerprint():
+    body = request.get_json(silent=True)
+    payload = json.dumps(body, sort_keys=True, default=str) if body is not None else request.get_data(as_text=True)
+    return hashlib.sha256(f"{request.method} {request.path}\n{payload}".encode()).hexdigest()
+
+
+def _key_reused():
+    return jsonify({
+        "message": "Idempotency-Key was already used with a different request body",
+        "error": "idempotency_key_reused"
+    }), 422
+
+
+def _replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        return _key_reused()
+    response = make_response(stored['body'], stored['status'])
+    response.headers['Content-Type'] = stored['contentType']
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(fn):
+    """Honour an optional Idempotency-Key header; apply below the jwt_required decorator."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({
+                "message": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters",
+                "error": "invalid_idempotency_key"
+            }), 400
+
+        store = request.current_app.idempotency
+        scope = f"{get_jwt_identity() or 'anonymous'}|{request.endpoint}|{key}"
+        key_id = hashlib.sha256(scope.encode()).hexdigest()
+        fingerprint = _fingerprint()
+
+        stored = store.cache.get(key_id)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+        existing = store.claim(key_id, fingerprint)
+        if existing is not None:
+            if existing['status'] == 'processing':
+                if existing['fingerprint'] != fingerprint:
+                    return _key_reused()
+                existing = store.wait(key_id)
+                if existing is None:
+                    # The first request failed and released the key: run this one
+                    return wrapper(*args, **kwargs)
+            if existing['status'] != 'completed':
+                response = jsonify({
+                    "message": "A request with this Idempotency-Key is still being processed",
+                    "error": "idempotency_in_progress"
+                })
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            store.cache.put(key_id, existing['response'])
+            return _replay(existing['response'], fingerprint)
+
+        try:
+            response = make_response(fn(*args, **kwargs))
+        except Exception:
+            store.abandon(key_id)
+            raise
+        if response.status_code >= 500:
+            store.abandon(key_id)
+            return response
+        store.complete(key_id, {
+            "fingerprint": fingerprint,
+            "status": response.status_code,
+            "body": response.get_data(as_text=True),
+            "contentType": response.headers.get('Content-Type', 'application/json')
+        })
+        return response
+    return wrapper
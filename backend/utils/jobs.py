@@ -0,0 +1,383 @@
+"""Background jobs backed by the ``jobs`` collection and a local thread pool.
+
+Blueprints register handlers with ``@job_handler('type', ...)`` and submit work
+with ``request.current_app.jobs.submit(...)``; clients poll ``/api/jobs/<id>``.
+There is no external broker: the job document is the source of truth for
+status and progress, and the in-process runner only decides when to run it.
+
+A handler receives a ``JobContext`` and returns a JSON-able result. It should
+call ``ctx.progress(done, total)`` as it goes, which is also where a pending
+cancellation is raised as ``JobCancelled``.
+
+Several processes may share the ``jobs`` collection. A runner claims a job by
+stamping its own ``ownerId`` and a lease (``lockedUntil``) on it. The lease is
+renewed by every progress write and by a heartbeat thread for as long as the
+job runs. Recovery, at start-up and then once per lease period, requeues only
+running or retrying jobs whose lease has expired, i.e. whose owner is gone.
+An owner that finds its job taken over stops it without writing a result.
+
+Handlers registered with ``tenant=True`` work on their creator's tenant data.
+While a tenant migration has that data frozen they are held: put back in the
+queue and offered again every ``HOLD_SECONDS``.
+"""
+
+import os
+import socket
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask import jsonify
+from pymongo import ReturnDocument
+
+QUEUED = 'queued'
+RUNNING = 'running'
+RETRYING = 'retrying'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+# Seconds between progress writes (and cancellation checks against the job document)
+PROGRESS_INTERVAL = 0.5
+
+# Seconds a claimed job stays leased to its runner without a renewal
+DEFAULT_LEASE_SECONDS = 60
+
+# Seconds before a held job is offered to the runner again
+HOLD_SECONDS = 2.0
+
+
+class JobType:
+    def __init__(self, name, handler, concurrency=1, max_attempts=3, retry_delay=2.0, tenant=False):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.tenant = tenant
+
+
+JOB_TYPES = {}
+
+
+def job_handler(name, concurrency=1, max_attempts=3, retry_delay=2.0, tenant=False):
+    """Register `fn(ctx)` as the handler for jobs of type `name`.
+
+    `tenant` marks handlers that write their creator's tenant data.
+    """
+    def decorator(fn):
+        JOB_TYPES[name] = JobType(name, fn, concurrency, max_attempts, retry_delay, tenant)
+        return fn
+    return decorator
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobFailed(Exception):
+    """Raised by a handler for errors that retrying cannot fix."""
+
+
+class JobLeaseLost(Exception):
+    """The job's lease expired and another runner took it over."""
+
+
+class JobContext:
+    def __init__(self, runner, job):
+        self.runner = runner
+        self.app = runner.app
+        self.db = runner.db
+        self.job_id = job['_id']
+        self.params = job.get('params') or {}
+        self.user_id = job.get('createdBy')
+        self.attempt = job.get('attempts', 1)
+        self._last_write = 0.0
+
+    def cancelled(self):
+        if str(self.job_id) in self.runner._cancel_requests:
+            return True
+        # Another process may have requested the cancellation
+        job = self.db.jobs.find_one({"_id": self.job_id}, {"cancelRequested": 1})
+        return bool(job and job.get('cancelRequested'))
+
+    def progress(self, done, total=None, message=None, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_write < PROGRESS_INTERVAL and (total is None or done < total):
+            return
+        self._last_write = now
+        update = {"progress.done": done, "updatedAt": datetime.utcnow()}
+        if total is not None:
+            update["progress.total"] = total
+        if message is not None:
+            update["progress.message"] = message
+        update["lockedUntil"] = self.runner.lease_expiry()
+        if not self.db.jobs.update_one({"_id": self.job_id, "ownerId": self.runner.owner_id}, {"$set": update}).matched_count:
+            raise JobLeaseLost()
+        if self.cancelled():
+            raise JobCancelled()
+
+
+class JobRunner:
+    def __init__(self, app, max_workers=4, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.app = app
+        self.db = app.db
+        self.lease_seconds = lease_seconds
+        # Unique per runner, so a restarted process never mistakes an old lease for its own
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{ObjectId()}"
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='jobs')
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._running = {}
+        self._active = set()
+        self._cancel_requests = set()
+        self._heartbeat = None
+        # user_id -> True while that user's tenant data must not be written (set by app.py)
+        self.tenant_held = None
+
+    def lease_expiry(self, extra=0):
+        return datetime.utcnow() + timedelta(seconds=self.lease_seconds + extra)
+
+    def submit(self, job_type, params=None, user_id=None):
+        """Create a queued job document and schedule it; returns the job document."""
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type: {job_type}")
+        now = datetime.utcnow()
+        job = {
+            "type": job_type,
+            "status": QUEUED,
+            "params": params or {},
+            "progress": {"done": 0, "total": None, "message": None},
+            "attempts": 0,
+            "maxAttempts": JOB_TYPES[job_type].max_attempts,
+            "cancelRequested": False,
+            "result": None,
+            "error": None,
+            "createdBy": user_id,
+            "createdAt": now,
+            "updatedAt": now,
+            "startedAt": None,
+            "finishedAt": None
+        }
+        self.db.jobs.insert_one(job)
+        self._enqueue(job_type, job['_id'])
+        return job
+
+    def get(self, job_id, user_id=None):
+        query = {"_id": ObjectId(job_id)}
+        if user_id is not None:
+            query["createdBy"] = user_id
+        return self.db.jobs.find_one(query)
+
+    def cancel(self, job_id, user_id=None):
+        """Cancel a queued job immediately, or flag a running one; returns the job or None."""
+        job = self.get(job_id, user_id)
+        if not job or job['status'] in FINISHED_STATUSES:
+            return job
+
+        with self._lock:
+            queue = self._pending.get(job['type'])
+            dequeued = queue is not None and job['_id'] in queue
+            if dequeued:
+                queue.remove(job['_id'])
+            else:
+                self._cancel_requests.add(str(job['_id']))
+
+        now = datetime.utcnow()
+        if dequeued or job['status'] == RETRYING:
+            self._finish(job['_id'], CANCELLED)
+        else:
+            self.db.jobs.update_one(
+                {"_id": job['_id'], "status": {"$nin": list(FINISHED_STATUSES)}},
+                {"$set": {"cancelRequested": True, "updatedAt": now}}
+            )
+        return self.db.jobs.find_one({"_id": job['_id']})
+
+    def recover(self, queued=True):
+        """Requeue running or retrying jobs whose runner's lease has expired, and with `queued` queued ones.
+
+        Queued jobs are only picked up at start-up: until then they sit in the
+        queue of the (live) process that submitted them.
+        """
+        self._start_heartbeat()
+        expired = [{"lockedUntil": None}, {"lockedUntil": {"$lt": datetime.utcnow()}}]
+        recoverable = {
+            "status": {"$in": [QUEUED, RUNNING, RETRYING] if queued else [RUNNING, RETRYING]},
+            "$or": expired + ([{"status": QUEUED}] if queued else [])
+        }
+        recovered = 0
+        for job in self.db.jobs.find(recoverable):
+            with self._lock:
+                if job['_id'] in self._pending.get(job['type'], ()):
+                    continue
+            # Only if nobody claimed or requeued it since it was read
+            guard = {"status": job['status'], "lockedUntil": job.get('lockedUntil')}
+            if job['type'] not in JOB_TYPES:
+                self._finish(job['_id'], FAILED, error=f"Unknown job type: {job['type']}", guard=guard)
+            elif job.get('cancelRequested'):
+                self._finish(job['_id'], CANCELLED, guard=guard)
+            elif job['status'] != QUEUED and job.get('attempts', 0) >= job.get('maxAttempts', 1):
+                self._finish(job['_id'], FAILED, error="Interrupted: its runner stopped renewing the lease", guard=guard)
+            elif job['status'] == QUEUED or self.db.jobs.update_one(
+                dict(guard, _id=job['_id']), {"$set": {"status": QUEUED, "ownerId": None, "lockedUntil": None}}
+            ).modified_count:
+                self._enqueue(job['type'], job['_id'])
+                recovered += 1
+        return recovered
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='jobs-heartbeat', daemon=True)
+                self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        next_recovery = time.monotonic() + self.lease_seconds
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            try:
+                with self._lock:
+                    active = list(self._active)
+                if active:
+                    # Handlers that go quiet (one long query, say) keep their lease while this process lives
+                    self.db.jobs.update_many(
+                        {"_id": {"$in": active}, "ownerId": self.owner_id, "status": RUNNING},
+                        {"$set": {"lockedUntil": self.lease_expiry()}}
+                    )
+                if time.monotonic() >= next_recovery:
+                    next_recovery = time.monotonic() + self.lease_seconds
+                    recovered = self.recover(queued=False)
+                    if recovered:
+                        print(f"🔁 Requeued {recovered} jobs whose runner stopped renewing its lease")
+            except Exception as e:
+                print(f"⚠️ Job heartbeat failed: {e}")
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _enqueue(self, job_type, job_id):
+        with self._lock:
+            self._pending.setdefault(job_type, deque()).append(job_id)
+        self._dispatch()
+
+    def _dispatch(self):
+        # Start as many queued jobs as each type's concurrency limit allows
+        with self._lock:
+            for job_type, queue in self._pending.items():
+                limit = JOB_TYPES[job_type].concurrency
+                while queue and self._running.get(job_type, 0) < limit:
+                    job_id = queue.popleft()
+                    self._running[job_type] = self._running.get(job_type, 0) + 1
+                    self._executor.submit(self._run, job_type, job_id)
+
+    def _run(self, job_type, job_id):
+        try:
+            self._attempt(JOB_TYPES[job_type], job_id)
+        finally:
+            with self._lock:
+                self._running[job_type] -= 1
+                self._cancel_requests.discard(str(job_id))
+            self._dispatch()
+
+    def _held(self, job_type, job_id):
+        if not job_type.tenant or self.tenant_held is None:
+            return False
+        job = self.db.jobs.find_one({"_id": job_id}, {"createdBy": 1, "cancelRequested": 1})
+        # A cancelled job goes on to be finished as cancelled
+        if not job or not job.get('createdBy') or job.get('cancelRequested'):
+            return False
+        return self.tenant_held(job['createdBy'])
+
+    def _attempt(self, job_type, job_id):
+        if self._held(job_type, job_id):
+            timer = threading.Timer(HOLD_SECONDS, self._enqueue, args=(job_type.name, job_id))
+            timer.daemon = True
+            timer.start()
+            return
+        now = datetime.utcnow()
+        job = self.db.jobs.find_one_and_update(
+            {"_id": job_id, "status": {"$in": [QUEUED, RETRYING]}, "cancelRequested": {"$ne": True}},
+            {"$set": {
+                "status": RUNNING, "ownerId": self.owner_id, "lockedUntil": self.lease_expiry(),
+                "startedAt": now, "updatedAt": now
+            }, "$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            # Cancelled (or claimed elsewhere) before it started
+            self.db.jobs.update_one(
+                {"_id": job_id, "cancelRequested": True, "status": {"$nin": list(FINISHED_STATUSES)}},
+                {"$set": {"status": CANCELLED, "finishedAt": now, "updatedAt": now}}
+            )
+            return
+
+        ctx = JobContext(self, job)
+        owned = {"ownerId": self.owner_id}
+        with self._lock:
+            self._active.add(job_id)
+        try:
+            result = job_type.handler(ctx)
+        except JobLeaseLost:
+            print(f"⚠️ Job {job_id} ({job_type.name}) was taken over by another runner; stopped")
+        except JobCancelled:
+            self._finish(job_id, CANCELLED, guard=owned)
+        except Exception as e:
+            print(f"❌ Job {job_id} ({job_type.name}) attempt {job['attempts']} failed: {str(e)}")
+            if isinstance(e, JobFailed) or job['attempts'] >= job['maxAttempts']:
+                self._finish(job_id, FAILED, error=str(e), trace=traceback.format_exc(limit=5), guard=owned)
+                return
+            delay = job_type.retry_delay * 2 ** (job['attempts'] - 1)
+            # The retry timer lives in this process: keep the lease until well after it fires
+            self.db.jobs.update_one({"_id": job_id, **owned}, {"$set": {
+                "status": RETRYING, "error": str(e), "lockedUntil": self.lease_expiry(delay),
+                "updatedAt": datetime.utcnow()
+            }})
+            timer = threading.Timer(delay, self._enqueue, args=(job_type.name, job_id))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._finish(job_id, SUCCEEDED, result=result, guard=owned)
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def _finish(self, job_id, status, result=None, error=None, trace=None, guard=None):
+        """Record the outcome; with `guard`, only while the job document still matches it."""
+        now = datetime.utcnow()
+        update = {"status": status, "lockedUntil": None, "finishedAt": now, "updatedAt": now}
+        if result is not None:
+            update["result"] = result
+        if error is not None:
+            update["error"] = error
+        if trace is not None:
+            update["trace"] = trace
+        self.db.jobs.update_one(dict(guard or {}, _id=job_id), {"$set": update})
+
+
+def serialize_job(job):
+    return {
+        "id": str(job['_id']),
+        "type": job['type'],
+        "status": job['status'],
+        "progress": job.get('progress'),
+        "attempts": job.get('attempts', 0),
+        "maxAttempts": job.get('maxAttempts'),
+        "cancelRequested": job.get('cancelRequested', False),
+        "result": job.get('result'),
+        "error": job.get('error'),
+        "createdAt": job['createdAt'].isoformat(),
+        "startedAt": job['startedAt'].isoformat() if job.get('startedAt') else None,
+        "finishedAt": job['finishedAt'].isoformat() if job.get('finishedAt') else None
+    }
+
+
+def job_accepted_response(job, message):
+    """202 response pointing the client at the job to poll."""
+    response = jsonify({"message": message, "job": serialize_job(job)})
+    response.headers['Location'] = f"/api/jobs/{job['_id']}"
+    return response, 202
@@ -0,0 +1,276 @@
+"""Per-customer payment ledger kept up to date with ``$inc``.
+
+Payments store a ``customerKey`` (the customer name lowercased, with
+punctuation and company suffixes dropped, so "ABC Corp." and "abc
+corporation" share a ledger). ``customer_ledger`` holds one document per
+(owner, customer key) with the payment count and base-currency totals, per
+status and overall. The payment handlers apply each change as a single
+upserted ``$inc``, so statements and top-customer lists read O(customers)
+documents instead of scanning payments.
+
+An update applies the change that its own write made: the payment is
+rewritten with ``find_one_and_update`` guarded on ``LEDGER_FIELDS`` as they
+were read, and the delta is computed from the pre-image it returns, so two
+concurrent updates never both subtract the same old values.
+
+Every ``$inc`` also bumps the entry's ``version``. The ``ledger_rebuild`` job
+recomputes entries from the payments and writes each one only while its
+version is still the one read before the recount; an entry that took an
+``$inc`` meanwhile is recounted again, up to ``REBUILD_ATTEMPTS`` times.
+"""
+
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from utils.archive import archive_name
+from utils.dedupe import canonical_company
+from utils.fx import base_amount
+from utils.tenancy import owner_database
+
+# ?sort= values for the customer list -> ledger field (descending)
+CUSTOMER_SORTS = {
+    'total': 'totalAmount',
+    'paid': 'totals.Completed.amount',
+    'pending': 'totals.Pending.amount',
+}
+
+# Payment fields a ledger delta is computed from
+LEDGER_FIELDS = ('customer', 'customerKey', 'amount', 'base', 'status')
+
+# Recounts of the entries that changed while they were being rebuilt
+REBUILD_ATTEMPTS = 3
+
+
+def customer_key(name):
+    key = canonical_company(name)
+    return key or str(name or '').strip().lower()
+
+
+def payment_key(payment):
+    # Payments written before customer keys existed have none stored
+    return payment.get('customerKey') or customer_key(payment.get('customer'))
+
+
+def _status_field(status):
+    # Status values become field names: keep them free of '.' and a leading '$'
+    return str(status or 'Unknown').replace('.', '_').lstrip('$') or 'Unknown'
+
+
+def _amount(payment):
+    base = payment.get('base') or {}
+    return float(base.get('amount', payment.get('amount') or 0))
+
+
+def ledger_delta(payment, sign):
+    """The ``$inc`` that adds (`sign`=1) or removes (-1) `payment` from its ledger."""
+    amount = round(sign * _amount(payment), 2)
+    status = _status_field(payment.get('status'))
+    return {
+        "paymentCount": sign,
+        "totalAmount": amount,
+        f"totals.{status}.count": sign,
+        f"totals.{status}.amount": amount,
+    }
+
+
+def _combine(*deltas):
+    combined = {}
+    for delta in deltas:
+        for field, value in delta.items():
+            combined[field] = round(combined.get(field, 0) + value, 2)
+    return {field: value for field, value in combined.items() if value}
+
+
+def _update(inc, customer=None, payment_date=None):
+    update = {"$inc": dict(inc, version=1), "$set": {"updatedAt": datetime.utcnow()}}
+    if customer is not None:
+        update["$set"]["customer"] = customer
+    if payment_date:
+        update["$max"] = {"lastPaymentDate": payment_date}
+    return update
+
+
+def _apply(db, user_id, key, inc, customer=None, payment_date=None):
+    if not inc:
+        return
+    db.customer_ledger.update_one({"createdBy": user_id, "customerKey": key}, _update(inc, customer, payment_date), upsert=True)
+    if inc.get('paymentCount', 0) < 0:
+        # The customer's last payment went away
+        db.customer_ledger.delete_one({"createdBy": user_id, "customerKey": key, "paymentCount": {"$lte": 0}})
+
+
+def record_payment(db, user_id, payment):
+    _apply(db, user_id, payment_key(payment), ledger_delta(payment, 1), payment.get('customer'), payment.get('date'))
+
+
+def record_payments(db, payments):
+    """Add newly inserted `payments` (of any owners) to the ledgers, one bulk write per owner.
+
+    Returns the number of ledger entries written.
+    """
+    entries = {}
+    for payment in payments:
+        owner, key = payment['createdBy'], payment_key(payment)
+        entry = entries.setdefault(owner, {}).setdefault(key, {"inc": {}, "customer": None, "date": None})
+        entry['inc'] = _combine(entry['inc'], ledger_delta(payment, 1))
+        entry['customer'] = payment.get('customer')
+        if payment.get('date') and (entry['date'] is None or _date_order(payment['date']) > _date_order(entry['date'])):
+            entry['date'] = payment['date']
+    for owner, by_key in entries.items():
+        owner_database(db, owner).customer_ledger.bulk_write([
+            UpdateOne({"createdBy": owner, "customerKey": key}, _update(entry['inc'], entry['customer'], entry['date']),
+                      upsert=True)
+            for key, entry in by_key.items()
+        ], ordered=False)
+    return sum(len(by_key) for by_key in entries.values())
+
+
+def remove_payment(db, user_id, payment):
+    _apply(db, user_id, payment_key(payment), ledger_delta(payment, -1))
+
+
+def move_payment(db, user_id, old, new):
+    """Apply an update: one ``$inc`` when the customer is unchanged, otherwise one per ledger."""
+    old_key, new_key = payment_key(old), payment_key(new)
+    if old_key == new_key:
+        _apply(db, user_id, old_key, _combine(ledger_delta(old, -1), ledger_delta(new, 1)),
+               new.get('customer'), new.get('date'))
+    else:
+        remove_payment(db, user_id, old)
+        record_payment(db, user_id, new)
+
+
+def _date_order(value):
+    # Dates sort after strings, as in BSON, so payments not yet migrated to typed dates still compare
+    return (isinstance(value, datetime), value)
+
+
+def serialize_ledger(entry):
+    return {
+        "customerKey": entry['customerKey'],
+        "customer": entry.get('customer'),
+        "paymentCount": entry.get('paymentCount', 0),
+        "totalAmount": round(entry.get('totalAmount', 0), 2),
+        "totals": {
+            status: {"count": values.get('count', 0), "amount": round(values.get('amount', 0), 2)}
+            for status, values in (entry.get('totals') or {}).items() if values.get('count')
+        },
+        "lastPaymentDate": entry.get('lastPaymentDate'),
+        "updatedAt": entry.get('updatedAt')
+    }
+
+
+def ledger_guard(payment):
+    """Filter matching `payment` only while the fields its ledger delta came from are unchanged."""
+    return {field: payment.get(field) for field in LEDGER_FIELDS}
+
+
+def _recount(db, user_id, keys=None):
+    """Ledger entries recomputed from `user_id`'s payments in both tiers, for all customers or `keys`."""
+    match = {"createdBy": user_id}
+    if keys is not None:
+        match["customerKey"] = {"$in": keys}
+    # Archived payments are still part of each customer's lifetime totals
+    rows = db.payments.aggregate([
+        {"$match": match},
+        {"$unionWith": {"coll": archive_name('payments'), "pipeline": [{"$match": match}]}},
+        {"$group": {
+            "_id": {"key": "$customerKey", "status": "$status"},
+            "customer": {"$last": "$customer"},
+            "count": {"$sum": 1},
+            "amount": {"$sum": base_amount('amount')},
+            "lastPaymentDate": {"$max": "$date"}
+        }}
+    ], allowDiskUse=True)
+
+    now = datetime.utcnow()
+    entries = {}
+    for row in rows:
+        key = row['_id']['key']
+        entry = entries.setdefault(key, {
+            "createdBy": user_id, "customerKey": key, "customer": row['customer'],
+            "paymentCount": 0, "totalAmount": 0.0, "totals": {}, "lastPaymentDate": None, "updatedAt": now
+        })
+        entry['paymentCount'] += row['count']
+        entry['totalAmount'] = round(entry['totalAmount'] + row['amount'], 2)
+        entry['totals'][_status_field(row['_id']['status'])] = {"count": row['count'], "amount": round(row['amount'], 2)}
+        if row['lastPaymentDate'] and (entry['lastPaymentDate'] is None or _date_order(row['lastPaymentDate']) > _date_order(entry['lastPaymentDate'])):
+            entry['lastPaymentDate'] = row['lastPaymentDate']
+    return entries
+
+
+def _write_entries(db, user_id, entries, versions, batch_size, progress):
+    """Write `entries` (and delete the entries of customers without payments) where the version is unchanged.
+
+    Returns the customer keys whose entry changed since `versions` was read.
+    """
+    ledger = db.customer_ledger
+    # Tells this write's entries apart from ones an $inc created at the same version meanwhile
+    rebuild = ObjectId()
+    keys = sorted(set(entries) | set(versions))
+    conflicts = []
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        operations = []
+        for key in batch:
+            guard = {"createdBy": user_id, "customerKey": key, "version": versions.get(key)}
+            if key in entries:
+                replacement = dict(entries[key], version=(versions.get(key) or 0) + 1, rebuild=rebuild)
+                # An entry created since the read fails the upsert on the unique (createdBy, customerKey) index
+                operations.append(ReplaceOne(guard, replacement, upsert=True))
+            else:
+                operations.append(DeleteOne(guard))
+        try:
+            ledger.bulk_write(operations, ordered=False)
+        except BulkWriteError:
+            pass
+        written = {
+            entry['customerKey']: (entry.get('rebuild'), entry.get('version'))
+            for entry in ledger.find(
+                {"createdBy": user_id, "customerKey": {"$in": batch}}, {"customerKey": 1, "rebuild": 1, "version": 1}
+            )
+        }
+        conflicts += [
+            key for key in batch
+            if written.get(key) != ((rebuild, (versions.get(key) or 0) + 1) if key in entries else None)
+        ]
+        if progress:
+            progress(start + len(batch), len(keys))
+    return conflicts
+
+
+def rebuild_ledger(db, user_id, batch_size=1000, progress=None):
+    """Recompute `user_id`'s ledger from their payments; returns the number of customers."""
+    # Payments written before customer keys existed
+    query = {"createdBy": user_id, "customerKey": {"$exists": False}}
+    for collection in (db.payments, db[archive_name('payments')]):
+        while True:
+            batch = list(collection.find(query, {"customer": 1}).limit(batch_size))
+            if not batch:
+                break
+            collection.bulk_write([
+                UpdateOne({"_id": payment['_id']}, {"$set": {"customerKey": customer_key(payment.get('customer'))}})
+                for payment in batch
+            ], ordered=False)
+
+    keys = None
+    customers = 0
+    for _ in range(REBUILD_ATTEMPTS):
+        # Versions first: an $inc that lands after this read makes its entry's write miss
+        scope = {"createdBy": user_id}
+        if keys is not None:
+            scope["customerKey"] = {"$in": keys}
+        versions = {
+            entry['customerKey']: entry.get('version')
+            for entry in db.customer_ledger.find(scope, {"customerKey": 1, "version": 1})
+        }
+        entries = _recount(db, user_id, keys)
+        if keys is None:
+            customers = len(entries)
+        keys = _write_entries(db, user_id, entries, versions, batch_size, progress)
+        if not keys:
+            break
+    return customers
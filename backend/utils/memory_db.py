@@ -0,0 +1,1419 @@
+"""In-memory storage engine implementing the subset of the pymongo API the app uses.
+
+Used when MongoDB is unreachable (or DB_BACKEND=memory) so the whole API,
+the seeders and the benchmarks can run without a database server.
+Collections keep documents in insertion order, support hash
+(``[("field", "hashed")]``) and sorted (``[("field", 1)]``) secondary indexes,
+and pick an index for equality/range predicates and sorts much like Mongo's
+planner does. Reads (find, count, distinct, aggregate) are published to the
+``CommandListener`` objects passed as ``MemoryClient(event_listeners=...)``,
+and the ``explain`` command returns the plan a read would use.
+"""
+
+import itertools
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ASCENDING, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, WriteError
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import (
+    BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+)
+
+_MISSING = object()
+_Pattern = type(re.compile(''))
+
+# Sorts after every real index key; used as an open upper bound in range scans
+_MAX_KEY = (99,)
+_RANGE_OPS = ('$gt', '$gte', '$lt', '$lte')
+
+
+# ---------------------------------------------------------------------------
+# Value helpers
+# ---------------------------------------------------------------------------
+
+def _type_rank(value):
+    # Follows BSON comparison order so mixed-type sorts behave like Mongo
+    if value is None or value is _MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, (list, tuple)):
+        return 5
+    if isinstance(value, bytes):
+        return 6
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+
+def sort_key(value):
+    rank = _type_rank(value)
+    if rank == 1:
+        return (1, 0)
+    if rank in (4, 5, 10):
+        return (rank, repr(value))
+    return (rank, value)
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def _hashable(value):
+    if isinstance(value, dict):
+        return ('__dict__',) + tuple((k, _hashable(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return ('__list__',) + tuple(_hashable(v) for v in value)
+    return value
+
+
+def _get_path(doc, path):
+    if '.' not in path:
+        return doc.get(path, _MISSING) if isinstance(doc, dict) else _MISSING
+    current = doc
+    for part in path.split('.'):
+        if isinstance(current, dict):
+            current = current.get(part, _MISSING)
+        elif isinstance(current, list) and part.isdigit() and int(part) < len(current):
+            current = current[int(part)]
+        elif isinstance(current, list):
+            values = [v.get(part, _MISSING) for v in current if isinstance(v, dict)]
+            current = [v for v in values if v is not _MISSING] or _MISSING
+        else:
+            return _MISSING
+        if current is _MISSING:
+            return _MISSING
+    return current
+
+
+def _set_path(doc, path, value):
+    parts = path.split('.')
+    current = doc
+    for part in parts[:-1]:
+        nxt = current.get(part)
+        if not isinstance(nxt, dict):
+            nxt = {}
+            current[part] = nxt
+        current = nxt
+    current[parts[-1]] = value
+
+
+def _del_path(doc, path):
+    parts = path.split('.')
+    current = doc
+    for part in parts[:-1]:
+        current = current.get(part)
+        if not isinstance(current, dict):
+            return
+    current.pop(parts[-1], None)
+
+
+# ---------------------------------------------------------------------------
+# Query matching
+# ---------------------------------------------------------------------------
+
+def _candidates(value):
+    if isinstance(value, list):
+        return [value] + value
+    return [value]
+
+
+def _same(a, b):
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    return a == b
+
+
+def _eq(value, target):
+    if target is None:
+        return value is None or value is _MISSING or (isinstance(value, list) and None in value)
+    if value is _MISSING:
+        return False
+    if isinstance(target, _Pattern):
+        return any(isinstance(v, str) and target.search(v) for v in _candidates(value))
+    return any(_same(v, target) for v in _candidates(value))
+
+
+def _compare(value, target, op):
+    if value is _MISSING:
+        return False
+    for v in _candidates(value):
+        if _type_rank(v) != _type_rank(target):
+            continue
+        try:
+            if op == '$gt' and v > target:
+                return True
+            if op == '$gte' and v >= target:
+                return True
+            if op == '$lt' and v < target:
+                return True
+            if op == '$lte' and v <= target:
+                return True
+        except TypeError:
+            continue
+    return False
+
+
+def _match_operators(value, cond):
+    for op, arg in cond.items():
+        if op == '$eq':
+            ok = _eq(value, arg)
+        elif op == '$ne':
+            ok = not _eq(value, arg)
+        elif op in _RANGE_OPS:
+            ok = _compare(value, arg, op)
+        elif op == '$in':
+            ok = any(_eq(value, t) for t in arg)
+        elif op == '$nin':
+            ok = not any(_eq(value, t) for t in arg)
+        elif op == '$exists':
+            ok = (value is not _MISSING) == bool(arg)
+        elif op == '$regex':
+            flags = 0
+            for flag in cond.get('$options', ''):
+                flags |= {'i': re.I, 'm': re.M, 's': re.S, 'x': re.X}.get(flag, 0)
+            pattern = arg if isinstance(arg, _Pattern) else re.compile(arg, flags)
+            ok = _eq(value, pattern)
+        elif op == '$options':
+            continue
+        elif op == '$size':
+            ok = isinstance(value, list) and len(value) == arg
+        elif op == '$all':
+            ok = all(_eq(value, t) for t in arg)
+        elif op == '$elemMatch':
+            ok = isinstance(value, list) and any(
+                _match(elem, arg) if isinstance(elem, dict) else _match_value(elem, arg)
+                for elem in value
+            )
+        elif op == '$not':
+            ok = not _match_value(value, arg)
+        else:
+            raise OperationFailure(f"unknown operator: {op}")
+        if not ok:
+            return False
+    return True
+
+
+def _is_operator_dict(cond):
+    return isinstance(cond, dict) and cond and all(k.startswith('$') for k in cond)
+
+
+def _match_value(value, cond):
+    if _is_operator_dict(cond):
+        return _match_operators(value, cond)
+    return _eq(value, cond)
+
+
+def _match(doc, query):
+    for key, cond in query.items():
+        if key == '$and':
+            if not all(_match(doc, sub) for sub in cond):
+                return False
+        elif key == '$or':
+            if not any(_match(doc, sub) for sub in cond):
+                return False
+        elif key == '$nor':
+            if any(_match(doc, sub) for sub in cond):
+                return False
+        elif key == '$expr':
+            if not _eval(cond, doc):
+                return False
+        elif not _match_value(_get_path(doc, key), cond):
+            return False
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Projection, updates and sorting
+# ---------------------------------------------------------------------------
+
+def _project(doc, projection):
+    if not projection:
+        return _copy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+
+    include_id = projection.get('_id', 1)
+    fields = {k: v for k, v in projection.items() if k != '_id'}
+
+    if (fields and all(fields.values())) or (not fields and include_id):
+        out = {}
+        if include_id and '_id' in doc:
+            out['_id'] = doc['_id']
+        for path in fields:
+            value = _get_path(doc, path)
+            if value is not _MISSING:
+                _set_path(out, path, _copy(value))
+        return out
+
+    out = _copy(doc)
+    for path in fields:
+        _del_path(out, path)
+    if not include_id:
+        out.pop('_id', None)
+    return out
+
+
+def _normalize_sort(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction if direction is not None else ASCENDING)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(k, d) for k, d in key_or_list]
+
+
+def _sort_docs(docs, sort_spec):
+    for field, direction in reversed(sort_spec):
+        docs.sort(key=lambda d, f=field: sort_key(_missing_to_none(_get_path(d, f))), reverse=direction < 0)
+    return docs
+
+
+def _missing_to_none(value):
+    return None if value is _MISSING else value
+
+
+def _apply_update(doc, update, is_insert=False):
+    if not any(k.startswith('$') for k in update):
+        replacement = _copy(update)
+        replacement['_id'] = doc.get('_id', replacement.get('_id'))
+        doc.clear()
+        doc.update(replacement)
+        return
+
+    for op, spec in update.items():
+        if op == '$set':
+            for path, value in spec.items():
+                _set_path(doc, path, _copy(value))
+        elif op == '$setOnInsert':
+            if is_insert:
+                for path, value in spec.items():
+                    _set_path(doc, path, _copy(value))
+        elif op == '$unset':
+            for path in spec:
+                _del_path(doc, path)
+        elif op in ('$inc', '$mul'):
+            for path, amount in spec.items():
+                current = _get_path(doc, path)
+                if current is _MISSING or current is None:
+                    current = 0
+                    if op == '$mul':
+                        amount = 0
+                if not isinstance(current, (int, float)) or isinstance(current, bool):
+                    raise WriteError(f"Cannot apply {op} to a value of non-numeric type at '{path}'", 14)
+                _set_path(doc, path, current + amount if op == '$inc' else current * amount)
+        elif op in ('$min', '$max'):
+            for path, value in spec.items():
+                current = _get_path(doc, path)
+                if current is _MISSING or (
+                    op == '$min' and sort_key(value) < sort_key(current)
+                ) or (op == '$max' and sort_key(value) > sort_key(current)):
+                    _set_path(doc, path, _copy(value))
+        elif op in ('$push', '$addToSet'):
+            for path, value in spec.items():
+                current = _get_path(doc, path)
+                if current is _MISSING:
+                    current = []
+                    _set_path(doc, path, current)
+                if not isinstance(current, list):
+                    raise WriteError(f"The field '{path}' must be an array", 2)
+                values = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+                for item in values:
+                    if op == '$push' or not any(_same(item, existing) for existing in current):
+                        current.append(_copy(item))
+                if op == '$push' and isinstance(value, dict) and '$slice' in value:
+                    limit = value['$slice']
+                    current[:] = current[limit:] if limit < 0 else current[:limit]
+        elif op == '$pull':
+            for path, cond in spec.items():
+                current = _get_path(doc, path)
+                if isinstance(current, list):
+                    current[:] = [
+                        item for item in current
+                        if not (_match(item, cond) if isinstance(cond, dict) and not _is_operator_dict(cond)
+                                else _match_value(item, cond))
+                    ]
+        elif op == '$currentDate':
+            for path in spec:
+                _set_path(doc, path, datetime.utcnow())
+        else:
+            raise WriteError(f"Unknown modifier: {op}", 9)
+
+
+def _upsert_seed(query):
+    doc = {}
+    for key, cond in query.items():
+        if key.startswith('$'):
+            continue
+        if _is_operator_dict(cond):
+            if '$eq' in cond:
+                _set_path(doc, key, _copy(cond['$eq']))
+        elif not isinstance(cond, _Pattern):
+            _set_path(doc, key, _copy(cond))
+    return doc
+
+
+# ---------------------------------------------------------------------------
+# Aggregation expressions
+# ---------------------------------------------------------------------------
+
+def _eval(expr, doc):
+    if isinstance(expr, str) and expr.startswith('$'):
+        if expr == '$$ROOT':
+            return doc
+        return _missing_to_none(_get_path(doc, expr[1:]))
+    if isinstance(expr, list):
+        return [_eval(e, doc) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) == 1:
+        op, arg = next(iter(expr.items()))
+        if op.startswith('$'):
+            return _eval_operator(op, arg, doc)
+    return {k: _eval(v, doc) for k, v in expr.items()}
+
+
+def _eval_operator(op, arg, doc):
+    if op == '$literal':
+        return arg
+    if op == '$cond':
+        if isinstance(arg, dict):
+            arg = [arg['if'], arg['then'], arg['else']]
+        return _eval(arg[1], doc) if _eval(arg[0], doc) else _eval(arg[2], doc)
+    if op == '$ifNull':
+        values = [_eval(a, doc) for a in arg]
+        for value in values[:-1]:
+            if value is not None:
+                return value
+        return values[-1]
+
+    args = _eval(arg, doc)
+    if op in ('$add', '$multiply'):
+        if any(a is None for a in args):
+            return None
+        total = 0 if op == '$add' else 1
+        for a in args:
+            if isinstance(a, datetime):
+                total = a + timedelta(milliseconds=total)
+            elif isinstance(total, datetime):
+                total = total + timedelta(milliseconds=a)
+            else:
+                total = total + a if op == '$add' else total * a
+        return total
+    if op in ('$subtract', '$divide', '$mod'):
+        a, b = args
+        if a is None or b is None:
+            return None
+        if op == '$subtract':
+            if isinstance(a, datetime) and isinstance(b, datetime):
+                return (a - b).total_seconds() * 1000
+            if isinstance(a, datetime):
+                return a - timedelta(milliseconds=b)
+            return a - b
+        return a / b if op == '$divide' else a % b
+    if op in ('$eq', '$ne', '$gt', '$gte', '$lt', '$lte'):
+        a, b = (sort_key(v) for v in args)
+        return {
+            '$eq': a == b, '$ne': a != b, '$gt': a > b,
+            '$gte': a >= b, '$lt': a < b, '$lte': a <= b
+        }[op]
+    if op == '$and':
+        return all(args)
+    if op == '$or':
+        return any(args)
+    if op == '$not':
+        return not (args[0] if isinstance(args, list) else args)
+    if op == '$in':
+        return any(_same(args[0], v) for v in (args[1] or []))
+    if op == '$size':
+        return len(args[0] if isinstance(args, list) and len(args) == 1 and isinstance(args[0], list) else args)
+    if op == '$toLower':
+        return (args or '').lower()
+    if op == '$toUpper':
+        return (args or '').upper()
+    if op == '$concat':
+        return None if any(a is None for a in args) else ''.join(args)
+    if op == '$arrayElemAt':
+        array, index = args
+        try:
+            return array[index]
+        except (IndexError, TypeError):
+            return None
+    if op in ('$max', '$min'):
+        values = [v for v in (args if isinstance(args, list) else [args]) if v is not None]
+        if not values:
+            return None
+        pick = max if op == '$max' else min
+        return pick(values, key=sort_key)
+    raise OperationFailure(f"Unrecognized expression '{op}'")
+
+
+class _Accumulator:
+    def __init__(self, op, expr):
+        self.op = op
+        self.expr = expr
+        self.value = None
+        self.count = 0
+        self.items = []
+
+    def add(self, doc):
+        op = self.op
+        if op == '$count':
+            self.count += 1
+            return
+        value = _eval(self.expr, doc)
+        if op in ('$sum', '$avg'):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.value = (self.value or 0) + value
+                self.count += 1
+        elif op in ('$min', '$max'):
+            if value is None:
+                return
+            if self.value is None or (
+                op == '$min' and sort_key(value) < sort_key(self.value)
+            ) or (op == '$max' and sort_key(value) > sort_key(self.value)):
+                self.value = value
+        elif op == '$first':
+            if not self.count:
+                self.value = value
+            self.count += 1
+        elif op == '$last':
+            self.value = value
+        elif op == '$push':
+            self.items.append(value)
+        elif op == '$addToSet':
+            if not any(_same(value, existing) for existing in self.items):
+                self.items.append(value)
+        else:
+            raise OperationFailure(f"unknown group operator '{op}'")
+
+    def result(self):
+        if self.op == '$sum':
+            return self.value or 0
+        if self.op == '$avg':
+            return self.value / self.count if self.count else None
+        if self.op == '$count':
+            return self.count
+        if self.op in ('$push', '$addToSet'):
+            return self.items
+        return self.value
+
+
+def _group(docs, spec):
+    groups = {}
+    for doc in docs:
+        group_id = _eval(spec['_id'], doc)
+        key = _hashable(group_id)
+        state = groups.get(key)
+        if state is None:
+            state = (group_id, {
+                name: _Accumulator(*next(iter(acc.items())))
+                for name, acc in spec.items() if name != '_id'
+            })
+            groups[key] = state
+        for acc in state[1].values():
+            acc.add(doc)
+    results = []
+    for group_id, accumulators in groups.values():
+        row = {'_id': group_id}
+        for name, acc in accumulators.items():
+            row[name] = acc.result()
+        results.append(row)
+    return results
+
+
+def _project_stage(docs, spec):
+    results = []
+    exclusions = [k for k, v in spec.items() if v in (0, False)]
+    inclusion = any(v not in (0, False) for k, v in spec.items() if k != '_id')
+    for doc in docs:
+        if not inclusion:
+            out = _copy(doc)
+            for path in exclusions:
+                _del_path(out, path)
+            results.append(out)
+            continue
+        out = {}
+        if spec.get('_id', 1) not in (0, False) and '_id' in doc:
+            out['_id'] = doc['_id']
+        for key, value in spec.items():
+            if key == '_id' and value in (0, 1, True, False):
+                continue
+            if value in (1, True):
+                found = _get_path(doc, key)
+                if found is not _MISSING:
+                    _set_path(out, key, _copy(found))
+            elif value not in (0, False):
+                _set_path(out, key, _eval(value, doc))
+        results.append(out)
+    return results
+
+
+def _unwind(docs, spec):
+    if isinstance(spec, str):
+        spec = {'path': spec}
+    path = spec['path'][1:]
+    preserve = spec.get('preserveNullAndEmptyArrays', False)
+    results = []
+    for doc in docs:
+        value = _get_path(doc, path)
+        if isinstance(value, list) and value:
+            for item in value:
+                out = _copy(doc)
+                _set_path(out, path, item)
+                results.append(out)
+        elif isinstance(value, list) or value is _MISSING or value is None:
+            if preserve:
+                results.append(doc)
+        else:
+            results.append(doc)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Indexes
+# ---------------------------------------------------------------------------
+
+class _Index:
+    def __init__(self, name, keys, unique=False, sparse=False, expire_after=None):
+        self.name = name
+        self.keys = keys
+        self.fields = [field for field, _ in keys]
+        self.directions = [direction for _, direction in keys]
+        self.hashed = any(direction == 'hashed' for direction in self.directions)
+        self.unique = unique
+        self.sparse = sparse
+        self.expire_after = expire_after
+        self._map = {}       # hashed: key tuple -> set of ids
+        self._entries = []   # sorted: [(key tuple, id sort key, id)]
+
+    def describe(self):
+        info = {'key': list(self.keys)}
+        if self.unique:
+            info['unique'] = True
+        if self.sparse:
+            info['sparse'] = True
+        if self.expire_after is not None:
+            info['expireAfterSeconds'] = self.expire_after
+        return info
+
+    def keys_for(self, doc):
+        per_field = []
+        present = False
+        for field in self.fields:
+            value = _get_path(doc, field)
+            if value is not _MISSING:
+                present = True
+            if isinstance(value, list) and value:
+                per_field.append({sort_key(v) for v in value})
+            else:
+                per_field.append([sort_key(_missing_to_none(value))])
+        if self.sparse and not present:
+            return []
+        return list(itertools.product(*per_field))
+
+    def check_unique(self, doc_id, doc):
+        if not self.unique:
+            return
+        for key in self.keys_for(doc):
+            for other in self._ids_for_key(key):
+                if other != doc_id:
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error index: {self.name} dup key: {key}",
+                        11000,
+                        {'keyPattern': dict(self.keys), 'index': self.name}
+                    )
+
+    def _ids_for_key(self, key):
+        if self.hashed:
+            return self._map.get(key, ())
+        lo = bisect_left(self._entries, (key,))
+        hi = bisect_left(self._entries, (key + (_MAX_KEY,),))
+        return [entry[2] for entry in self._entries[lo:hi] if entry[0] == key]
+
+    def add(self, doc_id, doc):
+        for key in self.keys_for(doc):
+            if self.hashed:
+                self._map.setdefault(key, set()).add(doc_id)
+            else:
+                insort(self._entries, (key, sort_key(doc_id), doc_id))
+
+    def remove(self, doc_id, doc):
+        id_key = sort_key(doc_id)
+        for key in self.keys_for(doc):
+            if self.hashed:
+                ids = self._map.get(key)
+                if ids is not None:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del self._map[key]
+            else:
+                pos = bisect_left(self._entries, (key, id_key))
+                if pos < len(self._entries) and self._entries[pos][0] == key and self._entries[pos][2] == doc_id:
+                    del self._entries[pos]
+
+    def clear(self):
+        self._map.clear()
+        del self._entries[:]
+
+    def scan(self, prefixes, bounds=None, reverse=False):
+        """Yield ids for each equality prefix, optionally bounded on the next field."""
+        # Multikey entries and overlapping prefixes can reach a document twice
+        seen = set()
+        for prefix in prefixes:
+            if self.hashed:
+                for doc_id in self._map.get(prefix, ()):
+                    if doc_id not in seen:
+                        seen.add(doc_id)
+                        yield doc_id
+                continue
+            lo_key, hi_key = prefix, prefix + (_MAX_KEY,)
+            if bounds:
+                lower, upper = bounds
+                if lower is not None:
+                    lo_key = prefix + (lower[0],) if lower[1] else prefix + (lower[0], _MAX_KEY)
+                if upper is not None:
+                    hi_key = prefix + (upper[0], _MAX_KEY) if upper[1] else prefix + (upper[0],)
+            lo = bisect_left(self._entries, (lo_key,))
+            hi = bisect_left(self._entries, (hi_key,))
+            entries = self._entries[lo:hi]
+            if reverse:
+                entries = reversed(entries)
+            for entry in entries:
+                if entry[2] not in seen:
+                    seen.add(entry[2])
+                    yield entry[2]
+
+
+# ---------------------------------------------------------------------------
+# Cursor, collection, database, client
+# ---------------------------------------------------------------------------
+
+class MemoryCursor:
+    def __init__(self, collection, filter=None, projection=None, sort=None, skip=0, limit=0):
+        self._collection = collection
+        self._filter = filter or {}
+        self._projection = projection
+        self._sort = _normalize_sort(sort) if sort else None
+        self._skip = skip
+        self._limit = limit
+        self._iterator = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip):
+        self._skip = skip
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    def hint(self, index):
+        return self
+
+    def max_time_ms(self, max_time_ms):
+        return self
+
+    def allow_disk_use(self, allow_disk_use):
+        return self
+
+    def collation(self, collation):
+        return self
+
+    def _execute(self):
+        command = {'filter': self._filter, 'sort': dict(self._sort) if self._sort else None,
+                   'projection': self._projection, 'skip': self._skip, 'limit': self._limit}
+        docs, _ = self._collection._monitored(
+            'find', command, lambda: self._collection._run_query(self._filter, self._sort, self._skip, self._limit)
+        )
+        projection = self._projection
+        return iter([_project(doc, projection) for doc in docs])
+
+    def explain(self):
+        _, stats = self._collection._run_query(self._filter, self._sort, self._skip, self._limit)
+        return stats
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = self._execute()
+        return next(self._iterator)
+
+    next = __next__
+
+    def rewind(self):
+        self._iterator = None
+        return self
+
+    def clone(self):
+        return MemoryCursor(self._collection, self._filter, self._projection, self._sort, self._skip, self._limit)
+
+    def close(self):
+        self._iterator = iter(())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MemoryCollection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        self._docs = {}
+        self._indexes = {}
+        self._lock = threading.RLock()
+        self._next_ttl_check = 0.0
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.database.get_collection(f"{self.name}.{name}")
+
+    def __getitem__(self, name):
+        return self.database.get_collection(f"{self.name}.{name}")
+
+    def with_options(self, **kwargs):
+        return self
+
+    # -- indexes ----------------------------------------------------------
+
+    def create_index(self, keys, unique=False, sparse=False, name=None, expireAfterSeconds=None,
+                     background=None, **kwargs):
+        keys = _normalize_sort(keys)
+        name = name or '_'.join(f"{field}_{direction}" for field, direction in keys)
+        with self._lock:
+            if name in self._indexes:
+                return name
+            index = _Index(name, keys, unique=unique, sparse=sparse, expire_after=expireAfterSeconds)
+            for doc_id, doc in self._docs.items():
+                index.check_unique(doc_id, doc)
+                index.add(doc_id, doc)
+            self._indexes[name] = index
+        return name
+
+    def create_indexes(self, indexes):
+        return [self.create_index(index.document['key'].items(), **{
+            k: v for k, v in index.document.items() if k != 'key'
+        }) for index in indexes]
+
+    def drop_index(self, name):
+        with self._lock:
+            if name not in self._indexes:
+                raise OperationFailure(f"index not found with name [{name}]")
+            del self._indexes[name]
+
+    def drop_indexes(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def index_information(self):
+        info = {'_id_': {'key': [('_id', 1)]}}
+        with self._lock:
+            for name, index in self._indexes.items():
+                info[name] = index.describe()
+        return info
+
+    def list_indexes(self):
+        return iter([dict(name=name, **info) for name, info in self.index_information().items()])
+
+    # -- internal write helpers (caller holds the lock) -------------------
+
+    def _store(self, doc):
+        if '_id' not in doc:
+            doc['_id'] = ObjectId()
+        doc_id = _hashable(doc['_id'])
+        if doc_id in self._docs:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.full_name} index: _id_ dup key: {doc['_id']}",
+                11000, {'keyPattern': {'_id': 1}, 'index': '_id_'}
+            )
+        for index in self._indexes.values():
+            index.check_unique(doc_id, doc)
+        self._docs[doc_id] = doc
+        for index in self._indexes.values():
+            index.add(doc_id, doc)
+        return doc['_id']
+
+    def _replace(self, doc_id, old, new):
+        for index in self._indexes.values():
+            index.check_unique(doc_id, new)
+        for index in self._indexes.values():
+            index.remove(doc_id, old)
+            index.add(doc_id, new)
+        self._docs[doc_id] = new
+
+    def _remove(self, doc_id):
+        doc = self._docs.pop(doc_id)
+        for index in self._indexes.values():
+            index.remove(doc_id, doc)
+        return doc
+
+    def _expire(self):
+        # Mimics the TTL monitor; runs at most once a second
+        now = time.monotonic()
+        if now < self._next_ttl_check:
+            return
+        self._next_ttl_check = now + 1.0
+        for index in list(self._indexes.values()):
+            if index.expire_after is None:
+                continue
+            cutoff = datetime.utcnow() - timedelta(seconds=index.expire_after)
+            expired = [
+                doc_id for doc_id, doc in self._docs.items()
+                if isinstance(doc.get(index.fields[0]), datetime) and doc[index.fields[0]] < cutoff
+            ]
+            for doc_id in expired:
+                self._remove(doc_id)
+
+    # -- query planning ---------------------------------------------------
+
+    def _plan(self, query, sort_spec):
+        equalities = {}
+        ranges = {}
+        for key, cond in query.items():
+            if key.startswith('$'):
+                continue
+            if _is_operator_dict(cond):
+                if '$eq' in cond and not isinstance(cond['$eq'], (dict, list, _Pattern)):
+                    equalities[key] = [cond['$eq']]
+                elif '$in' in cond and all(not isinstance(v, (dict, list, _Pattern)) for v in cond['$in']):
+                    equalities[key] = list(cond['$in'])
+                bounds = {op: v for op, v in cond.items() if op in _RANGE_OPS}
+                if bounds:
+                    ranges[key] = bounds
+            elif not isinstance(cond, (dict, list, _Pattern)):
+                equalities[key] = [cond]
+
+        best = None
+        for index in self._indexes.values():
+            prefix_len = 0
+            for field in index.fields:
+                if field not in equalities:
+                    break
+                prefix_len += 1
+            if index.hashed:
+                if prefix_len < len(index.fields):
+                    continue
+                score = (prefix_len, 0, 1, -len(index.fields))
+                candidate = (score, index, prefix_len, None, None)
+            else:
+                range_field = index.fields[prefix_len] if prefix_len < len(index.fields) else None
+                bounds = ranges.get(range_field) if range_field else None
+                reverse = None
+                if sort_spec and all(len(equalities[f]) == 1 for f in index.fields[:prefix_len]):
+                    # Entries are stored ascending on every field whatever the declared
+                    # direction, so a sort is covered when it walks them one way
+                    tail = index.fields[prefix_len:]
+                    if len(sort_spec) <= len(tail) and all(
+                        field == sort_field for field, (sort_field, _) in zip(tail, sort_spec)
+                    ):
+                        same = [sort_dir > 0 for _, sort_dir in sort_spec]
+                        if all(same):
+                            reverse = False
+                        elif not any(same):
+                            reverse = True
+                covers_sort = reverse is not None
+                if not prefix_len and not bounds and not covers_sort:
+                    continue
+                score = (prefix_len + (1 if bounds else 0), 1 if covers_sort else 0, 0, -len(index.fields))
+                candidate = (score, index, prefix_len, bounds, reverse)
+            if best is None or candidate[0] > best[0]:
+                best = candidate
+
+        if best is None:
+            return None
+        _, index, prefix_len, bounds, reverse = best
+        prefixes = [
+            tuple(sort_key(v) for v in combo)
+            for combo in itertools.product(*(equalities[f] for f in index.fields[:prefix_len]))
+        ]
+        scan_bounds = None
+        if bounds:
+            lower = upper = None
+            for op, value in bounds.items():
+                if op in ('$gt', '$gte'):
+                    lower = (sort_key(value), op == '$gte')
+                else:
+                    upper = (sort_key(value), op == '$lte')
+            scan_bounds = (lower, upper)
+        return index, prefixes, scan_bounds, bool(reverse), reverse is not None
+
+    def _run_query(self, query, sort_spec=None, skip=0, limit=0):
+        query = query or {}
+        with self._lock:
+            self._expire()
+            plan = None
+            if '_id' in query and not _is_operator_dict(query['_id']) and not isinstance(query['_id'], _Pattern):
+                doc = self._docs.get(_hashable(query['_id']))
+                ids = [_hashable(query['_id'])] if doc is not None else []
+                stage = {'stage': 'IDHACK'}
+                sorted_by_index = True
+            else:
+                plan = self._plan(query, sort_spec)
+                if plan is None:
+                    ids = list(self._docs.keys())
+                    stage = {'stage': 'COLLSCAN', 'filter': query}
+                    sorted_by_index = False
+                else:
+                    index, prefixes, bounds, reverse, sorted_by_index = plan
+                    ids = list(index.scan(prefixes, bounds, reverse))
+                    stage = {
+                        'stage': 'FETCH',
+                        'inputStage': {
+                            'stage': 'IXSCAN',
+                            'indexName': index.name,
+                            'keyPattern': dict(index.keys),
+                            'direction': 'backward' if reverse else 'forward'
+                        }
+                    }
+            docs_map = self._docs
+            if not query or (plan is None and stage['stage'] == 'IDHACK' and len(query) == 1):
+                matched = [docs_map[i] for i in ids if i in docs_map]
+            else:
+                matched = [docs_map[i] for i in ids if i in docs_map and _match(docs_map[i], query)]
+
+        examined = len(ids)
+        needs_sort = bool(sort_spec) and not sorted_by_index
+        if needs_sort:
+            _sort_docs(matched, sort_spec)
+            stage = {'stage': 'SORT', 'sortPattern': dict(sort_spec), 'inputStage': stage}
+        if skip:
+            matched = matched[skip:]
+        if limit:
+            matched = matched[:abs(limit)]
+            stage = {'stage': 'LIMIT', 'limitAmount': abs(limit), 'inputStage': stage}
+
+        stats = {
+            'queryPlanner': {
+                'namespace': self.full_name,
+                'parsedQuery': query,
+                'winningPlan': stage
+            },
+            'executionStats': {
+                'nReturned': len(matched),
+                'totalDocsExamined': examined,
+                'totalKeysExamined': examined if plan is not None else 0,
+                'executionStages': stage
+            },
+            'ok': 1.0
+        }
+        return matched, stats
+
+    # -- reads ------------------------------------------------------------
+
+    def _monitored(self, command_name, fields, run):
+        """Run a read, publishing it to the client's command listeners like pymongo would."""
+        listeners = self.database.client._command_listeners
+        if not listeners:
+            return run()
+        command = {command_name: self.name}
+        command.update((key, value) for key, value in fields.items() if value)
+        event = _CommandEvent(command_name, command, self.database.name)
+        for listener in listeners:
+            listener.started(event)
+        started = time.perf_counter()
+        try:
+            result = run()
+        except Exception as e:
+            event.duration_micros = int((time.perf_counter() - started) * 1e6)
+            event.failure = {'errmsg': str(e)}
+            for listener in listeners:
+                listener.failed(event)
+            raise
+        event.duration_micros = int((time.perf_counter() - started) * 1e6)
+        for listener in listeners:
+            listener.succeeded(event)
+        return result
+
+    def find(self, filter=None, projection=None, sort=None, skip=0, limit=0, **kwargs):
+        return MemoryCursor(self, filter, projection, sort, skip, limit)
+
+    def find_one(self, filter=None, projection=None, sort=None, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {'_id': filter}
+        sort_spec = _normalize_sort(sort) if sort else None
+        docs, _ = self._monitored(
+            'find', {'filter': filter, 'sort': dict(sort_spec) if sort_spec else None, 'projection': projection,
+                     'limit': 1},
+            lambda: self._run_query(filter, sort_spec, 0, 1)
+        )
+        return _project(docs[0], projection) if docs else None
+
+    def count_documents(self, filter, skip=0, limit=0, **kwargs):
+        docs, _ = self._monitored(
+            'count', {'query': filter, 'skip': skip, 'limit': limit},
+            lambda: self._run_query(filter, None, skip, limit)
+        )
+        return len(docs)
+
+    def estimated_document_count(self, **kwargs):
+        return len(self._docs)
+
+    def distinct(self, key, filter=None, **kwargs):
+        docs, _ = self._monitored('distinct', {'key': key, 'query': filter}, lambda: self._run_query(filter))
+        values = []
+        for doc in docs:
+            value = _get_path(doc, key)
+            if value is _MISSING:
+                continue
+            for item in (value if isinstance(value, list) else [value]):
+                if not any(_same(item, existing) for existing in values):
+                    values.append(item)
+        return values
+
+    def _split_pipeline(self, pipeline):
+        """(filter, sort, remaining stages): a leading $match and $sort run as a query, as in Mongo."""
+        stages = list(pipeline)
+        query = {}
+        sort_spec = None
+        if stages and '$match' in stages[0]:
+            query = stages.pop(0)['$match']
+        if stages and '$sort' in stages[0]:
+            sort_spec = _normalize_sort(stages.pop(0)['$sort'])
+        return query, sort_spec, stages
+
+    def aggregate(self, pipeline, **kwargs):
+        pipeline = list(pipeline)
+        return self._monitored('aggregate', {'pipeline': pipeline}, lambda: self._aggregate(pipeline))
+
+    def _aggregate(self, pipeline):
+        query, sort_spec, stages = self._split_pipeline(pipeline)
+        docs, _ = self._run_query(query, sort_spec)
+
+        for stage in stages:
+            (op, spec), = stage.items()
+            if op == '$match':
+                docs = [doc for doc in docs if _match(doc, spec)]
+            elif op == '$group':
+                docs = _group(docs, spec)
+            elif op == '$sort':
+                docs = _sort_docs(list(docs), _normalize_sort(spec))
+            elif op == '$limit':
+                docs = docs[:spec]
+            elif op == '$skip':
+                docs = docs[spec:]
+            elif op == '$project':
+                docs = _project_stage(docs, spec)
+            elif op in ('$addFields', '$set'):
+                results = []
+                for doc in docs:
+                    out = _copy(doc)
+                    for key, expr in spec.items():
+                        _set_path(out, key, _eval(expr, doc))
+                    results.append(out)
+                docs = results
+            elif op == '$unset':
+                docs = _project_stage(docs, {field: 0 for field in ([spec] if isinstance(spec, str) else spec)})
+            elif op == '$unwind':
+                docs = _unwind(docs, spec)
+            elif op == '$count':
+                docs = [{spec: len(docs)}]
+            elif op == '$replaceRoot':
+                docs = [_eval(spec['newRoot'], doc) for doc in docs]
+            elif op == '$unionWith':
+                other, sub_pipeline = (spec, []) if isinstance(spec, str) else (spec['coll'], spec.get('pipeline', []))
+                docs = list(docs) + list(self.database.get_collection(other)._aggregate(sub_pipeline))
+            else:
+                raise OperationFailure(f"Unrecognized pipeline stage name: '{op}'")
+        return iter([_copy(doc) for doc in docs])
+
+    # -- writes -----------------------------------------------------------
+
+    def insert_one(self, document, **kwargs):
+        doc = _copy(document)
+        with self._lock:
+            inserted_id = self._store(doc)
+        # pymongo sets _id on the caller's document as well
+        document['_id'] = inserted_id
+        return InsertOneResult(inserted_id, True)
+
+    def insert_many(self, documents, ordered=True, **kwargs):
+        documents = list(documents)
+        inserted_ids = []
+        errors = []
+        with self._lock:
+            for position, document in enumerate(documents):
+                if '_id' not in document:
+                    document['_id'] = ObjectId()
+                try:
+                    inserted_ids.append(self._store(_copy(document)))
+                except DuplicateKeyError as e:
+                    errors.append({'index': position, 'code': 11000, 'errmsg': str(e), 'op': document})
+                    if ordered:
+                        break
+        if errors:
+            raise BulkWriteError({
+                'writeErrors': errors, 'writeConcernErrors': [], 'nInserted': len(inserted_ids),
+                'nUpserted': 0, 'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': []
+            })
+        return InsertManyResult(inserted_ids, True)
+
+    def _update(self, filter, update, upsert, multi, replace=False):
+        matched = modified = 0
+        upserted_id = None
+        with self._lock:
+            docs, _ = self._run_query(filter, None, 0, 0 if multi else 1)
+            for doc in docs:
+                doc_id = _hashable(doc['_id'])
+                new = _copy(doc)
+                if replace:
+                    new = _copy(update)
+                    new['_id'] = doc['_id']
+                else:
+                    _apply_update(new, update)
+                matched += 1
+                if new != doc:
+                    if new.get('_id') != doc['_id']:
+                        raise WriteError("Performing an update on the path '_id' would modify the immutable field '_id'", 66)
+                    self._replace(doc_id, doc, new)
+                    modified += 1
+            if not docs and upsert:
+                new = _upsert_seed(filter or {})
+                if replace:
+                    new.update(_copy(update))
+                else:
+                    _apply_update(new, update, is_insert=True)
+                upserted_id = self._store(new)
+        raw = {'n': matched or (1 if upserted_id is not None else 0), 'nModified': modified, 'ok': 1.0}
+        if upserted_id is not None:
+            raw['upserted'] = upserted_id
+        return UpdateResult(raw, True)
+
+    def update_one(self, filter, update, upsert=False, **kwargs):
+        return self._update(filter, update, upsert, multi=False)
+
+    def update_many(self, filter, update, upsert=False, **kwargs):
+        return self._update(filter, update, upsert, multi=True)
+
+    def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        return self._update(filter, replacement, upsert, multi=False, replace=True)
+
+    def delete_one(self, filter, **kwargs):
+        with self._lock:
+            docs, _ = self._run_query(filter, None, 0, 1)
+            for doc in docs:
+                self._remove(_hashable(doc['_id']))
+        return DeleteResult({'n': len(docs), 'ok': 1.0}, True)
+
+    def delete_many(self, filter, **kwargs):
+        with self._lock:
+            docs, _ = self._run_query(filter)
+            for doc in docs:
+                self._remove(_hashable(doc['_id']))
+        return DeleteResult({'n': len(docs), 'ok': 1.0}, True)
+
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                            return_document=False, **kwargs):
+        with self._lock:
+            docs, _ = self._run_query(filter, _normalize_sort(sort) if sort else None, 0, 1)
+            before = docs[0] if docs else None
+            if before is None and not upsert:
+                return None
+            query = {'_id': before['_id']} if before is not None else filter
+            result = self._update(query, update, upsert, multi=False)
+            after_id = before['_id'] if before is not None else result.upserted_id
+            after = self._docs.get(_hashable(after_id))
+        doc = after if return_document else before
+        return _project(doc, projection) if doc is not None else None
+
+    def find_one_and_delete(self, filter, projection=None, sort=None, **kwargs):
+        with self._lock:
+            docs, _ = self._run_query(filter, _normalize_sort(sort) if sort else None, 0, 1)
+            if not docs:
+                return None
+            doc = self._remove(_hashable(docs[0]['_id']))
+        return _project(doc, projection)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        counts = {'nInserted': 0, 'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'nUpserted': 0}
+        upserted = []
+        errors = []
+        with self._lock:
+            for position, op in enumerate(requests):
+                try:
+                    if isinstance(op, InsertOne):
+                        self.insert_one(op._doc)
+                        counts['nInserted'] += 1
+                        continue
+                    if isinstance(op, (DeleteOne, DeleteMany)):
+                        delete = self.delete_one if isinstance(op, DeleteOne) else self.delete_many
+                        counts['nRemoved'] += delete(op._filter).deleted_count
+                        continue
+                    if isinstance(op, ReplaceOne):
+                        result = self.replace_one(op._filter, op._doc, upsert=op._upsert)
+                    elif isinstance(op, (UpdateOne, UpdateMany)):
+                        update = self.update_one if isinstance(op, UpdateOne) else self.update_many
+                        result = update(op._filter, op._doc, upsert=op._upsert)
+                    else:
+                        raise TypeError(f"{op!r} is not a valid request")
+                    counts['nMatched'] += result.matched_count
+                    counts['nModified'] += result.modified_count
+                    if result.upserted_id is not None:
+                        counts['nUpserted'] += 1
+                        upserted.append({'index': position, '_id': result.upserted_id})
+                except (DuplicateKeyError, WriteError) as e:
+                    errors.append({'index': position, 'code': e.code, 'errmsg': str(e)})
+                    if ordered:
+                        break
+        result = dict(counts, upserted=upserted, writeErrors=errors, writeConcernErrors=[])
+        if errors:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    def drop(self):
+        self.database.drop_collection(self.name)
+
+
+class MemoryDatabase:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.get_collection(name)
+
+    def __getitem__(self, name):
+        return self.get_collection(name)
+
+    def get_collection(self, name, **kwargs):
+        collection = self._collections.get(name)
+        if collection is None:
+            with self._lock:
+                collection = self._collections.setdefault(name, MemoryCollection(self, name))
+        return collection
+
+    def create_collection(self, name, **kwargs):
+        return self.get_collection(name)
+
+    def list_collection_names(self, **kwargs):
+        return [name for name, collection in self._collections.items() if collection._docs]
+
+    def drop_collection(self, name):
+        with self._lock:
+            self._collections.pop(getattr(name, 'name', name), None)
+
+    def with_options(self, **kwargs):
+        return self
+
+    def command(self, command, value=1, **kwargs):
+        name = command if isinstance(command, str) else next(iter(command))
+        if name == 'ping':
+            return {'ok': 1.0}
+        if name == 'dbStats':
+            return {
+                'db': self.name,
+                'collections': len(self._collections),
+                'objects': sum(len(c._docs) for c in self._collections.values()),
+                'ok': 1.0
+            }
+        if name == 'serverStatus':
+            return {'host': 'memory', 'version': 'memory', 'ok': 1.0}
+        if name == 'explain':
+            return self._explain(command['explain'])
+        raise OperationFailure(f"no such command: '{name}'", 59)
+
+    def _explain(self, spec):
+        """Plan and execution stats of a find, count, distinct or aggregate command document."""
+        name = next(iter(spec))
+        collection = self.get_collection(spec[name])
+        if name == 'find':
+            sort_spec = _normalize_sort(spec['sort']) if spec.get('sort') else None
+            _, stats = collection._run_query(spec.get('filter'), sort_spec, spec.get('skip', 0), spec.get('limit', 0))
+        elif name in ('count', 'distinct'):
+            _, stats = collection._run_query(spec.get('query'), None, spec.get('skip', 0), spec.get('limit', 0))
+        elif name == 'aggregate':
+            query, sort_spec, _ = collection._split_pipeline(spec['pipeline'])
+            _, stats = collection._run_query(query, sort_spec)
+        else:
+            raise OperationFailure(f"Cannot explain cmd: {name}", 2)
+        return stats
+
+
+class _CommandEvent:
+    """The attributes of pymongo's command monitoring events that listeners read."""
+
+    def __init__(self, command_name, command, database_name):
+        self.command_name = command_name
+        self.command = command
+        self.database_name = database_name
+        self.request_id = self.operation_id = next(_request_ids)
+        self.connection_id = ('memory', 0)
+        self.duration_micros = 0
+        self.reply = {'ok': 1.0}
+        self.failure = None
+
+
+_request_ids = itertools.count(1)
+
+
+class MemoryClient:
+    """Drop-in stand-in for ``pymongo.MongoClient`` backed by process memory."""
+
+    def __init__(self, *args, event_listeners=None, **kwargs):
+        self._databases = {}
+        self._lock = threading.Lock()
+        self._command_listeners = [
+            listener for listener in event_listeners or () if isinstance(listener, monitoring.CommandListener)
+        ]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.get_database(name)
+
+    def __getitem__(self, name):
+        return self.get_database(name)
+
+    def get_database(self, name=None, **kwargs):
+        name = name or 'test'
+        database = self._databases.get(name)
+        if database is None:
+            with self._lock:
+                database = self._databases.setdefault(name, MemoryDatabase(self, name))
+        return database
+
+    def get_default_database(self, default=None, **kwargs):
+        return self.get_database(default)
+
+    def list_database_names(self):
+        return list(self._databases)
+
+    def drop_database(self, name):
+        with self._lock:
+            self._databases.pop(getattr(name, 'name', name), None)
+
+    def close(self):
+        pass
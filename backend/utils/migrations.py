@@ -0,0 +1,295 @@
+"""Versioned schema migrations, run as resumable, throttled backfills.
+
+A ``Migration`` is a version number, a list of ``Backfill`` steps and the
+indexes it needs. A backfill walks one collection in ``_id`` order, a batch at
+a time, and turns each document into a ``$set`` of converted fields. After
+every batch the last ``_id`` is checkpointed in ``schema_migrations``, so a
+cancelled, failed or restarted run continues where it stopped. Batches are
+paced to ``max_per_second`` documents so a backfill does not crowd out live
+traffic.
+
+Each update is conditional on the values it converted: a document that a
+request rewrote in the meantime (the write paths already store the new
+format) is left alone. A dry run converts without writing and reports what
+would change, plus samples of values that cannot be converted; those are
+left in place by a real run too, and counted as ``invalid``.
+
+Runs are started with ``POST /api/admin/migrations/<version>/run`` (the
+``schema_migration`` job, once per tenant partition) or from the command line,
+which reads the same ``TENANT_PARTITIONS`` so both record their checkpoints
+under the same partition names:
+
+    python -m utils.migrations --list
+    python -m utils.migrations --version 1 --dry-run
+    python -m utils.migrations --version 1 --max-per-second 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from utils.validation import parse_date
+
+# schema_migrations states; a migration without a document is pending
+PENDING = 'pending'
+RUNNING = 'running'
+STOPPED = 'stopped'
+APPLIED = 'applied'
+
+# Unconvertible values reported per run
+MAX_SAMPLES = 20
+
+
+class Backfill:
+    def __init__(self, collection, fields, convert):
+        self.collection = collection
+        self.fields = fields
+        self.convert = convert
+
+    def changes(self, document):
+        """(`$set` of converted fields, fields whose value could not be converted) for one document."""
+        update, invalid = {}, []
+        for field in self.fields:
+            if field not in document:
+                continue
+            value = document[field]
+            try:
+                converted = self.convert(value)
+            except (ValueError, TypeError):
+                invalid.append(field)
+                continue
+            if type(converted) is not type(value) or converted != value:
+                update[field] = converted
+        return update, invalid
+
+
+class Migration:
+    def __init__(self, version, name, backfills, indexes=()):
+        self.version = version
+        self.name = name
+        self.backfills = backfills
+        # (collection, keys) pairs, created once the backfills are done
+        self.indexes = indexes
+
+
+MIGRATIONS = {}
+
+
+def register(migration):
+    if migration.version in MIGRATIONS:
+        raise ValueError(f"Duplicate migration version: {migration.version}")
+    MIGRATIONS[migration.version] = migration
+    return migration
+
+
+def to_date(value):
+    """A stored date string as a BSON date; empty strings become null."""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, str) and not value.strip():
+        return None
+    return parse_date(value)
+
+
+register(Migration(1, 'typed_dates', [
+    Backfill('leads', ['nextFollowUp'], to_date),
+    Backfill('leads_archive', ['nextFollowUp'], to_date),
+    Backfill('projects', ['deadline'], to_date),
+    Backfill('payments', ['date'], to_date),
+    Backfill('payments_archive', ['date'], to_date),
+    Backfill('customer_ledger', ['lastPaymentDate'], to_date),
+], indexes=[
+    ('leads', [("createdBy", 1), ("nextFollowUp", 1)]),
+    ('projects', [("createdBy", 1), ("deadline", 1)]),
+    ('payments', [("createdBy", 1), ("date", -1)]),
+]))
+
+
+def migration_status(control_db):
+    """Every registered migration with its recorded state, oldest first."""
+    records = {record['_id']: record for record in control_db.schema_migrations.find()}
+    status = []
+    for version in sorted(MIGRATIONS):
+        record = records.get(version, {})
+        status.append({
+            "version": version,
+            "name": MIGRATIONS[version].name,
+            "state": record.get('state', PENDING),
+            "counts": record.get('counts', {}),
+            "error": record.get('error'),
+            "startedAt": record.get('startedAt'),
+            "appliedAt": record.get('appliedAt'),
+            "updatedAt": record.get('updatedAt')
+        })
+    return status
+
+
+class Pacer:
+    """Sleeps just enough to keep the average rate at or below `per_second` (0: unthrottled)."""
+
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self.started = time.monotonic()
+        self.done = 0
+
+    def __call__(self, n):
+        self.done += n
+        if self.per_second > 0:
+            delay = self.done / self.per_second - (time.monotonic() - self.started)
+            if delay > 0:
+                time.sleep(delay)
+
+
+def _backfill(control_db, db, migration, backfill, key, options, report, pace, progress):
+    counts = {"scanned": 0, "updated": 0, "invalid": 0, "conflicts": 0}
+    last_id = None
+    if not options['dryRun']:
+        record = control_db.schema_migrations.find_one({"_id": migration.version}, {"checkpoints": 1, "counts": 1})
+        last_id = record['checkpoints'].get(key)
+        counts.update(record['counts'].get(key) or {})
+    report['counts'][key] = counts
+    projection = {field: 1 for field in backfill.fields}
+    collection = db[backfill.collection]
+
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(collection.find(query, projection).sort("_id", 1).limit(options['batchSize']))
+        if not batch:
+            return
+        updates = []
+        for document in batch:
+            update, invalid = backfill.changes(document)
+            if update:
+                # Only if the fields still hold what was converted
+                guard = {field: document[field] for field in update}
+                updates.append(UpdateOne(dict(guard, _id=document['_id']), {"$set": update}))
+            for field in invalid:
+                counts['invalid'] += 1
+                if len(report['invalidSamples']) < MAX_SAMPLES:
+                    report['invalidSamples'].append({
+                        "collection": backfill.collection, "id": str(document['_id']),
+                        "field": field, "value": str(document[field])[:100]
+                    })
+        counts['scanned'] += len(batch)
+        last_id = batch[-1]['_id']
+
+        if options['dryRun']:
+            counts['updated'] += len(updates)
+        else:
+            if updates:
+                result = collection.bulk_write(updates, ordered=False)
+                counts['updated'] += result.modified_count
+                counts['conflicts'] += len(updates) - result.matched_count
+            control_db.schema_migrations.update_one({"_id": migration.version}, {"$set": {
+                f"checkpoints.{key}": last_id,
+                f"counts.{key}": counts,
+                "updatedAt": datetime.utcnow()
+            }})
+        progress(sum(c['scanned'] for c in report['counts'].values()), None, f"{key}: {counts['scanned']}")
+        pace(len(batch))
+
+
+def apply_migration(control_db, partitions, migration, batch_size=1000, max_per_second=0, dry_run=False,
+                    progress=None):
+    """Run `migration` over every (name, database) in `partitions`; returns the report.
+
+    Real runs record their state and checkpoints in `control_db`.schema_migrations
+    and pick up from the checkpoints of an earlier, unfinished run.
+    """
+    options = {"batchSize": batch_size, "dryRun": dry_run}
+    report = {"version": migration.version, "name": migration.name, "dryRun": dry_run,
+              "counts": {}, "invalidSamples": []}
+    progress = progress or (lambda done, total=None, message=None: None)
+    pace = Pacer(max_per_second)
+    state = control_db.schema_migrations
+    now = datetime.utcnow()
+
+    if not dry_run:
+        state.update_one(
+            {"_id": migration.version},
+            {"$set": {"name": migration.name, "state": RUNNING, "error": None, "updatedAt": now},
+             "$setOnInsert": {"startedAt": now, "checkpoints": {}, "counts": {}}},
+            upsert=True
+        )
+    try:
+        for partition, db in partitions:
+            for backfill in migration.backfills:
+                key = f"{partition}:{backfill.collection}"
+                _backfill(control_db, db, migration, backfill, key, options, report, pace, progress)
+            if not dry_run:
+                for collection, keys in migration.indexes:
+                    db[collection].create_index(keys)
+    except BaseException as e:
+        if not dry_run:
+            # Checkpoints stay, so the next run resumes
+            state.update_one({"_id": migration.version}, {"$set": {
+                "state": STOPPED, "error": str(e) or type(e).__name__, "updatedAt": datetime.utcnow()
+            }})
+        raise
+
+    if not dry_run:
+        state.update_one({"_id": migration.version}, {"$set": {
+            "state": APPLIED, "counts": report['counts'], "appliedAt": datetime.utcnow(), "updatedAt": datetime.utcnow()
+        }})
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply schema migrations to a MongoDB database")
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/thrive_solutions'))
+    parser.add_argument('--db', default=os.getenv('MONGO_DB_NAME', 'thrive_solutions'))
+    parser.add_argument('--partitions', default=os.getenv('TENANT_PARTITIONS', ''),
+                        help='tenant partitions as "name=uri;name=uri" (default: TENANT_PARTITIONS)')
+    parser.add_argument('--list', action='store_true', help='show every migration and its state')
+    parser.add_argument('--version', type=int, help='migration to apply (default: every pending one)')
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--max-per-second', type=float, default=0, help='documents per second (0: unthrottled)')
+    args = parser.parse_args(argv)
+
+    from pymongo import MongoClient
+    from utils.tenancy import connect_partitions, parse_partitions
+    db = MongoClient(args.mongo_uri)[args.db]
+    # Named like the schema_migration job's partitions, so either can resume the other's run
+    if args.partitions:
+        specs = parse_partitions(args.partitions, args.db)
+        partitions = list(connect_partitions(specs, MongoClient).items())
+    else:
+        partitions = [('default', db)]
+    status = migration_status(db)
+    if args.list:
+        for entry in status:
+            print(f"{entry['version']:>4}  {entry['name']:<24} {entry['state']}")
+        return 0
+
+    if args.version is not None:
+        if args.version not in MIGRATIONS:
+            print(f"❌ Unknown migration version {args.version}")
+            return 1
+        versions = [args.version]
+    else:
+        versions = [entry['version'] for entry in status if entry['state'] != APPLIED]
+
+    def progress(done, total=None, message=None):
+        print(f"📝 {message}")
+
+    for version in versions:
+        started = time.perf_counter()
+        report = apply_migration(
+            db, partitions, MIGRATIONS[version], batch_size=args.batch_size,
+            max_per_second=args.max_per_second, dry_run=args.dry_run, progress=progress
+        )
+        elapsed = time.perf_counter() - started
+        print(f"✅ Migration {version} ({report['name']}) {'checked' if args.dry_run else 'applied'} "
+              f"in {elapsed:.1f}s: {report['counts']}")
+        for sample in report['invalidSamples']:
+            print(f"⚠️  {sample['collection']} {sample['id']}: {sample['field']}={sample['value']!r}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
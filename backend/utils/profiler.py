@@ -0,0 +1,301 @@
+"""Opt-in sampling profiler for individual requests.
+
+With ``PROFILER_ENABLED`` on, a request is profiled when an admin sends
+``X-Profile: true`` or when it is picked at ``PROFILER_SAMPLE_RATE``. While
+at least one profiled request is running, a sampler thread reads the stack
+of each profiled request's thread every ``PROFILER_INTERVAL_MS`` (via
+``sys._current_frames``, so the request thread itself does no extra work) and
+a pymongo ``CommandListener`` times every command that thread sends. The last
+``PROFILER_MAX_PROFILES`` profiles are kept in memory and served by
+``/api/admin/profiles`` as speedscope JSON or collapsed stacks for
+flamegraph.pl. The response of a profiled request carries ``X-Profile-Id``.
+
+A request that is not profiled pays one header lookup and one random number,
+and each Mongo command one dict lookup; the sampler sleeps until a profile
+starts.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from bson import ObjectId
+from flask import request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from pymongo import monitoring
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+_SITE_MARKERS = (os.sep + 'site-packages' + os.sep, os.sep + 'dist-packages' + os.sep)
+
+
+def _short_file(filename):
+    """Installed packages by module path, app files relative to the working directory, the rest by name."""
+    for marker in _SITE_MARKERS:
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    cwd = os.getcwd() + os.sep
+    if filename.startswith(cwd):
+        return filename[len(cwd):]
+    return os.path.basename(filename)
+
+
+class Profile:
+    def __init__(self, thread_id, method, path, endpoint, trigger):
+        self.id = str(ObjectId())
+        self.thread_id = thread_id
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.trigger = trigger
+        self.started_at = datetime.utcnow()
+        self.start = time.perf_counter()
+        self.end = None
+        self.status = None
+        self.frames = []
+        self._frame_index = {}
+        # (stack as frame indexes root first, weight in seconds), merging repeats
+        self.samples = []
+        self._last_sample = self.start
+        self.commands = []
+        self._pending = {}
+
+    def _frame(self, frame):
+        code = frame.f_code
+        key = (code.co_name, code.co_filename, frame.f_lineno)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = self._frame_index[key] = len(self.frames)
+            self.frames.append({"name": code.co_name, "file": _short_file(code.co_filename), "line": frame.f_lineno})
+        return index
+
+    def add_sample(self, frame, now):
+        stack = []
+        while frame is not None:
+            stack.append(self._frame(frame))
+            frame = frame.f_back
+        stack.reverse()
+        stack = tuple(stack)
+        weight = now - self._last_sample
+        self._last_sample = now
+        if self.samples and self.samples[-1][0] == stack:
+            self.samples[-1] = (stack, self.samples[-1][1] + weight)
+        else:
+            self.samples.append((stack, weight))
+
+    def command_started(self, event):
+        target = event.command.get(event.command_name)
+        self._pending[event.request_id] = (time.perf_counter(), {
+            "command": event.command_name,
+            "collection": target if isinstance(target, str) else None,
+            "database": event.database_name
+        })
+
+    def command_finished(self, event, ok):
+        started, command = self._pending.pop(event.request_id, (None, None))
+        if command is not None:
+            command.update(
+                startMs=round((started - self.start) * 1000, 3),
+                durationMs=round(event.duration_micros / 1000, 3),
+                ok=ok
+            )
+            self.commands.append(command)
+
+    def finish(self, status):
+        self.end = time.perf_counter()
+        self.status = status
+
+    @property
+    def duration_ms(self):
+        return round(((self.end or time.perf_counter()) - self.start) * 1000, 3)
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "endpoint": self.endpoint,
+            "trigger": self.trigger,
+            "status": self.status,
+            "startedAt": self.started_at,
+            "durationMs": self.duration_ms,
+            "samples": len(self.samples),
+            "mongo": {
+                "commands": len(self.commands),
+                "durationMs": round(sum(command['durationMs'] for command in self.commands), 3)
+            }
+        }
+
+    def detail(self):
+        return dict(self.summary(), commands=self.commands)
+
+    def _label(self, index):
+        frame = self.frames[index]
+        return f"{frame['name']} ({frame['file']}:{frame['line']})"
+
+    def collapsed(self):
+        """Folded stacks ("a;b;c <microseconds>") for flamegraph.pl or speedscope's import."""
+        totals = {}
+        for stack, weight in self.samples:
+            totals[stack] = totals.get(stack, 0) + weight
+        return ''.join(
+            f"{';'.join(self._label(index) for index in stack)} {max(1, round(weight * 1e6))}\n"
+            for stack, weight in totals.items()
+        )
+
+    def speedscope(self):
+        """A speedscope file: the sampled stacks, plus the Mongo commands as an evented profile."""
+        frames = list(self.frames)
+        end_ms = self.duration_ms
+        profiles = [{
+            "type": "sampled",
+            "name": f"{self.method} {self.path}",
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": end_ms,
+            "samples": [list(stack) for stack, _ in self.samples],
+            "weights": [round(weight * 1000, 3) for _, weight in self.samples]
+        }]
+        if self.commands:
+            events = []
+            for command in self.commands:
+                frames.append({"name": f"mongo {command['command']} {command['collection'] or command['database']}"})
+                events.append({"type": "O", "frame": len(frames) - 1, "at": command['startMs']})
+                events.append({"type": "C", "frame": len(frames) - 1,
+                               "at": min(end_ms, command['startMs'] + command['durationMs'])})
+            profiles.append({
+                "type": "evented",
+                "name": "MongoDB commands",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": end_ms,
+                "events": events
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.method} {self.path} ({self.started_at.isoformat()})",
+            "exporter": "thrive-profiler",
+            "shared": {"frames": frames},
+            "profiles": profiles
+        }
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Times the Mongo commands of profiled requests; events fire on the thread that sent the command."""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def started(self, event):
+        profile = self.profiler.active.get(threading.get_ident())
+        if profile is not None:
+            profile.command_started(event)
+
+    def succeeded(self, event):
+        profile = self.profiler.active.get(threading.get_ident())
+        if profile is not None:
+            profile.command_finished(event, True)
+
+    def failed(self, event):
+        profile = self.profiler.active.get(threading.get_ident())
+        if profile is not None:
+            profile.command_finished(event, False)
+
+
+class Profiler:
+    def __init__(self, sample_rate=0.0, interval=0.001, max_profiles=50):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.active = {}
+        self.profiles = deque(maxlen=max(1, max_profiles))
+        self.command_listener = CommandTimer(self)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self, method, path, endpoint, trigger):
+        profile = Profile(threading.get_ident(), method, path, endpoint, trigger)
+        with self._lock:
+            self.active[profile.thread_id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+                self._thread.start()
+            self._wake.set()
+        return profile
+
+    def stop(self, status=None):
+        with self._lock:
+            profile = self.active.pop(threading.get_ident(), None)
+            if not self.active:
+                self._wake.clear()
+        if profile is not None:
+            profile.finish(status)
+            self.profiles.append(profile)
+        return profile
+
+    def _sample(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            with self._lock:
+                profiles = list(self.active.values())
+            for profile in profiles:
+                frame = frames.get(profile.thread_id)
+                if frame is not None:
+                    profile.add_sample(frame, now)
+            del frames
+
+    def get(self, profile_id):
+        return next((profile for profile in list(self.profiles) if profile.id == profile_id), None)
+
+    def recent(self):
+        return [profile.summary() for profile in reversed(list(self.profiles))]
+
+
+def _is_admin(app):
+    try:
+        verify_jwt_in_request(optional=True)
+        user_id = get_jwt_identity()
+        if not user_id:
+            return False
+        user = app.db.users.find_one({"_id": ObjectId(user_id)}, {"role": 1})
+    except Exception:
+        return False
+    return bool(user) and user.get('role') == 'admin'
+
+
+def init_profiler(app):
+    """Install the profiling hooks; call early in create_app so later hooks are inside the profile."""
+    profiler = app.profiler
+
+    @app.before_request
+    def start_profile():
+        if request.method == 'OPTIONS':
+            return None
+        trigger = None
+        if request.headers.get(PROFILE_HEADER, '').lower() in ('1', 'true') and _is_admin(app):
+            trigger = 'header'
+        elif profiler.sample_rate and random.random() < profiler.sample_rate:
+            trigger = 'sampled'
+        if trigger:
+            profiler.start(request.method, request.path, request.endpoint, trigger)
+        return None
+
+    @app.after_request
+    def finish_profile(response):
+        profile = profiler.stop(response.status_code)
+        if profile is not None:
+            response.headers[PROFILE_ID_HEADER] = profile.id
+        return response
+
+    @app.teardown_request
+    def drop_profile(error=None):
+        # Requests that raised never reached after_request
+        profiler.stop(500 if error else None)
@@ -0,0 +1,67 @@
+"""Sparse fieldsets: turn a ``?fields=a,b,c`` query parameter into a Mongo projection."""
+
+from flask import jsonify
+
+# Fields a client may ask for, per resource. `id` is always returned (it is
+# derived from `_id`), and anything not listed here - passwords in particular -
+# can never be selected.
+FIELD_WHITELISTS = {
+    'users': ['fullName', 'email', 'role', 'createdAt'],
+    'leads': [
+        'name', 'email', 'mobile', 'address', 'company', 'designation', 'source',
+        'notes', 'status', 'nextFollowUp', 'assignedTo', 'createdBy', 'fileName',
+        'attachment', 'score', 'scoredAt', 'createdAt', 'updatedAt'
+    ],
+    'projects': [
+        'projectName', 'details', 'deadline', 'priority', 'projectFile', 'attachment',
+        'status', 'createdBy', 'createdAt', 'updatedAt'
+    ],
+    'budgets': [
+        'budgetName', 'projectId', 'projectName', 'totalBudget', 'developmentCost',
+        'designCost', 'testingCost', 'deploymentCost', 'maintenanceCost',
+        'thirdPartyCost', 'currency', 'base', 'notes', 'createdBy', 'createdAt', 'updatedAt'
+    ],
+    'payments': [
+        'customer', 'customerKey', 'date', 'amount', 'currency', 'base', 'status', 'createdBy', 'createdAt', 'updatedAt'
+    ]
+}
+
+_WHITELIST_SETS = {resource: frozenset(fields) for resource, fields in FIELD_WHITELISTS.items()}
+
+
+class InvalidFieldsError(ValueError):
+    def __init__(self, resource, unknown):
+        self.resource = resource
+        self.unknown = unknown
+        super().__init__(f"Unknown fields for {resource}: {', '.join(unknown)}")
+
+
+def full_projection(resource):
+    return {field: 1 for field in FIELD_WHITELISTS[resource]}
+
+
+def parse_fields(resource, raw, default=None):
+    """Return the projection for `raw`, or `default` when no fields were requested."""
+    if raw is None or not raw.strip():
+        return default
+
+    requested = []
+    for field in raw.split(','):
+        field = field.strip()
+        if field and field != 'id' and field not in requested:
+            requested.append(field)
+
+    unknown = [field for field in requested if field not in _WHITELIST_SETS[resource]]
+    if unknown:
+        raise InvalidFieldsError(resource, unknown)
+
+    # Only `id` requested: still project, so nothing but `_id` is read
+    return {field: 1 for field in requested} or {"_id": 1}
+
+
+def invalid_fields_response(error):
+    return jsonify({
+        "message": str(error),
+        "error": "invalid_fields",
+        "allowed_fields": FIELD_WHITELISTS[error.resource]
+    }), 400
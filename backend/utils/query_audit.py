@@ -0,0 +1,294 @@
+"""Query-plan auditing: explain each distinct query shape and flag scans.
+
+A pymongo ``CommandListener`` (the in-memory engine publishes the same events)
+sees every find, count, distinct and aggregate the app sends. Each one is
+reduced to its shape: the filter with every value replaced by ``?``, the sort
+and, for pipelines, the stage names. The first time a shape is seen, a
+background thread runs ``explain`` with ``executionStats`` on that command
+and records what the winning plan does. A shape is flagged for
+
+* ``collscan``: the plan reads the whole collection (``COLLSCAN``);
+* ``in_memory_sort``: the plan sorts documents itself (``SORT``) because no
+  index provides the order;
+* ``examined_ratio``: at least ``min_examined`` documents were examined and
+  more than ``max_ratio`` per document returned.
+
+Findings are reported per route (``request.endpoint``, or ``(background)``
+for jobs and start-up work). ``QUERY_AUDIT_MODE`` is ``sample`` in production,
+where only ``QUERY_AUDIT_SAMPLE_RATE`` of queries are looked at (so counts are
+sampled too), or ``full`` for tests and benchmarks, where every query is.
+Explains execute the query, once per shape, off the request thread.
+
+``python -m benchmarks.api_bench --audit-queries --strict-queries`` fails when
+a (route, collection, issue) finding is not in the ``--query-baseline``
+report, so a change that adds a scan to a route fails the run.
+"""
+
+import json
+import queue
+import random
+import threading
+import time
+
+from flask import has_request_context, request
+from pymongo import monitoring
+
+OFF = 'off'
+SAMPLE = 'sample'
+FULL = 'full'
+
+COLLSCAN = 'collscan'
+IN_MEMORY_SORT = 'in_memory_sort'
+EXAMINED_RATIO = 'examined_ratio'
+
+# Route of queries sent outside a request
+BACKGROUND = '(background)'
+
+# The parts of each audited command that affect its plan
+AUDITED_COMMANDS = {
+    'find': ('filter', 'sort', 'projection', 'skip', 'limit', 'hint', 'collation'),
+    'aggregate': ('pipeline', 'hint', 'collation'),
+    'count': ('query', 'skip', 'limit', 'hint', 'collation'),
+    'distinct': ('key', 'query', 'hint', 'collation'),
+}
+
+# Shapes tracked at most; later new shapes are only counted
+MAX_SHAPES = 5000
+
+_LOGICAL_OPS = ('$and', '$or', '$nor')
+
+
+def filter_shape(query):
+    """`query` with its values replaced by "?", keeping fields, operators and nesting."""
+    shape = {}
+    for key, value in (query or {}).items():
+        if key in _LOGICAL_OPS and isinstance(value, list):
+            shape[key] = [filter_shape(clause) for clause in value]
+        elif isinstance(value, dict) and value and all(op.startswith('$') for op in value):
+            shape[key] = {
+                op: filter_shape(arg) if op in ('$elemMatch', '$not') and isinstance(arg, dict) else '?'
+                for op, arg in value.items()
+            }
+        else:
+            shape[key] = '?'
+    return shape
+
+
+def command_shape(command_name, command):
+    if command_name == 'find':
+        shape = {"filter": filter_shape(command.get('filter'))}
+        if command.get('sort'):
+            shape['sort'] = dict(command['sort'])
+        return shape
+    if command_name == 'aggregate':
+        stages = []
+        for stage in command.get('pipeline') or []:
+            (op, spec), = stage.items()
+            if op == '$match':
+                stages.append({op: filter_shape(spec)})
+            elif op == '$sort':
+                stages.append({op: dict(spec)})
+            else:
+                stages.append(op)
+        return {"pipeline": stages}
+    shape = {"query": filter_shape(command.get('query'))}
+    if command_name == 'distinct':
+        shape['key'] = command.get('key')
+    return shape
+
+
+def _find(document, key):
+    """The first value stored under `key` anywhere in an explain result."""
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        children = document.values()
+    elif isinstance(document, list):
+        children = document
+    else:
+        return None
+    for child in children:
+        found = _find(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _stages(plan):
+    while isinstance(plan, dict):
+        if 'queryPlan' in plan:
+            # Slot-based engine plans wrap the classic tree
+            plan = plan['queryPlan']
+            continue
+        if 'stage' in plan:
+            yield plan['stage']
+        for child in plan.get('inputStages', []):
+            yield from _stages(child)
+        plan = plan.get('inputStage')
+
+
+def analyze(explain, max_ratio=10.0, min_examined=100):
+    """The plan stages, execution counts and issues of an ``explain`` result."""
+    planner = _find(explain, 'queryPlanner') or {}
+    stats = _find(explain, 'executionStats') or {}
+    stages = list(_stages(planner.get('winningPlan')))
+    examined = stats.get('totalDocsExamined', 0)
+    returned = stats.get('nReturned', 0)
+    issues = []
+    if 'COLLSCAN' in stages:
+        issues.append(COLLSCAN)
+    if 'SORT' in stages:
+        issues.append(IN_MEMORY_SORT)
+    if examined >= min_examined and examined > max_ratio * max(returned, 1):
+        issues.append(EXAMINED_RATIO)
+    return {
+        "stages": stages,
+        "docsExamined": examined,
+        "keysExamined": stats.get('totalKeysExamined', 0),
+        "returned": returned,
+        "issues": issues
+    }
+
+
+class _Shape:
+    def __init__(self, database, collection, command_name, shape):
+        self.database = database
+        self.collection = collection
+        self.command_name = command_name
+        self.shape = shape
+        self.plan = None
+        self.error = None
+
+    def summary(self):
+        summary = {
+            "collection": self.collection,
+            "command": self.command_name,
+            "shape": self.shape,
+            "explained": self.plan is not None or self.error is not None
+        }
+        if self.plan is not None:
+            summary.update(self.plan)
+        if self.error is not None:
+            summary['error'] = self.error
+        return summary
+
+
+class QueryListener(monitoring.CommandListener):
+    def __init__(self, auditor):
+        self.auditor = auditor
+
+    def started(self, event):
+        if event.command_name in AUDITED_COMMANDS:
+            self.auditor.observe(event.database_name, event.command_name, event.command)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class QueryAuditor:
+    def __init__(self, mode=SAMPLE, sample_rate=0.01, max_ratio=10.0, min_examined=100):
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.max_ratio = max_ratio
+        self.min_examined = min_examined
+        # Database name -> database explains run on; the first one registered under a name wins
+        self.databases = {}
+        self.command_listener = QueryListener(self)
+        self._shapes = {}
+        self._routes = {}
+        self._untracked = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add_database(self, database):
+        self.databases.setdefault(database.name, database)
+
+    def observe(self, database_name, command_name, command):
+        if self.mode == SAMPLE and random.random() >= self.sample_rate:
+            return
+        collection = command.get(command_name)
+        if not isinstance(collection, str):
+            return
+        shape = command_shape(command_name, command)
+        key = (database_name, collection, command_name, json.dumps(shape, sort_keys=False, default=str))
+        route = request.endpoint if has_request_context() and request.endpoint else BACKGROUND
+
+        with self._lock:
+            tracked = self._shapes.get(key)
+            if tracked is None:
+                if len(self._shapes) >= MAX_SHAPES:
+                    self._untracked += 1
+                    return
+                tracked = self._shapes[key] = _Shape(database_name, collection, command_name, shape)
+                fields = {field: command[field] for field in AUDITED_COMMANDS[command_name] if field in command}
+                self._queue.put((tracked, dict({command_name: collection}, **fields)))
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._explain_loop, name='query-audit', daemon=True)
+                    self._thread.start()
+            counts = self._routes.setdefault(route, {})
+            counts[key] = counts.get(key, 0) + 1
+
+    def _explain_loop(self):
+        while True:
+            tracked, command = self._queue.get()
+            try:
+                database = self.databases.get(tracked.database)
+                if database is None:
+                    raise LookupError(f"no database named {tracked.database!r} to explain on")
+                result = database.command({"explain": command, "verbosity": "executionStats"})
+                tracked.plan = analyze(result, self.max_ratio, self.min_examined)
+            except Exception as e:
+                tracked.error = str(e)
+            finally:
+                self._queue.task_done()
+
+    def drain(self, timeout=30.0):
+        """Wait up to `timeout` for queued explains; True when none are left."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def report(self):
+        """Every route's query shapes with their plans, plus the flagged ones as findings."""
+        with self._lock:
+            routes = {route: dict(counts) for route, counts in self._routes.items()}
+            shapes = dict(self._shapes)
+            untracked = self._untracked
+        report_routes = {}
+        findings = []
+        for route in sorted(routes):
+            entries = []
+            for key, count in sorted(routes[route].items(), key=lambda item: -item[1]):
+                summary = dict(shapes[key].summary(), count=count)
+                entries.append(summary)
+                for issue in summary.get('issues', []):
+                    findings.append({
+                        "route": route, "collection": summary['collection'], "command": summary['command'],
+                        "issue": issue, "shape": summary['shape']
+                    })
+            report_routes[route] = {"queries": sum(routes[route].values()), "shapes": entries}
+        return {
+            "mode": self.mode,
+            "shapes": len(shapes),
+            "untracked": untracked,
+            "pending": self._queue.unfinished_tasks,
+            "routes": report_routes,
+            "findings": findings
+        }
+
+
+def finding_key(finding):
+    return f"{finding['route']} {finding['collection']} {finding['issue']}"
+
+
+def new_findings(report, baseline=None):
+    """Findings of `report` whose (route, collection, issue) is not in the `baseline` report."""
+    known = {finding_key(finding) for finding in (baseline or {}).get('findings', [])}
+    return [finding for finding in report['findings'] if finding_key(finding) not in known]
@@ -0,0 +1,245 @@
+"""Per-user token-bucket rate limiting and adaptive load shedding.
+
+Every request takes a token from the bucket for ``(identity, endpoint)``:
+the JWT identity for authenticated routes, the client IP for ``/api/auth/*``.
+Buckets live in process memory, or in a local SQLite file
+(``RATE_LIMIT_STORE=sqlite:///path``) so that limits hold across worker
+processes on the same host.
+
+Load shedding rejects requests with 503 before they queue up behind the
+MongoDB connection pool: when too many requests are already in flight, or
+when the recent pool checkout wait (measured by a ``ConnectionPoolListener``)
+is above a threshold.
+"""
+
+import math
+import sqlite3
+import threading
+import time
+
+from flask import request, jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from pymongo import monitoring
+
+# endpoint -> (tokens per second, burst), overriding the configured defaults
+ROUTE_LIMITS = {
+    'admin.seed_dataset': (0.1, 2),
+    'admin.backfill_fx': (0.1, 2),
+}
+
+# Never limited or shed, so orchestrators can always probe the process
+EXEMPT_PATH_PREFIXES = ('/api/health',)
+
+
+def _refill(tokens, updated, rate, burst, now):
+    if tokens is None:
+        return float(burst)
+    return min(float(burst), tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryBucketStore:
+    def __init__(self, max_keys=100000, idle_seconds=300):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds
+
+    def take(self, key, rate, burst, cost=1):
+        """Return (allowed, tokens left, seconds until `cost` tokens are available)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (None, now))
+            tokens = _refill(tokens, updated, rate, burst, now)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            if len(self._buckets) >= self.max_keys and key not in self._buckets:
+                # Idle buckets have long since refilled, so they carry no state worth keeping
+                self._buckets = {k: (t, u) for k, (t, u) in self._buckets.items() if now - u < self.idle_seconds}
+            self._buckets[key] = (tokens, now)
+        return allowed, tokens, 0.0 if allowed else (cost - tokens) / rate
+
+
+class SqliteBucketStore:
+    """Buckets in a SQLite file shared by every worker process on the host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst, cost=1):
+        conn = self._connect()
+        # Wall-clock time: monotonic clocks are not comparable across processes
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = _refill(row[0] if row else None, row[1] if row else now, rate, burst, now)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, tokens, 0.0 if allowed else (cost - tokens) / rate
+
+
+def create_bucket_store(url):
+    if not url or url == 'memory':
+        return MemoryBucketStore()
+    if url.startswith('sqlite:///'):
+        return SqliteBucketStore(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported RATE_LIMIT_STORE: {url}")
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Tracks how long requests wait to check a connection out of the pool.
+
+    The wait is timed per thread (checkout events fire on the requesting
+    thread) and folded into an average that decays with wall time, so a
+    burst of slow checkouts stops counting once the pool recovers.
+    """
+
+    def __init__(self, half_life=2.0):
+        self.half_life = half_life
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wait = 0.0
+        self._updated = time.monotonic()
+        self.checked_out = 0
+
+    def _record(self, wait):
+        now = time.monotonic()
+        with self._lock:
+            decayed = self._wait * 0.5 ** ((now - self._updated) / self.half_life)
+            self._wait = 0.8 * decayed + 0.2 * wait
+            self._updated = now
+
+    def wait_ms(self):
+        with self._lock:
+            return 1000 * self._wait * 0.5 ** ((time.monotonic() - self._updated) / self.half_life)
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.monotonic()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, 'started', None)
+        if started is not None:
+            self._record(time.monotonic() - started)
+            self._local.started = None
+        with self._lock:
+            self.checked_out += 1
+
+    def connection_check_out_failed(self, event):
+        started = getattr(self._local, 'started', None)
+        if started is not None:
+            self._record(time.monotonic() - started)
+            self._local.started = None
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+
+def _identity():
+    if request.path.startswith('/api/auth/'):
+        return f"ip:{request.remote_addr}"
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        # Bad tokens are rejected by the route itself; limit them by address
+        identity = None
+    return f"user:{identity}" if identity else f"ip:{request.remote_addr}"
+
+
+def _too_busy(message, error, retry_after, status):
+    response = jsonify({"message": message, "error": error, "retryAfter": retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def init_rate_limiting(app):
+    """Install the rate limiter and load shedder as request hooks on `app`."""
+    config = app.config
+    store = create_bucket_store(config['RATE_LIMIT_STORE']) if config['RATE_LIMIT_ENABLED'] else None
+    monitor = getattr(app, 'pool_monitor', None)
+    state = {"in_flight": 0}
+    lock = threading.Lock()
+
+    @app.before_request
+    def shed_and_limit():
+        if request.method == 'OPTIONS' or request.path.startswith(EXEMPT_PATH_PREFIXES):
+            return None
+
+        with lock:
+            state["in_flight"] += 1
+            in_flight = state["in_flight"]
+        request.counted_in_flight = True
+
+        max_in_flight = config['LOAD_SHED_MAX_IN_FLIGHT']
+        if max_in_flight and in_flight > max_in_flight:
+            return _too_busy("Server is busy, please retry shortly", "overloaded", 1, 503)
+        max_wait = config['LOAD_SHED_POOL_WAIT_MS']
+        if max_wait and monitor is not None and monitor.wait_ms() > max_wait:
+            return _too_busy("Database is saturated, please retry shortly", "overloaded", 1, 503)
+
+        if store is None:
+            return None
+        if request.path.startswith('/api/auth/'):
+            rate, burst = config['RATE_LIMIT_AUTH_RATE'], config['RATE_LIMIT_AUTH_BURST']
+        else:
+            rate, burst = config['RATE_LIMIT_RATE'], config['RATE_LIMIT_BURST']
+        rate, burst = ROUTE_LIMITS.get(request.endpoint, (rate, burst))
+        try:
+            allowed, _, wait = store.take(f"{_identity()}|{request.endpoint}", rate, burst)
+        except Exception as e:
+            # A broken shared store should not take the API down with it
+            print(f"⚠️ Rate limit store error: {str(e)}")
+            return None
+        if not allowed:
+            return _too_busy("Too many requests, slow down", "rate_limited", max(1, math.ceil(wait)), 429)
+        return None
+
+    @app.teardown_request
+    def release_in_flight(exc):
+        if getattr(request, 'counted_in_flight', False):
+            with lock:
+                state["in_flight"] -= 1
+
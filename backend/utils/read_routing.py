@@ -0,0 +1,261 @@
+"""Per-route read preferences with read-your-own-writes via causal sessions.
+
+With ``READ_ROUTING_ENABLED`` the heavy list and aggregation endpoints in
+``ROUTE_READ_PREFERENCES`` read from secondaries (bounded by
+``READ_MAX_STALENESS_SECONDS``); everything else keeps reading the primary.
+
+A request reads and writes through one causally consistent session per
+client, started on first use and kept on ``g`` (one per thread, as sessions
+are not thread-safe and the dashboard reads on a thread pool). After a write the response carries the session's operation time in
+the ``X-Causal-Token`` header (and a cookie of the same name); a later read
+that sends it back starts its sessions from that point, so a secondary only
+answers once it has replicated the caller's own writes.
+
+Requires a replica set; on the in-memory backend routing is skipped.
+"""
+
+import base64
+import threading
+
+import bson
+from bson.timestamp import Timestamp
+from flask import g, has_request_context, request
+from pymongo import MongoClient, read_preferences
+from pymongo.collection import Collection
+
+from utils.tenancy import each_partition, owner_database
+
+CAUSAL_TOKEN = 'X-Causal-Token'
+
+# endpoint -> read preference mode; extend or override with READ_PREFERENCE_ROUTES
+ROUTE_READ_PREFERENCES = {
+    'leads.get_leads': 'secondaryPreferred',
+    'projects.get_projects': 'secondaryPreferred',
+    'budget.get_all_budgets': 'secondaryPreferred',
+    'budget.get_budgets_by_project': 'secondaryPreferred',
+    'budget.get_budget_totals': 'secondaryPreferred',
+    'payments.get_payments': 'secondaryPreferred',
+    'payments.get_payment_totals': 'secondaryPreferred',
+    'payments.get_customers': 'secondaryPreferred',
+    'payments.get_customer_statement': 'secondaryPreferred',
+    'dashboard.get_dashboard': 'secondaryPreferred',
+    'leads.get_lead_history': 'secondaryPreferred',
+    'projects.get_project_history': 'secondaryPreferred',
+    'budget.get_budget_history': 'secondaryPreferred',
+    'payments.get_payment_history': 'secondaryPreferred',
+}
+
+_MODES = {
+    'primaryPreferred': read_preferences.PrimaryPreferred,
+    'secondary': read_preferences.Secondary,
+    'secondaryPreferred': read_preferences.SecondaryPreferred,
+    'nearest': read_preferences.Nearest,
+}
+
+# Collection methods that accept a session
+_SESSION_METHODS = frozenset([
+    'find', 'find_one', 'aggregate', 'count_documents', 'distinct',
+    'insert_one', 'insert_many', 'update_one', 'update_many', 'replace_one',
+    'delete_one', 'delete_many', 'find_one_and_update', 'find_one_and_delete',
+    'find_one_and_replace', 'bulk_write',
+])
+
+
+def parse_route_preferences(spec):
+    """``endpoint=mode;endpoint=mode`` merged over ROUTE_READ_PREFERENCES."""
+    routes = dict(ROUTE_READ_PREFERENCES)
+    for entry in filter(None, (part.strip() for part in (spec or '').split(';'))):
+        endpoint, _, mode = entry.partition('=')
+        mode = mode.strip()
+        if mode != 'primary' and mode not in _MODES:
+            raise ValueError(f"Unknown read preference '{mode}' for {endpoint}")
+        routes[endpoint.strip()] = mode
+    return routes
+
+
+def read_preference(mode, max_staleness):
+    if mode == 'primary':
+        return read_preferences.Primary()
+    return _MODES[mode](max_staleness=max_staleness)
+
+
+def encode_token(operation_times):
+    """{client key: Timestamp} -> opaque header value."""
+    return base64.urlsafe_b64encode(bson.encode(operation_times)).decode()
+
+
+def request_token():
+    """The causal token the caller sent back, from the header or else the cookie."""
+    return request.headers.get(CAUSAL_TOKEN) or request.cookies.get(CAUSAL_TOKEN)
+
+
+def decode_token(value):
+    try:
+        decoded = bson.decode(base64.urlsafe_b64decode(value.encode()))
+    except Exception:
+        return {}
+    return {key: ts for key, ts in decoded.items() if isinstance(ts, Timestamp)}
+
+
+class SessionCollection:
+    """A collection whose operations run in the request's causally consistent session."""
+
+    def __init__(self, collection, reads):
+        self._collection = collection
+        self._reads = reads
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name not in _SESSION_METHODS:
+            return attribute
+
+        def call(*args, **kwargs):
+            if 'session' not in kwargs:
+                kwargs['session'] = self._reads.session(self._collection.database.client)
+            return attribute(*args, **kwargs)
+        return call
+
+    def __getitem__(self, name):
+        return self._collection[name]
+
+
+class _RequestReads:
+    def __init__(self, preference, token, client_keys):
+        self.preference = preference
+        self.token = token
+        self.client_keys = client_keys
+        # (client id, thread id) -> session
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    def session(self, client):
+        """This request's session on `client` for the calling thread."""
+        slot = (id(client), threading.get_ident())
+        with self._lock:
+            session = self.sessions.get(slot)
+            if session is None:
+                session = client.start_session(causal_consistency=True)
+                key = self.client_keys.get(id(client))
+                if key in self.token:
+                    session.advance_operation_time(self.token[key])
+                # A worker thread also sees what the request has written so far
+                for (client_id, _), other in self.sessions.items():
+                    if client_id == id(client) and other.operation_time is not None:
+                        session.advance_operation_time(other.operation_time)
+                self.sessions[slot] = session
+            return session
+
+    def operation_times(self):
+        """(client key, operation time) of every session this request used."""
+        with self._lock:
+            return [(self.client_keys.get(client_id), session.operation_time)
+                    for (client_id, _), session in self.sessions.items()]
+
+    def end(self):
+        with self._lock:
+            sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            session.end_session()
+
+
+class ReadRoutingDatabase:
+    """Wraps ``app.db`` so collections pick up the request's read preference and session."""
+
+    def __init__(self, db, client_keys):
+        self.inner = db
+        self.client_keys = client_keys
+        self.name = db.name
+        self.client = db.client
+
+    @property
+    def partition_databases(self):
+        return each_partition(self.inner)
+
+    def database_for(self, user_id):
+        return owner_database(self.inner, user_id)
+
+    def get_collection(self, name, **kwargs):
+        collection = self.inner.get_collection(name, **kwargs)
+        reads = g.get('read_routing') if has_request_context() else None
+        if reads is None or not isinstance(collection, Collection):
+            return collection
+        if reads.preference is not None:
+            collection = collection.with_options(read_preference=reads.preference)
+        return SessionCollection(collection, reads)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.get_collection(name)
+
+    def __getitem__(self, name):
+        return self.get_collection(name)
+
+    def command(self, *args, **kwargs):
+        return self.inner.command(*args, **kwargs)
+
+    def list_collection_names(self, **kwargs):
+        return self.inner.list_collection_names(**kwargs)
+
+    def create_collection(self, name, **kwargs):
+        return self.inner.create_collection(name, **kwargs)
+
+    def with_options(self, **kwargs):
+        return self
+
+
+def init_read_routing(app):
+    """Wrap ``app.db`` and install the request hooks when READ_ROUTING_ENABLED is set."""
+    if not app.config['READ_ROUTING_ENABLED']:
+        return
+
+    router = getattr(app, 'tenant_router', None)
+    if router is not None:
+        named = [('control', router.control_db)] + list(router.partitions.items())
+    else:
+        named = [('default', app.db)]
+    if not all(isinstance(db.client, MongoClient) for _, db in named):
+        print("⚠️ Read routing needs MongoDB replica sets; skipping on the in-memory backend")
+        return
+    client_keys = {}
+    for key, db in named:
+        client_keys.setdefault(id(db.client), key)
+
+    routes = parse_route_preferences(app.config['READ_PREFERENCE_ROUTES'])
+    max_staleness = app.config['READ_MAX_STALENESS_SECONDS']
+    preferences = {endpoint: read_preference(mode, max_staleness) for endpoint, mode in routes.items()}
+    app.db = ReadRoutingDatabase(app.db, client_keys)
+    print(f"📖 Read routing enabled for {len(preferences)} routes (maxStalenessSeconds={max_staleness})")
+
+    @app.before_request
+    def start_read_routing():
+        if request.method == 'OPTIONS':
+            return None
+        token = request_token()
+        g.read_routing = _RequestReads(
+            preferences.get(request.endpoint) if request.method == 'GET' else None,
+            decode_token(token) if token else {},
+            client_keys
+        )
+        return None
+
+    @app.after_request
+    def issue_causal_token(response):
+        reads = g.get('read_routing')
+        if reads is None or request.method == 'GET':
+            return response
+        latest = dict(reads.token)
+        for key, operation_time in reads.operation_times():
+            if key is not None and operation_time is not None and (key not in latest or operation_time > latest[key]):
+                latest[key] = operation_time
+        if latest and latest != reads.token:
+            token = encode_token(latest)
+            response.headers[CAUSAL_TOKEN] = token
+            response.set_cookie(CAUSAL_TOKEN, token, httponly=True, samesite='Lax')
+        return response
+
+    @app.teardown_request
+    def end_read_sessions(exc):
+        reads = g.pop('read_routing', None)
+        if reads is not None:
+            reads.end()
@@ -0,0 +1,190 @@
+"""Access-token revocation by ``jti`` with an in-memory fast path.
+
+Logging out stores the token's ``jti`` in ``revoked_tokens`` until the token
+would have expired anyway (a TTL index on ``expiresAt`` removes it). Every
+authenticated request asks ``is_revoked``, so that check must not cost a
+database round trip:
+
+* a Bloom filter holds every revoked ``jti``; a token it does not contain,
+  which is almost every token, is accepted from memory;
+* an exact set holds the revocations of the last ``RECENT_SECONDS`` (this
+  worker's own ones from the moment they are made), answered from memory;
+* any other Bloom hit is confirmed with one lookup by ``_id`` and the answer
+  kept in a small cache, so a false positive costs one query per worker.
+
+Each worker loads the filter at start-up (the ``revocations`` start-up task)
+and a background thread then fetches revocations newer than its last fetch
+every ``refresh_interval`` seconds, so a logout on one worker reaches the
+others within that interval. Entries never leave a Bloom filter, so it is
+rebuilt from the unexpired revocations every ``rebuild_interval`` seconds, or
+sooner when it fills up. Until the first load, checks go to the database.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+# Revocations answered from the exact set before only the Bloom filter has them
+RECENT_SECONDS = 600
+
+# Incremental fetches look this far behind the last one, for clock skew between workers
+REFRESH_OVERLAP = timedelta(seconds=30)
+
+# Confirmed answers for Bloom hits kept per worker
+MAX_ANSWERS = 1024
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(1, capacity)
+        self.bits = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / self.capacity * math.log(2)))
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: k positions from two independent 64-bit halves
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.bits for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    def __init__(self, db, capacity=100000, error_rate=0.001, refresh_interval=2.0, rebuild_interval=3600):
+        self.db = db
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._loaded = False
+        self._since = None
+        self._rebuild_at = None
+        # jti -> monotonic time it was seen
+        self._recent = {}
+        self._answers = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {"checks": 0, "bloomMisses": 0, "recentHits": 0, "lookups": 0, "falsePositives": 0}
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='revocation-refresh', daemon=True)
+            self._thread.start()
+        return self
+
+    def _count(self, key):
+        with self._lock:
+            self._counts[key] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._counts, loaded=self._loaded, revoked=self._bloom.count, capacity=self._bloom.capacity,
+                recent=len(self._recent)
+            )
+
+    def _seen(self, jtis, now):
+        """Record fetched or local revocations in the filter and the exact set."""
+        for jti in jtis:
+            if jti not in self._recent:
+                self._bloom.add(jti)
+            self._recent[jti] = now
+            # An earlier "not revoked" answer for it is stale now
+            self._answers.pop(jti, None)
+
+    def revoke(self, jti, user_id, expires_at):
+        """Revoke a token until `expires_at`, the token's own expiry."""
+        try:
+            self.db.revoked_tokens.insert_one({
+                "_id": jti, "userId": user_id, "revokedAt": datetime.utcnow(), "expiresAt": expires_at
+            })
+        except DuplicateKeyError:
+            pass
+        with self._lock:
+            self._seen([jti], time.monotonic())
+
+    def is_revoked(self, jti):
+        self._count('checks')
+        if jti in self._recent:
+            self._count('recentHits')
+            return True
+        if not self._loaded:
+            return self._lookup(jti)
+        if jti not in self._bloom:
+            self._count('bloomMisses')
+            return False
+        with self._lock:
+            answer = self._answers.get(jti)
+        if answer is not None:
+            return answer
+        revoked = self._lookup(jti)
+        if not revoked:
+            self._count('falsePositives')
+        with self._lock:
+            self._answers[jti] = revoked
+            while len(self._answers) > MAX_ANSWERS:
+                self._answers.popitem(last=False)
+        return revoked
+
+    def _lookup(self, jti):
+        self._count('lookups')
+        return self.db.revoked_tokens.find_one({"_id": jti}, {"_id": 1}) is not None
+
+    def load(self):
+        """(Re)build the filter from every unexpired revocation."""
+        started = datetime.utcnow()
+        jtis = [doc['_id'] for doc in self.db.revoked_tokens.find({"expiresAt": {"$gt": started}}, {"_id": 1})]
+        bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+        with self._lock:
+            # Revocations seen while the query ran are not in its result
+            for jti in self._recent:
+                if jti not in bloom:
+                    bloom.add(jti)
+            self._bloom = bloom
+            self._since = started
+            self._rebuild_at = time.monotonic() + self.rebuild_interval
+            self._loaded = True
+
+    def refresh(self):
+        """Fetch the revocations made since the last fetch, by any worker."""
+        if time.monotonic() >= self._rebuild_at or self._bloom.count > self._bloom.capacity:
+            self.load()
+            return
+        started = datetime.utcnow()
+        jtis = [
+            doc['_id']
+            for doc in self.db.revoked_tokens.find({"revokedAt": {"$gte": self._since - REFRESH_OVERLAP}}, {"_id": 1})
+        ]
+        now = time.monotonic()
+        with self._lock:
+            self._seen(jtis, now)
+            self._since = started
+            cutoff = now - RECENT_SECONDS
+            for jti in [jti for jti, seen in self._recent.items() if seen < cutoff]:
+                del self._recent[jti]
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            if not self._loaded:
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Failed to refresh revoked tokens: {e}")
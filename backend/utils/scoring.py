@@ -0,0 +1,134 @@
+"""Lead scoring: likelihood to convert, 0-100, computed in NumPy batches.
+
+A score is a logistic function of a weighted sum of the lead's source,
+status, designation seniority, age and follow-up timing. Scores are stored
+on the lead (``score``, ``scoredAt``) so the list can sort on an index.
+``create_lead`` and ``update_lead`` score the one lead they write; the
+``lead_rescore`` job rescores everything a user owns (ages keep moving) in
+batches, where each feature is computed for the whole batch at once.
+"""
+
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+SOURCE_WEIGHTS = {'Referral': 1.2, 'Event': 0.6, 'LinkedIn': 0.4, 'Website': 0.3, 'Cold Call': -0.4}
+STATUS_WEIGHTS = {'New': 0.0, 'Contacted': 0.5, 'Qualified': 1.5, 'Converted': 4.0, 'Lost': -4.0}
+
+# Substrings of a lowercased designation -> weight; the largest match counts
+SENIORITY_WEIGHTS = [
+    ('founder', 1.0), ('ceo', 1.0), ('cto', 1.0), ('director', 0.9), ('head', 0.8),
+    ('vp', 0.8), ('president', 0.8), ('manager', 0.5), ('lead', 0.3)
+]
+
+BIAS = -0.5
+# Per day since the lead was created, capped at AGE_CAP_DAYS
+AGE_WEIGHT = -0.01
+AGE_CAP_DAYS = 180
+# Follow-up due within this many days
+FOLLOW_UP_SOON_DAYS = 7
+FOLLOW_UP_SOON_WEIGHT = 0.5
+FOLLOW_UP_NONE_WEIGHT = -0.2
+# Scaled by how overdue the follow-up is, up to OVERDUE_CAP_DAYS
+OVERDUE_WEIGHT = -0.6
+OVERDUE_CAP_DAYS = 30
+
+SCORE_FIELDS = ('source', 'status', 'designation', 'createdAt', 'nextFollowUp')
+SCORE_PROJECTION = {field: 1 for field in SCORE_FIELDS}
+
+
+def _factorize(np, values, key=lambda value: value):
+    """(codes, distinct values): one dict lookup per row, so per-value work runs once per distinct value."""
+    index = {}
+    codes = np.fromiter((index.setdefault(key(value), len(index)) for value in values), dtype=np.intp, count=len(values))
+    return codes, list(index)
+
+
+def _weights(np, values, weigh):
+    codes, distinct = _factorize(np, values, lambda value: str(value or ''))
+    return np.array([weigh(value) for value in distinct], dtype=np.float64)[codes]
+
+
+def _seniority(designation):
+    designation = designation.lower()
+    return max((weight for keyword, weight in SENIORITY_WEIGHTS if keyword in designation), default=0.0)
+
+
+def _ordinal(value):
+    """Day number of a datetime or ISO date string; -1 when missing or unparseable."""
+    if isinstance(value, datetime):
+        return value.toordinal()
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').toordinal()
+    except ValueError:
+        return -1
+
+
+def _days(np, values):
+    # Dates repeat a lot (follow-ups especially), so parse each distinct value once
+    codes, distinct = _factorize(np, values)
+    return np.array([_ordinal(value) if value else -1 for value in distinct], dtype=np.int64)[codes]
+
+
+def score_leads(leads, now=None):
+    """Scores (0-100, 2 decimals) for a sequence of lead documents, as a NumPy array."""
+    # Imported on first use to keep NumPy off the start-up path
+    import numpy as np
+
+    leads = leads if isinstance(leads, list) else list(leads)
+    if not leads:
+        return np.zeros(0)
+    today = (now or datetime.utcnow()).toordinal()
+
+    z = np.full(len(leads), BIAS)
+    z += _weights(np, [lead.get('source') for lead in leads], lambda value: SOURCE_WEIGHTS.get(value, 0.0))
+    z += _weights(np, [lead.get('status') for lead in leads], lambda value: STATUS_WEIGHTS.get(value, 0.0))
+    z += _weights(np, [lead.get('designation') for lead in leads], _seniority)
+
+    created = np.fromiter(
+        (created.toordinal() if isinstance(created, datetime) else -1 for created in (lead.get('createdAt') for lead in leads)),
+        dtype=np.int64, count=len(leads)
+    )
+    age = np.where(created < 0, 0, today - created)
+    z += AGE_WEIGHT * np.clip(age, 0, AGE_CAP_DAYS)
+
+    follow_up = _days(np, [lead.get('nextFollowUp') for lead in leads])
+    missing = follow_up < 0
+    until = follow_up - today
+    z += np.where(missing, FOLLOW_UP_NONE_WEIGHT, 0.0)
+    z += np.where(~missing & (until >= -1) & (until <= FOLLOW_UP_SOON_DAYS), FOLLOW_UP_SOON_WEIGHT, 0.0)
+    z += np.where(~missing & (until < -1), OVERDUE_WEIGHT * np.clip(-until, 0, OVERDUE_CAP_DAYS) / OVERDUE_CAP_DAYS, 0.0)
+
+    return np.round(100.0 / (1.0 + np.exp(-z)), 2)
+
+
+def score_lead(lead, now=None):
+    return float(score_leads([lead], now)[0])
+
+
+def rescore_leads(collection, user_id, batch_size=50000, progress=None):
+    """Recompute ``score`` for every lead of `user_id`; returns (scored, changed)."""
+    total = collection.count_documents({"createdBy": user_id})
+    scored = changed = 0
+    last_id = None
+    while True:
+        query = {"createdBy": user_id}
+        if last_id is not None:
+            query['_id'] = {"$gt": last_id}
+        batch = list(collection.find(query, dict(SCORE_PROJECTION, score=1)).sort("_id", 1).limit(batch_size))
+        if not batch:
+            return scored, changed
+        now = datetime.utcnow()
+        scores = score_leads(batch, now)
+        # Only write scores that moved: a same-day rescore touches almost nothing
+        updates = [
+            UpdateOne({"_id": lead['_id']}, {"$set": {"score": float(score), "scoredAt": now}})
+            for lead, score in zip(batch, scores.tolist()) if lead.get('score') != score
+        ]
+        if updates:
+            collection.bulk_write(updates, ordered=False)
+        scored += len(batch)
+        changed += len(updates)
+        last_id = batch[-1]['_id']
+        if progress:
+            progress(scored, max(total, scored))
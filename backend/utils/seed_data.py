@@ -0,0 +1,311 @@
+"""Deterministic synthetic data generator for users, leads, projects, budgets and payments.
+
+Usage (from the backend directory):
+
+    python -m utils.seed_data --users 50 --leads 1000000 --projects 20000 --budgets 40000 --payments 500000
+
+Records are generated in batches and written with ``insert_many``; the same
+``--seed`` always produces the same dataset (apart from ObjectId values).
+Budgets and payments carry their ``base`` amounts, and every batch of
+payments is added to its owners' customer ledgers, as the API would do.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from utils.dedupe import blocking_keys
+from utils.scoring import score_leads
+from utils.fx import FxRateTable
+from utils.ledger import customer_key, record_payments
+
+FIRST_NAMES = [
+    'Aarav', 'Vivaan', 'Aditya', 'Vihaan', 'Arjun', 'Sai', 'Reyansh', 'Krishna', 'Ishaan', 'Rohan',
+    'Ananya', 'Diya', 'Priya', 'Isha', 'Kavya', 'Meera', 'Nisha', 'Pooja', 'Riya', 'Sneha',
+    'Rajesh', 'Suresh', 'Anil', 'Vikram', 'Deepak', 'Lakshmi', 'Sunita', 'Neha', 'Amit', 'Rahul'
+]
+LAST_NAMES = [
+    'Kumar', 'Sharma', 'Patel', 'Reddy', 'Iyer', 'Nair', 'Gupta', 'Singh', 'Rao', 'Mehta',
+    'Joshi', 'Menon', 'Das', 'Chopra', 'Banerjee', 'Pillai', 'Verma', 'Shah', 'Kapoor', 'Bose'
+]
+COMPANY_PREFIXES = [
+    'ABC', 'XYZ', 'Apex', 'Zenith', 'Nimbus', 'Vertex', 'Quantum', 'Orbit', 'Lotus', 'Indigo',
+    'Sapphire', 'Summit', 'Pioneer', 'Horizon', 'Crest', 'Nova', 'Vista', 'Bright', 'Prime', 'Astra'
+]
+COMPANY_SUFFIXES = ['Corporation', 'Technologies', 'Solutions', 'Industries', 'Systems', 'Labs', 'Enterprises']
+DESIGNATIONS = ['CEO', 'CTO', 'Project Manager', 'Engineering Manager', 'Director', 'Procurement Head', 'Founder']
+CITIES = [
+    ('Bangalore', 'Karnataka', '560001'), ('Mumbai', 'Maharashtra', '400001'), ('Chennai', 'Tamil Nadu', '600001'),
+    ('Hyderabad', 'Telangana', '500001'), ('Pune', 'Maharashtra', '411001'), ('Delhi', 'Delhi', '110001')
+]
+STREETS = ['MG Road', 'Park Street', 'Brigade Road', 'Anna Salai', 'Linking Road', 'Banjara Hills']
+ASSIGNEES = ['Sales Team A', 'Sales Team B', 'Enterprise Sales', 'Not Assigned']
+PROJECT_KINDS = ['CRM Rollout', 'Mobile App', 'Data Platform', 'Website Revamp', 'AI Integration', 'ERP Migration']
+
+# (value, weight) pairs
+LEAD_STATUSES = [('New', 35), ('Contacted', 25), ('Qualified', 15), ('Converted', 10), ('Lost', 15)]
+LEAD_SOURCES = [('Website', 35), ('Referral', 25), ('Event', 15), ('LinkedIn', 15), ('Cold Call', 10)]
+PROJECT_PRIORITIES = [('Low', 25), ('Medium', 50), ('High', 25)]
+PROJECT_STATUSES = [('Active', 60), ('Completed', 30), ('On Hold', 10)]
+PAYMENT_STATUSES = [('Completed', 75), ('Pending', 20), ('Failed', 5)]
+
+SEED_PASSWORD = 'password123'
+
+
+def _weighted(rng, choices):
+    values = [value for value, _ in choices]
+    weights = [weight for _, weight in choices]
+    return lambda: rng.choices(values, weights)[0]
+
+
+def _day(moment):
+    # Date fields are stored as midnight UTC
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _batched(factory, count, batch_size):
+    for start in range(0, count, batch_size):
+        yield [factory(i) for i in range(start, min(start + batch_size, count))]
+
+
+class DatasetGenerator:
+    def __init__(self, fx, seed=42, now=None, days=365):
+        self.fx = fx
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.now = now or datetime.utcnow()
+        self.days = days
+        self.lead_status = _weighted(self.rng, LEAD_STATUSES)
+        self.lead_source = _weighted(self.rng, LEAD_SOURCES)
+        self.project_priority = _weighted(self.rng, PROJECT_PRIORITIES)
+        self.project_status = _weighted(self.rng, PROJECT_STATUSES)
+        self.payment_status = _weighted(self.rng, PAYMENT_STATUSES)
+        # owner id -> [(project id, project name)], filled as projects are generated
+        self.projects_by_owner = {}
+
+    def _past(self, max_days=None):
+        seconds = self.rng.randint(0, (max_days or self.days) * 86400)
+        return self.now - timedelta(seconds=seconds)
+
+    def _person(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def _company(self):
+        return f"{self.rng.choice(COMPANY_PREFIXES)} {self.rng.choice(COMPANY_SUFFIXES)}"
+
+    def user(self, i, password_hash):
+        first, last = self._person()
+        created = self._past()
+        return {
+            "_id": ObjectId(),
+            "fullName": f"{first} {last}",
+            # Unique per (seed, i): reseeding with the same seed needs --drop
+            "email": f"{first.lower()}.{last.lower()}.{self.seed}.{i}@seed.thrive.test",
+            "password": password_hash,
+            "role": 'user',
+            "createdAt": created,
+            "updatedAt": created,
+            "isActive": True
+        }
+
+    def lead(self, i, owner):
+        first, last = self._person()
+        company = self._company()
+        city, state, pin = self.rng.choice(CITIES)
+        created = self._past()
+        status = self.lead_status()
+        follow_up = None
+        if status not in ('Converted', 'Lost'):
+            follow_up = _day(self.now + timedelta(days=self.rng.randint(-7, 30)))
+        lead = {
+            "name": f"{first} {last}",
+            "email": f"{first.lower()}.{last.lower()}{i}@{company.split()[0].lower()}.example.com",
+            "mobile": f"+91 {self.rng.randint(6000000000, 9999999999)}",
+            "address": f"{self.rng.randint(1, 999)} {self.rng.choice(STREETS)}, {city}, {state} {pin}",
+            "company": company,
+            "designation": self.rng.choice(DESIGNATIONS),
+            "source": self.lead_source(),
+            "notes": f"Interested in {self.rng.choice(PROJECT_KINDS).lower()} services.",
+            "status": status,
+            "nextFollowUp": follow_up,
+            "assignedTo": self.rng.choice(ASSIGNEES),
+            "createdBy": owner,
+            "fileName": None,
+            "createdAt": created,
+            "updatedAt": created + timedelta(days=self.rng.randint(0, 14))
+        }
+        lead['dedupeKeys'] = blocking_keys(lead)
+        return lead
+
+    def project(self, i, owner):
+        created = self._past()
+        project_id = ObjectId()
+        name = f"{self._company()} {self.rng.choice(PROJECT_KINDS)}"
+        self.projects_by_owner.setdefault(owner, []).append((str(project_id), name))
+        return {
+            "_id": project_id,
+            "projectName": name,
+            "details": f"Engagement #{i} for {name}.",
+            "deadline": _day(created + timedelta(days=self.rng.randint(30, 270))),
+            "priority": self.project_priority(),
+            "projectFile": None,
+            "status": self.project_status(),
+            "createdBy": owner,
+            "createdAt": created,
+            "updatedAt": created
+        }
+
+    def budget(self, i, owner):
+        projects = self.projects_by_owner.get(owner)
+        project_id, project_name = self.rng.choice(projects) if projects else (None, None)
+        total = float(self.rng.randrange(100000, 5000000, 1000))
+        # Split at most 90% of the total across the cost heads
+        shares = [self.rng.random() for _ in range(6)]
+        scale = self.rng.uniform(0.4, 0.9) * total / sum(shares)
+        costs = [round(share * scale, 2) for share in shares]
+        created = self._past()
+        budget = {
+            "budgetName": f"{project_name or 'General'} budget {i}",
+            "projectId": project_id,
+            "projectName": project_name,
+            "totalBudget": total,
+            "developmentCost": costs[0],
+            "designCost": costs[1],
+            "testingCost": costs[2],
+            "deploymentCost": costs[3],
+            "maintenanceCost": costs[4],
+            "thirdPartyCost": costs[5],
+            "currency": self.fx.base_currency,
+            "notes": '',
+            "createdBy": owner,
+            "createdAt": created,
+            "updatedAt": created
+        }
+        budget['base'] = self.fx.budget_base(budget)
+        return budget
+
+    def payment(self, i, owner):
+        created = self._past()
+        customer = self._company()
+        payment = {
+            "customer": customer,
+            "customerKey": customer_key(customer),
+            "date": _day(created),
+            "amount": float(self.rng.randrange(1000, 500000, 100)),
+            "status": self.payment_status(),
+            "createdBy": owner,
+            "createdAt": created,
+            "updatedAt": created
+        }
+        payment['base'] = self.fx.payment_base(payment)
+        return payment
+
+
+def generate_dataset(db, users=10, leads=1000, projects=100, budgets=200, payments=1000,
+                     seed=42, batch_size=5000, owners=None, password_hash=None, progress=None, fx=None):
+    """Insert a consistent synthetic dataset and return the number of documents per collection.
+
+    Documents are spread round-robin over `owners` (user id strings) plus the
+    `users` newly generated accounts. Budgets only reference projects of the
+    same owner, so projects are always generated first. `fx` (default: a
+    table in INR over `db`) gives budgets and payments their base amounts.
+    """
+    generator = DatasetGenerator(fx or FxRateTable(db), seed)
+    owners = list(owners or [])
+    counts = {}
+
+    def write(collection, batches, total, after_batch=None):
+        written = 0
+        for batch in batches:
+            db[collection].insert_many(batch, ordered=False)
+            if after_batch:
+                after_batch(batch)
+            written += len(batch)
+            if progress:
+                progress(collection, written, total)
+        counts[collection] = written
+
+    if users:
+        if password_hash is None:
+            from auth import hash_password
+            password_hash = hash_password(SEED_PASSWORD)
+        created = []
+
+        def user(i):
+            doc = generator.user(i, password_hash)
+            created.append(str(doc['_id']))
+            return doc
+
+        write('users', _batched(user, users, batch_size), users)
+        owners.extend(created)
+
+    if not owners:
+        raise ValueError("At least one owner or generated user is required")
+
+    def owned(factory):
+        return lambda i: factory(i, owners[i % len(owners)])
+
+    write('projects', _batched(owned(generator.project), projects, batch_size), projects)
+    write('budgets', _batched(owned(generator.budget), budgets, batch_size), budgets)
+    def scored(batches):
+        for batch in batches:
+            for lead, score in zip(batch, score_leads(batch, generator.now)):
+                lead['score'] = float(score)
+                lead['scoredAt'] = generator.now
+            yield batch
+
+    write('leads', scored(_batched(owned(generator.lead), leads, batch_size)), leads)
+    ledger_entries = []
+    write('payments', _batched(owned(generator.payment), payments, batch_size), payments,
+          lambda batch: ledger_entries.append(record_payments(db, batch)))
+    counts['customer_ledger'] = sum(ledger_entries)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed MongoDB with a synthetic dataset")
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/thrive_solutions'))
+    parser.add_argument('--db', default=os.getenv('MONGO_DB_NAME', 'thrive_solutions'))
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--leads', type=int, default=1000)
+    parser.add_argument('--projects', type=int, default=100)
+    parser.add_argument('--budgets', type=int, default=200)
+    parser.add_argument('--payments', type=int, default=1000)
+    parser.add_argument('--owner', action='append', default=[], help='existing user id to own data (repeatable)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--drop', action='store_true', help='empty the collections first')
+    args = parser.parse_args(argv)
+
+    from pymongo import MongoClient
+    db = MongoClient(args.mongo_uri)[args.db]
+    if args.drop:
+        for name in ('users', 'leads', 'projects', 'budgets', 'payments', 'customer_ledger'):
+            db[name].delete_many({})
+            print(f"🗑️  Emptied {name}")
+
+    started = time.perf_counter()
+
+    def progress(collection, written, total):
+        if written == total or written % (args.batch_size * 20) == 0:
+            print(f"📝 {collection}: {written}/{total}")
+
+    counts = generate_dataset(
+        db, users=args.users, leads=args.leads, projects=args.projects, budgets=args.budgets,
+        payments=args.payments, seed=args.seed, batch_size=args.batch_size, owners=args.owner,
+        progress=progress, fx=FxRateTable(db, os.getenv('BASE_CURRENCY', 'INR').upper())
+    )
+    elapsed = time.perf_counter() - started
+    print(f"✅ Seeded {sum(counts.values())} documents in {elapsed:.1f}s: {counts}")
+    if args.users:
+        print(f"🔑 Generated users log in with password '{SEED_PASSWORD}'")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
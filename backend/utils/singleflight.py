@@ -0,0 +1,139 @@
+"""Singleflight for identical concurrent GETs.
+
+Duplicate tabs and frontend retries send the same list request several times
+at once. Views decorated with ``coalesced`` share one execution per key:
+the first request (the leader) runs the view, and requests that arrive with
+the same key while it runs wait for it and get the same status, headers and
+body bytes. Nothing is cached: once the leader finishes, the next request
+runs the view again.
+
+The key is (user, endpoint, sorted query parameters, causal token, data
+version), where the causal token is the one read routing resolves (header or
+cookie). The data version is a per-user counter that every successful
+POST/PUT/DELETE in this process bumps, so a read that starts after a write
+has been answered never joins a flight that started before it. Users are
+hashed onto ``VERSION_SLOTS`` counters to keep memory bounded; a collision
+only means fewer reads are shared.
+"""
+
+import threading
+from functools import wraps
+
+from flask import Response, request, make_response
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+from utils.read_routing import request_token
+
+VERSION_SLOTS = 1024
+
+WRITE_METHODS = frozenset(['POST', 'PUT', 'PATCH', 'DELETE'])
+
+# Header on responses that were shared from another request's execution
+COALESCED_HEADER = 'X-Coalesced'
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, max_wait=30.0):
+        self.max_wait = max_wait
+        self._flights = {}
+        self._versions = [0] * VERSION_SLOTS
+        self._lock = threading.Lock()
+        self._counts = {"executed": 0, "coalesced": 0, "timedOut": 0}
+
+    def version(self, user_id):
+        return self._versions[hash(user_id) % VERSION_SLOTS]
+
+    def bump(self, user_id):
+        with self._lock:
+            self._versions[hash(user_id) % VERSION_SLOTS] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, inFlight=len(self._flights))
+
+    def do(self, key, fn):
+        """(fn's result, whether it was shared from another caller's call)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._counts['executed'] += 1
+        if not leader:
+            if flight.done.wait(self.max_wait):
+                with self._lock:
+                    self._counts['coalesced'] += 1
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result, True
+            # The leader is stuck; do not queue up behind it
+            with self._lock:
+                self._counts['timedOut'] += 1
+            return fn(), False
+
+        try:
+            flight.result = fn()
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+
+def _request_identity():
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+
+def coalesced(fn):
+    """Share one execution of a GET view between identical concurrent requests; apply below jwt_required."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        flights = getattr(request.current_app, 'singleflight', None)
+        if flights is None or request.method != 'GET':
+            return fn(*args, **kwargs)
+
+        user_id = get_jwt_identity()
+        key = (
+            user_id,
+            request.endpoint,
+            tuple(sorted(kwargs.items())),
+            tuple(sorted(request.args.items(multi=True))),
+            request_token(),
+            flights.version(user_id)
+        )
+
+        def execute():
+            response = make_response(fn(*args, **kwargs))
+            return response.status_code, list(response.headers), response.get_data()
+
+        (status, headers, body), shared = flights.do(key, execute)
+        response = Response(body, status=status, headers=headers)
+        if shared:
+            response.headers[COALESCED_HEADER] = 'true'
+        return response
+    return wrapper
+
+
+def init_singleflight(app):
+    app.singleflight = SingleFlight()
+
+    @app.after_request
+    def bump_data_version(response):
+        # Later reads by this user must not join flights that started before the write
+        if request.method in WRITE_METHODS and response.status_code < 400:
+            app.singleflight.bump(_request_identity())
+        return response
@@ -0,0 +1,139 @@
+"""Start-up work that runs after ``create_app`` returns, and cached health probes.
+
+Index builds, validator pushes and job recovery are registered as tasks and
+run on a background thread, so a new process starts serving within
+milliseconds. A task is retried with backoff for as long as MongoDB does not
+answer pings. Once it does, a task gets ``max_attempts`` attempts; a task that
+still fails (a unique index over duplicate rows, say) is marked failed and the
+tasks after it run anyway. A second loop pings the database every
+``HEALTH_PROBE_INTERVAL`` seconds; the health endpoints only read those
+cached results and never touch the database themselves.
+
+Liveness means the process is up. Readiness means every start-up task has
+finished and the last ping succeeded; with a failed task the status is
+``degraded`` and the task's error is listed.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+
+class StartupTasks:
+    def __init__(self, db, probe_interval=10, retry_delay=0.5, max_retry_delay=30, max_attempts=5):
+        self.db = db
+        self.probe_interval = probe_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self.started_at = time.monotonic()
+        self._tasks = []
+        self._done = {}
+        self._failed = set()
+        self._errors = {}
+        self._probe = {"ok": False, "checkedAt": None, "latencyMs": None, "error": "not checked yet"}
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, name, fn):
+        """Register `fn` to run once at start-up; tasks run in the order they were added."""
+        self._tasks.append((name, fn))
+
+    def start(self, background=True):
+        """Run the tasks (inline when `background` is false) and keep probing the database."""
+        if background:
+            self._thread = threading.Thread(target=self._run, name='startup-tasks', daemon=True)
+            self._thread.start()
+            return
+        self._run_tasks()
+        self._check()
+        self._thread = threading.Thread(target=self._probe_loop, name='health-probe', daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """Block until the tasks have finished; returns whether they did within `timeout`."""
+        return self._ready.wait(timeout)
+
+    def _run(self):
+        self._run_tasks()
+        self._check()
+        self._probe_loop()
+
+    def _run_tasks(self):
+        for name, fn in self._tasks:
+            self._run_task(name, fn)
+        self._ready.set()
+        print(f"✅ Start-up tasks finished in {time.monotonic() - self.started_at:.3f}s")
+
+    def _run_task(self, name, fn):
+        delay = self.retry_delay
+        attempts = 0
+        while True:
+            started = time.monotonic()
+            try:
+                fn()
+            except Exception as e:
+                # Only failures against a reachable database count: an unreachable one is waited out
+                if self._check():
+                    attempts += 1
+                gave_up = attempts >= self.max_attempts
+                with self._lock:
+                    self._errors[name] = str(e)
+                    if gave_up:
+                        self._failed.add(name)
+                if gave_up:
+                    print(f"❌ Start-up task {name} failed {attempts} times, continuing without it: {e}")
+                    return
+                print(f"⚠️ Start-up task {name} failed, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+            with self._lock:
+                self._done[name] = round((time.monotonic() - started) * 1000, 3)
+                self._errors.pop(name, None)
+            return
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.probe_interval)
+            self._check()
+
+    def _check(self):
+        started = time.monotonic()
+        try:
+            self.db.command('ping')
+            probe = {"ok": True, "error": None}
+        except Exception as e:
+            probe = {"ok": False, "error": str(e)}
+        probe['latencyMs'] = round((time.monotonic() - started) * 1000, 3)
+        probe['checkedAt'] = datetime.utcnow().isoformat()
+        with self._lock:
+            self._probe = probe
+        return probe['ok']
+
+    def live(self):
+        return {"status": "alive", "uptimeSeconds": round(time.monotonic() - self.started_at, 3)}
+
+    def ready(self):
+        """Return (ready, details) from the cached task and probe state."""
+        with self._lock:
+            probe = dict(self._probe)
+            tasks = {
+                name: (
+                    "done" if name in self._done else "failed" if name in self._failed
+                    else "retrying" if name in self._errors else "pending"
+                )
+                for name, _ in self._tasks
+            }
+            errors = dict(self._errors)
+            failed = bool(self._failed)
+        ready = self._ready.is_set() and probe['ok']
+        if ready:
+            status = "degraded" if failed else "ready"
+        else:
+            status = "unavailable" if self._ready.is_set() else "starting"
+        details = {"status": status, "database": probe, "tasks": tasks}
+        if errors:
+            details['errors'] = errors
+        return ready, details
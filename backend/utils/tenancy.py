@@ -0,0 +1,441 @@
+"""Horizontal partitioning of tenant data across several MongoDB databases/clusters.
+
+Enabled by ``TENANT_PARTITIONS``, a ``;``-separated list of ``name=uri``
+entries, e.g.::
+
+    TENANT_PARTITIONS="p0=mongodb://db0:27017/thrive_p0;p1=mongodb://db1:27017/thrive_p1"
+
+(``memory://<db name>`` partitions use the in-memory engine). A user's leads,
+projects, budgets and payments live in exactly one partition, chosen by the
+``tenant_directory`` collection when it has an entry for the user and by a
+consistent hash ring otherwise. Everything else (users, jobs, FX rates, the
+directory itself) stays in the control database from ``MONGO_URI``.
+
+``app.db`` becomes a ``TenantDatabase``: inside a request, a tenant
+collection resolves to the caller's partition. Outside a request (jobs, CLI,
+startup) it resolves to a ``RoutedCollection`` that routes on the
+``createdBy`` value in the filter or document, or fans out to every
+partition for index creation, counts and bulk deletes.
+"""
+
+import bisect
+import hashlib
+import threading
+import time
+from datetime import datetime
+
+from flask import has_request_context, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from pymongo import MongoClient, ReplaceOne, uri_parser
+from pymongo.results import InsertManyResult
+
+from utils.jobs import JOB_TYPES, RUNNING, job_handler
+from utils.memory_db import MemoryClient
+
+TENANT_COLLECTIONS = frozenset([
+    'leads', 'projects', 'budgets', 'payments', 'customer_ledger', 'leads_archive', 'payments_archive'
+])
+
+# Blueprints that read or write tenant collections, and so are held during a migration
+TENANT_BLUEPRINTS = frozenset(['leads', 'projects', 'budget', 'payments', 'dashboard'])
+
+ACTIVE = 'active'
+COPYING = 'copying'
+FROZEN = 'frozen'
+
+
+class TenantRoutingError(RuntimeError):
+    pass
+
+
+def parse_partitions(spec, default_db_name):
+    """Parse ``name=uri;name=uri`` into [(name, uri, database name)]."""
+    partitions = []
+    for entry in filter(None, (part.strip() for part in spec.split(';'))):
+        name, sep, uri = entry.partition('=')
+        if not sep or not name.strip() or not uri.strip():
+            raise ValueError(f"Invalid TENANT_PARTITIONS entry: {entry}")
+        uri = uri.strip()
+        if uri.startswith('memory://'):
+            db_name = uri[len('memory://'):] or default_db_name
+        else:
+            db_name = uri_parser.parse_uri(uri).get('database') or default_db_name
+        partitions.append((name.strip(), uri, db_name))
+    if len({name for name, _, _ in partitions}) != len(partitions):
+        raise ValueError("TENANT_PARTITIONS names must be unique")
+    return partitions
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    def __init__(self, names, vnodes=64):
+        points = sorted((_hash(f"{name}#{i}"), name) for name in names for i in range(vnodes))
+        self._keys = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    def lookup(self, key):
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._names[index]
+
+
+class TenantRouter:
+    def __init__(self, control_db, partitions, directory_ttl=5.0, vnodes=64):
+        self.control_db = control_db
+        self.partitions = partitions
+        self.ring = HashRing(list(partitions), vnodes)
+        self.directory_ttl = directory_ttl
+        self._directory = {}
+        self._lock = threading.Lock()
+
+    def entry(self, user_id):
+        """Directory entry for `user_id` (cached for `directory_ttl` seconds), or None."""
+        now = time.monotonic()
+        cached = self._directory.get(user_id)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        entry = self.control_db.tenant_directory.find_one({"_id": user_id})
+        with self._lock:
+            self._directory[user_id] = (entry, now + self.directory_ttl)
+        return entry
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._directory.pop(user_id, None)
+
+    def partition_for(self, user_id):
+        entry = self.entry(user_id)
+        if entry is not None:
+            return entry['partition']
+        return self.ring.lookup(str(user_id))
+
+    def db_for(self, user_id):
+        return self.partitions[self.partition_for(user_id)]
+
+    def frozen(self, user_id):
+        """Whether a migration has frozen `user_id`'s data (as of the cached directory entry)."""
+        entry = self.entry(user_id)
+        return bool(entry) and entry.get('state') == FROZEN
+
+
+class _FanOutResult:
+    def __init__(self, results):
+        self.acknowledged = True
+        self.deleted_count = sum(getattr(r, 'deleted_count', 0) or 0 for r in results)
+        self.matched_count = sum(getattr(r, 'matched_count', 0) or 0 for r in results)
+        self.modified_count = sum(getattr(r, 'modified_count', 0) or 0 for r in results)
+
+
+class RoutedCollection:
+    """A tenant collection used without a request identity: routes on `createdBy`."""
+
+    def __init__(self, router, name):
+        self.router = router
+        self.name = name
+
+    def _all(self):
+        return [db[self.name] for db in self.router.partitions.values()]
+
+    def _for_filter(self, filter):
+        owner = (filter or {}).get('createdBy')
+        if not isinstance(owner, str):
+            raise TenantRoutingError(f"Queries on {self.name} outside a request need a createdBy value")
+        return self.router.db_for(owner)[self.name]
+
+    def insert_one(self, document, *args, **kwargs):
+        return self._for_filter(document).insert_one(document, *args, **kwargs)
+
+    def insert_many(self, documents, *args, **kwargs):
+        by_partition = {}
+        for document in documents:
+            owner = document.get('createdBy')
+            if not isinstance(owner, str):
+                raise TenantRoutingError(f"Documents inserted into {self.name} need a createdBy value")
+            by_partition.setdefault(self.router.partition_for(owner), []).append(document)
+        for partition, batch in by_partition.items():
+            self.router.partitions[partition][self.name].insert_many(batch, *args, **kwargs)
+        return InsertManyResult([document['_id'] for document in documents], True)
+
+    def find(self, filter=None, *args, **kwargs):
+        return self._for_filter(filter).find(filter, *args, **kwargs)
+
+    def find_one(self, filter=None, *args, **kwargs):
+        return self._for_filter(filter).find_one(filter, *args, **kwargs)
+
+    def update_one(self, filter, *args, **kwargs):
+        return self._for_filter(filter).update_one(filter, *args, **kwargs)
+
+    def delete_one(self, filter, *args, **kwargs):
+        return self._for_filter(filter).delete_one(filter, *args, **kwargs)
+
+    def find_one_and_update(self, filter, *args, **kwargs):
+        return self._for_filter(filter).find_one_and_update(filter, *args, **kwargs)
+
+    def find_one_and_delete(self, filter, *args, **kwargs):
+        return self._for_filter(filter).find_one_and_delete(filter, *args, **kwargs)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        match = pipeline[0].get('$match') if pipeline else None
+        return self._for_filter(match).aggregate(pipeline, *args, **kwargs)
+
+    # Owner-less calls fan out to every partition
+
+    def update_many(self, filter, *args, **kwargs):
+        if isinstance((filter or {}).get('createdBy'), str):
+            return self._for_filter(filter).update_many(filter, *args, **kwargs)
+        return _FanOutResult([c.update_many(filter, *args, **kwargs) for c in self._all()])
+
+    def delete_many(self, filter, *args, **kwargs):
+        if isinstance((filter or {}).get('createdBy'), str):
+            return self._for_filter(filter).delete_many(filter, *args, **kwargs)
+        return _FanOutResult([c.delete_many(filter, *args, **kwargs) for c in self._all()])
+
+    def count_documents(self, filter, *args, **kwargs):
+        if isinstance((filter or {}).get('createdBy'), str):
+            return self._for_filter(filter).count_documents(filter, *args, **kwargs)
+        return sum(c.count_documents(filter, *args, **kwargs) for c in self._all())
+
+    def estimated_document_count(self, **kwargs):
+        return sum(c.estimated_document_count(**kwargs) for c in self._all())
+
+    def create_index(self, keys, **kwargs):
+        return [c.create_index(keys, **kwargs) for c in self._all()][0]
+
+    def drop(self):
+        for collection in self._all():
+            collection.drop()
+
+
+def _request_identity():
+    if not has_request_context():
+        return None
+    try:
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+
+class TenantDatabase:
+    """Stands in for ``app.db`` when tenant partitioning is enabled."""
+
+    def __init__(self, control_db, router):
+        self.control_db = control_db
+        self.router = router
+        self.name = control_db.name
+        self.client = control_db.client
+
+    @property
+    def partition_databases(self):
+        return list(self.router.partitions.values())
+
+    def database_for(self, user_id):
+        return self.router.db_for(user_id)
+
+    def get_collection(self, name, **kwargs):
+        if name not in TENANT_COLLECTIONS:
+            return self.control_db.get_collection(name, **kwargs)
+        user_id = _request_identity()
+        if user_id is None:
+            return RoutedCollection(self.router, name)
+        return self.router.db_for(user_id).get_collection(name, **kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.get_collection(name)
+
+    def __getitem__(self, name):
+        return self.get_collection(name)
+
+    def command(self, *args, **kwargs):
+        return self.control_db.command(*args, **kwargs)
+
+    def list_collection_names(self, **kwargs):
+        return self.control_db.list_collection_names(**kwargs)
+
+    def create_collection(self, name, **kwargs):
+        return self.control_db.create_collection(name, **kwargs)
+
+    def with_options(self, **kwargs):
+        return self
+
+
+def each_partition(db):
+    """The physical databases behind `db`: every partition, or `db` itself."""
+    # Checked on the type: on a plain database any attribute is a collection
+    return db.partition_databases if hasattr(type(db), 'partition_databases') else [db]
+
+
+def owner_database(db, user_id):
+    """The physical database holding `user_id`'s tenant data, for bulk work outside a request."""
+    return db.database_for(user_id) if hasattr(type(db), 'database_for') else db
+
+
+def frozen_tenants(db):
+    """Users whose data a migration has frozen right now; bulk jobs must leave it alone."""
+    if not hasattr(type(db), 'partition_databases'):
+        return []
+    return [entry['_id'] for entry in db.control_db.tenant_directory.find({"state": FROZEN}, {"_id": 1})]
+
+
+def connect_partitions(specs, connect, listeners=()):
+    """Open one database per partition, reusing a client per URI."""
+    clients = {}
+    partitions = {}
+    for name, uri, db_name in specs:
+        if uri.startswith('memory://'):
+            key = 'memory'
+            if key not in clients:
+                clients[key] = MemoryClient(event_listeners=listeners)
+        else:
+            # Partitions on the same cluster share one connection pool
+            key = tuple(sorted(uri_parser.parse_uri(uri)['nodelist']))
+            if key not in clients:
+                clients[key] = connect(uri)
+        partitions[name] = clients[key][db_name]
+    return partitions
+
+
+def init_tenancy(app):
+    """Replace ``app.db`` with a TenantDatabase when TENANT_PARTITIONS is configured."""
+    spec = app.config.get('TENANT_PARTITIONS')
+    if not spec:
+        return
+    specs = parse_partitions(spec, app.config['MONGO_DB_NAME'])
+    listeners = list(getattr(app, 'mongo_listeners', []))
+    partitions = connect_partitions(
+        specs, lambda uri: MongoClient(
+            uri, serverSelectionTimeoutMS=app.config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+            event_listeners=listeners, connect=False
+        ), listeners
+    )
+    app.tenant_router = TenantRouter(app.db, partitions, app.config['TENANT_DIRECTORY_TTL'])
+    app.db = TenantDatabase(app.db, app.tenant_router)
+    print(f"🧩 Tenant partitioning across {', '.join(partitions)}")
+
+    @app.before_request
+    def hold_migrating_tenant():
+        # A tenant is briefly frozen while a migration copies its last changes
+        if request.method == 'OPTIONS' or request.blueprint not in TENANT_BLUEPRINTS:
+            return None
+        try:
+            verify_jwt_in_request(optional=True)
+            user_id = get_jwt_identity()
+        except Exception:
+            return None
+        if user_id and app.tenant_router.frozen(user_id):
+            response = jsonify({
+                "message": "Your data is being moved, please retry shortly",
+                "error": "tenant_migrating"
+            })
+            response.status_code = 503
+            response.headers['Retry-After'] = '2'
+            return response
+        return None
+
+
+MIGRATION_BATCH_SIZE = 1000
+
+
+def _copy(source, target, query, ctx, copied):
+    """Upsert every document matching `query` from source into target, in `_id` batches."""
+    last_id = None
+    while True:
+        page = dict(query, _id={"$gt": last_id}) if last_id is not None else query
+        batch = list(source.find(page).sort("_id", 1).limit(MIGRATION_BATCH_SIZE))
+        if not batch:
+            return
+        last_id = batch[-1]['_id']
+        target.bulk_write([ReplaceOne({"_id": doc['_id']}, doc, upsert=True) for doc in batch], ordered=False)
+        copied[source.name] = copied.get(source.name, 0) + len(batch)
+        ctx.progress(sum(copied.values()), None, f"{source.name}: {copied[source.name]}")
+
+
+def _sync(source, target, query, ctx, copied):
+    """Make `target` hold exactly `source`'s documents matching `query`.
+
+    Documents are compared whole rather than by ``updatedAt``: archiving,
+    rescoring and merges write without changing it.
+    """
+    last_id = None
+    kept = set()
+    while True:
+        page = dict(query, _id={"$gt": last_id}) if last_id is not None else query
+        batch = list(source.find(page).sort("_id", 1).limit(MIGRATION_BATCH_SIZE))
+        if not batch:
+            break
+        last_id = batch[-1]['_id']
+        ids = [doc['_id'] for doc in batch]
+        kept.update(ids)
+        current = {doc['_id']: doc for doc in target.find({"_id": {"$in": ids}})}
+        changed = [doc for doc in batch if current.get(doc['_id']) != doc]
+        if changed:
+            target.bulk_write([ReplaceOne({"_id": doc['_id']}, doc, upsert=True) for doc in changed], ordered=False)
+            copied[source.name] = copied.get(source.name, 0) + len(changed)
+        ctx.progress(sum(copied.values()), None, f"{source.name}: checked")
+    stale = [doc['_id'] for doc in target.find(query, {"_id": 1}) if doc['_id'] not in kept]
+    if stale:
+        target.delete_many({"_id": {"$in": stale}})
+
+
+def _wait_for_tenant_jobs(ctx, user_id, copied):
+    """Wait until none of `user_id`'s jobs that write tenant data is running."""
+    types = [name for name, job_type in JOB_TYPES.items() if job_type.tenant]
+    while ctx.db.jobs.count_documents({"createdBy": user_id, "status": RUNNING, "type": {"$in": types}}):
+        ctx.progress(sum(copied.values()), None, "waiting for the tenant's running jobs", force=True)
+        time.sleep(1)
+
+
+def _set_entry(router, user_id, **fields):
+    router.control_db.tenant_directory.update_one(
+        {"_id": user_id},
+        {"$set": dict(fields, updatedAt=datetime.utcnow())},
+        upsert=True
+    )
+    router.invalidate(user_id)
+
+
+@job_handler('tenant_migration', concurrency=2, max_attempts=1)
+def run_tenant_migration(ctx):
+    """Move one user's tenant collections to another partition while they keep working.
+
+    1. copy everything while the source stays live,
+    2. freeze the tenant (requests get 503, its jobs are held), wait out
+       directory caches and the tenant's jobs already running,
+    3. re-copy every document that is missing or differs and drop what was deleted,
+    4. point the directory at the target, then clear the source.
+    """
+    router = ctx.app.tenant_router
+    user_id = ctx.params['userId']
+    source_name = router.partition_for(user_id)
+    target_name = ctx.params['target']
+    if source_name == target_name:
+        return {"moved": False, "partition": target_name}
+    source, target = router.partitions[source_name], router.partitions[target_name]
+    query = {"createdBy": user_id}
+    copied = {}
+
+    _set_entry(router, user_id, partition=source_name, state=COPYING, target=target_name)
+    try:
+        for name in sorted(TENANT_COLLECTIONS):
+            _copy(source[name], target[name], query, ctx, copied)
+
+        _set_entry(router, user_id, partition=source_name, state=FROZEN, target=target_name)
+        # Let every process see the freeze and in-flight requests drain
+        time.sleep(router.directory_ttl + 1)
+        _wait_for_tenant_jobs(ctx, user_id, copied)
+
+        for name in sorted(TENANT_COLLECTIONS):
+            _sync(source[name], target[name], query, ctx, copied)
+    except BaseException:
+        # Cancelled or failed: the source is still authoritative, so roll back
+        _set_entry(router, user_id, partition=source_name, state=ACTIVE, target=None)
+        for name in TENANT_COLLECTIONS:
+            target[name].delete_many(query)
+        raise
+
+    _set_entry(router, user_id, partition=target_name, state=ACTIVE, target=None)
+    removed = {name: source[name].delete_many(query).deleted_count for name in sorted(TENANT_COLLECTIONS)}
+    return {"moved": True, "from": source_name, "to": target_name, "copied": copied, "removed": removed}
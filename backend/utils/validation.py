@@ -0,0 +1,223 @@
+"""Declarative request schemas compiled into single-pass validators.
+
+A schema is a mapping of field name -> Field. ``Schema`` compiles it once
+(at import time, in models.py) into a tuple of per-field converters, so
+validating a request is one loop that checks presence, coerces types and
+drops any key the schema does not know about.
+"""
+
+from datetime import datetime, timezone
+
+from flask import jsonify
+
+MISSING = object()
+
+_NUMBER_BSON_TYPES = ['double', 'int', 'long', 'decimal']
+
+
+def parse_date(value):
+    """A naive UTC datetime from a datetime or an ISO 8601 date or date-time string."""
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class ValidationError(Exception):
+    def __init__(self, message, error, **extra):
+        super().__init__(message)
+        self.message = message
+        self.error = error
+        self.extra = extra
+
+    def response(self):
+        return jsonify({"message": self.message, "error": self.error, **self.extra}), 400
+
+
+class Field:
+    def __init__(self, kind='string', required=False, default=None, updatable=True, strip=False,
+                 minimum=None, exclusive_minimum=None, choices=None,
+                 invalid_message=None, invalid_error=None, range_message=None, range_error=None):
+        self.kind = kind
+        self.required = required
+        self.default = default
+        self.updatable = updatable
+        self.strip = strip
+        self.minimum = minimum
+        self.exclusive_minimum = exclusive_minimum
+        self.choices = choices
+        self.invalid_message = invalid_message
+        self.invalid_error = invalid_error
+        self.range_message = range_message
+        self.range_error = range_error
+
+    def compile(self, name):
+        """Return a function that coerces one present, non-empty value."""
+        invalid = ValidationError(
+            (self.invalid_message or "{field} must be a valid {kind}").format(field=name, kind=self.kind),
+            self.invalid_error or 'invalid_field'
+        )
+        out_of_range = ValidationError(
+            (self.range_message or "{field} must be a positive number").format(field=name),
+            self.range_error or 'invalid_field'
+        )
+
+        if self.kind == 'number':
+            minimum, exclusive_minimum = self.minimum, self.exclusive_minimum
+
+            def convert(value):
+                if isinstance(value, bool):
+                    raise invalid
+                try:
+                    number = float(value)
+                except (ValueError, TypeError):
+                    raise invalid
+                if number != number or number in (float('inf'), float('-inf')):
+                    raise invalid
+                if minimum is not None and number < minimum:
+                    raise out_of_range
+                if exclusive_minimum is not None and number <= exclusive_minimum:
+                    raise out_of_range
+                return number
+            return convert
+
+        if self.kind == 'string':
+            strip, choices = self.strip, self.choices
+
+            def convert(value):
+                if isinstance(value, (dict, list)):
+                    raise invalid
+                text = value if isinstance(value, str) else str(value)
+                if strip:
+                    text = text.strip()
+                if choices is not None and text not in choices:
+                    raise ValidationError(
+                        f"{name} must be one of: {', '.join(choices)}", self.invalid_error or 'invalid_field'
+                    )
+                return text
+            return convert
+
+        if self.kind == 'date':
+            def convert(value):
+                if isinstance(value, (bool, int, float, dict, list)):
+                    raise invalid
+                try:
+                    return parse_date(value)
+                except (ValueError, TypeError):
+                    raise invalid
+            return convert
+
+        if self.kind == 'any':
+            return lambda value: value
+
+        raise ValueError(f"Unknown field kind: {self.kind}")
+
+    def json_schema(self):
+        if self.kind == 'number':
+            schema = {"bsonType": list(_NUMBER_BSON_TYPES)}
+            if self.minimum is not None:
+                schema["minimum"] = self.minimum
+            if self.exclusive_minimum is not None:
+                schema["minimum"] = self.exclusive_minimum
+                schema["exclusiveMinimum"] = True
+        elif self.kind == 'string':
+            schema = {"bsonType": ["string"]}
+            if self.choices is not None:
+                schema["enum"] = list(self.choices) + ([] if self.required else [None])
+        elif self.kind == 'date':
+            schema = {"bsonType": ["date"]}
+        else:
+            return {}
+        if not self.required:
+            schema["bsonType"].append("null")
+        return schema
+
+
+def _is_empty(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+class Schema:
+    """Compiled validator for one resource.
+
+    `report_all_missing` lists every missing required field in one error
+    (the budget API's behaviour); otherwise the first missing field is reported.
+    """
+
+    def __init__(self, name, fields, report_all_missing=False):
+        self.name = name
+        self.fields = fields
+        self.report_all_missing = report_all_missing
+        self._create_steps = tuple(
+            (field_name, field.compile(field_name), field.required, field.default)
+            for field_name, field in fields.items()
+        )
+        self._update_steps = tuple(
+            (field_name, converter, required, MISSING)
+            for field_name, converter, required, _ in self._create_steps
+            if fields[field_name].updatable
+        )
+
+    def validate(self, data, partial=False):
+        """Return a new dict holding only known fields, coerced to their types.
+
+        With `partial` (updates) only fields present in `data` are returned,
+        restricted to updatable ones, and no defaults are applied.
+        """
+        if not isinstance(data, dict):
+            raise ValidationError("Request body must be a JSON object", "invalid_body")
+
+        clean = {}
+        missing = []
+        for name, convert, required, default in (self._update_steps if partial else self._create_steps):
+            value = data.get(name, MISSING)
+            if value is MISSING:
+                if required and not partial:
+                    missing.append(name)
+                elif default is not MISSING:
+                    clean[name] = default
+                continue
+            if _is_empty(value):
+                if required:
+                    missing.append(name)
+                elif not partial and default is not None:
+                    clean[name] = default
+                else:
+                    clean[name] = None
+                continue
+            clean[name] = convert(value)
+
+        if missing:
+            if self.report_all_missing:
+                raise ValidationError(
+                    f"The following fields are required: {', '.join(missing)}",
+                    "missing_fields",
+                    missing_fields=missing
+                )
+            raise ValidationError(f"{missing[0]} is required", "missing_fields")
+        return clean
+
+    def json_schema(self, extra_required=()):
+        properties = {}
+        for name, field in self.fields.items():
+            schema = field.json_schema()
+            if schema:
+                properties[name] = schema
+        required = [name for name, field in self.fields.items() if field.required]
+        return {
+            "$jsonSchema": {
+                "bsonType": "object",
+                "required": required + list(extra_required),
+                "properties": properties
+            }
+        }
+
+
+def push_collection_validators(db, schemas, extra_required=('createdBy',)):
+    """Install `$jsonSchema` validators (validationLevel=moderate) for `{collection: Schema}`."""
+    for collection, schema in schemas.items():
+        validator = schema.json_schema(extra_required)
+        if collection not in db.list_collection_names():
+            db.create_collection(collection)
+        db.command('collMod', collection, validator=validator, validationLevel='moderate')
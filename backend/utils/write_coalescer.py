@@ -0,0 +1,116 @@
+"""Group commit for high-frequency inserts.
+
+For the collections listed in ``WRITE_COALESCE_COLLECTIONS``, concurrent
+``insert_one`` calls are buffered for up to ``WRITE_COALESCE_MAX_DELAY_MS``
+(or until ``WRITE_COALESCE_MAX_BATCH`` documents are waiting) and written
+with a single unordered ``insert_many``, so a burst of requests shares one
+round trip and one journal flush. The first caller of a batch flushes it;
+the others wait for the result. Each caller gets back its own ``_id``, or
+the error for its own document when only part of the batch fails.
+
+Requests running in a causal session (``READ_ROUTING_ENABLED``) insert
+directly, so their write still advances their read-your-writes token.
+"""
+
+import threading
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+from pymongo.results import InsertOneResult
+from pymongo.write_concern import WriteConcern
+
+from utils.read_routing import SessionCollection
+
+
+def parse_write_concern(w, journal):
+    """WRITE_COALESCE_W / WRITE_COALESCE_J -> WriteConcern, or None to keep the collection's own."""
+    if not w and journal is None:
+        return None
+    if w and w.isdigit():
+        w = int(w)
+    return WriteConcern(w=w or None, j=journal)
+
+
+def _write_error(error):
+    if error.get('code') == 11000:
+        return DuplicateKeyError(error.get('errmsg', 'duplicate key'), 11000, error)
+    return WriteError(error.get('errmsg', 'write failed'), error.get('code'), error)
+
+
+class _Batch:
+    def __init__(self, collection):
+        self.collection = collection
+        self.documents = []
+        self.errors = {}
+        self.error = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class WriteCoalescer:
+    def __init__(self, collections=(), max_batch=100, max_delay=0.005, write_concern=None):
+        self.collections = frozenset(collections)
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self.write_concern = write_concern
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def enabled_for(self, collection):
+        return (
+            collection.name in self.collections
+            and hasattr(collection, 'database')
+            and not isinstance(collection, SessionCollection)
+        )
+
+    def insert_one(self, collection, document):
+        """Insert `document` into `collection`, batched with concurrent inserts when enabled."""
+        if not self.enabled_for(collection):
+            return collection.insert_one(document)
+
+        if '_id' not in document:
+            document['_id'] = ObjectId()
+        # Tenant partitions hand out different collection objects per request
+        key = (id(collection.database.client), collection.database.name, collection.name)
+        with self._lock:
+            batch = self._pending.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._pending[key] = _Batch(collection)
+            position = len(batch.documents)
+            batch.documents.append(document)
+            if len(batch.documents) >= self.max_batch:
+                del self._pending[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.max_delay)
+            with self._lock:
+                if self._pending.get(key) is batch:
+                    del self._pending[key]
+            self._flush(batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        if position in batch.errors:
+            raise batch.errors[position]
+        return InsertOneResult(document['_id'], True)
+
+    def _flush(self, batch):
+        collection = batch.collection
+        if self.write_concern is not None:
+            collection = collection.with_options(write_concern=self.write_concern)
+        try:
+            collection.insert_many(batch.documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                batch.errors[error['index']] = _write_error(error)
+            if e.details.get('writeConcernErrors'):
+                # Nothing is known to be durable: fail the whole batch
+                batch.error = e
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()